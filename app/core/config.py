@@ -2,16 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import os
-from typing import Dict, List, Optional
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
 from pydantic_settings import BaseSettings
 from app.utils.logger import logger
+from app.utils.shared_state import get_shared_state
+from app.utils.token_file import token_file_cache
 
 
 class Settings(BaseSettings):
     """Application settings"""
 
     # API Configuration
-    API_ENDPOINT: str = "https://chat.z.ai/api/chat/completions"
+    # 上游站点地址，可指向本地回放服务器做离线压测（见 tests/fake_upstream.py）
+    ZAI_BASE_URL: str = os.getenv("ZAI_BASE_URL", "https://chat.z.ai").rstrip("/")
+    LONGCAT_BASE_URL: str = os.getenv("LONGCAT_BASE_URL", "https://longcat.chat").rstrip("/")
+    K2THINK_BASE_URL: str = os.getenv("K2THINK_BASE_URL", "https://www.k2think.ai").rstrip("/")
     AUTH_TOKEN: str = os.getenv("AUTH_TOKEN", "sk-your-api-key")
 
     # 认证token文件路径（可选）
@@ -19,8 +25,72 @@ class Settings(BaseSettings):
 
     # Token池配置
     TOKEN_HEALTH_CHECK_INTERVAL: int = int(os.getenv("TOKEN_HEALTH_CHECK_INTERVAL", "300"))  # 5分钟
+    TOKEN_HEALTH_CHECK_ENABLED: bool = os.getenv("TOKEN_HEALTH_CHECK_ENABLED", "true").lower() == "true"  # 后台定期健康检查
+    TOKEN_HEALTH_CHECK_CONCURRENCY: int = int(os.getenv("TOKEN_HEALTH_CHECK_CONCURRENCY", "10"))  # 同时进行的检查数上限
     TOKEN_FAILURE_THRESHOLD: int = int(os.getenv("TOKEN_FAILURE_THRESHOLD", "3"))  # 失败3次后标记为不可用
     TOKEN_RECOVERY_TIMEOUT: int = int(os.getenv("TOKEN_RECOVERY_TIMEOUT", "1800"))  # 30分钟后重试失败的token
+    # Token选择策略: round_robin / least_in_flight / power_of_two / ewma_latency / success_rate
+    TOKEN_SELECTION_STRATEGY: str = os.getenv("TOKEN_SELECTION_STRATEGY", "round_robin")
+    # 单个token的并发与速率限制（0 表示不限制），全部token达到上限时请求排队等待
+    TOKEN_MAX_CONCURRENCY: int = int(os.getenv("TOKEN_MAX_CONCURRENCY", "0"))
+    TOKEN_RPM_LIMIT: int = int(os.getenv("TOKEN_RPM_LIMIT", "0"))
+    TOKEN_QUEUE_TIMEOUT: float = float(os.getenv("TOKEN_QUEUE_TIMEOUT", "30"))  # 排队最长等待时间（秒）
+
+    # Token状态持久化文件（可选），重启后恢复失败计数、禁用状态等，避免重新探测已失效的token
+    TOKEN_STATE_FILE: Optional[str] = os.getenv("TOKEN_STATE_FILE")
+    TOKEN_STATE_SAVE_INTERVAL: float = float(os.getenv("TOKEN_STATE_SAVE_INTERVAL", "60"))  # 定期保存间隔（秒）
+
+    # Token文件监听（文件变化后自动重新加载，无需重启）
+    TOKEN_FILE_WATCH_ENABLED: bool = os.getenv("TOKEN_FILE_WATCH_ENABLED", "true").lower() == "true"
+    TOKEN_FILE_WATCH_INTERVAL: float = float(os.getenv("TOKEN_FILE_WATCH_INTERVAL", "5"))  # 轮询间隔（秒，未安装watchfiles时使用）
+
+    # 上游HTTP连接池配置（每个提供商一个长连接客户端）
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # 空闲连接保活时间（秒）
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"  # 需要安装 h2
+
+    # 上游重试：向客户端输出任何内容之前，上游返回可重试状态码或连接失败时换token重新签名后重试
+    UPSTREAM_RETRY_MAX_ATTEMPTS: int = int(os.getenv("UPSTREAM_RETRY_MAX_ATTEMPTS", "3"))  # 含首次请求，1 表示不重试
+    UPSTREAM_RETRY_BUDGET: float = float(os.getenv("UPSTREAM_RETRY_BUDGET", "15"))  # 重试总时长预算（秒）
+    UPSTREAM_RETRY_BACKOFF: float = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.2"))  # 首次退避时间（秒），之后翻倍
+    UPSTREAM_RETRY_STATUSES: str = os.getenv("UPSTREAM_RETRY_STATUSES", "401,403,429,500,502,503,504")
+
+    # 对冲请求（仅流式）：首块等待超过最近首块延迟的指定百分位后，用另一个token再发一个请求，先产出首块的胜出
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))  # 等待时间下限（秒）
+    HEDGE_MAX_DELAY: float = float(os.getenv("HEDGE_MAX_DELAY", "10"))  # 等待时间上限（秒）
+    HEDGE_DEFAULT_DELAY: float = float(os.getenv("HEDGE_DEFAULT_DELAY", "2"))  # 样本不足时的等待时间（秒）
+    HEDGE_MAX_RATIO: float = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))  # 对冲请求占总请求的比例上限
+
+    # 模型路由配置
+    # 别名：别名=模型，多个用 , 分隔，例如 gpt-4o=GLM-4.5,gpt-4o-mini=GLM-4.5-Air
+    MODEL_ALIASES: str = os.getenv("MODEL_ALIASES", "")
+    # 规则：通配符或 re:正则=提供商，多个用 ; 分隔，例如 glm-*=zai;re:^longcat=longcat
+    MODEL_ROUTES: str = os.getenv("MODEL_ROUTES", "")
+
+    # 跨提供商降级和熔断配置
+    # 降级链：模型之间用 -> 连接，多条链用 ; 分隔，例如 GLM-4.5->GLM-4.5-Air->LongCat-Flash
+    MODEL_FALLBACKS: str = os.getenv("MODEL_FALLBACKS", "")
+    CIRCUIT_BREAKER_ENABLED: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    CIRCUIT_BREAKER_WINDOW: int = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "20"))  # 统计最近多少次请求
+    CIRCUIT_BREAKER_MIN_REQUESTS: int = int(os.getenv("CIRCUIT_BREAKER_MIN_REQUESTS", "10"))
+    CIRCUIT_BREAKER_ERROR_RATE: float = float(os.getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5"))
+    CIRCUIT_BREAKER_SLOW_CALL: float = float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL", "10"))  # 慢请求首块耗时（秒），0 不统计
+    CIRCUIT_BREAKER_SLOW_RATE: float = float(os.getenv("CIRCUIT_BREAKER_SLOW_RATE", "0.8"))
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+
+    # JSON 后端: auto / orjson / msgspec / stdlib（auto 优先使用已安装的 orjson、msgspec）
+    JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")
+
+    # 流式输出合并：时间窗口内同一字段的连续文本增量合并为一个 SSE 事件（0 表示不合并）
+    # 单个请求可通过 x-stream-coalesce-ms 请求头覆盖
+    STREAM_COALESCE_MS: float = float(os.getenv("STREAM_COALESCE_MS", "0"))
+    STREAM_COALESCE_MAX_BYTES: int = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "4096"))  # 单个合并事件的文本上限
+
+    # 监控面板保留的最近请求数（环形缓冲区大小，百分位基于这些请求计算）
+    REQUEST_LOG_SIZE: int = int(os.getenv("REQUEST_LOG_SIZE", "1000"))
 
     def _load_tokens_from_file(self, file_path: str) -> List[str]:
         """
@@ -70,71 +140,102 @@ class Settings(BaseSettings):
             logger.error(f"❌ 读取token文件失败 {file_path}: {e}")
         return tokens
 
+    @property
+    def zai_api_endpoint(self) -> str:
+        """Z.AI 补全接口地址，使用时由 ZAI_BASE_URL 生成"""
+        return f"{self.ZAI_BASE_URL}/api/chat/completions"
+
     @property
     def auth_token_list(self) -> List[str]:
         """
         解析认证token列表
 
-        从AUTH_TOKENS_FILE指定的文件加载token（如果配置了文件路径）
+        从AUTH_TOKENS_FILE指定的文件加载token（如果配置了文件路径），
+        结果按文件指纹缓存，文件变化后才会重新解析
         """
         # 如果未配置token文件路径，返回空列表
         if not self.AUTH_TOKENS_FILE:
-            logger.debug("📄 未配置AUTH_TOKENS_FILE，跳过token文件加载")
             return []
 
-        # 从文件加载token
-        tokens = self._load_tokens_from_file(self.AUTH_TOKENS_FILE)
+        return token_file_cache.get(self.AUTH_TOKENS_FILE, self._load_tokens_from_file, "token")
+
+    @property
+    def token_pool_options(self) -> Dict[str, Any]:
+        """创建或更新 token 池时使用的参数（启动、token 文件热更新和管理接口共用）"""
+        return {
+            "failure_threshold": self.TOKEN_FAILURE_THRESHOLD,
+            "recovery_timeout": self.TOKEN_RECOVERY_TIMEOUT,
+            "strategy": self.TOKEN_SELECTION_STRATEGY,
+            "max_concurrency": self.TOKEN_MAX_CONCURRENCY,
+            "rpm_limit": self.TOKEN_RPM_LIMIT,
+            "state_file": self.TOKEN_STATE_FILE,
+            "shared_state": get_shared_state(),
+        }
 
-        # 去重，保持顺序
-        if tokens:
-            seen = set()
-            unique_tokens = []
-            for token in tokens:
-                if token not in seen:
-                    unique_tokens.append(token)
-                    seen.add(token)
+    @property
+    def upstream_retry_statuses(self) -> List[int]:
+        """需要重试的上游状态码"""
+        statuses = []
+        for item in self.UPSTREAM_RETRY_STATUSES.split(","):
+            item = item.strip()
+            if item.isdigit():
+                statuses.append(int(item))
+        return statuses
 
-            # 记录去重信息
-            duplicate_count = len(tokens) - len(unique_tokens)
-            if duplicate_count > 0:
-                logger.warning(f"⚠️ 检测到 {duplicate_count} 个重复token，已自动去重")
+    @property
+    def model_aliases(self) -> Dict[str, str]:
+        """模型别名 -> 目标模型"""
+        aliases = {}
+        for item in self.MODEL_ALIASES.split(","):
+            alias, _, target = item.partition("=")
+            if alias.strip() and target.strip():
+                aliases[alias.strip()] = target.strip()
+        return aliases
 
-            return unique_tokens
+    @property
+    def model_route_patterns(self) -> List[Tuple[str, str]]:
+        """按顺序匹配的 (通配符或 re:正则, 提供商名称)"""
+        patterns = []
+        for item in self.MODEL_ROUTES.split(";"):
+            pattern, _, provider = item.rpartition("=")
+            if pattern.strip() and provider.strip():
+                patterns.append((pattern.strip(), provider.strip()))
+        return patterns
+
+    def reload_routing(self):
+        """从环境变量和 .env 重新读取模型路由相关配置"""
+        fresh = Settings()
+        for name in ("MODEL_ALIASES", "MODEL_ROUTES", "MODEL_FALLBACKS"):
+            setattr(self, name, getattr(fresh, name))
 
-        return []
+    @property
+    def model_fallback_chains(self) -> Dict[str, List[str]]:
+        """每个模型失败后依次尝试的降级模型"""
+        chains: Dict[str, List[str]] = {}
+        for chain in self.MODEL_FALLBACKS.split(";"):
+            models = [model.strip() for model in chain.split("->") if model.strip()]
+            if len(models) < 2:
+                continue
+            for index, model in enumerate(models[:-1]):
+                fallbacks = chains.setdefault(model, [])
+                for fallback in models[index + 1:]:
+                    if fallback != model and fallback not in fallbacks:
+                        fallbacks.append(fallback)
+        return chains
 
     @property
     def longcat_token_list(self) -> List[str]:
         """
         解析 LongCat token 列表
 
-        从 LONGCAT_TOKENS_FILE 指定的文件加载 token（如果配置了文件路径）
+        从 LONGCAT_TOKENS_FILE 指定的文件加载 token（如果配置了文件路径），
+        结果按文件指纹缓存，文件变化后才会重新解析
         """
         # 如果未配置token文件路径，返回空列表
         if not self.LONGCAT_TOKENS_FILE:
-            logger.debug("📄 未配置LONGCAT_TOKENS_FILE，跳过LongCat token文件加载")
             return []
 
-        # 从文件加载token
-        tokens = self._load_tokens_from_file(self.LONGCAT_TOKENS_FILE)
-
-        # 去重，保持顺序
-        if tokens:
-            seen = set()
-            unique_tokens = []
-            for token in tokens:
-                if token not in seen:
-                    unique_tokens.append(token)
-                    seen.add(token)
-
-            # 记录去重信息
-            duplicate_count = len(tokens) - len(unique_tokens)
-            if duplicate_count > 0:
-                logger.warning(f"⚠️ 检测到 {duplicate_count} 个重复LongCat token，已自动去重")
-
-            return unique_tokens
-
-        return []
+        return token_file_cache.get(self.LONGCAT_TOKENS_FILE, self._load_tokens_from_file, "LongCat token")
 
     # Model Configuration
     PRIMARY_MODEL: str = os.getenv("PRIMARY_MODEL", "GLM-4.5")
@@ -171,13 +272,48 @@ class Settings(BaseSettings):
     # Server Configuration
     LISTEN_PORT: int = int(os.getenv("LISTEN_PORT", "8080"))
     DEBUG_LOGGING: bool = os.getenv("DEBUG_LOGGING", "true").lower() == "true"
+    # 日志配置: default（同步输出）/ production（队列异步输出，流式逐块日志采样）
+    LOG_PROFILE: str = os.getenv("LOG_PROFILE", "default").lower()
+    LOG_CHUNK_SAMPLE_EVERY: int = int(os.getenv("LOG_CHUNK_SAMPLE_EVERY", "0"))  # 逐块日志每 N 块输出一次，0 使用配置默认值
     SERVICE_NAME: str = os.getenv("SERVICE_NAME", "z-ai2api-server")
 
+    # 多进程部署（Granian）：worker 进程数、每个 worker 的运行时线程数、事件循环实现（auto/asyncio/uvloop/rloop）
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    THREADS: int = int(os.getenv("THREADS", "1"))
+    LOOP: str = os.getenv("LOOP", "auto").lower()
+    # 多 worker 共享token状态文件（内存映射 + 文件锁），WORKERS > 1 时默认放在系统临时目录
+    SHARED_STATE_FILE: Optional[str] = os.getenv("SHARED_STATE_FILE")
+    SHARED_STATE_SLOTS: int = int(os.getenv("SHARED_STATE_SLOTS", "4096"))  # 可共享的token数上限
+    SHARED_STATE_SYNC_INTERVAL: float = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", "1"))  # 同步其他 worker 状态的间隔（秒）
+
+    @property
+    def shared_state_path(self) -> Optional[str]:
+        """共享token状态文件路径，单 worker 且未显式配置时为 None"""
+        if self.SHARED_STATE_FILE:
+            return self.SHARED_STATE_FILE
+        if self.WORKERS > 1:
+            return os.path.join(tempfile.gettempdir(), f"{self.SERVICE_NAME}-{self.LISTEN_PORT}.state")
+        return None
+
     ANONYMOUS_MODE: bool = os.getenv("ANONYMOUS_MODE", "true").lower() == "true"
+
+    # 匿名模式访客令牌预取池
+    GUEST_TOKEN_POOL_ENABLED: bool = os.getenv("GUEST_TOKEN_POOL_ENABLED", "true").lower() == "true"
+    GUEST_TOKEN_POOL_MIN_SIZE: int = int(os.getenv("GUEST_TOKEN_POOL_MIN_SIZE", "2"))  # 低于此数量立即补充
+    GUEST_TOKEN_POOL_MAX_SIZE: int = int(os.getenv("GUEST_TOKEN_POOL_MAX_SIZE", "8"))
+    GUEST_TOKEN_MAX_USES: int = int(os.getenv("GUEST_TOKEN_MAX_USES", "1"))  # 单个访客令牌最多使用次数
+    GUEST_TOKEN_DEFAULT_TTL: int = int(os.getenv("GUEST_TOKEN_DEFAULT_TTL", "1800"))  # JWT 无 exp 时的有效期（秒）
+    GUEST_TOKEN_REFRESH_MARGIN: int = int(os.getenv("GUEST_TOKEN_REFRESH_MARGIN", "60"))  # 提前淘汰的秒数
     TOOL_SUPPORT: bool = os.getenv("TOOL_SUPPORT", "true").lower() == "true"
     SCAN_LIMIT: int = int(os.getenv("SCAN_LIMIT", "200000"))
     SKIP_AUTH_TOKEN: bool = os.getenv("SKIP_AUTH_TOKEN", "false").lower() == "true"
 
+    # K2Think Configuration
+    K2THINK_SESSION_TTL: int = int(os.getenv("K2THINK_SESSION_TTL", "1800"))  # 握手Cookie未声明过期时间时的缓存时长（秒）
+    # 预建对话数量，0 表示关闭（默认）；每个预建对话都会以占位消息 "Hello" 在上游真实创建一个对话
+    K2THINK_WARM_CONVERSATIONS: int = int(os.getenv("K2THINK_WARM_CONVERSATIONS", "0"))
+    K2THINK_CONVERSATION_TTL: int = int(os.getenv("K2THINK_CONVERSATION_TTL", "600"))  # 预建对话的最长保留时间（秒）
+
     # LongCat Configuration
     LONGCAT_PASSPORT_TOKEN: Optional[str] = os.getenv("LONGCAT_PASSPORT_TOKEN")
     LONGCAT_TOKENS_FILE: Optional[str] = os.getenv("LONGCAT_TOKENS_FILE")
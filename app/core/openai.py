@@ -2,15 +2,24 @@
 # -*- coding: utf-8 -*-
 
 import time
-import json
-from typing import List, Dict, Any
-from fastapi import APIRouter, Header, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from app.core.config import settings
 from app.models.schemas import OpenAIRequest, Message, ModelsResponse, Model, OpenAIResponse, Choice, Usage
 from app.utils.logger import get_logger
-from app.providers import get_provider_router
+from app.utils import json_codec
+from app.utils.stream_coalescer import coalesce_stream
+from app.utils.stream_guard import GuardedStreamingResponse
+from app.utils.request_log import note_request_model
+from app.utils.metrics import (
+    TOKEN_POOL_IN_FLIGHT,
+    TOKEN_POOL_QUEUE_DEPTH,
+    TOKEN_POOL_TOKENS,
+    metrics_registry,
+)
+from app.providers import get_provider_router, provider_registry
 from app.utils.token_pool import get_token_pool
 
 logger = get_logger()
@@ -28,6 +37,16 @@ def get_provider_router_instance():
     return provider_router
 
 
+def verify_api_key(authorization: Optional[str] = Header(None)):
+    """校验 Authorization: Bearer <AUTH_TOKEN>，SKIP_AUTH_TOKEN 开启时跳过"""
+    if settings.SKIP_AUTH_TOKEN:
+        return
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    if authorization[7:] != settings.AUTH_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+
 def create_chunk(chat_id: str, model: str, delta: Dict[str, Any], finish_reason: str = None) -> Dict[str, Any]:
     """创建标准的 OpenAI chunk 结构"""
     return {
@@ -56,14 +75,14 @@ async def handle_non_stream_response(stream_response, request: OpenAIRequest) ->
             chunk_str = chunk_data[6:].strip()
             if chunk_str and chunk_str != "[DONE]":
                 try:
-                    chunk = json.loads(chunk_str)
+                    chunk = json_codec.loads(chunk_str)
                     if "choices" in chunk and chunk["choices"]:
                         choice = chunk["choices"][0]
                         if "delta" in choice and "content" in choice["delta"]:
                             content = choice["delta"]["content"]
                             if content:
                                 full_content.append(content)
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     continue
 
     # 构建响应
@@ -114,21 +133,31 @@ async def list_models():
         return fallback_response
 
 
+def _resolve_coalesce_ms(header_value: Optional[str]) -> float:
+    """解析 x-stream-coalesce-ms 请求头，无效时使用配置默认值"""
+    if header_value is None:
+        return settings.STREAM_COALESCE_MS
+    try:
+        return min(max(float(header_value), 0.0), 1000.0)
+    except ValueError:
+        logger.warning(f"⚠️ 无效的 x-stream-coalesce-ms: {header_value}")
+        return settings.STREAM_COALESCE_MS
+
+
 @router.post("/v1/chat/completions")
-async def chat_completions(request: OpenAIRequest, authorization: str = Header(...)):
+async def chat_completions(
+    request: OpenAIRequest,
+    authorization: str = Header(...),
+    x_stream_coalesce_ms: Optional[str] = Header(None),
+):
     """Handle chat completion requests with multi-provider architecture"""
+    note_request_model(request.model)
     role = request.messages[0].role if request.messages else "unknown"
     logger.info(f"😶‍🌫️ 收到客户端请求 - 模型: {request.model}, 流式: {request.stream}, 消息数: {len(request.messages)}, 角色: {role}, 工具数: {len(request.tools) if request.tools else 0}")
 
     try:
         # Validate API key (skip if SKIP_AUTH_TOKEN is enabled)
-        if not settings.SKIP_AUTH_TOKEN:
-            if not authorization.startswith("Bearer "):
-                raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-
-            api_key = authorization[7:]
-            if api_key != settings.AUTH_TOKEN:
-                raise HTTPException(status_code=401, detail="Invalid API key")
+        verify_api_key(authorization)
 
         # 使用多提供商路由器处理请求
         router_instance = get_provider_router_instance()
@@ -139,6 +168,8 @@ async def chat_completions(request: OpenAIRequest, authorization: str = Header(.
             error_info = result["error"]
             if error_info.get("code") == "model_not_found":
                 raise HTTPException(status_code=404, detail=error_info["message"])
+            elif error_info.get("code") == "provider_unavailable":
+                raise HTTPException(status_code=503, detail=error_info["message"])
             else:
                 raise HTTPException(status_code=500, detail=error_info["message"])
 
@@ -147,7 +178,11 @@ async def chat_completions(request: OpenAIRequest, authorization: str = Header(.
             # 流式响应
             if hasattr(result, '__aiter__'):
                 # 结果是异步生成器
-                return StreamingResponse(
+                coalesce_ms = _resolve_coalesce_ms(x_stream_coalesce_ms)
+                if coalesce_ms > 0:
+                    result = coalesce_stream(result, coalesce_ms, settings.STREAM_COALESCE_MAX_BYTES)
+                # 客户端断开时立即关闭生成器，取消上游流
+                return GuardedStreamingResponse(
                     result,
                     media_type="text/event-stream",
                     headers={
@@ -178,6 +213,42 @@ async def chat_completions(request: OpenAIRequest, authorization: str = Header(.
 # Token pool management endpoints
 
 
+def _get_guest_token_pool_status() -> Optional[Dict[str, Any]]:
+    """获取 Z.AI 访客令牌预取池状态"""
+    provider = provider_registry.get_provider_by_name("zai")
+    guest_pool = getattr(provider, "guest_token_pool", None)
+    return guest_pool.get_status() if guest_pool else None
+
+
+@router.get("/v1/hedging/status")
+async def get_hedging_status():
+    """Z.AI 对冲请求统计：对冲率、胜出方、当前等待时间"""
+    provider = provider_registry.get_provider_by_name("zai")
+    hedge_policy = getattr(provider, "hedge_policy", None)
+    if hedge_policy is None:
+        return {"enabled": False}
+    return {"enabled": True, **hedge_policy.get_status()}
+
+
+@router.get("/v1/providers/status")
+async def get_providers_status():
+    """降级链和各提供商熔断器状态"""
+    return get_provider_router_instance().get_status()
+
+
+@router.post("/v1/providers/reload-routing", dependencies=[Depends(verify_api_key)])
+async def reload_routing():
+    """重新读取 MODEL_ALIASES / MODEL_ROUTES / MODEL_FALLBACKS 并整体替换路由表"""
+    settings.reload_routing()
+    table = get_provider_router_instance().factory.rebuild_routing()
+    return {
+        "status": "success",
+        "routes": len(table.routes),
+        "patterns": len(table.patterns),
+        "fallbacks": len(table.fallbacks),
+    }
+
+
 @router.get("/v1/token-pool/status")
 async def get_token_pool_status():
     """获取token池状态信息"""
@@ -187,6 +258,7 @@ async def get_token_pool_status():
             return {
                 "status": "disabled",
                 "message": "Token池未初始化，当前仅使用匿名模式",
+                "guest_token_pool": _get_guest_token_pool_status(),
                 "anonymous_mode": settings.ANONYMOUS_MODE,
                 "auth_tokens_file": settings.AUTH_TOKENS_FILE,
                 "auth_tokens_configured": len(settings.auth_token_list) > 0
@@ -196,11 +268,14 @@ async def get_token_pool_status():
         return {
             "status": "active",
             "pool_info": pool_status,
+            "guest_token_pool": _get_guest_token_pool_status(),
             "config": {
                 "anonymous_mode": settings.ANONYMOUS_MODE,
                 "failure_threshold": settings.TOKEN_FAILURE_THRESHOLD,
                 "recovery_timeout": settings.TOKEN_RECOVERY_TIMEOUT,
-                "health_check_interval": settings.TOKEN_HEALTH_CHECK_INTERVAL
+                "health_check_interval": settings.TOKEN_HEALTH_CHECK_INTERVAL,
+                "health_check_enabled": settings.TOKEN_HEALTH_CHECK_ENABLED,
+                "health_check_concurrency": settings.TOKEN_HEALTH_CHECK_CONCURRENCY
             }
         }
     except Exception as e:
@@ -218,7 +293,7 @@ async def trigger_health_check():
 
         start_time = time.time()
         logger.info("🔍 API触发Token池健康检查...")
-        await token_pool.health_check_all()
+        await token_pool.health_check_all(settings.ZAI_BASE_URL, concurrency=settings.TOKEN_HEALTH_CHECK_CONCURRENCY)
         duration = time.time() - start_time
 
         pool_status = token_pool.get_pool_status()
@@ -255,7 +330,7 @@ async def update_token_pool_endpoint(tokens: List[str]):
         if not valid_tokens:
             raise HTTPException(status_code=400, detail="至少需要提供一个有效的token")
 
-        update_token_pool(valid_tokens)
+        update_token_pool(valid_tokens, **settings.token_pool_options)
         token_pool = get_token_pool()
 
         return {
@@ -266,3 +341,22 @@ async def update_token_pool_endpoint(tokens: List[str]):
     except Exception as e:
         logger.error(f"更新token池失败: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update token pool: {str(e)}")
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的运行指标"""
+    token_pool = get_token_pool()
+    if token_pool:
+        # token池状态在抓取时计算，不在请求路径上维护
+        summary = token_pool.get_load_summary()
+        TOKEN_POOL_TOKENS.labels("total").set(summary["total"])
+        TOKEN_POOL_TOKENS.labels("available").set(summary["available"])
+        TOKEN_POOL_TOKENS.labels("unavailable").set(summary["total"] - summary["available"])
+        TOKEN_POOL_IN_FLIGHT.set(summary["in_flight"])
+        TOKEN_POOL_QUEUE_DEPTH.set(summary["queue_depth"])
+
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
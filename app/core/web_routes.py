@@ -1,28 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import time
 from typing import Dict, List, Any
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from app.core.config import settings
 from app.utils.logger import get_logger
+from app.utils.request_log import get_request_log
 
 logger = get_logger()
 router = APIRouter()
 
-# 全局变量存储请求统计和实时请求数据
-request_stats = {
-    "totalRequests": 0,
-    "successfulRequests": 0,
-    "failedRequests": 0,
-    "lastRequestTime": time.time(),
-    "averageResponseTime": 0
-}
-
-live_requests = []
-
 
 def get_index_html() -> str:
     """获取服务首页HTML"""
@@ -1114,54 +1103,13 @@ async def docs():
 @router.get("/dashboard/stats")
 async def dashboard_stats():
     """获取统计数据"""
-    global request_stats
-    return JSONResponse(content=request_stats)
+    return JSONResponse(content=get_request_log().stats())
 
 
 @router.get("/dashboard/requests")
 async def dashboard_requests():
     """获取实时请求数据"""
-    global live_requests
-    return JSONResponse(content=live_requests)
-
-
-def update_request_stats(path: str, status: int, duration: float):
-    """更新请求统计"""
-    global request_stats
-    request_stats["totalRequests"] += 1
-    request_stats["lastRequestTime"] = time.time()
-    
-    if status >= 200 and status < 300:
-        request_stats["successfulRequests"] += 1
-    else:
-        request_stats["failedRequests"] += 1
-    
-    # 更新平均响应时间
-    if request_stats["totalRequests"] > 0:
-        total_duration = request_stats["averageResponseTime"] * (request_stats["totalRequests"] - 1) + duration
-        request_stats["averageResponseTime"] = total_duration / request_stats["totalRequests"]
-
-
-def add_live_request(method: str, path: str, status: int, duration: float, user_agent: str, model: str = None):
-    """添加实时请求记录"""
-    global live_requests
-    
-    request = {
-        "id": str(int(time.time() * 1000)),
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "method": method,
-        "path": path,
-        "status": status,
-        "duration": duration,
-        "user_agent": user_agent,
-        "model": model or "GLM-4.5"
-    }
-    
-    live_requests.append(request)
-    
-    # 只保留最近的100条请求
-    if len(live_requests) > 100:
-        live_requests = live_requests[1:]
+    return JSONResponse(content=[record.to_dict() for record in get_request_log().recent(100)])
 
 
 def get_models_html() -> str:
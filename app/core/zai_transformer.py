@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json
 import time
 import uuid
 import random
@@ -12,6 +11,7 @@ import asyncio
 
 from app.core.config import settings
 from app.utils.logger import get_logger
+from app.utils import json_codec
 from app.utils.token_pool import get_token_pool, initialize_token_pool
 from app.utils.user_agent import get_random_user_agent
 
@@ -143,7 +143,7 @@ class ZAITransformer:
         """初始化转换器"""
         self.name = "zai"
         self.base_url = "https://chat.z.ai"
-        self.api_url = settings.API_ENDPOINT
+        self.api_url = settings.zai_api_endpoint
         self.auth_url = f"{self.base_url}/api/v1/auths/"
 
         # 模型映射
@@ -447,7 +447,7 @@ class ZAITransformer:
                     continue
 
                 try:
-                    chunk = json.loads(chunk_str)
+                    chunk = json_codec.loads(chunk_str)
 
                     if chunk.get("type") == "chat:completion":
                         data = chunk.get("data", {})
@@ -481,7 +481,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(role_chunk)}\n\n"
+                                    yield json_codec.sse_data(role_chunk)
 
                             # 处理工具调用块
                             tool_call_id = data.get("tool_call", {}).get("id", "")
@@ -509,7 +509,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(close_chunk)}\n\n"
+                                    yield json_codec.sse_data(close_chunk)
                                     content_index += 1
 
                                 tool_id = tool_call_id
@@ -539,7 +539,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(new_tool_chunk)}\n\n"
+                                    yield json_codec.sse_data(new_tool_chunk)
 
                             # 处理参数增量
                             if delta_args:
@@ -565,7 +565,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(args_chunk)}\n\n"
+                                    yield json_codec.sse_data(args_chunk)
 
                         elif phase == "thinking":
                             # 处理思考内容
@@ -590,7 +590,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(role_chunk)}\n\n"
+                                    yield json_codec.sse_data(role_chunk)
 
                             delta_content = data.get("delta_content", "")
                             if delta_content:
@@ -618,7 +618,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(thinking_chunk)}\n\n"
+                                    yield json_codec.sse_data(thinking_chunk)
                                 else:
                                     result["choices"][0]["message"]["thinking"]["content"] += content
 
@@ -650,7 +650,7 @@ class ZAITransformer:
                                             "model": current_model,
                                             "object": "chat.completion.chunk",
                                         }
-                                        yield f"data: {json.dumps(sig_chunk)}\n\n"
+                                        yield json_codec.sse_data(sig_chunk)
                                         content_index += 1
                                     else:
                                         result["choices"][0]["message"]["thinking"]["signature"] = signature
@@ -672,7 +672,7 @@ class ZAITransformer:
                                             "model": current_model,
                                             "object": "chat.completion.chunk",
                                         }
-                                        yield f"data: {json.dumps(content_chunk)}\n\n"
+                                        yield json_codec.sse_data(content_chunk)
                                     else:
                                         result["choices"][0]["message"]["content"] += content_after
 
@@ -694,7 +694,7 @@ class ZAITransformer:
                                             "model": current_model,
                                             "object": "chat.completion.chunk",
                                         }
-                                        yield f"data: {json.dumps(role_chunk)}\n\n"
+                                        yield json_codec.sse_data(role_chunk)
 
                                     content_chunk = {
                                         "choices": [
@@ -709,7 +709,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(content_chunk)}\n\n"
+                                    yield json_codec.sse_data(content_chunk)
                                 else:
                                     result["choices"][0]["message"]["content"] += delta_content
 
@@ -731,7 +731,7 @@ class ZAITransformer:
                                         "model": current_model,
                                         "object": "chat.completion.chunk",
                                     }
-                                    yield f"data: {json.dumps(finish_chunk)}\n\n"
+                                    yield json_codec.sse_data(finish_chunk)
                                     yield "data: [DONE]\n\n"
                                 else:
                                     result["id"] = current_id
@@ -764,14 +764,14 @@ class ZAITransformer:
                                             "model": current_model,
                                             "object": "chat.completion.chunk",
                                         }
-                                        yield f"data: {json.dumps(close_chunk)}\n\n"
+                                        yield json_codec.sse_data(close_chunk)
                                         yield "data: [DONE]\n\n"
 
-                except json.JSONDecodeError as e:
+                except json_codec.JSONDecodeError as e:
                     logger.debug(f"JSON解析错误: {e}")
                 except Exception as e:
                     logger.error(f"处理chunk错误: {e}")
 
         # 非流式模式返回完整结果
         if not is_stream:
-            yield json.dumps(result)
+            yield json_codec.dumps(result)
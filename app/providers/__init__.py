@@ -10,7 +10,14 @@ from app.providers.base import BaseProvider, ProviderConfig, provider_registry
 from app.providers.zai_provider import ZAIProvider
 from app.providers.k2think_provider import K2ThinkProvider
 from app.providers.longcat_provider import LongCatProvider
-from app.providers.provider_factory import ProviderFactory, ProviderRouter, get_provider_router, initialize_providers
+from app.providers.provider_factory import (
+    ProviderFactory,
+    ProviderRouter,
+    get_provider_router,
+    initialize_providers,
+    start_providers,
+    shutdown_providers,
+)
 
 __all__ = [
     "BaseProvider",
@@ -22,5 +29,7 @@ __all__ = [
     "ProviderFactory",
     "ProviderRouter",
     "get_provider_router",
-    "initialize_providers"
+    "initialize_providers",
+    "start_providers",
+    "shutdown_providers"
 ]
@@ -6,14 +6,19 @@
 定义统一的提供商接口规范
 """
 
-import json
 import time
 import uuid
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional, AsyncGenerator, Union
 from dataclasses import dataclass
 
+import httpx
+
 from app.models.schemas import OpenAIRequest, Message
+from app.core.config import settings
+from app.utils.chunk_encoder import OpenAIChunkEncoder
+from app.utils.http_client import HttpClientConfig, get_http_client
+from app.utils import json_codec
 from app.utils.logger import get_logger
 
 logger = get_logger()
@@ -27,6 +32,11 @@ class ProviderConfig:
     timeout: int = 30
     headers: Optional[Dict[str, str]] = None
     extra_config: Optional[Dict[str, Any]] = None
+    # 连接池配置，未设置时使用全局 HTTP_* 配置
+    max_connections: Optional[int] = None
+    max_keepalive_connections: Optional[int] = None
+    keepalive_expiry: Optional[float] = None
+    http2: Optional[bool] = None
 
 
 @dataclass
@@ -47,6 +57,7 @@ class BaseProvider(ABC):
         self.config = config
         self.name = config.name
         self.logger = get_logger()
+        self._http_client_config: Optional[HttpClientConfig] = None
         
     @abstractmethod
     async def chat_completion(
@@ -101,6 +112,25 @@ class BaseProvider(ABC):
     def get_supported_models(self) -> List[str]:
         """获取支持的模型列表"""
         return []
+
+    async def startup(self):  # noqa: B027 可选钩子，子类按需覆盖
+        """可选的启动钩子：应用启动时调用，用于启动后台任务（预热池等），默认什么也不做"""
+
+    async def shutdown(self):  # noqa: B027 可选钩子，子类按需覆盖
+        """可选的关闭钩子：应用关闭时调用，用于停止后台任务，默认什么也不做"""
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """获取该提供商的共享长连接客户端（由应用 lifespan 统一关闭）"""
+        if self._http_client_config is None:
+            config = self.config
+            self._http_client_config = HttpClientConfig(
+                timeout=config.timeout,
+                max_connections=config.max_connections or settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.max_keepalive_connections or settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.keepalive_expiry or settings.HTTP_KEEPALIVE_EXPIRY,
+                http2=settings.HTTP2_ENABLED if config.http2 is None else config.http2,
+            )
+        return get_http_client(self.name, self._http_client_config)
     
     def create_chat_id(self) -> str:
         """生成聊天ID"""
@@ -127,6 +157,10 @@ class BaseProvider(ABC):
             }],
             "system_fingerprint": f"fp_{self.name}_001",
         }
+
+    def create_chunk_encoder(self, chat_id: str, model: str) -> OpenAIChunkEncoder:
+        """创建流式响应块编码器（输出与 create_openai_chunk + format_sse_chunk 一致，逐 token 开销更低）"""
+        return OpenAIChunkEncoder(chat_id, model, f"fp_{self.name}_001")
     
     def create_openai_response(
         self, 
@@ -197,7 +231,7 @@ class BaseProvider(ABC):
 
     async def format_sse_chunk(self, chunk: Dict[str, Any]) -> str:
         """格式化SSE响应块"""
-        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        return json_codec.sse_data(chunk)
     
     async def format_sse_done(self) -> str:
         """格式化SSE结束标记"""
@@ -5,27 +5,213 @@
 K2Think 提供商适配器
 """
 
-import json
 import re
 import time
 import uuid
+import asyncio
 import httpx
-from typing import Dict, List, Any, Optional, AsyncGenerator, Union
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Any, Optional, AsyncGenerator, Tuple, Union
 
 from app.providers.base import BaseProvider, ProviderConfig
 from app.models.schemas import OpenAIRequest, Message
-from app.utils.logger import get_logger
+from app.core.config import settings
+from app.utils.logger import chunk_log_enabled, get_logger
+from app.utils.sse_parser import iter_sse_events
+from app.utils import json_codec
 
 logger = get_logger()
 
 
+@dataclass
+class K2GuestSession:
+    """K2Think 握手得到的访客会话Cookie"""
+    cookies: str
+    expires_at: float
+    invalidated: bool = False
+
+
+@dataclass
+class K2Conversation:
+    """已创建（可能是预建）的 K2Think 对话"""
+    conversation_id: str
+    cookie: str
+    model_id: str
+    session: K2GuestSession
+    expires_at: float
+
+
+class K2StreamParser:
+    """
+    K2Think 流式内容的增量解析器（标签感知的状态机）
+
+    上游每个数据块携带截至目前的完整内容，解析器只消费新追加的部分，
+    直接产出 reasoning_content / content 增量，避免每块都对全文跑正则再做差分。
+    输出与 extract_reasoning_and_answer 的结果一致（含首尾空白裁剪）。
+    """
+
+    REASONING_OPEN = '<details type="reasoning"'
+    SUMMARY_CLOSE = '</summary>'
+    REASONING_CLOSE = '</details>'
+    ANSWER_OPEN = '<answer>'
+    ANSWER_CLOSE = '</answer>'
+
+    # 解析状态
+    SEEK = 0               # 寻找推理块或答案块的起始标签
+    REASONING_HEADER = 1   # 已进入推理块，跳过 <summary> 部分
+    REASONING = 2          # 推理内容
+    ANSWER = 3             # 答案内容
+    DONE = 4               # 答案结束，忽略后续内容
+
+    # 用于判断新内容是否是前一次内容的延续
+    _TAIL_SIZE = 32
+
+    def __init__(self):
+        self.state = self.SEEK
+        self.reasoning_done = False
+        self._buffer = ""
+        self._section_started = False
+        self._pending_ws = ""
+        self._received = 0
+        self._tail = ""
+
+    def feed_content(self, content: str) -> List[Tuple[str, str]]:
+        """
+        输入上游的一个内容块（累计全文），返回 [(字段名, 增量文本)]
+
+        若内容不是上一块的延续（例如上游改为只发增量），则整体按新增文本处理。
+        """
+        received = self._received
+        if (received and len(content) >= received
+                and content.startswith(self._tail, received - len(self._tail))):
+            appended = content[received:]
+        else:
+            appended = content
+        self._received = len(content)
+        self._tail = content[-self._TAIL_SIZE:]
+        return self.feed(appended)
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """输入新追加的文本，返回 [(字段名, 增量文本)]"""
+        out: List[Tuple[str, str]] = []
+        if not text or self.state == self.DONE:
+            return out
+
+        self._buffer += text
+        while True:
+            buf = self._buffer
+            state = self.state
+
+            if state == self.SEEK:
+                answer_idx = buf.find(self.ANSWER_OPEN)
+                reasoning_idx = -1 if self.reasoning_done else buf.find(self.REASONING_OPEN)
+
+                if reasoning_idx != -1 and (answer_idx == -1 or reasoning_idx < answer_idx):
+                    tag_end = buf.find('>', reasoning_idx + len(self.REASONING_OPEN))
+                    if tag_end == -1:
+                        self._buffer = buf[reasoning_idx:]
+                        break
+                    self._buffer = buf[tag_end + 1:]
+                    self.state = self.REASONING_HEADER
+                elif answer_idx != -1:
+                    self._buffer = buf[answer_idx + len(self.ANSWER_OPEN):]
+                    self._start_section(self.ANSWER)
+                else:
+                    keep = self._partial_tag_len(buf, self.ANSWER_OPEN)
+                    if not self.reasoning_done:
+                        keep = max(keep, self._partial_tag_len(buf, self.REASONING_OPEN))
+                    self._buffer = buf[len(buf) - keep:] if keep else ""
+                    break
+
+            elif state == self.REASONING_HEADER:
+                idx = buf.find(self.SUMMARY_CLOSE)
+                if idx == -1:
+                    keep = self._partial_tag_len(buf, self.SUMMARY_CLOSE)
+                    self._buffer = buf[len(buf) - keep:] if keep else ""
+                    break
+                self._buffer = buf[idx + len(self.SUMMARY_CLOSE):]
+                self._start_section(self.REASONING)
+
+            elif state == self.REASONING or state == self.ANSWER:
+                if state == self.REASONING:
+                    field, close_tag = "reasoning_content", self.REASONING_CLOSE
+                else:
+                    field, close_tag = "content", self.ANSWER_CLOSE
+
+                idx = buf.find(close_tag)
+                if idx == -1:
+                    # 末尾可能是被截断的结束标签，先保留
+                    keep = self._partial_tag_len(buf, close_tag)
+                    self._emit(out, field, buf[:len(buf) - keep])
+                    self._buffer = buf[len(buf) - keep:] if keep else ""
+                    break
+
+                self._emit(out, field, buf[:idx])
+                self._buffer = buf[idx + len(close_tag):]
+                if state == self.REASONING:
+                    self.reasoning_done = True
+                    self.state = self.SEEK
+                else:
+                    self.state = self.DONE
+                    self._buffer = ""
+                    break
+
+            else:
+                self._buffer = ""
+                break
+
+        return out
+
+    def _start_section(self, state: int):
+        """进入新的内容段"""
+        self.state = state
+        self._section_started = False
+        self._pending_ws = ""
+
+    def _emit(self, out: List[Tuple[str, str]], field: str, text: str):
+        """输出内容段文本：去掉段首空白，段尾空白暂存到确认后面还有内容时再输出"""
+        if not text:
+            return
+        if not self._section_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._section_started = True
+
+        stripped = text.rstrip()
+        if not stripped:
+            self._pending_ws += text
+            return
+
+        piece = self._pending_ws + stripped if self._pending_ws else stripped
+        self._pending_ws = text[len(stripped):]
+        if out and out[-1][0] == field:
+            out[-1] = (field, out[-1][1] + piece)
+        else:
+            out.append((field, piece))
+
+    @staticmethod
+    def _partial_tag_len(buf: str, tag: str) -> int:
+        """buf 末尾可能构成 tag 前缀的长度"""
+        start = buf.rfind('<', max(0, len(buf) - len(tag) + 1))
+        if start != -1 and tag.startswith(buf[start:]):
+            return len(buf) - start
+        return 0
+
+
 class K2ThinkProvider(BaseProvider):
     """K2Think 提供商"""
+
+    # 预建对话时使用的占位首条消息，真实消息在补全请求中发送；
+    # 它会作为真实消息发送到上游，因此预建对话默认关闭（K2THINK_WARM_CONVERSATIONS=0）
+    WARM_PLACEHOLDER = "Hello"
     
     def __init__(self):
         config = ProviderConfig(
             name="k2think",
-            api_endpoint="https://www.k2think.ai/api/guest/chat/completions",
+            api_endpoint=f"{settings.K2THINK_BASE_URL}/api/guest/chat/completions",
             timeout=30,
             headers={
                 'Accept': 'text/event-stream',
@@ -47,8 +233,15 @@ class K2ThinkProvider(BaseProvider):
         super().__init__(config)
 
         # K2Think 特定配置
-        self.handshake_url = "https://www.k2think.ai/guest"
-        self.new_chat_url = "https://www.k2think.ai/api/v1/chats/guest/new"
+        self.handshake_url = f"{settings.K2THINK_BASE_URL}/guest"
+        self.new_chat_url = f"{settings.K2THINK_BASE_URL}/api/v1/chats/guest/new"
+
+        # 握手Cookie缓存与预建对话池
+        self._session: Optional[K2GuestSession] = None
+        self._session_lock: Optional[asyncio.Lock] = None
+        self._warm_conversations: Deque[K2Conversation] = deque()
+        self._warm_event: Optional[asyncio.Event] = None
+        self._warm_task: Optional[asyncio.Task] = None
         
         # 内容解析正则表达式 - 使用DOTALL标志确保.匹配换行符
         self.reasoning_pattern = re.compile(r'<details type="reasoning"[^>]*>.*?<summary>.*?</summary>(.*?)</details>', re.DOTALL)
@@ -61,10 +254,36 @@ class K2ThinkProvider(BaseProvider):
     def parse_cookies(self, headers) -> str:
         """解析Cookie"""
         cookies = []
-        for key, value in headers.items():
+        # httpx.Headers.items() 会把多个 Set-Cookie 合并成一个值，需要用 multi_items()
+        items = headers.multi_items() if hasattr(headers, "multi_items") else headers.items()
+        for key, value in items:
             if key.lower() == 'set-cookie':
                 cookies.append(value.split(';')[0])
         return '; '.join(cookies)
+
+    def parse_cookie_expiry(self, headers) -> Optional[float]:
+        """解析 Set-Cookie 中最早的过期时间（Max-Age / Expires），没有则返回 None"""
+        expiry = None
+        items = headers.multi_items() if hasattr(headers, "multi_items") else headers.items()
+        for key, value in items:
+            if key.lower() != 'set-cookie':
+                continue
+            max_age = None
+            expires = None
+            for attr in value.split(';')[1:]:
+                name, _, attr_value = attr.strip().partition('=')
+                name = name.lower()
+                try:
+                    if name == 'max-age':
+                        max_age = time.time() + int(attr_value)
+                    elif name == 'expires':
+                        expires = parsedate_to_datetime(attr_value).timestamp()
+                except (ValueError, TypeError):
+                    continue
+            cookie_expiry = max_age if max_age is not None else expires
+            if cookie_expiry is not None:
+                expiry = cookie_expiry if expiry is None else min(expiry, cookie_expiry)
+        return expiry
     
     def extract_reasoning_and_answer(self, content: str) -> tuple[str, str]:
         """提取推理内容和答案内容"""
@@ -110,39 +329,72 @@ class K2ThinkProvider(BaseProvider):
         
         return "", False
     
-    async def get_k2_auth_data(self, request: OpenAIRequest) -> Dict[str, Any]:
-        """获取K2Think认证数据"""
-        # 1. 握手请求 - 使用更简单的Accept-Encoding来避免Brotli问题
+    def _is_session_valid(self, session: Optional[K2GuestSession]) -> bool:
+        """检查握手会话是否仍然有效"""
+        return session is not None and not session.invalidated and session.expires_at > time.time()
+
+    async def _get_guest_session(self) -> K2GuestSession:
+        """获取握手会话，缓存的Cookie在有效期内直接复用"""
+        if self._is_session_valid(self._session):
+            return self._session
+
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+        async with self._session_lock:
+            # 等锁期间可能已被其他请求刷新
+            if self._is_session_valid(self._session):
+                return self._session
+            self._session = await self._handshake()
+            return self._session
+
+    async def _handshake(self) -> K2GuestSession:
+        """握手请求，获取访客Cookie"""
+        # 使用更简单的Accept-Encoding来避免Brotli问题
         headers_for_handshake = {**self.config.headers}
         headers_for_handshake['Accept-Encoding'] = 'gzip, deflate'  # 移除br和zstd
 
-        async with httpx.AsyncClient() as client:
-            handshake_response = await client.get(
-                self.handshake_url,
-                headers=headers_for_handshake,
-                follow_redirects=True
-            )
-            if not handshake_response.is_success:
-                try:
-                    # 使用httpx的text属性，它会自动处理解压缩和编码
-                    error_text = handshake_response.text
-                    raise Exception(f"K2 握手失败: {handshake_response.status_code} {error_text[:200]}")
-                except Exception as e:
-                    raise Exception(f"K2 握手失败: {handshake_response.status_code}")
-            
-            initial_cookies = self.parse_cookies(handshake_response.headers)
-        
-        # 2. 准备消息
-        prepared_messages = self.prepare_k2_messages(request.messages)
-        first_user_message = next((m for m in prepared_messages if m["role"] == "user"), None)
-        if not first_user_message:
-            raise Exception("没有找到用户消息来初始化对话")
-        
-        # 3. 创建新对话
+        client = self.get_http_client()
+        handshake_response = await client.get(
+            self.handshake_url,
+            headers=headers_for_handshake,
+            follow_redirects=True
+        )
+        if not handshake_response.is_success:
+            try:
+                # 使用httpx的text属性，它会自动处理解压缩和编码
+                error_text = handshake_response.text
+                raise Exception(f"K2 握手失败: {handshake_response.status_code} {error_text[:200]}")
+            except Exception as e:
+                raise Exception(f"K2 握手失败: {handshake_response.status_code}")
+
+        expires_at = self.parse_cookie_expiry(handshake_response.headers)
+        if expires_at is None:
+            expires_at = time.time() + settings.K2THINK_SESSION_TTL
+
+        self.logger.debug(f"🤝 K2 握手完成，Cookie 有效期 {int(expires_at - time.time())} 秒")
+        return K2GuestSession(
+            cookies=self.parse_cookies(handshake_response.headers),
+            expires_at=expires_at
+        )
+
+    def invalidate_session(self, session: Optional[K2GuestSession]):
+        """淘汰被上游拒绝的握手会话，基于该会话预建的对话随之失效"""
+        if session is None or session.invalidated:
+            return
+        session.invalidated = True
+        if self._session is session:
+            self._session = None
+        self._warm_conversations = deque(
+            c for c in self._warm_conversations if c.session is not session
+        )
+        self.logger.warning("🚫 K2 访客会话被拒绝，已淘汰缓存的Cookie")
+        self._request_warm_refill()
+
+    async def _create_conversation(self, session: K2GuestSession, content: str, model_id: str) -> K2Conversation:
+        """调用 /new 创建新对话"""
         message_id = str(uuid.uuid4())
         now = int(time.time() * 1000)
-        model_id = request.model or "MBZUAI-IFM/K2-Think"
-        
+
         new_chat_payload = {
             "chat": {
                 "id": "",
@@ -156,7 +408,7 @@ class K2ThinkProvider(BaseProvider):
                             "parentId": None,
                             "childrenIds": [],
                             "role": "user",
-                            "content": first_user_message["content"],
+                            "content": content,
                             "timestamp": now // 1000,
                             "models": [model_id]
                         }
@@ -168,7 +420,7 @@ class K2ThinkProvider(BaseProvider):
                     "parentId": None,
                     "childrenIds": [],
                     "role": "user",
-                    "content": first_user_message["content"],
+                    "content": content,
                     "timestamp": now // 1000,
                     "models": [model_id]
                 }],
@@ -176,75 +428,159 @@ class K2ThinkProvider(BaseProvider):
                 "timestamp": now
             }
         }
-        
-        headers_with_cookies = {**self.config.headers, 'Cookie': initial_cookies}
+
+        headers_with_cookies = {**self.config.headers, 'Cookie': session.cookies}
         headers_with_cookies['Accept-Encoding'] = 'gzip, deflate'  # 移除br和zstd
 
-        async with httpx.AsyncClient() as client:
-            new_chat_response = await client.post(
-                self.new_chat_url,
-                headers=headers_with_cookies,
-                json=new_chat_payload,
-                follow_redirects=True
-            )
-            if not new_chat_response.is_success:
-                try:
-                    # 使用httpx的text属性，它会自动处理解压缩和编码
-                    error_text = new_chat_response.text
-                except Exception:
-                    error_text = f"Status: {new_chat_response.status_code}"
-                raise Exception(f"K2 新对话创建失败: {new_chat_response.status_code} {error_text[:200]}")
+        client = self.get_http_client()
+        new_chat_response = await client.post(
+            self.new_chat_url,
+            headers=headers_with_cookies,
+            json=new_chat_payload,
+            follow_redirects=True
+        )
+        if new_chat_response.status_code in (401, 403):
+            self.invalidate_session(session)
+        if not new_chat_response.is_success:
+            try:
+                # 使用httpx的text属性，它会自动处理解压缩和编码
+                error_text = new_chat_response.text
+            except Exception:
+                error_text = f"Status: {new_chat_response.status_code}"
+            raise Exception(f"K2 新对话创建失败: {new_chat_response.status_code} {error_text[:200]}")
 
+        try:
+            new_chat_data = new_chat_response.json()
+        except Exception as e:
+            # 如果JSON解析失败，尝试获取原始内容
             try:
-                new_chat_data = new_chat_response.json()
-            except Exception as e:
-                # 如果JSON解析失败，尝试获取原始内容
+                # 使用httpx的text属性，它会自动处理解压缩和编码
+                content_str = new_chat_response.text
+                self.logger.debug(f"K2 响应原始内容: {content_str[:500]}")
+                raise Exception(f"K2 响应JSON解析失败: {e}, 原始内容: {content_str[:200]}")
+            except Exception as decode_error:
+                # 如果text也失败，尝试手动处理
                 try:
-                    # 使用httpx的text属性，它会自动处理解压缩和编码
-                    content_str = new_chat_response.text
-                    self.logger.debug(f"K2 响应原始内容: {content_str[:500]}")
-                    raise Exception(f"K2 响应JSON解析失败: {e}, 原始内容: {content_str[:200]}")
-                except Exception as decode_error:
-                    # 如果text也失败，尝试手动处理
-                    try:
-                        raw_bytes = new_chat_response.content
-                        content_str = raw_bytes.decode('utf-8', errors='replace')
-                        raise Exception(f"K2 响应解析失败: {e}, 手动解码内容: {content_str[:200]}")
-                    except Exception:
-                        raise Exception(f"K2 响应解析完全失败: {e}, 解码错误: {decode_error}")
-            conversation_id = new_chat_data.get("id")
-            if not conversation_id:
-                raise Exception("无法从K2 /new端点获取conversation_id")
-            
-            chat_specific_cookies = self.parse_cookies(new_chat_response.headers)
-        
-        # 4. 组合最终Cookie
-        base_cookies = [initial_cookies, chat_specific_cookies]
+                    raw_bytes = new_chat_response.content
+                    content_str = raw_bytes.decode('utf-8', errors='replace')
+                    raise Exception(f"K2 响应解析失败: {e}, 手动解码内容: {content_str[:200]}")
+                except Exception:
+                    raise Exception(f"K2 响应解析完全失败: {e}, 解码错误: {decode_error}")
+        conversation_id = new_chat_data.get("id")
+        if not conversation_id:
+            raise Exception("无法从K2 /new端点获取conversation_id")
+
+        # 组合最终Cookie
+        chat_specific_cookies = self.parse_cookies(new_chat_response.headers)
+        base_cookies = [session.cookies, chat_specific_cookies]
         base_cookies = [c for c in base_cookies if c]
         final_cookie = '; '.join(base_cookies) + '; guest_conversation_count=1'
-        
-        # 5. 构建最终请求载荷
+
+        return K2Conversation(
+            conversation_id=conversation_id,
+            cookie=final_cookie,
+            model_id=model_id,
+            session=session,
+            expires_at=min(session.expires_at, time.time() + settings.K2THINK_CONVERSATION_TTL)
+        )
+
+    def _take_warm_conversation(self, model_id: str) -> Optional[K2Conversation]:
+        """从预建池中取出一个仍然有效的对话"""
+        now = time.time()
+        taken = None
+        while self._warm_conversations:
+            conversation = self._warm_conversations.popleft()
+            if (conversation.session.invalidated or conversation.expires_at <= now
+                    or conversation.model_id != model_id):
+                continue
+            taken = conversation
+            break
+        self._request_warm_refill()
+        return taken
+
+    def _request_warm_refill(self):
+        """唤醒预建对话的后台补充任务"""
+        if self._warm_event is not None:
+            self._warm_event.set()
+
+    async def _warm_loop(self):
+        """后台保持一小批预建对话"""
+        backoff = 1.0
+        while True:
+            await self._warm_event.wait()
+            self._warm_event.clear()
+
+            while len(self._warm_conversations) < settings.K2THINK_WARM_CONVERSATIONS:
+                try:
+                    session = await self._get_guest_session()
+                    conversation = await self._create_conversation(
+                        session, self.WARM_PLACEHOLDER, self.get_supported_models()[0]
+                    )
+                    self._warm_conversations.append(conversation)
+                    backoff = 1.0
+                except Exception as e:
+                    self.logger.warning(f"⚠️ K2 预建对话失败: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+
+    async def startup(self):
+        """启动预建对话池"""
+        if settings.K2THINK_WARM_CONVERSATIONS > 0 and self._warm_task is None:
+            self._warm_event = asyncio.Event()
+            self._warm_event.set()
+            self._warm_task = asyncio.create_task(self._warm_loop())
+
+    async def shutdown(self):
+        """停止预建对话池"""
+        task = self._warm_task
+        self._warm_task = None
+        self._warm_event = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def get_k2_auth_data(self, request: OpenAIRequest) -> Dict[str, Any]:
+        """获取K2Think认证数据"""
+        # 1. 准备消息
+        prepared_messages = self.prepare_k2_messages(request.messages)
+        first_user_message = next((m for m in prepared_messages if m["role"] == "user"), None)
+        if not first_user_message:
+            raise Exception("没有找到用户消息来初始化对话")
+
+        model_id = request.model or "MBZUAI-IFM/K2-Think"
+
+        # 2. 优先使用预建对话，否则复用缓存的握手Cookie创建新对话
+        conversation = self._take_warm_conversation(model_id)
+        if conversation is None:
+            session = await self._get_guest_session()
+            conversation = await self._create_conversation(session, first_user_message["content"], model_id)
+
+        # 3. 构建最终请求载荷
         final_payload = {
             "stream": True,
             "model": model_id,
             "messages": prepared_messages,
-            "conversation_id": conversation_id,
+            "conversation_id": conversation.conversation_id,
             "params": {}
         }
-        
+
         # 添加可选参数
         if request.temperature is not None:
             final_payload["params"]["temperature"] = request.temperature
         if request.max_tokens is not None:
             final_payload["params"]["max_tokens"] = request.max_tokens
-        
-        final_headers = {**self.config.headers, 'Cookie': final_cookie}
-        
+
+        final_headers = {**self.config.headers, 'Cookie': conversation.cookie}
+
         return {
             "payload": final_payload,
-            "headers": final_headers
+            "headers": final_headers,
+            "session": conversation.session
         }
-    
+
     def prepare_k2_messages(self, messages: List[Message]) -> List[Dict[str, Any]]:
         """准备K2Think消息格式"""
         result = []
@@ -290,106 +626,80 @@ class K2ThinkProvider(BaseProvider):
 
         self.logger.info(f"🌊 开始K2Think流式请求")
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            async with client.stream(
-                "POST",
-                transformed["url"],
-                headers=headers_for_request,
-                json=transformed["payload"]
-            ) as response:
-                if not response.is_success:
-                    error_msg = f"K2Think API 错误: {response.status_code}"
-                    self.log_response(False, error_msg)
-                    # 对于流式响应，我们需要yield错误信息
-                    yield await self.format_sse_chunk({
-                        "error": {
-                            "message": error_msg,
-                            "type": "provider_error",
-                            "code": "api_error"
-                        }
-                    })
-                    return
+        client = self.get_http_client()
+        async with client.stream(
+            "POST",
+            transformed["url"],
+            headers=headers_for_request,
+            json=transformed["payload"]
+        ) as response:
+            if not response.is_success:
+                error_msg = f"K2Think API 错误: {response.status_code}"
+                self.log_response(False, error_msg)
+                if response.status_code in (401, 403):
+                    self.invalidate_session(transformed.get("session"))
+                # 对于流式响应，我们需要yield错误信息
+                yield await self.format_sse_chunk({
+                    "error": {
+                        "message": error_msg,
+                        "type": "provider_error",
+                        "code": "api_error"
+                    }
+                })
+                return
 
-                # 发送初始角色块
-                yield await self.format_sse_chunk(
-                    self.create_openai_chunk(chat_id, model, {"role": "assistant"})
-                )
+            encoder = self.create_chunk_encoder(chat_id, model)
+            # 角色块在第一个增量之前发送，上游在输出内容之前失败时错误块是流的第一个数据块
+            role_sent = False
 
-                # 处理流式数据
-                accumulated_content = ""
-                previous_reasoning = ""
-                previous_answer = ""
-                reasoning_phase = True
-                chunk_count = 0
+            # 处理流式数据 - 增量解析器只处理新增的内容，整体为线性复杂度
+            parser = K2StreamParser()
+            chunk_count = 0
 
-                try:
-                    async for line in response.aiter_lines():
-                        chunk_count += 1
-                        self.logger.debug(f"📦 收到数据块 #{chunk_count}: {line[:100]}...")
-
-                        if not line.startswith("data:"):
-                            continue
-
-                        data_str = line[5:].strip()
-                        if self._is_end_marker(data_str):
-                            self.logger.debug(f"🏁 检测到结束标记: {data_str}")
-                            continue
-
-                        content = self._parse_data_string(data_str)
-                        if not content:
-                            continue
-
-                        accumulated_content = content
-                        current_reasoning, current_answer = self.extract_reasoning_and_answer(accumulated_content)
-
-                        # 处理推理阶段
-                        if reasoning_phase and current_reasoning:
-                            delta = self.calculate_delta(previous_reasoning, current_reasoning)
-                            if delta.strip():
-                                self.logger.debug(f"🧠 推理增量: {delta[:50]}...")
-                                yield await self.format_sse_chunk(
-                                    self.create_openai_chunk(chat_id, model, {"reasoning_content": delta})
-                                )
-                                previous_reasoning = current_reasoning
-
-                        # 切换到答案阶段
-                        if current_answer and reasoning_phase:
-                            reasoning_phase = False
-                            self.logger.debug("🔄 切换到答案阶段")
-                            # 发送剩余的推理内容
-                            final_reasoning_delta = self.calculate_delta(previous_reasoning, current_reasoning)
-                            if final_reasoning_delta.strip():
-                                yield await self.format_sse_chunk(
-                                    self.create_openai_chunk(chat_id, model, {"reasoning_content": final_reasoning_delta})
-                                )
-
-                        # 处理答案阶段
-                        if not reasoning_phase and current_answer:
-                            delta = self.calculate_delta(previous_answer, current_answer)
-                            if delta.strip():
-                                self.logger.debug(f"💬 答案增量: {delta[:50]}...")
-                                yield await self.format_sse_chunk(
-                                    self.create_openai_chunk(chat_id, model, {"content": delta})
-                                )
-                                previous_answer = current_answer
+            try:
+                async for event in iter_sse_events(response, split_data_lines=True):
+                    chunk_count += 1
+                    if event.raw is not None:
+                        continue
+
+                    data_str = event.data.strip()
+                    log_chunk = chunk_log_enabled(chunk_count)
+                    if log_chunk:
+                        self.logger.debug(f"📦 收到数据块 #{chunk_count}: {data_str[:100]}...")
+                    if self._is_end_marker(data_str):
+                        self.logger.debug(f"🏁 检测到结束标记: {data_str}")
+                        continue
+
+                    content = self._parse_data_string(data_str)
+                    if not content:
+                        continue
+
+                    for field, delta in parser.feed_content(content):
+                        if not role_sent:
+                            role_sent = True
+                            # 发送初始角色块
+                            yield encoder.chunk({"role": "assistant"})
+                        if log_chunk:
+                            self.logger.debug(f"{'🧠 推理' if field == 'reasoning_content' else '💬 答案'}增量: {delta[:50]}...")
+                        yield encoder.text(field, delta)
 
-                except Exception as e:
-                    self.logger.error(f"流式响应处理错误: {e}")
-                    yield await self.format_sse_chunk({
-                        "error": {
-                            "message": f"流式处理错误: {str(e)}",
-                            "type": "stream_error",
-                            "code": "processing_error"
-                        }
-                    })
-                    return
+            except Exception as e:
+                self.logger.error(f"流式响应处理错误: {e}")
+                yield await self.format_sse_chunk({
+                    "error": {
+                        "message": f"流式处理错误: {str(e)}",
+                        "type": "stream_error",
+                        "code": "processing_error"
+                    }
+                })
+                return
 
-                # 发送结束块
-                self.logger.info(f"✅ K2Think流式响应完成，共处理 {chunk_count} 个数据块")
-                yield await self.format_sse_chunk(
-                    self.create_openai_chunk(chat_id, model, {}, "stop")
-                )
-                yield await self.format_sse_done()
+            # 发送结束块
+            self.logger.info(f"✅ K2Think流式响应完成，共处理 {chunk_count} 个数据块")
+            if not role_sent:
+                yield encoder.chunk({"role": "assistant"})
+            yield encoder.chunk({}, "stop")
+            yield await self.format_sse_done()
 
     async def transform_request(self, request: OpenAIRequest) -> Dict[str, Any]:
         """转换OpenAI请求为K2Think格式"""
@@ -401,6 +711,7 @@ class K2ThinkProvider(BaseProvider):
             "url": self.config.api_endpoint,
             "headers": auth_data["headers"],
             "payload": auth_data["payload"],
+            "session": auth_data["session"],
             "model": request.model
         }
     
@@ -424,20 +735,22 @@ class K2ThinkProvider(BaseProvider):
                 return self._handle_stream_request(transformed, request)
             else:
                 # 非流式请求 - 使用传统的 client.post()
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        transformed["url"],
-                        headers=headers_for_request,
-                        json=transformed["payload"]
-                    )
+                client = self.get_http_client()
+                response = await client.post(
+                    transformed["url"],
+                    headers=headers_for_request,
+                    json=transformed["payload"]
+                )
 
-                    if not response.is_success:
-                        error_msg = f"K2Think API 错误: {response.status_code}"
-                        self.log_response(False, error_msg)
-                        return self.handle_error(Exception(error_msg))
+                if not response.is_success:
+                    error_msg = f"K2Think API 错误: {response.status_code}"
+                    self.log_response(False, error_msg)
+                    if response.status_code in (401, 403):
+                        self.invalidate_session(transformed.get("session"))
+                    return self.handle_error(Exception(error_msg))
 
-                    # 转换非流式响应
-                    return await self.transform_response(response, request, transformed)
+                # 转换非流式响应
+                return await self.transform_response(response, request, transformed)
 
         except Exception as e:
             self.log_response(False, str(e))
@@ -464,7 +777,7 @@ class K2ThinkProvider(BaseProvider):
     def _parse_data_string(self, data_str: str) -> str:
         """解析数据字符串"""
         try:
-            obj = json.loads(data_str)
+            obj = json_codec.loads(data_str)
             content, is_done = self.parse_api_response(obj)
             return "" if is_done else content
         except:
@@ -477,16 +790,15 @@ class K2ThinkProvider(BaseProvider):
         model: str
     ) -> Dict[str, Any]:
         """处理K2Think非流式响应"""
-        # 聚合流式内容 - 使用httpx的aiter_lines，它会自动处理解压缩
+        # 聚合流式内容 - aiter_bytes() 返回的是已解压的数据
         final_content = ""
 
         try:
-            # 使用aiter_lines()，httpx会自动处理压缩和编码
-            async for line in response.aiter_lines():
-                if not line.startswith("data:"):
+            async for event in iter_sse_events(response, split_data_lines=True):
+                if event.raw is not None:
                     continue
 
-                data_str = line[5:].strip()
+                data_str = event.data.strip()
                 if self._is_end_marker(data_str):
                     continue
 
@@ -5,7 +5,6 @@
 LongCat 提供商适配器
 """
 
-import json
 import time
 import httpx
 import random
@@ -16,6 +15,8 @@ from app.providers.base import BaseProvider, ProviderConfig
 from app.models.schemas import OpenAIRequest, Message
 from app.utils.logger import get_logger
 from app.utils.user_agent import get_dynamic_headers
+from app.utils.sse_parser import iter_sse_events
+from app.utils import json_codec
 from app.core.config import settings
 
 logger = get_logger()
@@ -28,7 +29,7 @@ class LongCatProvider(BaseProvider):
         # 使用动态生成的 headers，不包含 User-Agent（将在请求时动态生成）
         config = ProviderConfig(
             name="longcat",
-            api_endpoint="https://longcat.chat/api/v1/chat-completion",
+            api_endpoint=f"{settings.LONGCAT_BASE_URL}/api/v1/chat-completion",
             timeout=30,
             headers={
                 'accept': 'text/event-stream,application/json',
@@ -38,7 +39,7 @@ class LongCatProvider(BaseProvider):
             }
         )
         super().__init__(config)
-        self.base_url = "https://longcat.chat"
+        self.base_url = settings.LONGCAT_BASE_URL
         self.session_create_url = f"{self.base_url}/api/v1/session-create"
         self.session_delete_url = f"{self.base_url}/api/v1/session-delete"
     
@@ -81,21 +82,21 @@ class LongCatProvider(BaseProvider):
         headers = self.create_headers_with_auth(token, user_agent)
         data = {"model": "", "agentId": ""}
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.session_create_url,
-                headers=headers,
-                json=data
-            )
+        client = self.get_http_client()
+        response = await client.post(
+            self.session_create_url,
+            headers=headers,
+            json=data
+        )
 
-            if response.status_code != 200:
-                raise Exception(f"会话创建失败: {response.status_code}")
+        if response.status_code != 200:
+            raise Exception(f"会话创建失败: {response.status_code}")
 
-            response_data = response.json()
-            if response_data.get("code") != 0:
-                raise Exception(f"会话创建错误: {response_data.get('message')}")
+        response_data = response.json()
+        if response_data.get("code") != 0:
+            raise Exception(f"会话创建错误: {response_data.get('message')}")
 
-            return response_data["data"]["conversationId"]
+        return response_data["data"]["conversationId"]
 
     async def delete_session(self, conversation_id: str, token: str, user_agent: str) -> None:
         """删除会话"""
@@ -106,14 +107,14 @@ class LongCatProvider(BaseProvider):
                 f"{self.base_url}/c/{conversation_id}"
             )
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = f"{self.session_delete_url}?conversationId={conversation_id}"
-                response = await client.get(url, headers=headers)
+            client = self.get_http_client()
+            url = f"{self.session_delete_url}?conversationId={conversation_id}"
+            response = await client.get(url, headers=headers)
 
-                if response.status_code == 200:
-                    self.logger.debug(f"成功删除会话 {conversation_id}")
-                else:
-                    self.logger.warning(f"删除会话失败: {response.status_code}")
+            if response.status_code == 200:
+                self.logger.debug(f"成功删除会话 {conversation_id}")
+            else:
+                self.logger.warning(f"删除会话失败: {response.status_code}")
         except Exception as e:
             self.logger.error(f"删除会话出错: {e}")
 
@@ -191,22 +192,27 @@ class LongCatProvider(BaseProvider):
             # 转换请求
             transformed = await self.transform_request(request)
 
-            # 发送请求
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    transformed["url"],
-                    headers=transformed["headers"],
-                    json=transformed["payload"]
-                )
-
+            if request.stream:
+                # 流式请求：边接收边转发，不等待上游生成完毕
+                return self._create_stream_response(request, transformed)
+
+            # 非流式请求
+            client = self.get_http_client()
+            async with client.stream(
+                "POST",
+                transformed["url"],
+                headers=transformed["headers"],
+                json=transformed["payload"]
+            ) as response:
                 if not response.is_success:
                     error_msg = f"LongCat API 错误: {response.status_code}"
-                    try:
-                        error_detail = await response.atext()
-                        self.logger.error(f"❌ API 错误详情: {error_detail}")
-                    except:
-                        pass
+                    await self._log_error_detail(response)
                     self.log_response(False, error_msg)
+                    self.schedule_session_deletion(
+                        transformed["conversation_id"],
+                        transformed["passport_token"],
+                        transformed["user_agent"]
+                    )
                     return self.handle_error(Exception(error_msg))
 
                 # 转换响应
@@ -217,6 +223,60 @@ class LongCatProvider(BaseProvider):
             self.log_response(False, str(e))
             return self.handle_error(e, "请求处理")
     
+    async def _log_error_detail(self, response: httpx.Response):
+        """记录上游错误响应内容"""
+        try:
+            error_detail = (await response.aread()).decode("utf-8", errors="ignore")
+            if error_detail:
+                self.logger.error(f"❌ API 错误详情: {error_detail[:1000]}")
+        except Exception:
+            pass
+
+    async def _create_stream_response(
+        self,
+        request: OpenAIRequest,
+        transformed: Dict[str, Any]
+    ) -> AsyncGenerator[str, None]:
+        """在 client.stream 上下文内逐块转发 LongCat 流式响应"""
+        conversation_id = transformed["conversation_id"]
+        passport_token = transformed["passport_token"]
+        user_agent = transformed["user_agent"]
+        # 交给 _handle_stream_response 后由其负责会话清理
+        handed_off = False
+
+        try:
+            client = self.get_http_client()
+            async with client.stream(
+                "POST",
+                transformed["url"],
+                headers=transformed["headers"],
+                json=transformed["payload"]
+            ) as response:
+                if not response.is_success:
+                    error_msg = f"LongCat API 错误: {response.status_code}"
+                    await self._log_error_detail(response)
+                    self.log_response(False, error_msg)
+                    yield await self.format_sse_chunk(self.handle_error(Exception(error_msg)))
+                    yield await self.format_sse_done()
+                    return
+
+                stream = await self.transform_response(response, request, transformed)
+                # 内层生成器一旦开始运行，就由其 finally 负责会话清理（包括客户端断开导致的取消）
+                handed_off = True
+                try:
+                    async for chunk in stream:
+                        yield chunk
+                finally:
+                    # 客户端提前断开时也要立即关闭内层生成器，触发其会话清理
+                    await stream.aclose()
+        except Exception as e:
+            self.logger.error(f"❌ LongCat 流式请求异常: {e}")
+            yield await self.format_sse_chunk(self.handle_error(e, "流式请求"))
+            yield await self.format_sse_done()
+        finally:
+            if not handed_off:
+                self.schedule_session_deletion(conversation_id, passport_token, user_agent)
+
     async def transform_response(
         self,
         response: httpx.Response,
@@ -250,23 +310,20 @@ class LongCatProvider(BaseProvider):
     ) -> AsyncGenerator[str, None]:
         """处理LongCat流式响应"""
         session_deleted = False
+        encoder = self.create_chunk_encoder(chat_id, model)
+        # 角色块在收到第一个正常数据后才发送，上游在输出内容之前失败时错误块是流的第一个数据块
+        role_sent = False
+        stream_finished = False
 
         try:
-            # 发送初始角色块
-            yield await self.format_sse_chunk(
-                self.create_openai_chunk(chat_id, model, {"role": "assistant"})
-            )
-
-            stream_finished = False
-
-            async for line in response.aiter_lines():
-                line = line.strip()
 
+            async for event in iter_sse_events(response, split_data_lines=True):
                 # 首先检查是否是错误响应（JSON格式但不是SSE格式）
-                if not line.startswith('data:'):
+                if event.raw is not None:
+                    line = event.raw.strip()
                     # 尝试解析为JSON错误响应
                     try:
-                        error_data = json.loads(line)
+                        error_data = json_codec.loads(line)
                         if isinstance(error_data, dict) and 'code' in error_data and 'message' in error_data:
                             # 这是一个错误响应
                             self.logger.error(f"❌ LongCat API 返回错误: {error_data}")
@@ -286,20 +343,23 @@ class LongCatProvider(BaseProvider):
                                 self.schedule_session_deletion(conversation_id, passport_token, user_agent)
                                 session_deleted = True
                             return
-                    except json.JSONDecodeError:
+                    except json_codec.JSONDecodeError:
                         # 不是JSON，跳过这行
                         continue
 
                     # 如果不是错误响应，跳过
                     continue
 
-                data_str = line[5:].strip()
+                if not role_sent:
+                    role_sent = True
+                    # 发送初始角色块
+                    yield encoder.chunk({"role": "assistant"})
+
+                data_str = event.data.strip()
                 if data_str == '[DONE]':
                     # 如果还没有发送完成块，发送一个
                     if not stream_finished:
-                        yield await self.format_sse_chunk(
-                            self.create_openai_chunk(chat_id, model, {}, "stop")
-                        )
+                        yield encoder.chunk({}, "stop")
                     yield await self.format_sse_done()
 
                     # 清理会话
@@ -309,7 +369,7 @@ class LongCatProvider(BaseProvider):
                     break
 
                 try:
-                    longcat_data = json.loads(data_str)
+                    longcat_data = json_codec.loads(data_str)
 
                     # 获取 delta 内容
                     choices = longcat_data.get("choices", [])
@@ -322,19 +382,12 @@ class LongCatProvider(BaseProvider):
 
                     # 只有当内容不为空时才发送内容块
                     if content is not None and content != "":
-                        openai_chunk = self.create_openai_chunk(
-                            chat_id,
-                            model,
-                            {"content": content}
-                        )
-                        yield await self.format_sse_chunk(openai_chunk)
+                        yield encoder.text("content", content)
 
                     # 检查是否为流的结束
                     # LongCat 使用 lastOne=true 来标识最后一个块
                     if longcat_data.get("lastOne") and not stream_finished:
-                        yield await self.format_sse_chunk(
-                            self.create_openai_chunk(chat_id, model, {}, "stop")
-                        )
+                        yield encoder.chunk({}, "stop")
                         yield await self.format_sse_done()
                         stream_finished = True
 
@@ -346,9 +399,7 @@ class LongCatProvider(BaseProvider):
 
                     # 备用检查：如果有 finishReason 但没有 lastOne，也可能是结束
                     elif finish_reason == "stop" and longcat_data.get("contentStatus") == "FINISHED" and not stream_finished:
-                        yield await self.format_sse_chunk(
-                            self.create_openai_chunk(chat_id, model, {}, "stop")
-                        )
+                        yield encoder.chunk({}, "stop")
                         yield await self.format_sse_done()
                         stream_finished = True
 
@@ -358,7 +409,7 @@ class LongCatProvider(BaseProvider):
                             session_deleted = True
                         break
 
-                except json.JSONDecodeError as e:
+                except json_codec.JSONDecodeError as e:
                     self.logger.error(f"❌ 解析LongCat流数据错误: {e}")
                     continue
                 except Exception as e:
@@ -367,11 +418,13 @@ class LongCatProvider(BaseProvider):
 
         except Exception as e:
             self.logger.error(f"❌ LongCat流处理错误: {e}")
+            if not role_sent:
+                # 还没有输出任何内容，返回错误块
+                yield await self.format_sse_chunk(self.handle_error(e, "流式响应"))
+                yield await self.format_sse_done()
             # 发送错误结束块（只有在还没有结束的情况下）
-            if not stream_finished:
-                yield await self.format_sse_chunk(
-                    self.create_openai_chunk(chat_id, model, {}, "stop")
-                )
+            elif not stream_finished:
+                yield encoder.chunk({}, "stop")
                 yield await self.format_sse_done()
         finally:
             # 确保会话被清理
@@ -396,12 +449,12 @@ class LongCatProvider(BaseProvider):
         }
 
         try:
-            async for line in response.aiter_lines():
-                line = line.strip()
-                if not line.startswith('data:'):
+            async for event in iter_sse_events(response, split_data_lines=True):
+                if event.raw is not None:
+                    line = event.raw.strip()
                     # 检查是否是错误响应
                     try:
-                        error_data = json.loads(line)
+                        error_data = json_codec.loads(line)
                         if isinstance(error_data, dict) and 'code' in error_data and 'message' in error_data:
                             # 这是一个错误响应
                             self.logger.error(f"❌ LongCat API 返回错误: {error_data}")
@@ -415,17 +468,17 @@ class LongCatProvider(BaseProvider):
                             self.schedule_session_deletion(conversation_id, passport_token, user_agent)
 
                             return self.handle_error(error_exception, "API响应")
-                    except json.JSONDecodeError:
+                    except json_codec.JSONDecodeError:
                         # 不是JSON，跳过这行
                         pass
                     continue
 
-                data_str = line[5:].strip()
+                data_str = event.data.strip()
                 if data_str == '[DONE]':
                     break
 
                 try:
-                    chunk = json.loads(data_str)
+                    chunk = json_codec.loads(data_str)
 
                     # 提取内容 - 只有当内容不为空时才添加
                     choices = chunk.get("choices", [])
@@ -448,7 +501,7 @@ class LongCatProvider(BaseProvider):
                     if chunk.get("lastOne"):
                         break
 
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     continue
 
         except Exception as e:
@@ -7,24 +7,50 @@
 """
 
 import time
-from typing import Dict, List, Optional, Union, AsyncGenerator, Any
+from typing import Dict, List, Optional, Tuple, Union, AsyncGenerator, AsyncIterator, Any
 from app.providers.base import BaseProvider, provider_registry
 from app.providers.zai_provider import ZAIProvider
 from app.providers.k2think_provider import K2ThinkProvider
 from app.providers.longcat_provider import LongCatProvider
+from app.providers.routing_table import Route, RoutingTable, build_routing_table
 from app.models.schemas import OpenAIRequest
 from app.core.config import settings
+from app.utils import json_codec
+from app.utils.circuit_breaker import CircuitBreaker
 from app.utils.logger import get_logger
+from app.utils.metrics import PROVIDER_FALLBACKS, observe_request, observe_stream
 
 logger = get_logger()
 
 
+async def _prepend_chunk(first: Optional[str], rest: AsyncIterator[str]) -> AsyncIterator[str]:
+    """先产出已读出的第一个数据块，再继续透传剩余内容"""
+    try:
+        if first is not None:
+            yield first
+        async for item in rest:
+            yield item
+    finally:
+        await _close_stream(rest)
+
+
+def _is_error_chunk(item: str) -> bool:
+    return item.startswith('data: {"error"')
+
+
+async def _close_stream(stream: AsyncIterator[str]):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
 class ProviderFactory:
     """提供商工厂"""
     
     def __init__(self):
         self._initialized = False
         self._default_provider = "zai"
+        self._routing: Optional[RoutingTable] = None
     
     def initialize(self):
         """初始化所有提供商"""
@@ -54,40 +80,43 @@ class ProviderFactory:
             )
             
             self._initialized = True
+            self.rebuild_routing()
             
         except Exception as e:
             logger.error(f"❌ 提供商工厂初始化失败: {e}")
             raise
     
+    @property
+    def routing(self) -> RoutingTable:
+        """当前的路由表"""
+        if self._routing is None:
+            self.initialize()
+        return self._routing
+
+    def rebuild_routing(self) -> RoutingTable:
+        """按当前配置重新编译路由表并整体替换"""
+        table = build_routing_table(
+            provider_registry,
+            settings.provider_model_mapping,
+            settings.model_aliases,
+            settings.model_route_patterns,
+            settings.model_fallback_chains,
+            self._default_provider,
+        )
+        self._routing = table
+        logger.info(
+            f"🧭 路由表已编译: {len(table.routes)} 个名称, {len(table.patterns)} 条规则, {len(table.fallbacks)} 条降级链"
+        )
+        return table
+
+    def resolve(self, model: str) -> Optional[Route]:
+        """根据模型名称获取路由（规范模型名 + 提供商）"""
+        return self.routing.lookup(model)
+
     def get_provider_for_model(self, model: str) -> Optional[BaseProvider]:
         """根据模型名称获取提供商"""
-        if not self._initialized:
-            self.initialize()
-        
-        # 首先尝试从配置的映射中获取
-        provider_mapping = settings.provider_model_mapping
-        provider_name = provider_mapping.get(model)
-        
-        if provider_name:
-            provider = provider_registry.get_provider_by_name(provider_name)
-            if provider:
-                logger.debug(f"🎯 模型 {model} 映射到提供商 {provider_name}")
-                return provider
-        
-        # 尝试从注册表中直接获取
-        provider = provider_registry.get_provider(model)
-        if provider:
-            logger.debug(f"🎯 模型 {model} 找到提供商 {provider.name}")
-            return provider
-        
-        # 使用默认提供商
-        default_provider = provider_registry.get_provider_by_name(self._default_provider)
-        if default_provider:
-            logger.warning(f"⚠️ 模型 {model} 未找到专用提供商，使用默认提供商 {self._default_provider}")
-            return default_provider
-        
-        logger.error(f"❌ 无法为模型 {model} 找到任何提供商")
-        return None
+        route = self.routing.lookup(model)
+        return route.provider if route else None
     
     def list_supported_models(self) -> List[str]:
         """列出所有支持的模型"""
@@ -117,18 +146,45 @@ class ProviderRouter:
     
     def __init__(self):
         self.factory = ProviderFactory()
+        # 每个提供商一个熔断器，首次使用时创建
+        self.breakers: Dict[str, CircuitBreaker] = {}
+    
+    def get_breaker(self, provider_name: str) -> Optional[CircuitBreaker]:
+        """获取提供商的熔断器，未启用熔断时返回 None"""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return None
+        breaker = self.breakers.get(provider_name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider_name,
+                window=settings.CIRCUIT_BREAKER_WINDOW,
+                min_requests=settings.CIRCUIT_BREAKER_MIN_REQUESTS,
+                error_rate=settings.CIRCUIT_BREAKER_ERROR_RATE,
+                slow_call_duration=settings.CIRCUIT_BREAKER_SLOW_CALL,
+                slow_call_rate=settings.CIRCUIT_BREAKER_SLOW_RATE,
+                open_duration=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+            )
+            self.breakers[provider_name] = breaker
+        return breaker
     
     async def route_request(
         self, 
         request: OpenAIRequest,
         **kwargs
     ) -> Union[Dict[str, Any], AsyncGenerator[str, None]]:
-        """路由请求到合适的提供商"""
+        """
+        路由请求到合适的提供商
+
+        按降级链依次尝试：跳过熔断器打开的提供商；提供商返回错误、抛出异常，
+        或流式响应的第一个数据块就是错误块时，改用链上的下一个模型。
+        最后一个候选仍失败时把它的错误原样返回给客户端。
+        """
         logger.info(f"🚦 路由请求: 模型={request.model}, 流式={request.stream}")
-        
-        # 获取提供商
-        provider = self.factory.get_provider_for_model(request.model)
-        if not provider:
+
+        # 整个请求使用同一张路由表，期间重新加载配置不影响本次请求
+        table = self.factory.routing
+        route = table.lookup(request.model)
+        if route is None:
             error_msg = f"不支持的模型: {request.model}"
             logger.error(f"❌ {error_msg}")
             return {
@@ -138,19 +194,185 @@ class ProviderRouter:
                     "code": "model_not_found"
                 }
             }
-        
-        logger.info(f"✅ 使用提供商: {provider.name}")
-        
-        try:
-            # 调用提供商处理请求
-            result = await provider.chat_completion(request, **kwargs)
-            logger.info(f"🎉 请求处理完成: {provider.name}")
+
+        candidates = (route,) + table.fallbacks.get(route.model, ())
+        if request.stream and len(candidates) > 1:
+            return self._stream_with_fallback(candidates, request, kwargs)
+
+        provider, model_label, started, result, failed = await self._try_candidates(
+            candidates, request, False, kwargs
+        )
+        if provider is None:
             return result
-            
-        except Exception as e:
-            error_msg = f"提供商 {provider.name} 处理请求失败: {str(e)}"
+        logger.info(f"🎉 请求处理完成: {provider.name}")
+        if hasattr(result, "__aiter__"):
+            return observe_stream(result, provider.name, model_label, started)
+        observe_request(provider.name, model_label, "error" if failed else "success", time.perf_counter() - started)
+        return result
+
+    async def _stream_with_fallback(
+        self,
+        candidates: Tuple[Route, ...],
+        request: OpenAIRequest,
+        kwargs: Dict[str, Any],
+    ) -> AsyncGenerator[str, None]:
+        """
+        在响应体内按降级链尝试流式请求
+
+        候选的第一个数据块在输出合并层和客户端断开检测之内读取，响应头也不必等待上游首字节；
+        所有候选都失败时以错误块结束。
+        """
+        provider, model_label, started, result, _ = await self._try_candidates(candidates, request, True, kwargs)
+        if provider is not None and hasattr(result, "__aiter__"):
+            logger.info(f"🎉 请求处理完成: {provider.name}")
+            stream = observe_stream(result, provider.name, model_label, started)
+            try:
+                async for item in stream:
+                    yield item
+            finally:
+                await stream.aclose()
+            return
+
+        if provider is not None:
+            observe_request(provider.name, model_label, "error", time.perf_counter() - started)
+        yield json_codec.sse_data(result)
+        yield "data: [DONE]\n\n"
+
+    async def _try_candidates(
+        self,
+        candidates: Tuple[Route, ...],
+        request: OpenAIRequest,
+        peek: bool,
+        kwargs: Dict[str, Any],
+    ) -> Tuple[Optional[BaseProvider], str, float, Any, bool]:
+        """
+        依次尝试候选路由
+
+        peek 为 True 时读出流式响应的第一个数据块判断是否失败（提供商约定：上游在输出任何内容之前失败时，
+        错误块是流的第一个数据块）；否则流式响应原样返回，熔断器结果在读到第一个数据块时记录。
+
+        Returns:
+            (提供商, 指标模型标签, 开始时间, 结果, 是否失败)；所有候选都被熔断跳过时提供商为 None，
+            结果为最后一次失败的错误或 provider_unavailable 错误
+        """
+        last_error: Optional[Dict[str, Any]] = None
+        for index, candidate in enumerate(candidates):
+            is_last = index == len(candidates) - 1
+            model, provider = candidate.model, candidate.provider
+
+            breaker = self.get_breaker(provider.name)
+            if breaker is not None and not breaker.allow():
+                logger.warning(f"⚡ 提供商 {provider.name} 熔断中，跳过模型 {model}")
+                PROVIDER_FALLBACKS.labels(provider.name, "circuit_open").inc()
+                continue
+
+            if index:
+                logger.info(f"↪️ 降级到模型 {model}")
+            # 别名和大小写不同的模型名替换为规范名称再交给提供商
+            attempt_request = request if model == request.model else request.model_copy(update={"model": model})
+            logger.info(f"✅ 使用提供商: {provider.name}")
+            started = time.perf_counter()
+            # 客户端可以传任意模型名，未注册的模型归入 other，避免指标标签无限增长
+            model_label = model if candidate.known else "other"
+
+            tracked = False
+            try:
+                # 调用提供商处理请求
+                result = await provider.chat_completion(attempt_request, **kwargs)
+                if not hasattr(result, "__aiter__"):
+                    failed = isinstance(result, dict) and "error" in result
+                elif peek:
+                    result, failed = await self._peek_stream(result, is_last)
+                else:
+                    failed = False
+                    if breaker is not None:
+                        result, tracked = self._track_stream(result, breaker, started), True
+            except Exception as e:
+                error_msg = f"提供商 {provider.name} 处理请求失败: {str(e)}"
+                logger.error(f"❌ {error_msg}")
+                result, failed = provider.handle_error(e, "路由处理"), True
+
+            if breaker is not None and not tracked:
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success(time.perf_counter() - started)
+
+            if failed and not is_last:
+                logger.warning(f"⚠️ 提供商 {provider.name} 处理模型 {model} 失败，尝试降级")
+                PROVIDER_FALLBACKS.labels(provider.name, "error").inc()
+                observe_request(provider.name, model_label, "error", time.perf_counter() - started)
+                last_error = result if isinstance(result, dict) else {
+                    "error": {
+                        "message": f"提供商 {provider.name} 处理模型 {model} 失败",
+                        "type": "provider_error",
+                        "code": "upstream_error"
+                    }
+                }
+                continue
+
+            return provider, model_label, started, result, failed
+
+        if last_error is None:
+            error_msg = f"模型 {request.model} 的所有提供商均处于熔断状态"
             logger.error(f"❌ {error_msg}")
-            return provider.handle_error(e, "路由处理")
+            last_error = {
+                "error": {
+                    "message": error_msg,
+                    "type": "provider_error",
+                    "code": "provider_unavailable"
+                }
+            }
+        return None, "", 0.0, last_error, True
+
+    @staticmethod
+    async def _peek_stream(stream: AsyncIterator[str], keep_error: bool):
+        """
+        读出流式响应的第一个数据块，返回 (重新拼接后的流, 是否失败)
+
+        失败且 keep_error 为 False 时关闭原始流，返回的流为 None
+        """
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            # 包括客户端断开导致的取消
+            await _close_stream(stream)
+            raise
+
+        failed = first is None or _is_error_chunk(first)
+        if failed and not keep_error:
+            await _close_stream(stream)
+            return None, True
+        return _prepend_chunk(first, stream), failed
+
+    @staticmethod
+    async def _track_stream(
+        stream: AsyncIterator[str],
+        breaker: CircuitBreaker,
+        started: float,
+    ) -> AsyncGenerator[str, None]:
+        """透传流式响应，按第一个数据块向熔断器记录成功或失败"""
+        pending = True
+        try:
+            async for item in stream:
+                if pending:
+                    pending = False
+                    if _is_error_chunk(item):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success(time.perf_counter() - started)
+                yield item
+            if pending:
+                pending = False
+                breaker.record_failure()
+        except Exception:
+            if pending:
+                breaker.record_failure()
+            raise
+        finally:
+            await _close_stream(stream)
     
     def get_models_list(self) -> Dict[str, Any]:
         """获取模型列表（OpenAI格式）"""
@@ -173,6 +395,17 @@ class ProviderRouter:
             "data": models
         }
 
+    def get_status(self) -> Dict[str, Any]:
+        """降级链和各提供商熔断器状态"""
+        return {
+            "fallbacks": {
+                model: [route.model for route in routes]
+                for model, routes in self.factory.routing.fallbacks.items()
+            },
+            "circuit_breaker_enabled": settings.CIRCUIT_BREAKER_ENABLED,
+            "circuit_breakers": {name: breaker.get_status() for name, breaker in self.breakers.items()},
+        }
+
 
 # 全局路由器实例
 _router: Optional[ProviderRouter] = None
@@ -194,3 +427,23 @@ def initialize_providers():
     router = get_provider_router()
     logger.info("✅ 提供商系统初始化完成")
     return router
+
+
+async def start_providers():
+    """启动所有提供商的后台任务"""
+    for name in provider_registry.list_providers():
+        provider = provider_registry.get_provider_by_name(name)
+        try:
+            await provider.startup()
+        except Exception as e:
+            logger.error(f"❌ 提供商 {name} 启动失败: {e}")
+
+
+async def shutdown_providers():
+    """停止所有提供商的后台任务"""
+    for name in provider_registry.list_providers():
+        provider = provider_registry.get_provider_by_name(name)
+        try:
+            await provider.shutdown()
+        except Exception as e:
+            logger.warning(f"⚠️ 提供商 {name} 关闭失败: {e}")
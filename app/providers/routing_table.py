@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型路由表
+初始化时把模型映射、注册表、别名、通配符/正则规则和降级链编译成一张只读查找表，
+请求时一次字典查询即可得到提供商；配置变更时整体重建后替换引用，正在处理的请求继续使用旧表。
+"""
+
+import re
+from dataclasses import dataclass
+from fnmatch import translate
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Pattern, Tuple
+
+from app.providers.base import BaseProvider, ProviderRegistry
+from app.utils.logger import get_logger
+
+logger = get_logger()
+
+# 精确名称以外的模型名（大小写不同、规则匹配、默认提供商）解析结果的缓存上限，避免任意模型名撑大内存
+MAX_CACHED_MODELS = 1024
+
+
+@dataclass(frozen=True)
+class Route:
+    """一个模型名的路由结果"""
+    model: str  # 传给提供商的模型名（别名和大小写归一化后的规范名称）
+    provider: BaseProvider
+    known: bool = True  # 是否为已注册模型，未注册的模型在指标中归入 other
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    """re: 前缀为正则表达式（从模型名开头匹配），其余按通配符 * ? [...] 处理，均不区分大小写"""
+    if pattern.startswith("re:"):
+        return re.compile(pattern[3:], re.IGNORECASE)
+    return re.compile(translate(pattern), re.IGNORECASE)
+
+
+class RoutingTable:
+    """编译后的只读路由表"""
+
+    def __init__(
+        self,
+        routes: Mapping[str, Route],
+        patterns: List[Tuple[Pattern, BaseProvider]],
+        default: Optional[BaseProvider] = None,
+        fallbacks: Optional[Mapping[str, Tuple[Route, ...]]] = None,
+    ):
+        # 精确名称、别名及它们的小写形式
+        self.routes: Mapping[str, Route] = MappingProxyType(dict(routes))
+        self.patterns: Tuple[Tuple[Pattern, BaseProvider], ...] = tuple(patterns)
+        self.default = default
+        # 规范模型名 -> 依次尝试的降级路由
+        self.fallbacks: Mapping[str, Tuple[Route, ...]] = MappingProxyType(dict(fallbacks or {}))
+        self._resolved: Dict[str, Optional[Route]] = {}
+
+    def lookup(self, model: str) -> Optional[Route]:
+        """查找模型的路由，找不到任何提供商时返回 None"""
+        route = self.routes.get(model)
+        if route is not None:
+            return route
+        try:
+            return self._resolved[model]
+        except KeyError:
+            pass
+        route = self._resolve(model)
+        if len(self._resolved) < MAX_CACHED_MODELS:
+            self._resolved[model] = route
+        return route
+
+    def _resolve(self, model: str) -> Optional[Route]:
+        route = self.routes.get(model.lower())
+        if route is not None:
+            return route
+        for pattern, provider in self.patterns:
+            if pattern.match(model):
+                logger.debug(f"🎯 模型 {model} 匹配规则 {pattern.pattern}，使用提供商 {provider.name}")
+                return Route(model, provider, known=False)
+        if self.default is not None:
+            logger.warning(f"⚠️ 模型 {model} 未找到专用提供商，使用默认提供商 {self.default.name}")
+            return Route(model, self.default, known=False)
+        logger.error(f"❌ 无法为模型 {model} 找到任何提供商")
+        return None
+
+
+def build_routing_table(
+    registry: ProviderRegistry,
+    model_mapping: Mapping[str, str],
+    aliases: Mapping[str, str],
+    patterns: List[Tuple[str, str]],
+    fallback_chains: Mapping[str, List[str]],
+    default_provider: Optional[str] = None,
+) -> RoutingTable:
+    """
+    编译路由表
+
+    Args:
+        registry: 提供商注册表
+        model_mapping: 配置的模型 -> 提供商映射，优先于注册表
+        aliases: 别名 -> 模型，请求时替换为目标模型
+        patterns: 按顺序匹配的 (通配符或 re:正则, 提供商名称)
+        fallback_chains: 模型 -> 依次尝试的降级模型
+        default_provider: 以上都未命中时使用的提供商名称
+    """
+    exact: Dict[str, Route] = {}
+    for model, provider_name in model_mapping.items():
+        provider = registry.get_provider_by_name(provider_name)
+        if provider is None:
+            logger.warning(f"⚠️ 模型 {model} 映射的提供商 {provider_name} 不存在，已忽略")
+            continue
+        exact[model] = Route(model, provider)
+    for model in registry.list_models():
+        provider = registry.get_provider(model)
+        if model not in exact and provider is not None:
+            exact[model] = Route(model, provider)
+
+    lowered: Dict[str, Route] = {}
+    for model, route in exact.items():
+        lowered.setdefault(model.lower(), route)
+
+    routes = dict(exact)
+    for alias, target in aliases.items():
+        route = exact.get(target) or lowered.get(target.lower())
+        if route is None:
+            logger.warning(f"⚠️ 别名 {alias} 的目标模型 {target} 不存在，已忽略")
+            continue
+        routes.setdefault(alias, route)
+    for name, route in list(routes.items()):
+        routes.setdefault(name.lower(), route)
+
+    compiled = []
+    for pattern, provider_name in patterns:
+        provider = registry.get_provider_by_name(provider_name)
+        if provider is None:
+            logger.warning(f"⚠️ 路由规则 {pattern} 的提供商 {provider_name} 不存在，已忽略")
+            continue
+        try:
+            compiled.append((compile_pattern(pattern), provider))
+        except re.error as e:
+            logger.warning(f"⚠️ 路由规则 {pattern} 不是有效的正则表达式: {e}")
+
+    default = registry.get_provider_by_name(default_provider) if default_provider else None
+    table = RoutingTable(routes, compiled, default)
+
+    # 降级目标只接受已注册的模型名或别名，不经过路由规则和默认提供商，避免拼错的模型名被默认提供商接走
+    fallbacks: Dict[str, Tuple[Route, ...]] = {}
+    for model, chain in fallback_chains.items():
+        primary = table.lookup(model)
+        if primary is None:
+            continue
+        fallback_routes = []
+        for fallback in chain:
+            route = routes.get(fallback) or routes.get(fallback.lower())
+            if route is None:
+                logger.warning(f"⚠️ 模型 {model} 的降级目标 {fallback} 不存在，已忽略")
+                continue
+            if route.model != primary.model and route not in fallback_routes:
+                fallback_routes.append(route)
+        if fallback_routes:
+            fallbacks[primary.model] = tuple(fallback_routes)
+    return RoutingTable(routes, compiled, default, fallbacks)
@@ -5,25 +5,33 @@
 Z.AI 提供商适配器
 """
 
-import json
 import time
 import uuid
 import httpx
+import asyncio
 import hmac
 import hashlib
 import base64
 from urllib.parse import urlencode
 import os
+from contextlib import ExitStack, nullcontext
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Any, Optional, AsyncGenerator, Union
+from typing import Collection, Dict, List, Any, Optional, AsyncGenerator, Tuple, Union
 
 from app.providers.base import BaseProvider, ProviderConfig
 from app.models.schemas import OpenAIRequest, Message
 from app.core.config import settings
-from app.utils.logger import get_logger
+from app.utils.logger import chunk_log_enabled, get_logger
 from app.utils.token_pool import get_token_pool
+from app.utils.guest_token_pool import GuestTokenPool
+from app.utils.hedging import HedgePolicy, PrefetchedResponse
+from app.utils.metrics import UPSTREAM_RETRIES
+from app.utils.retry_policy import NETWORK_ERROR, RetryPolicy
 from app.core.zai_transformer import generate_uuid, get_zai_dynamic_headers
 from app.utils.sse_tool_handler import SSEToolHandler
+from app.utils.sse_parser import iter_sse_events
+from app.utils import json_codec
 
 logger = get_logger()
 
@@ -45,7 +53,7 @@ def _decode_jwt_payload(token: str) -> Dict[str, Any]:
         if len(parts) < 2:
             return {}
         payload_raw = _urlsafe_b64decode(parts[1])
-        return json.loads(payload_raw.decode("utf-8", errors="ignore"))
+        return json_codec.loads(payload_raw.decode("utf-8", errors="ignore"))
     except Exception:
         return {}
 
@@ -79,20 +87,39 @@ def generate_signature(message_text: str, request_id: str, timestamp_ms: int, us
     return signature
 
 
+@dataclass
+class UpstreamStream:
+    """已发出的上游流式请求"""
+    response: httpx.Response
+    transformed: Dict[str, Any]
+    scope: ExitStack  # 跟踪所用token的进行中请求
+    body: Any  # 供 SSE 解析读取的响应，预读首块后为 PrefetchedResponse
+
+    @property
+    def ok(self) -> bool:
+        return self.response.status_code == 200
+
+    async def aclose(self):
+        try:
+            await self.response.aclose()
+        finally:
+            self.scope.close()
+
+
 class ZAIProvider(BaseProvider):
     """Z.AI 提供商"""
     
     def __init__(self):
         config = ProviderConfig(
             name="zai",
-            api_endpoint=settings.API_ENDPOINT,
+            api_endpoint=settings.zai_api_endpoint,
             timeout=30,
             headers=get_zai_dynamic_headers()
         )
         super().__init__(config)
         
         # Z.AI 特定配置
-        self.base_url = "https://chat.z.ai"
+        self.base_url = settings.ZAI_BASE_URL
         self.auth_url = f"{self.base_url}/api/v1/auths/"
         
         # 模型映射
@@ -105,6 +132,45 @@ class ZAIProvider(BaseProvider):
             settings.GLM46_THINKING_MODEL: "GLM-4-6-API-V1",  # GLM-4.6-Thinking
             settings.GLM46_SEARCH_MODEL: "GLM-4-6-API-V1",  # GLM-4.6-Search
         }
+
+        # 上游失败时换token重试的策略
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.UPSTREAM_RETRY_MAX_ATTEMPTS,
+            budget=settings.UPSTREAM_RETRY_BUDGET,
+            backoff=settings.UPSTREAM_RETRY_BACKOFF,
+            statuses=settings.upstream_retry_statuses,
+        )
+
+        # 对冲请求策略（可选）
+        self.hedge_policy: Optional[HedgePolicy] = None
+        if settings.HEDGE_ENABLED:
+            self.hedge_policy = HedgePolicy(
+                percentile=settings.HEDGE_PERCENTILE,
+                min_delay=settings.HEDGE_MIN_DELAY,
+                max_delay=settings.HEDGE_MAX_DELAY,
+                default_delay=settings.HEDGE_DEFAULT_DELAY,
+                max_ratio=settings.HEDGE_MAX_RATIO,
+            )
+
+        # 匿名模式下的访客令牌预取池
+        self.guest_token_pool = GuestTokenPool(
+            fetcher=self._fetch_guest_token,
+            expiry_resolver=lambda token: _decode_jwt_payload(token).get("exp"),
+            min_size=settings.GUEST_TOKEN_POOL_MIN_SIZE,
+            max_size=settings.GUEST_TOKEN_POOL_MAX_SIZE,
+            max_uses=settings.GUEST_TOKEN_MAX_USES,
+            default_ttl=settings.GUEST_TOKEN_DEFAULT_TTL,
+            refresh_margin=settings.GUEST_TOKEN_REFRESH_MARGIN,
+        )
+
+    async def startup(self):
+        """启动访客令牌预取"""
+        if settings.ANONYMOUS_MODE and settings.GUEST_TOKEN_POOL_ENABLED:
+            await self.guest_token_pool.start()
+
+    async def shutdown(self):
+        """停止访客令牌预取"""
+        await self.guest_token_pool.stop()
     
     def get_supported_models(self) -> List[str]:
         """获取支持的模型列表"""
@@ -118,22 +184,39 @@ class ZAIProvider(BaseProvider):
             settings.GLM46_SEARCH_MODEL,
         ]
     
-    async def get_token(self) -> str:
-        """获取认证令牌"""
+    async def _fetch_guest_token(self) -> str:
+        """从 Z.AI 获取一个新的访客令牌"""
+        try:
+            headers = get_zai_dynamic_headers()
+            client = self.get_http_client()
+            response = await client.get(self.auth_url, headers=headers, timeout=10.0)
+            if response.status_code == 200:
+                data = response.json()
+                token = data.get("token", "")
+                if token:
+                    self.logger.debug(f"获取访客令牌成功: {token[:20]}...")
+                    return token
+        except Exception as e:
+            self.logger.warning(f"异步获取访客令牌失败: {e}")
+        return ""
+
+    async def get_token(self, exclude: Optional[Collection[str]] = None) -> str:
+        """
+        获取认证令牌
+
+        Args:
+            exclude: 不再使用的令牌（同一请求已经用过的令牌），没有其他令牌时返回空字符串
+        """
         # 如果启用匿名模式，只尝试获取访客令牌
         if settings.ANONYMOUS_MODE:
-            try:
-                headers = get_zai_dynamic_headers()
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(self.auth_url, headers=headers, timeout=10.0)
-                    if response.status_code == 200:
-                        data = response.json()
-                        token = data.get("token", "")
-                        if token:
-                            self.logger.debug(f"获取访客令牌成功: {token[:20]}...")
-                            return token
-            except Exception as e:
-                self.logger.warning(f"异步获取访客令牌失败: {e}")
+            # 优先从预取池中取用，池为空时才同步获取
+            token = self.guest_token_pool.acquire()
+            if token:
+                return token
+
+            token = await self._fetch_guest_token()
+            if token:
+                return token
 
             # 匿名模式下，如果获取访客令牌失败，直接返回空
             self.logger.error("❌ 匿名模式下获取访客令牌失败")
@@ -142,19 +225,29 @@ class ZAIProvider(BaseProvider):
         # 非匿名模式：首先使用token池获取备份令牌
         token_pool = get_token_pool()
         if token_pool:
-            token = token_pool.get_next_token()
+            # 所有token都达到并发/RPM上限时排队等待空出的名额
+            token = await token_pool.acquire_token(timeout=settings.TOKEN_QUEUE_TIMEOUT, exclude=exclude)
             if token:
                 self.logger.debug(f"从token池获取令牌: {token[:20]}...")
                 return token
 
         # 如果token池为空或没有可用token，使用配置的AUTH_TOKEN
         if settings.AUTH_TOKEN and settings.AUTH_TOKEN != "sk-your-api-key":
-            self.logger.debug("使用配置的AUTH_TOKEN")
-            return settings.AUTH_TOKEN
+            if not exclude or settings.AUTH_TOKEN not in exclude:
+                self.logger.debug("使用配置的AUTH_TOKEN")
+                return settings.AUTH_TOKEN
 
-        self.logger.error("❌ 无法获取有效的认证令牌")
+        if not exclude:
+            self.logger.error("❌ 无法获取有效的认证令牌")
         return ""
     
+    def _track_token(self, token: str):
+        """跟踪token池中token的上游请求，匿名模式或不在池中的token不跟踪"""
+        token_pool = get_token_pool()
+        if token and token_pool and not settings.ANONYMOUS_MODE:
+            return token_pool.track_request(token)
+        return nullcontext()
+
     def mark_token_failure(self, token: str, error: Exception = None):
         """标记token使用失败"""
         token_pool = get_token_pool()
@@ -302,6 +395,23 @@ class ZAIProvider(BaseProvider):
         if request.max_tokens is not None:
             body["params"]["max_tokens"] = request.max_tokens
         
+        signed_url, headers = self._sign_request(chat_id, last_user_text, token)
+
+        # 存储当前token用于错误处理
+        self._current_token = token
+
+        return {
+            "url": signed_url,
+            "headers": headers,
+            "body": body,
+            "token": token,
+            "chat_id": chat_id,
+            "model": requested_model,
+            "signing_text": last_user_text,
+        }
+
+    def _sign_request(self, chat_id: str, last_user_text: str, token: str) -> Tuple[str, Dict[str, str]]:
+        """用指定token生成签名URL和请求头（每次调用使用新的时间戳和请求ID）"""
         # 构建请求头
         headers = get_zai_dynamic_headers(chat_id)
         if token:
@@ -324,25 +434,115 @@ class ZAIProvider(BaseProvider):
             "requestId": request_id,
             "user_id": user_id,
             "token": token or "",
-            "current_url": f"https://chat.z.ai/c/{chat_id}",
+            "current_url": f"{self.base_url}/c/{chat_id}",
             "pathname": f"/c/{chat_id}",
             "signature_timestamp": timestamp_ms,
         }
         signed_url = f"{self.config.api_endpoint}?{urlencode(query_params)}"
         headers["X-Signature"] = signature
-        
-        # 存储当前token用于错误处理
+        return signed_url, headers
+
+    async def _resign_request(
+        self,
+        transformed: Dict[str, Any],
+        new_chat: bool = False,
+        exclude: Optional[Collection[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        换下一个token重新签名；new_chat 为 True 时使用新的对话ID（与原请求并发发送时）
+
+        指定 exclude 时只使用其中以外的token，没有这样的token时返回 None
+        """
+        token = await self.get_token(exclude)
+        if exclude and not token:
+            return None
+        chat_id = transformed["chat_id"]
+        body = transformed["body"]
+        if new_chat:
+            chat_id = generate_uuid()
+            body = {**body, "chat_id": chat_id, "id": generate_uuid()}
+        signed_url, headers = self._sign_request(chat_id, transformed["signing_text"], token)
         self._current_token = token
+        return {**transformed, "url": signed_url, "headers": headers, "token": token, "chat_id": chat_id, "body": body}
+
+    async def _send_with_retry(
+        self,
+        transformed: Dict[str, Any],
+        stream: bool,
+        timeout: float,
+    ) -> Tuple[httpx.Response, Dict[str, Any], ExitStack]:
+        """
+        发送上游请求，失败时按重试策略换token重新签名后重试
+
+        调用方此时还没有向客户端输出任何内容，因此重试对客户端透明。
+
+        Returns:
+            (上游响应, 最终使用的请求, 跟踪该token进行中请求的上下文)；
+            响应可能是不可重试或重试用尽后的错误响应，由调用方处理并负责关闭响应和上下文
+        """
+        policy = self.retry_policy
+        client = self.get_http_client()
+        started = time.monotonic()
+        attempt = 0
+        # 本次请求已经用过的token，重试时优先换成没用过的
+        tried = set()
+        while True:
+            attempt += 1
+            token = transformed.get("token", "")
+            tried.add(token)
+            scope = ExitStack()
+            tracker = scope.enter_context(self._track_token(token))
+            try:
+                upstream_request = client.build_request(
+                    "POST",
+                    transformed["url"],
+                    json=transformed["body"],
+                    headers=transformed["headers"],
+                    timeout=timeout,
+                )
+                response = await client.send(upstream_request, stream=stream)
+            except httpx.TransportError as e:
+                scope.close()
+                delay = policy.retry_delay(NETWORK_ERROR, attempt, started)
+                if delay is None:
+                    raise
+                reason, detail = "network", f"{type(e).__name__}: {e}"
+            except BaseException:
+                scope.close()
+                raise
+            else:
+                if response.is_success:
+                    if tracker:
+                        tracker.mark_first_byte()
+                    return response, transformed, scope
+
+                status = response.status_code
+                delay = policy.retry_delay(status, attempt, started)
+                if delay is None:
+                    return response, transformed, scope
+
+                try:
+                    error_text = (await response.aread()).decode("utf-8", errors="ignore")
+                finally:
+                    await response.aclose()
+                    scope.close()
+                reason, detail = str(status), error_text[:200]
+                if policy.rule_for(status).mark_failure and not settings.ANONYMOUS_MODE:
+                    self.mark_token_failure(token, Exception(f"Z.AI API 错误: {status}"))
+
+            UPSTREAM_RETRIES.labels(self.name, reason).inc()
+            self.logger.warning(
+                f"🔁 上游请求失败 ({reason}) {detail}，第 {attempt} 次尝试，"
+                f"{delay:.2f}s 后换token重试"
+            )
+            if delay:
+                await asyncio.sleep(delay)
+            # 所有token都已用过时（token比重试次数少）才重复使用
+            transformed = (
+                await self._resign_request(transformed, exclude=tried)
+                or await self._resign_request(transformed)
+            )
 
-        return {
-            "url": signed_url,
-            "headers": headers,
-            "body": body,
-            "token": token,
-            "chat_id": chat_id,
-            "model": requested_model
-        }
-    
     async def chat_completion(
         self,
         request: OpenAIRequest,
@@ -361,25 +561,102 @@ class ZAIProvider(BaseProvider):
                 return self._create_stream_response(request, transformed)
             else:
                 # 非流式响应
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        transformed["url"],
-                        headers=transformed["headers"],
-                        json=transformed["body"]
-                    )
+                response, transformed, scope = await self._send_with_retry(transformed, stream=False, timeout=30.0)
+                scope.close()
 
-                    if not response.is_success:
-                        error_msg = f"Z.AI API 错误: {response.status_code}"
-                        self.log_response(False, error_msg)
-                        return self.handle_error(Exception(error_msg))
+                if not response.is_success:
+                    error_msg = f"Z.AI API 错误: {response.status_code}"
+                    self.log_response(False, error_msg)
+                    return self.handle_error(Exception(error_msg))
 
-                    return await self.transform_response(response, request, transformed)
+                return await self.transform_response(response, request, transformed)
 
         except Exception as e:
             self.log_response(False, str(e))
             return self.handle_error(e, "请求处理")
 
     
+    async def _open_stream(self, transformed: Dict[str, Any]) -> UpstreamStream:
+        """发送流式请求（含重试），成功时预读出首个数据块"""
+        response, transformed, scope = await self._send_with_retry(transformed, stream=True, timeout=60.0)
+        upstream = UpstreamStream(response, transformed, scope, response)
+        if response.status_code != 200:
+            return upstream
+        try:
+            chunks = response.aiter_bytes()
+            first_chunk = b""
+            async for first_chunk in chunks:
+                if first_chunk:
+                    break
+            upstream.body = PrefetchedResponse(first_chunk, chunks)
+        except BaseException:
+            await upstream.aclose()
+            raise
+        return upstream
+
+
+    @staticmethod
+    async def _discard(task: "asyncio.Task[UpstreamStream]"):
+        """取消未胜出的请求并关闭其响应"""
+        if not task.done():
+            task.cancel()
+        results = await asyncio.gather(task, return_exceptions=True)
+        if isinstance(results[0], UpstreamStream):
+            await results[0].aclose()
+
+    async def _open_hedged(self, transformed: Dict[str, Any]) -> UpstreamStream:
+        """
+        发送流式请求，首块等待超过对冲延迟后用另一个token再发一个请求
+
+        先拿到首块的请求胜出，另一个取消；两个都失败时返回原请求的结果
+        """
+        policy = self.hedge_policy
+        policy.start_request()
+        started = time.perf_counter()
+        delay = policy.delay()
+        primary = asyncio.create_task(self._open_stream(transformed))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            hedge_transformed = None
+            if not done and policy.try_hedge():
+                # 对冲必须换一个token，否则与原请求共享同一个token的限流和故障
+                hedge_transformed = await self._resign_request(
+                    transformed, new_chat=True, exclude={transformed.get("token", "")}
+                )
+                if hedge_transformed is None:
+                    policy.record_no_token()
+                    self.logger.debug("🪁 没有另一个可用token，跳过对冲请求")
+            if hedge_transformed is None:
+                upstream = await primary
+                tasks.remove(primary)
+                policy.record_latency(time.perf_counter() - started)
+                return upstream
+
+            self.logger.info(f"🪁 首块等待超过 {delay:.2f}s，使用另一个token发送对冲请求")
+            tasks.append(asyncio.create_task(self._open_stream(hedge_transformed)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 同时完成时优先原请求
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None and task.result().ok:
+                        hedge_won = task is not primary
+                        policy.record_latency(time.perf_counter() - started)
+                        policy.record_winner(hedge_won)
+                        tasks.remove(task)
+                        if hedge_won:
+                            self.logger.info("🪁 对冲请求先返回首块，取消原请求")
+                        return task.result()
+
+            # 两个请求都失败：返回原请求的错误响应（或抛出其异常）
+            policy.record_latency(time.perf_counter() - started)
+            tasks.remove(primary)
+            return primary.result()
+        finally:
+            for task in tasks:
+                await self._discard(task)
+
     async def _create_stream_response(
         self,
         request: OpenAIRequest,
@@ -388,14 +665,18 @@ class ZAIProvider(BaseProvider):
 
         current_token = transformed.get("token", "")
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                self.logger.info(f"🎯 发送请求到 Z.AI: {transformed['url']}")
-                async with client.stream(
-                    "POST",
-                    transformed["url"],
-                    json=transformed["body"],
-                    headers=transformed["headers"],
-                ) as response:
+            self.logger.info(f"🎯 发送请求到 Z.AI: {transformed['url']}")
+            # 还没有输出任何内容，上游失败时按重试策略换token重试；
+            # scope 跟踪最终使用的token的进行中请求数和首字节延迟，供负载感知的选择策略使用
+            if self.hedge_policy is not None:
+                upstream = await self._open_hedged(transformed)
+                response, transformed, scope, body = upstream.response, upstream.transformed, upstream.scope, upstream.body
+            else:
+                response, transformed, scope = await self._send_with_retry(transformed, stream=True, timeout=60.0)
+                body = response
+            current_token = transformed.get("token", "")
+            with scope:
+                try:
                     if response.status_code != 200:
                         self.logger.error(f"❌ 上游返回错误: {response.status_code}")
                         error_text = await response.aread()
@@ -409,7 +690,7 @@ class ZAIProvider(BaseProvider):
                                 "code": response.status_code
                             }
                         }
-                        yield f"data: {json.dumps(error_response)}\n\n"
+                        yield json_codec.sse_data(error_response)
                         yield "data: [DONE]\n\n"
                         return
 
@@ -420,9 +701,11 @@ class ZAIProvider(BaseProvider):
 
                     chat_id = transformed["chat_id"]
                     model = transformed["model"]
-                    async for chunk in self._handle_stream_response(response, chat_id, model, request, transformed):
+                    async for chunk in self._handle_stream_response(body, chat_id, model, request, transformed):
                         yield chunk
                     return
+                finally:
+                    await response.aclose()
         except Exception as e:
             self.logger.error(f"❌ 流处理错误: {e}")
             import traceback
@@ -435,7 +718,7 @@ class ZAIProvider(BaseProvider):
                     "type": "stream_error"
                 }
             }
-            yield f"data: {json.dumps(error_response)}\n\n"
+            yield json_codec.sse_data(error_response)
             yield "data: [DONE]\n\n"
             return
 
@@ -475,181 +758,135 @@ class ZAIProvider(BaseProvider):
 
         # 处理状态
         has_thinking = False
+        role_sent = False
         thinking_signature = None
+        encoder = self.create_chunk_encoder(chat_id, model)
 
-        # 处理SSE流
-        buffer = ""
+        # 处理SSE流（字节级增量解析，每个 data 行是一个完整的 JSON）
         line_count = 0
         self.logger.debug("📡 开始接收 SSE 流数据...")
 
         try:
-            async for line in response.aiter_lines():
+            async for event in iter_sse_events(response, split_data_lines=True):
                 line_count += 1
-                if not line:
+                if event.raw is not None:
+                    continue
+
+                chunk_str = event.data.strip()
+                if not chunk_str or chunk_str == "[DONE]":
+                    if chunk_str == "[DONE]":
+                        yield "data: [DONE]\n\n"
                     continue
 
-                # 累积到buffer处理完整的数据行
-                buffer += line + "\n"
-
-                # 检查是否有完整的data行
-                while "\n" in buffer:
-                    current_line, buffer = buffer.split("\n", 1)
-                    if not current_line.strip():
-                        continue
-
-                    if current_line.startswith("data:"):
-                        chunk_str = current_line[5:].strip()
-                        if not chunk_str or chunk_str == "[DONE]":
-                            if chunk_str == "[DONE]":
-                                yield "data: [DONE]\n\n"
-                            continue
-
-                        self.logger.debug(f"📦 解析数据块: {chunk_str[:1000]}..." if len(chunk_str) > 1000 else f"📦 解析数据块: {chunk_str}")
-
-                        try:
-                            chunk = json.loads(chunk_str)
-
-                            if chunk.get("type") == "chat:completion":
-                                data = chunk.get("data", {})
-                                phase = data.get("phase")
-
-                                # 记录每个阶段（只在阶段变化时记录）
-                                if phase and phase != getattr(self, '_last_phase', None):
-                                    self.logger.info(f"📈 SSE 阶段: {phase}")
-                                    self._last_phase = phase
-
-                                # 使用工具处理器处理所有阶段
-                                if tool_handler:
-                                    # 构建 SSE 数据块，包含所有必要字段
-                                    sse_chunk = {
-                                        "phase": phase,
-                                        "edit_content": data.get("edit_content", ""),
-                                        "delta_content": data.get("delta_content", ""),
-                                        "edit_index": data.get("edit_index"),
-                                        "usage": data.get("usage", {})
-                                    }
-
-                                    # 处理工具调用并输出结果
-                                    for output in tool_handler.process_sse_chunk(sse_chunk):
-                                        yield output
-
-                                # 非工具调用模式 - 处理思考内容
-                                elif phase == "thinking":
-                                    if not has_thinking:
-                                        has_thinking = True
-                                        # 发送初始角色
-                                        role_chunk = self.create_openai_chunk(
-                                            chat_id,
-                                            model,
-                                            {"role": "assistant"}
-                                        )
-                                        yield await self.format_sse_chunk(role_chunk)
-
-                                    delta_content = data.get("delta_content", "")
-                                    if delta_content:
-                                        # 处理思考内容格式
-                                        if delta_content.startswith("<details"):
-                                            content = (
-                                                delta_content.split("</summary>\n>")[-1].strip()
-                                                if "</summary>\n>" in delta_content
-                                                else delta_content
-                                            )
-                                        else:
-                                            content = delta_content
-
-                                        thinking_chunk = self.create_openai_chunk(
-                                            chat_id,
-                                            model,
-                                            {
-                                                "role": "assistant",
-                                                "reasoning_content": content
-                                            }
-                                        )
-                                        yield await self.format_sse_chunk(thinking_chunk)
-
-                                # 处理答案内容
-                                elif phase == "answer":
-                                    edit_content = data.get("edit_content", "")
-                                    delta_content = data.get("delta_content", "")
-
-                                    # 处理思考结束和答案开始
-                                    if edit_content and "</details>\n" in edit_content:
-                                        if has_thinking:
-                                            # 发送思考签名
-                                            thinking_signature = str(int(time.time() * 1000))
-                                            sig_chunk = self.create_openai_chunk(
-                                                chat_id,
-                                                model,
-                                                {
-                                                    "role": "assistant",
-                                                    "thinking": {
-                                                        "content": "",
-                                                        "signature": thinking_signature,
-                                                    }
-                                                }
-                                            )
-                                            yield await self.format_sse_chunk(sig_chunk)
-
-                                        # 提取答案内容
-                                        content_after = edit_content.split("</details>\n")[-1]
-                                        if content_after:
-                                            content_chunk = self.create_openai_chunk(
-                                                chat_id,
-                                                model,
-                                                {
-                                                    "role": "assistant",
-                                                    "content": content_after
-                                                }
-                                            )
-                                            yield await self.format_sse_chunk(content_chunk)
-
-                                    # 处理增量内容
-                                    elif delta_content:
-                                        # 如果还没有发送角色
-                                        if not has_thinking:
-                                            role_chunk = self.create_openai_chunk(
-                                                chat_id,
-                                                model,
-                                                {"role": "assistant"}
-                                            )
-                                            yield await self.format_sse_chunk(role_chunk)
-
-                                        content_chunk = self.create_openai_chunk(
-                                            chat_id,
-                                            model,
-                                            {
-                                                "role": "assistant",
-                                                "content": delta_content
-                                            }
-                                        )
-                                        output_data = await self.format_sse_chunk(content_chunk)
-                                        self.logger.debug(f"➡️ 输出内容块到客户端: {output_data}")
-                                        yield output_data
-
-                                    # 处理完成
-                                    if data.get("usage"):
-                                        self.logger.info(f"📦 完成响应 - 使用统计: {json.dumps(data['usage'])}")
-
-                                        # 只有在非工具调用模式下才发送普通完成信号
-                                        if not tool_handler:
-                                            finish_chunk = self.create_openai_chunk(
-                                                chat_id,
-                                                model,
-                                                {"role": "assistant", "content": ""},
-                                                "stop"
-                                            )
-                                            finish_chunk["usage"] = data["usage"]
-
-                                            finish_output = await self.format_sse_chunk(finish_chunk)
-                                            self.logger.debug(f"➡️ 发送完成信号: {finish_output[:1000]}...")
-                                            yield finish_output
-                                            self.logger.debug("➡️ 发送 [DONE]")
-                                            yield "data: [DONE]\n\n"
-
-                        except json.JSONDecodeError as e:
-                            self.logger.debug(f"❌ JSON解析错误: {e}, 内容: {chunk_str[:1000]}")
-                        except Exception as e:
-                            self.logger.error(f"❌ 处理chunk错误: {e}")
+                log_chunk = chunk_log_enabled(line_count)
+                if log_chunk:
+                    self.logger.debug(f"📦 解析数据块: {chunk_str[:1000]}..." if len(chunk_str) > 1000 else f"📦 解析数据块: {chunk_str}")
+
+                try:
+                    chunk = json_codec.loads(chunk_str)
+
+                    if chunk.get("type") == "chat:completion":
+                        data = chunk.get("data", {})
+                        phase = data.get("phase")
+
+                        # 记录每个阶段（只在阶段变化时记录）
+                        if phase and phase != getattr(self, '_last_phase', None):
+                            self.logger.info(f"📈 SSE 阶段: {phase}")
+                            self._last_phase = phase
+
+                        # 使用工具处理器处理所有阶段
+                        if tool_handler:
+                            # 构建 SSE 数据块，包含所有必要字段
+                            sse_chunk = {
+                                "phase": phase,
+                                "edit_content": data.get("edit_content", ""),
+                                "delta_content": data.get("delta_content", ""),
+                                "edit_index": data.get("edit_index"),
+                                "usage": data.get("usage", {})
+                            }
+
+                            # 处理工具调用并输出结果
+                            for output in tool_handler.process_sse_chunk(sse_chunk):
+                                yield output
+
+                        # 非工具调用模式 - 处理思考内容
+                        elif phase == "thinking":
+                            if not has_thinking:
+                                has_thinking = True
+                                if not role_sent:
+                                    role_sent = True
+                                    # 发送初始角色
+                                    yield encoder.chunk({"role": "assistant"})
+
+                            delta_content = data.get("delta_content", "")
+                            if delta_content:
+                                # 处理思考内容格式
+                                if delta_content.startswith("<details"):
+                                    content = (
+                                        delta_content.split("</summary>\n>")[-1].strip()
+                                        if "</summary>\n>" in delta_content
+                                        else delta_content
+                                    )
+                                else:
+                                    content = delta_content
+
+                                yield encoder.text("reasoning_content", content, role="assistant")
+
+                        # 处理答案内容
+                        elif phase == "answer":
+                            edit_content = data.get("edit_content", "")
+                            delta_content = data.get("delta_content", "")
+
+                            # 处理思考结束和答案开始
+                            if edit_content and "</details>\n" in edit_content:
+                                if has_thinking:
+                                    # 发送思考签名
+                                    thinking_signature = str(int(time.time() * 1000))
+                                    yield encoder.chunk({
+                                        "role": "assistant",
+                                        "thinking": {
+                                            "content": "",
+                                            "signature": thinking_signature,
+                                        }
+                                    })
+
+                                # 提取答案内容
+                                content_after = edit_content.split("</details>\n")[-1]
+                                if content_after:
+                                    yield encoder.text("content", content_after, role="assistant")
+
+                            # 处理增量内容
+                            elif delta_content:
+                                # 如果还没有发送角色（每个流只发送一次）
+                                if not role_sent:
+                                    role_sent = True
+                                    yield encoder.chunk({"role": "assistant"})
+
+                                output_data = encoder.text("content", delta_content, role="assistant")
+                                if log_chunk:
+                                    self.logger.debug(f"➡️ 输出内容块到客户端: {output_data}")
+                                yield output_data
+
+                            # 处理完成
+                            if data.get("usage"):
+                                self.logger.info(f"📦 完成响应 - 使用统计: {json_codec.dumps(data['usage'])}")
+
+                                # 只有在非工具调用模式下才发送普通完成信号
+                                if not tool_handler:
+                                    finish_output = encoder.chunk(
+                                        {"role": "assistant", "content": ""},
+                                        "stop",
+                                        usage=data["usage"]
+                                    )
+                                    self.logger.debug(f"➡️ 发送完成信号: {finish_output[:1000]}...")
+                                    yield finish_output
+                                    self.logger.debug("➡️ 发送 [DONE]")
+                                    yield "data: [DONE]\n\n"
+
+                except json_codec.JSONDecodeError as e:
+                    self.logger.debug(f"❌ JSON解析错误: {e}, 内容: {chunk_str[:1000]}")
+                except Exception as e:
+                    self.logger.error(f"❌ 处理chunk错误: {e}")
 
             # 工具处理器会自动发送结束信号，这里不需要重复发送
             if not tool_handler:
@@ -663,9 +900,7 @@ class ZAIProvider(BaseProvider):
             import traceback
             self.logger.error(traceback.format_exc())
             # 发送错误结束块
-            yield await self.format_sse_chunk(
-                self.create_openai_chunk(chat_id, model, {}, "stop")
-            )
+            yield encoder.chunk({}, "stop")
             yield "data: [DONE]\n\n"
     
     async def _handle_non_stream_response(
@@ -677,7 +912,7 @@ class ZAIProvider(BaseProvider):
         """处理非流式响应
 
         说明：上游始终以 SSE 形式返回（transform_request 固定 stream=True），
-        因此这里需要聚合 aiter_lines() 的 data: 块，提取 usage、思考内容与答案内容，
+        因此这里需要聚合 SSE 流中的 data: 块，提取 usage、思考内容与答案内容，
         并最终产出一次性 OpenAI 格式响应。
         """
         final_content = ""
@@ -689,17 +924,13 @@ class ZAIProvider(BaseProvider):
         }
 
         try:
-            async for line in response.aiter_lines():
-                if not line:
-                    continue
-
-                line = line.strip()
-
-                # 仅处理以 data: 开头的 SSE 行，其余行尝试作为错误/JSON 忽略
-                if not line.startswith("data:"):
+            async for event in iter_sse_events(response, split_data_lines=True):
+                # 仅处理 SSE data 行，其余行尝试作为错误/JSON 忽略
+                if event.raw is not None:
+                    line = event.raw.strip()
                     # 尝试解析为错误 JSON
                     try:
-                        maybe_err = json.loads(line)
+                        maybe_err = json_codec.loads(line)
                         if isinstance(maybe_err, dict) and (
                             "error" in maybe_err or "code" in maybe_err or "message" in maybe_err
                         ):
@@ -714,14 +945,14 @@ class ZAIProvider(BaseProvider):
                         pass
                     continue
 
-                data_str = line[5:].strip()
+                data_str = event.data.strip()
                 if not data_str or data_str in ("[DONE]", "DONE", "done"):
                     continue
 
                 # 解析 SSE 数据块
                 try:
-                    chunk = json.loads(data_str)
-                except json.JSONDecodeError:
+                    chunk = json_codec.loads(data_str)
+                except json_codec.JSONDecodeError:
                     continue
 
                 if chunk.get("type") != "chat:completion":
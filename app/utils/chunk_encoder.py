@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+OpenAI 流式响应块编码器
+同一个流中 id、model、system_fingerprint 等字段都不变，每个流只渲染一次前后缀，
+每个 token 只需序列化 delta 内容再拼接，省去逐 token 构建嵌套字典和完整序列化的开销。
+输出与 BaseProvider.create_openai_chunk + format_sse_chunk 的结果逐字节一致。
+"""
+
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils import json_codec
+from app.utils.stream_coalescer import DeltaChunk, coalescing_enabled
+
+
+class OpenAIChunkEncoder:
+    """单个流的 chunk 编码器（非线程安全，每个流创建一个）"""
+
+    def __init__(self, chat_id: str, model: str, system_fingerprint: str):
+        self._id_json = json_codec.dumps(chat_id)
+        self._model_json = json_codec.dumps(model)
+        self._tail = f',"logprobs":null}}],"system_fingerprint":{json_codec.dumps(system_fingerprint)}'
+        self._text_tail = ',"finish_reason":null' + self._tail + "}\n\n"
+
+        self._created = -1
+        self._head = ""
+        self._text_heads: Dict[Tuple[str, Optional[str]], str] = {}
+
+        self._renderers: Dict[Tuple[str, Optional[str]], Callable[[str], str]] = {}
+
+    def _current_head(self) -> str:
+        """返回 delta 之前的前缀，created 每秒最多重新渲染一次"""
+        now = int(time.time())
+        if now != self._created:
+            self._created = now
+            self._head = (
+                f'data: {{"id":{self._id_json},"object":"chat.completion.chunk","created":{now},'
+                f'"model":{self._model_json},"choices":[{{"index":0,"delta":'
+            )
+            self._text_heads.clear()
+        return self._head
+
+    def text(self, field: str, value: str, role: Optional[str] = None) -> str:
+        """
+        编码只包含单个文本字段的 delta（流中绝大多数的 chunk）
+
+        等价于 format_sse_chunk(create_openai_chunk(chat_id, model, {"role": role, field: value}))，
+        role 为 None 时 delta 中不包含 role。
+        """
+        head = self._current_head()
+        key = (field, role)
+        text_head = self._text_heads.get(key)
+        if text_head is None:
+            role_part = f'"role":{json_codec.dumps(role)},' if role is not None else ""
+            text_head = f"{head}{{{role_part}{json_codec.dumps(field)}:"
+            self._text_heads[key] = text_head
+        encoded = text_head + json_codec.dumps(value) + "}" + self._text_tail
+        # 经过输出合并层时，文本增量以 DeltaChunk 返回，便于合并同一字段的连续增量；
+        # 每次编码时判断，编码器在合并层开始之前创建时也能正确合并
+        if not coalescing_enabled():
+            return encoded
+
+        render = self._renderers.get(key)
+        if render is None:
+            render = self._renderers[key] = lambda merged: self.text(field, merged, role)
+        return DeltaChunk(encoded, value, render)
+
+    def chunk(
+        self,
+        delta: Dict[str, Any],
+        finish_reason: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """编码任意 delta，可附带结束原因和使用统计"""
+        parts = [
+            self._current_head(),
+            json_codec.dumps(delta),
+            ',"finish_reason":',
+            json_codec.dumps(finish_reason),
+            self._tail,
+        ]
+        if usage is not None:
+            parts.append(',"usage":')
+            parts.append(json_codec.dumps(usage))
+        parts.append("}\n\n")
+        return "".join(parts)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+提供商熔断器
+按最近 window 次请求的错误率和慢请求比例判断上游是否异常：
+- closed：正常放行，窗口内请求数达到 min_requests 且错误率或慢请求比例超过阈值时打开
+- open：直接跳过该提供商（不再等待它超时），open_duration 秒后进入 half_open
+- half_open：只放行一个探测请求，成功则关闭，失败则重新打开
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.utils.metrics import CIRCUIT_BREAKER_STATE
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 指标中的状态取值
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """基于错误率和延迟的熔断器"""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_requests: int = 10,
+        error_rate: float = 0.5,
+        slow_call_duration: float = 10.0,
+        slow_call_rate: float = 0.8,
+        open_duration: float = 30.0,
+    ):
+        """
+        Args:
+            name: 提供商名称
+            window: 统计最近多少次请求
+            min_requests: 窗口内至少有多少次请求才判断是否打开
+            error_rate: 错误率阈值
+            slow_call_duration: 超过该耗时（秒）的成功请求计为慢请求，0 表示不统计
+            slow_call_rate: 慢请求比例阈值
+            open_duration: 打开后多久进入半开状态（秒）
+        """
+        self.name = name
+        self.window = max(1, window)
+        self.min_requests = max(1, min(min_requests, self.window))
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_started = 0.0
+        # 最近的结果：(是否失败, 是否慢请求)
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=self.window)
+        self._failures = 0
+        self._slow = 0
+
+        # 统计信息
+        self.times_opened = 0
+        self.rejected = 0
+        CIRCUIT_BREAKER_STATE.labels(name).set(0)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """是否放行一个请求；半开状态同一时间只放行一个探测请求"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            if now - self.opened_at < self.open_duration:
+                self.rejected += 1
+                return False
+            self._set_state(HALF_OPEN)
+            self._probe_started = now
+            return True
+        # 半开：探测请求未记录结果（例如客户端中途断开）超过 open_duration 后允许新的探测
+        if now - self._probe_started >= self.open_duration:
+            self._probe_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self, duration: float, now: Optional[float] = None):
+        """记录一次成功请求及其耗时（秒）"""
+        if self.state != CLOSED:
+            self._close()
+            return
+        self._push(False, bool(self.slow_call_duration) and duration >= self.slow_call_duration, now)
+
+    def record_failure(self, now: Optional[float] = None):
+        """记录一次失败请求"""
+        if self.state != CLOSED:
+            self._open(time.monotonic() if now is None else now)
+            return
+        self._push(True, False, now)
+
+    def _push(self, failed: bool, slow: bool, now: Optional[float]):
+        outcomes = self._outcomes
+        if len(outcomes) == outcomes.maxlen:
+            old_failed, old_slow = outcomes[0]
+            self._failures -= old_failed
+            self._slow -= old_slow
+        outcomes.append((failed, slow))
+        self._failures += failed
+        self._slow += slow
+
+        count = len(outcomes)
+        if count < self.min_requests:
+            return
+        if self._failures / count >= self.error_rate or (
+            self.slow_call_duration and self._slow / count >= self.slow_call_rate
+        ):
+            self._open(time.monotonic() if now is None else now)
+
+    def _open(self, now: float):
+        self._set_state(OPEN)
+        self.opened_at = now
+        self.times_opened += 1
+        self._outcomes.clear()
+        self._failures = self._slow = 0
+
+    def _close(self):
+        self._set_state(CLOSED)
+        self._outcomes.clear()
+        self._failures = self._slow = 0
+
+    def get_status(self) -> Dict:
+        """获取熔断器状态"""
+        count = len(self._outcomes)
+        return {
+            "state": self.state,
+            "window_requests": count,
+            "error_rate": round(self._failures / count, 3) if count else 0.0,
+            "slow_rate": round(self._slow / count, 3) if count else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
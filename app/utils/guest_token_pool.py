@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+访客令牌预取池
+在匿名模式下后台预先获取访客令牌，请求路径直接 O(1) 取用，避免每次请求多一次上游往返
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from app.utils.logger import logger
+
+
+@dataclass
+class GuestToken:
+    """预取的访客令牌"""
+    token: str
+    expires_at: float
+    uses: int = 0
+
+
+class GuestTokenPool:
+    """后台补充的访客令牌池"""
+
+    def __init__(
+        self,
+        fetcher: Callable[[], Awaitable[Optional[str]]],
+        expiry_resolver: Optional[Callable[[str], Optional[float]]] = None,
+        min_size: int = 2,
+        max_size: int = 8,
+        max_uses: int = 1,
+        default_ttl: float = 1800,
+        refresh_margin: float = 60,
+    ):
+        """
+        初始化访客令牌池
+
+        Args:
+            fetcher: 获取一个新访客令牌的协程函数，失败时返回 None 或空串
+            expiry_resolver: 根据令牌解析过期时间戳（秒）的函数，例如读取 JWT 的 exp
+            min_size: 低于此数量时立即触发后台补充
+            max_size: 池的最大容量
+            max_uses: 单个令牌最多被复用的次数
+            default_ttl: 无法解析过期时间时使用的有效期（秒）
+            refresh_margin: 距离过期不足该秒数的令牌视为已过期
+        """
+        self.fetcher = fetcher
+        self.expiry_resolver = expiry_resolver
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_uses = max(1, max_uses)
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+
+        self._tokens: Deque[GuestToken] = deque()
+        self._refill_event: Optional[asyncio.Event] = None
+        self._refill_task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.fetch_failures = 0
+        self.expired = 0
+
+    @property
+    def size(self) -> int:
+        """当前池中的令牌数"""
+        return len(self._tokens)
+
+    @property
+    def is_running(self) -> bool:
+        """后台补充任务是否在运行"""
+        return self._refill_task is not None and not self._refill_task.done()
+
+    def acquire(self) -> Optional[str]:
+        """
+        取出一个可用的访客令牌（O(1)，不做任何 I/O）
+
+        Returns:
+            可用令牌，池为空时返回 None，由调用方回退到同步获取
+        """
+        now = time.time()
+        tokens = self._tokens
+
+        while tokens:
+            entry = tokens[0]
+            if entry.expires_at - self.refresh_margin <= now:
+                tokens.popleft()
+                self.expired += 1
+                continue
+
+            entry.uses += 1
+            tokens.popleft()
+            if entry.uses < self.max_uses:
+                # 还能复用的令牌放回队尾，让复用均匀分布在各个令牌上
+                tokens.append(entry)
+
+            self.hits += 1
+            if len(tokens) < self.min_size:
+                self._request_refill()
+            return entry.token
+
+        self.misses += 1
+        self._request_refill()
+        return None
+
+    def add(self, token: str) -> bool:
+        """将一个令牌放入池中，池已满或令牌即将过期时丢弃"""
+        if not token or len(self._tokens) >= self.max_size:
+            return False
+
+        expires_at = self._resolve_expiry(token)
+        if expires_at - self.refresh_margin <= time.time():
+            self.expired += 1
+            return False
+
+        self._tokens.append(GuestToken(token=token, expires_at=expires_at))
+        return True
+
+    def _resolve_expiry(self, token: str) -> float:
+        """解析令牌过期时间，解析失败时使用默认有效期"""
+        if self.expiry_resolver:
+            try:
+                expires_at = self.expiry_resolver(token)
+                if expires_at:
+                    return float(expires_at)
+            except Exception as e:
+                logger.debug(f"解析访客令牌过期时间失败: {e}")
+        return time.time() + self.default_ttl
+
+    def _request_refill(self):
+        """唤醒后台补充任务"""
+        if self._refill_event is not None:
+            self._refill_event.set()
+
+    def _purge_expired(self):
+        """移除已过期（或即将过期）的令牌"""
+        deadline = time.time() + self.refresh_margin
+        if any(entry.expires_at <= deadline for entry in self._tokens):
+            alive = [entry for entry in self._tokens if entry.expires_at > deadline]
+            self.expired += len(self._tokens) - len(alive)
+            self._tokens = deque(alive)
+
+    async def refill(self) -> int:
+        """将池补充到最大容量，返回新增的令牌数"""
+        self._purge_expired()
+        added = 0
+
+        while len(self._tokens) < self.max_size:
+            try:
+                token = await self.fetcher()
+            except Exception as e:
+                token = None
+                logger.warning(f"⚠️ 预取访客令牌异常: {e}")
+
+            if not token:
+                self.fetch_failures += 1
+                break
+
+            self.fetched += 1
+            if self.add(token):
+                added += 1
+
+        return added
+
+    async def _refill_loop(self):
+        """后台补充循环：低水位时立即补充，否则定期清理过期令牌"""
+        backoff = 1.0
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=self.refresh_margin or 30)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+
+            low_watermark = max(self.min_size, 1)
+            if len(self._tokens) >= low_watermark:
+                self._purge_expired()
+                if len(self._tokens) >= low_watermark:
+                    continue
+
+            added = await self.refill()
+            if added == 0 and len(self._tokens) < low_watermark:
+                # 上游暂时不可用，退避后重试
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                self._refill_event.set()
+            else:
+                backoff = 1.0
+
+    async def start(self):
+        """启动后台补充任务并预热"""
+        if self.is_running:
+            return
+
+        self._refill_event = asyncio.Event()
+        self._refill_event.set()
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        logger.info(f"🎟️ 访客令牌池已启动 (min={self.min_size}, max={self.max_size}, 复用上限={self.max_uses})")
+
+    async def stop(self):
+        """停止后台补充任务"""
+        task = self._refill_task
+        self._refill_task = None
+        self._refill_event = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def get_status(self) -> Dict:
+        """获取访客令牌池状态"""
+        now = time.time()
+        return {
+            "running": self.is_running,
+            "size": len(self._tokens),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "max_uses": self.max_uses,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetched": self.fetched,
+            "fetch_failures": self.fetch_failures,
+            "expired": self.expired,
+            "next_expiry_in": round(min((t.expires_at for t in self._tokens), default=now) - now, 1),
+        }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对冲请求策略
+上游首块延迟长尾明显：请求在等待时间超过最近请求首块延迟的指定百分位后，
+用另一个token再发一个相同的请求，先产出首块的请求胜出，另一个取消。
+对冲数量受预算限制（每个请求积累 max_ratio 个额度，每次对冲消耗 1 个），上游整体变慢时不会成倍放大流量。
+"""
+
+from typing import AsyncIterator, Dict, List
+
+from app.utils.metrics import HEDGE_DELAY, HEDGES
+
+# 预算额度上限，避免长时间空闲后集中对冲
+MAX_BUDGET = 10.0
+
+
+class HedgePolicy:
+    """按最近首块延迟百分位决定对冲等待时间，并统计对冲效果"""
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_delay: float = 0.5,
+        max_delay: float = 10.0,
+        default_delay: float = 2.0,
+        max_ratio: float = 0.1,
+        window: int = 500,
+        min_samples: int = 20,
+    ):
+        """
+        Args:
+            percentile: 对冲等待时间取最近首块延迟的该百分位
+            min_delay: 等待时间下限（秒）
+            max_delay: 等待时间上限（秒）
+            default_delay: 样本不足 min_samples 时的等待时间（秒）
+            max_ratio: 对冲请求占总请求的比例上限
+            window: 参与百分位计算的最近样本数
+            min_samples: 开始按百分位计算所需的最少样本数
+        """
+        self.percentile = min(max(percentile, 1.0), 100.0)
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.default_delay = default_delay
+        self.max_ratio = max(0.0, max_ratio)
+        self.window = max(1, window)
+        self.min_samples = max(1, min_samples)
+
+        # 首块延迟环形缓冲区
+        self._samples: List[float] = []
+        self._next = 0
+        # 等待时间缓存，每积累一定数量的新样本重新计算
+        self._delay = self._clamp(default_delay)
+        self._pending = 0
+        self._budget = 1.0
+
+        # 统计信息
+        self.requests = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.hedge_wins = 0
+        self.budget_skipped = 0
+        self.no_token_skipped = 0
+        HEDGE_DELAY.set(self._delay)
+
+    def _clamp(self, delay: float) -> float:
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def delay(self) -> float:
+        """当前的对冲等待时间（秒）"""
+        return self._delay
+
+    def record_latency(self, latency: float):
+        """记录一次首块延迟（被取消的请求记录取消时已等待的时间）"""
+        samples = self._samples
+        if len(samples) < self.window:
+            samples.append(latency)
+        else:
+            samples[self._next] = latency
+            self._next = (self._next + 1) % self.window
+
+        self._pending += 1
+        if len(samples) >= self.min_samples and self._pending >= max(1, min(len(samples), self.window) // 20):
+            self._pending = 0
+            ordered = sorted(samples)
+            index = min(len(ordered) - 1, max(0, int(-(-self.percentile * len(ordered) // 100)) - 1))
+            self._delay = self._clamp(ordered[index])
+            HEDGE_DELAY.set(self._delay)
+
+    def start_request(self):
+        """新请求开始，积累对冲预算"""
+        self.requests += 1
+        self._budget = min(MAX_BUDGET, self._budget + self.max_ratio)
+
+    def try_hedge(self) -> bool:
+        """预算充足时消耗一个额度并返回 True"""
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            self.hedged += 1
+            return True
+        self.budget_skipped += 1
+        HEDGES.labels("budget").inc()
+        return False
+
+    def record_no_token(self):
+        """try_hedge 之后没有另一个可用token，放弃对冲并退还额度"""
+        self._budget = min(MAX_BUDGET, self._budget + 1.0)
+        self.hedged -= 1
+        self.no_token_skipped += 1
+        HEDGES.labels("no_token").inc()
+
+    def record_winner(self, hedge_won: bool):
+        """记录已对冲请求的胜出方"""
+        if hedge_won:
+            self.hedge_wins += 1
+            HEDGES.labels("hedge").inc()
+        else:
+            self.primary_wins += 1
+            HEDGES.labels("primary").inc()
+
+    def get_status(self) -> Dict:
+        """获取对冲统计"""
+        return {
+            "percentile": self.percentile,
+            "delay": round(self._delay, 3),
+            "samples": len(self._samples),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "primary_wins": self.primary_wins,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedged, 4) if self.hedged else 0.0,
+            "budget_skipped": self.budget_skipped,
+            "no_token_skipped": self.no_token_skipped,
+            "max_ratio": self.max_ratio,
+        }
+
+
+class PrefetchedResponse:
+    """已读出首个数据块的流式响应：aiter_bytes() 先产出该数据块，再继续读取剩余内容"""
+
+    def __init__(self, first_chunk: bytes, chunks: AsyncIterator[bytes]):
+        self.first_chunk = first_chunk
+        self._chunks = chunks
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        if self.first_chunk:
+            yield self.first_chunk
+        async for chunk in self._chunks:
+            yield chunk
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+共享上游 HTTP 客户端注册表
+为每个提供商维护一个长连接的 httpx.AsyncClient，避免每次请求都重新进行 TCP + TLS 握手
+"""
+
+import time
+from dataclasses import dataclass
+from http.cookiejar import CookieJar
+from typing import Dict, Optional
+
+import httpx
+
+from app.utils.logger import logger
+from app.utils.metrics import UPSTREAM_CONNECT
+
+
+@dataclass
+class HttpClientConfig:
+    """客户端连接池配置"""
+    timeout: float = 30.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    transport: Optional[httpx.AsyncBaseTransport] = None  # 自定义传输层（测试时注入 MockTransport）
+
+
+@dataclass
+class HttpClientStats:
+    """客户端连接复用统计"""
+    requests: int = 0
+    connections_opened: int = 0
+    connect_time_total: float = 0.0
+    created_at: float = 0.0
+    http2: bool = False
+
+    @property
+    def connections_reused(self) -> int:
+        """复用已有连接的请求数"""
+        return max(self.requests - self.connections_opened, 0)
+
+    @property
+    def reuse_rate(self) -> float:
+        """连接复用率"""
+        if self.requests == 0:
+            return 0.0
+        return self.connections_reused / self.requests
+
+    @property
+    def avg_connect_time(self) -> float:
+        """平均建连耗时（秒）"""
+        if self.connections_opened == 0:
+            return 0.0
+        return self.connect_time_total / self.connections_opened
+
+
+class _NullCookieJar(CookieJar):
+    """不保存任何响应 Cookie 的 CookieJar
+
+    共享客户端会被不同 token / 会话复用，上游 Cookie 一律由调用方通过请求头显式传入，
+    不能让上一次响应的 Set-Cookie 串到下一次请求里。
+    """
+
+    def set_cookie(self, cookie):
+        return
+
+    def extract_cookies(self, response, request):
+        return
+
+
+def _http2_available() -> bool:
+    """检查 HTTP/2 依赖（h2）是否已安装"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClientRegistry:
+    """按名称管理的共享 AsyncClient 注册表
+
+    客户端在首次使用时惰性创建，在应用 lifespan 结束时统一关闭。
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._configs: Dict[str, HttpClientConfig] = {}
+        self._stats: Dict[str, HttpClientStats] = {}
+
+    def get_client(self, name: str, config: Optional[HttpClientConfig] = None) -> httpx.AsyncClient:
+        """获取（必要时创建）指定名称的共享客户端"""
+        client = self._clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+
+        config = config or self._configs.get(name) or HttpClientConfig()
+        client = self._create_client(name, config)
+        self._clients[name] = client
+        self._configs[name] = config
+        return client
+
+    def _create_client(self, name: str, config: HttpClientConfig) -> httpx.AsyncClient:
+        """创建带连接复用统计的客户端"""
+        http2 = config.http2
+        if http2 and not _http2_available():
+            logger.warning(f"⚠️ {name} 请求启用 HTTP/2，但未安装 h2（pip install httpx[http2]），回退到 HTTP/1.1")
+            http2 = False
+
+        stats = HttpClientStats(created_at=time.time(), http2=http2)
+        self._stats[name] = stats
+        connect_metric = UPSTREAM_CONNECT.labels(name)
+
+        async def on_request(request: httpx.Request):
+            stats.requests += 1
+            connect_started = 0.0
+
+            async def trace(event_name: str, info: dict):
+                # httpcore 仅在新建连接时触发 connect_tcp 事件，复用连接时不会
+                nonlocal connect_started
+                if event_name == "connection.connect_tcp.started":
+                    connect_started = time.perf_counter()
+                elif event_name == "connection.connect_tcp.complete":
+                    connect_time = time.perf_counter() - connect_started
+                    stats.connections_opened += 1
+                    stats.connect_time_total += connect_time
+                    connect_metric.observe(connect_time)
+
+            request.extensions["trace"] = trace
+
+        logger.debug(
+            f"🔌 创建共享HTTP客户端: {name} (max_connections={config.max_connections}, "
+            f"keepalive={config.max_keepalive_connections}, http2={http2})"
+        )
+
+        return httpx.AsyncClient(
+            timeout=config.timeout,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            http2=http2,
+            transport=config.transport,
+            cookies=_NullCookieJar(),
+            event_hooks={"request": [on_request]},
+        )
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """获取所有客户端的连接复用统计"""
+        result = {}
+        for name, stats in self._stats.items():
+            client = self._clients.get(name)
+            result[name] = {
+                "requests": stats.requests,
+                "connections_opened": stats.connections_opened,
+                "connections_reused": stats.connections_reused,
+                "reuse_rate": f"{stats.reuse_rate:.2%}",
+                "avg_connect_time_ms": round(stats.avg_connect_time * 1000, 2),
+                "http2": stats.http2,
+                "is_closed": client.is_closed if client else True,
+            }
+        return result
+
+    async def close_all(self):
+        """关闭所有共享客户端"""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for name, client in clients:
+            try:
+                await client.aclose()
+                logger.debug(f"🔌 已关闭共享HTTP客户端: {name}")
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭HTTP客户端 {name} 失败: {e}")
+
+
+# 全局共享客户端注册表
+http_client_registry = HttpClientRegistry()
+
+
+def get_http_client(name: str, config: Optional[HttpClientConfig] = None) -> httpx.AsyncClient:
+    """获取全局共享客户端"""
+    return http_client_registry.get_client(name, config)
+
+
+async def close_http_clients():
+    """关闭全局共享客户端（应用关闭时调用）"""
+    await http_client_registry.close_all()
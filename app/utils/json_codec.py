@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+JSON 编解码
+流式热路径上每个上游 chunk 都要解析一次、每个下游 chunk 都要序列化一次，
+这里统一封装，安装了 orjson / msgspec 时自动使用，否则回退到标准库。
+
+本模块会被 app.utils 包在配置加载之前导入，不能依赖 app.core.config；
+JSON_BACKEND 配置由 main.py 启动时通过 set_json_backend() 应用。
+调用方应通过模块属性（json_codec.loads / json_codec.dumps）访问，以便切换后端后立即生效。
+"""
+
+import json
+from typing import Any, Callable, Dict, Union
+
+from app.utils.logger import get_logger
+
+logger = get_logger()
+
+# 所有后端的解析错误都统一为标准库异常（orjson.JSONDecodeError 本身就是其子类）
+JSONDecodeError = json.JSONDecodeError
+
+JSONInput = Union[str, bytes, bytearray, memoryview]
+
+_BACKEND_PRIORITY = ("orjson", "msgspec", "stdlib")
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _stdlib_loads(data: JSONInput) -> Any:
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _make_orjson():
+    import orjson
+
+    option = orjson.OPT_NON_STR_KEYS
+    encode = orjson.dumps
+
+    def dumps_bytes(obj: Any) -> bytes:
+        try:
+            return encode(obj, option=option)
+        except TypeError:
+            # 超出 64 位的整数等 orjson 不支持的值，交给标准库处理
+            return _stdlib_dumps(obj).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        return dumps_bytes(obj).decode("utf-8")
+
+    return orjson.loads, dumps, dumps_bytes
+
+
+def _make_msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def loads(data: JSONInput) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            doc = data if isinstance(data, str) else bytes(data).decode("utf-8", "replace")
+            raise JSONDecodeError(str(e), doc, 0) from None
+
+    def dumps_bytes(obj: Any) -> bytes:
+        try:
+            return encoder.encode(obj)
+        except (TypeError, msgspec.EncodeError):
+            return _stdlib_dumps(obj).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        return dumps_bytes(obj).decode("utf-8")
+
+    return loads, dumps, dumps_bytes
+
+
+def _make_stdlib():
+    return _stdlib_loads, _stdlib_dumps, lambda obj: _stdlib_dumps(obj).encode("utf-8")
+
+
+_BACKEND_FACTORIES: Dict[str, Callable] = {
+    "orjson": _make_orjson,
+    "msgspec": _make_msgspec,
+    "stdlib": _make_stdlib,
+}
+
+backend: str = "stdlib"
+loads: Callable[[JSONInput], Any] = _stdlib_loads
+dumps: Callable[[Any], str] = _stdlib_dumps
+dumps_bytes: Callable[[Any], bytes] = _make_stdlib()[2]
+
+
+def available_backends() -> list:
+    """返回当前环境可用的后端（按优先级）"""
+    result = []
+    for name in _BACKEND_PRIORITY:
+        try:
+            _BACKEND_FACTORIES[name]()
+            result.append(name)
+        except ImportError:
+            continue
+    return result
+
+
+def set_json_backend(name: str = "auto") -> str:
+    """
+    切换 JSON 后端
+
+    Args:
+        name: auto / orjson / msgspec / stdlib，auto 按 orjson > msgspec > stdlib 选择第一个可用的
+
+    Returns:
+        实际使用的后端名称（指定的后端未安装时回退到 auto）
+    """
+    global backend, loads, dumps, dumps_bytes
+
+    name = (name or "auto").lower()
+    if name != "auto" and name not in _BACKEND_FACTORIES:
+        logger.warning(f"⚠️ 未知的 JSON 后端 {name}，使用 auto")
+        name = "auto"
+
+    candidates = _BACKEND_PRIORITY if name == "auto" else (name,) + _BACKEND_PRIORITY
+    for candidate in candidates:
+        try:
+            loads, dumps, dumps_bytes = _BACKEND_FACTORIES[candidate]()
+        except ImportError:
+            if candidate == name:
+                logger.warning(f"⚠️ JSON 后端 {name} 未安装，自动选择可用后端")
+            continue
+        backend = candidate
+        break
+
+    return backend
+
+
+def sse_data(obj: Any) -> str:
+    """序列化为一条 SSE data 消息"""
+    return f"data: {dumps(obj)}\n\n"
+
+
+set_json_backend()
@@ -8,8 +8,27 @@ from loguru import logger
 # Global logger instance
 app_logger = None
 
+# 日志配置：default 同步写入、逐块日志全部输出；production 通过队列异步写入、逐块日志按采样输出
+LOG_PROFILES = ("default", "production")
+PRODUCTION_CHUNK_SAMPLE_EVERY = 100
 
-def setup_logger(log_dir=None, log_retention_days=7, log_rotation="1 day", debug_mode=False):
+# 热路径上的日志开关（setup_logger 时确定），逐块日志先检查开关再格式化
+_debug_enabled = False
+_chunk_sample_every = 1
+
+
+def debug_enabled() -> bool:
+    """是否输出 DEBUG 日志；用于在格式化开销较大的调试日志之前做级别判断"""
+    return _debug_enabled
+
+
+def chunk_log_enabled(index: int) -> bool:
+    """流式逐块日志是否输出第 index 块：需要开启 DEBUG，且命中采样（每 N 块输出一次）"""
+    return _debug_enabled and index % _chunk_sample_every == 0
+
+
+def setup_logger(log_dir=None, log_retention_days=7, log_rotation="1 day", debug_mode=False,
+                 profile="default", chunk_sample_every=0):
     """
     Create a logger instance
 
@@ -18,13 +37,22 @@ def setup_logger(log_dir=None, log_retention_days=7, log_rotation="1 day", debug
         log_retention_days (int): 日志保留天数
         log_rotation (str): 日志轮转间隔
         debug_mode (bool): 是否开启调试模式
+        profile (str): 日志配置，default 或 production
+        chunk_sample_every (int): 流式逐块日志每 N 块输出一次，0 表示使用配置的默认值
     """
-    global app_logger
+    global app_logger, _debug_enabled, _chunk_sample_every
 
     try:
         logger.remove()
 
+        unknown_profile = profile not in LOG_PROFILES
+        production = profile == "production"
+
         log_level = "DEBUG" if debug_mode else "INFO"
+        _debug_enabled = debug_mode
+        if chunk_sample_every <= 0:
+            chunk_sample_every = PRODUCTION_CHUNK_SAMPLE_EVERY if production else 1
+        _chunk_sample_every = chunk_sample_every
 
         console_format = (
             "<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>"
@@ -33,7 +61,15 @@ def setup_logger(log_dir=None, log_retention_days=7, log_rotation="1 day", debug
             "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | <level>{message}</level>"
         )
 
-        logger.add(sys.stderr, level=log_level, format=console_format, colorize=True)
+        if production:
+            # 通过队列由后台线程写入，请求处理不阻塞在 stderr 上；关闭异常时的变量诊断输出
+            logger.add(sys.stderr, level=log_level, format=console_format, colorize=False,
+                       enqueue=True, backtrace=False, diagnose=False, catch=True)
+        else:
+            logger.add(sys.stderr, level=log_level, format=console_format, colorize=True)
+
+        if unknown_profile:
+            logger.warning(f"⚠️ 未知的日志配置 {profile}，使用 default")
 
         # 尝试设置文件日志，如果失败则仅使用控制台输出
         if debug_mode and log_dir is not None:
@@ -70,6 +106,11 @@ def setup_logger(log_dir=None, log_retention_days=7, log_rotation="1 day", debug
         raise
 
 
+def flush_logger():
+    """等待队列中的日志写完（production 配置下关闭前调用）"""
+    logger.complete()
+
+
 def get_logger():
     """Get the logger instance"""
     global app_logger
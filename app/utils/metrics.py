@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+轻量指标注册表
+提供计数器、仪表和固定分桶直方图，输出 Prometheus 文本格式（/metrics）。
+
+所有记录都在事件循环线程中进行，不加锁；带标签的指标通过 labels() 取得子指标后缓存复用，
+热路径上的 inc() / observe() 只做数值累加，没有额外的对象分配。
+"""
+
+import time
+from bisect import bisect_left
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # 最后一个桶对应 +Inf；各桶分别计数，输出时再累加
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    """指标基类：按标签值元组缓存子指标"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """获取（必要时创建）指定标签值的子指标，热路径上应缓存返回值"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {values}")
+            key = tuple(str(v) for v in values)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def clear(self):
+        """清空所有子指标"""
+        self._children.clear()
+
+    def _label_str(self, values: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        for values, child in list(self._children.items()):
+            yield from self._render_child(values, child)
+
+    def _render_child(self, values, child) -> Iterator[str]:
+        yield f"{self.name}{self._label_str(values)} {_format(child.value)}"
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    """固定分桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child: _HistogramChild) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            le = 'le="' + _format(bound) + '"'
+            yield f"{self.name}_bucket{self._label_str(values, le)} {cumulative}"
+        le = 'le="+Inf"'
+        yield f"{self.name}_bucket{self._label_str(values, le)} {child.count}"
+        yield f"{self.name}_sum{self._label_str(values)} {_format(child.sum)}"
+        yield f"{self.name}_count{self._label_str(values)} {child.count}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+
+REQUESTS = metrics_registry.counter(
+    "zai2api_requests_total", "Chat completion requests", ("provider", "model", "outcome"))
+REQUEST_DURATION = metrics_registry.histogram(
+    "zai2api_request_duration_seconds", "Chat completion request duration", ("provider", "model", "outcome"))
+TIME_TO_FIRST_TOKEN = metrics_registry.histogram(
+    "zai2api_time_to_first_token_seconds", "Time from request start to first content chunk", ("provider", "model"))
+CHUNKS_PER_SECOND = metrics_registry.histogram(
+    "zai2api_stream_chunks_per_second", "Streamed non-empty content chunks per second after the first one",
+    ("provider", "model"), buckets=RATE_BUCKETS)
+UPSTREAM_CONNECT = metrics_registry.histogram(
+    "zai2api_upstream_connect_seconds", "Upstream TCP connect time for new connections", ("client",))
+TOKEN_POOL_WAIT = metrics_registry.histogram(
+    "zai2api_token_pool_wait_seconds", "Time spent acquiring a token from the pool", ("outcome",))
+UPSTREAM_RETRIES = metrics_registry.counter(
+    "zai2api_upstream_retries_total", "Upstream attempts retried before any byte reached the client",
+    ("provider", "reason"))
+HEDGES = metrics_registry.counter(
+    "zai2api_hedged_requests_total",
+    "Hedged upstream requests by outcome (primary/hedge won, or skipped for budget/no_token)", ("outcome",))
+HEDGE_DELAY = metrics_registry.gauge(
+    "zai2api_hedge_delay_seconds", "Current first-chunk wait before a hedge request is sent")
+PROVIDER_FALLBACKS = metrics_registry.counter(
+    "zai2api_provider_fallbacks_total",
+    "Providers passed over during routing (circuit open, or failed before any byte reached the client)",
+    ("provider", "reason"))
+CIRCUIT_BREAKER_STATE = metrics_registry.gauge(
+    "zai2api_circuit_breaker_state", "Provider circuit breaker state (0 closed, 1 open, 2 half-open)",
+    ("provider",))
+TOKEN_REQUESTS = metrics_registry.counter(
+    "zai2api_token_requests_total", "Upstream results per token (token id is a hash)", ("token", "outcome"))
+STREAMS = metrics_registry.counter(
+    "zai2api_streams_total", "Streaming responses by outcome", ("outcome",))
+ACTIVE_STREAMS = metrics_registry.gauge(
+    "zai2api_active_streams", "Streaming responses in progress")
+TOKEN_POOL_TOKENS = metrics_registry.gauge(
+    "zai2api_token_pool_tokens", "Tokens in the pool by state", ("state",))
+TOKEN_POOL_IN_FLIGHT = metrics_registry.gauge(
+    "zai2api_token_pool_in_flight", "Upstream requests in flight across all pooled tokens")
+TOKEN_POOL_QUEUE_DEPTH = metrics_registry.gauge(
+    "zai2api_token_pool_queue_depth", "Requests waiting for a token")
+
+
+def observe_request(provider: str, model: str, outcome: str, duration: float):
+    """记录一次非流式请求"""
+    REQUESTS.labels(provider, model, outcome).inc()
+    REQUEST_DURATION.labels(provider, model, outcome).observe(duration)
+
+
+def _has_content(item: str) -> bool:
+    """SSE 数据块中是否带有非空的 content / reasoning_content 字段"""
+    start = item.find('content":')
+    while start != -1:
+        value = item[start + 9:].lstrip()
+        if value.startswith('"') and not value.startswith('""'):
+            return True
+        start = item.find('content":', start + 9)
+    return False
+
+
+async def observe_stream(
+    source: AsyncIterator[str],
+    provider: str,
+    model: str,
+    started: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    透传流式响应并记录请求耗时、首个内容块延迟和内容块输出速率（空内容块不计入）
+
+    结果分为 success / error（输出了错误块或抛出异常）/ cancelled（客户端断开）
+    """
+    started = time.perf_counter() if started is None else started
+    first_token_at = 0.0
+    content_chunks = 0
+    outcome = "success"
+
+    try:
+        async for item in source:
+            if _has_content(item):
+                content_chunks += 1
+                if not first_token_at:
+                    first_token_at = time.perf_counter()
+            elif item.startswith('data: {"error"'):
+                outcome = "error"
+            yield item
+    except BaseException as e:
+        # GeneratorExit / CancelledError 表示客户端断开
+        outcome = "error" if isinstance(e, Exception) else "cancelled"
+        raise
+    finally:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        finished = time.perf_counter()
+        observe_request(provider, model, outcome, finished - started)
+        if first_token_at:
+            TIME_TO_FIRST_TOKEN.labels(provider, model).observe(first_token_at - started)
+            if content_chunks > 1 and finished > first_token_at:
+                CHUNKS_PER_SECOND.labels(provider, model).observe((content_chunks - 1) / (finished - first_token_at))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+实时请求记录
+ASGI 中间件记录每个 API 请求的方法、路径、模型、状态码、首字节耗时和总耗时，
+写入固定大小的环形缓冲区（预分配，覆盖最旧的记录，写入 O(1)）；
+监控面板读取时再排序计算 p50/p95/p99，请求路径上不做任何统计计算。
+"""
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class RequestRecord:
+    """单个请求的记录"""
+    timestamp: float
+    method: str
+    path: str
+    user_agent: str = ""
+    model: Optional[str] = None
+    status: int = 0
+    ttft: Optional[float] = None  # 首个响应体字节的耗时（秒）
+    duration: float = 0.0  # 总耗时（秒），流式请求包含整个流
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为监控面板使用的格式（耗时单位为毫秒）"""
+        return {
+            "id": str(int(self.timestamp * 1000)),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.timestamp)),
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration": round(self.duration * 1000, 1),
+            "ttft": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "user_agent": self.user_agent,
+            "model": self.model,
+        }
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """最近秩法计算百分位（毫秒）"""
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    values.sort()
+    count = len(values)
+    return {
+        f"p{p}": round(values[min(count - 1, max(0, -(-p * count // 100) - 1))] * 1000, 1)
+        for p in PERCENTILES
+    }
+
+
+class RequestLog:
+    """固定大小的请求记录环形缓冲区
+
+    累计计数（总数/成功/失败/平均耗时）覆盖全部请求，百分位只基于缓冲区中最近的请求。
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, capacity)
+        self._records: List[Optional[RequestRecord]] = [None] * self.capacity
+        self._next = 0
+
+        self.total = 0
+        self.successful = 0
+        self.failed = 0
+        self.total_duration = 0.0
+        self.last_request_time: Optional[float] = None
+
+    def add(self, record: RequestRecord):
+        """写入一条记录，缓冲区满时覆盖最旧的记录"""
+        self._records[self._next] = record
+        self._next += 1
+        if self._next == self.capacity:
+            self._next = 0
+
+        self.total += 1
+        if 200 <= record.status < 300:
+            self.successful += 1
+        else:
+            self.failed += 1
+        self.total_duration += record.duration
+        self.last_request_time = record.timestamp
+
+    def recent(self, limit: Optional[int] = None) -> List[RequestRecord]:
+        """最近的请求记录（最新的在前）"""
+        ordered = self._records[self._next:] + self._records[:self._next]
+        records = [record for record in reversed(ordered) if record is not None]
+        return records[:limit] if limit is not None else records
+
+    def stats(self) -> Dict[str, Any]:
+        """统计数据；百分位在读取时计算"""
+        records = self.recent()
+        durations = [record.duration for record in records]
+        ttfts = [record.ttft for record in records if record.ttft is not None]
+        return {
+            "totalRequests": self.total,
+            "successfulRequests": self.successful,
+            "failedRequests": self.failed,
+            "averageResponseTime": round(self.total_duration / self.total * 1000, 1) if self.total else 0,
+            "lastRequestTime": self.last_request_time,
+            "windowSize": len(records),
+            "responseTime": _percentiles(durations),
+            "timeToFirstToken": _percentiles(ttfts),
+        }
+
+
+# 当前请求的记录，供接口处理函数补充模型等信息
+_current_record: ContextVar[Optional[RequestRecord]] = ContextVar("current_request_record", default=None)
+
+# 全局请求记录
+request_log = RequestLog()
+
+
+def get_request_log() -> RequestLog:
+    """获取全局请求记录"""
+    return request_log
+
+
+def initialize_request_log(capacity: int) -> RequestLog:
+    """按配置的容量重新创建全局请求记录"""
+    global request_log
+    request_log = RequestLog(capacity)
+    return request_log
+
+
+def note_request_model(model: str):
+    """记录当前请求使用的模型（不在中间件记录的请求中时忽略）"""
+    record = _current_record.get()
+    if record is not None:
+        record.model = model
+
+
+class RequestTimingMiddleware:
+    """请求计时 ASGI 中间件
+
+    只记录 path_prefixes 下的请求（默认 /v1/），监控面板自身的轮询不计入。
+    """
+
+    def __init__(self, app: ASGIApp, path_prefixes: Sequence[str] = ("/v1/",)):
+        self.app = app
+        self.path_prefixes: Tuple[str, ...] = tuple(path_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        user_agent = ""
+        for name, value in scope.get("headers", ()):
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+                break
+
+        record = RequestRecord(
+            timestamp=time.time(),
+            method=scope["method"],
+            path=scope["path"],
+            user_agent=user_agent,
+        )
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                record.status = message["status"]
+            elif record.ttft is None and message_type == "http.response.body" and message.get("body"):
+                record.ttft = time.perf_counter() - started
+            await send(message)
+
+        context_token = _current_record.set(record)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            if not record.status:
+                record.status = 500
+            raise
+        finally:
+            record.duration = time.perf_counter() - started
+            _current_record.reset(context_token)
+            request_log.add(record)
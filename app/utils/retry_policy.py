@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上游请求重试策略
+在还没有向客户端输出任何内容之前，上游返回可重试的状态码或连接失败时换token重新签名后重试。
+重试受最大尝试次数和总时长预算限制，按状态码区分处理方式：
+- 401/403：token失效，记录失败后立即换token
+- 429：token被限流，换token并短暂退避
+- 5xx / 连接失败：上游临时故障，指数退避后重试
+"""
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+# 连接失败、读超时等没有状态码的错误
+NETWORK_ERROR = 0
+
+
+@dataclass(frozen=True)
+class RetryRule:
+    """单个状态码的处理方式"""
+    mark_failure: bool = False  # 是否计入token失败次数
+    backoff: bool = True  # 是否在重试前退避
+
+
+DEFAULT_RULES: Dict[int, RetryRule] = {
+    401: RetryRule(mark_failure=True, backoff=False),
+    403: RetryRule(mark_failure=True, backoff=False),
+    429: RetryRule(),
+    500: RetryRule(),
+    502: RetryRule(),
+    503: RetryRule(),
+    504: RetryRule(),
+    NETWORK_ERROR: RetryRule(),
+}
+
+DEFAULT_STATUSES = (401, 403, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """有限次数 + 总时长预算的重试策略"""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        budget: float = 15.0,
+        backoff: float = 0.2,
+        max_backoff: float = 2.0,
+        statuses: Iterable[int] = DEFAULT_STATUSES,
+        retry_network_errors: bool = True,
+    ):
+        """
+        Args:
+            max_attempts: 最大尝试次数（含首次请求），1 表示不重试
+            budget: 从首次请求开始的总时长预算（秒），超出后不再重试
+            backoff: 首次退避时间（秒），之后每次翻倍并加随机抖动
+            max_backoff: 单次退避时间上限（秒）
+            statuses: 需要重试的上游状态码，未在 DEFAULT_RULES 中的按退避重试处理
+            retry_network_errors: 连接失败、超时等网络错误是否重试
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.budget = budget
+        self.backoff = max(0.0, backoff)
+        self.max_backoff = max_backoff
+        self.rules: Dict[int, RetryRule] = {
+            status: DEFAULT_RULES.get(status, RetryRule()) for status in statuses
+        }
+        if retry_network_errors:
+            self.rules[NETWORK_ERROR] = DEFAULT_RULES[NETWORK_ERROR]
+
+    def rule_for(self, status: int) -> Optional[RetryRule]:
+        """状态码对应的处理方式，不可重试时返回 None"""
+        return self.rules.get(status)
+
+    def retry_delay(self, status: int, attempt: int, started: float, now: Optional[float] = None) -> Optional[float]:
+        """
+        第 attempt 次尝试失败后的重试等待时间
+
+        Args:
+            status: 上游状态码，网络错误为 NETWORK_ERROR
+            attempt: 已完成的尝试次数（从 1 开始）
+            started: 首次请求的 time.monotonic() 时间
+
+        Returns:
+            重试前需要等待的秒数；不可重试、次数用尽或预算不足时返回 None
+        """
+        rule = self.rules.get(status)
+        if rule is None or attempt >= self.max_attempts:
+            return None
+
+        delay = 0.0
+        if rule.backoff and self.backoff:
+            delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+            delay *= random.uniform(0.5, 1.0)
+
+        elapsed = (time.monotonic() if now is None else now) - started
+        if elapsed + delay >= self.budget:
+            return None
+        return delay
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多进程共享的token状态
+多个 worker 进程通过同一个内存映射文件共享每个token的进行中请求数、RPM 令牌桶和禁用状态，
+所有读写都在文件锁（flock）内完成，临界区只有几次内存读写。
+
+文件布局：
+    头部（64 字节）| worker 表（MAX_WORKERS × pid）| token 槽位（slots × SLOT_SIZE）
+每个槽位按token哈希线性探测分配，进行中请求数按 worker 分列保存，
+worker 退出或崩溃后清零它那一列，不会留下永久占用的名额。
+
+依赖 fcntl，仅支持类 Unix 系统。
+"""
+
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.utils.logger import logger
+
+MAGIC = b"ZAI2SHM\0"
+VERSION = 1
+MAX_WORKERS = 64
+
+_HEADER = struct.Struct("<8sIII")  # magic, version, slots, max_workers
+_HEADER_SIZE = 64
+_WORKER = struct.Struct("<q")  # pid，0 表示空闲
+_WORKERS_OFFSET = _HEADER_SIZE
+_SLOTS_OFFSET = _WORKERS_OFFSET + MAX_WORKERS * _WORKER.size
+
+# 槽位：token哈希(24)、失败次数、保留、禁用时间、令牌桶余额、令牌桶更新时间，之后是各 worker 的进行中请求数
+_KEY_SIZE = 24
+_SLOT = struct.Struct("<24sii3d")
+_IN_FLIGHT_OFFSET = _SLOT.size
+SLOT_SIZE = _SLOT.size + MAX_WORKERS * 4
+_FAILURE = struct.Struct("<i")
+_DOUBLE = struct.Struct("<d")
+_FAILURE_OFFSET = _KEY_SIZE
+_DISABLED_OFFSET = _KEY_SIZE + 8
+_RATE_OFFSET = _DISABLED_OFFSET + 8
+_RATE_UPDATED_OFFSET = _RATE_OFFSET + 8
+
+# try_acquire 的结果
+ACQUIRED = 0
+DISABLED = 1  # 已被（其他 worker）禁用，附带禁用时间
+BUSY = 2  # 达到并发上限
+RATE_LIMITED = 3  # 达到 RPM 上限，附带可再次使用的时间
+
+
+def shared_state_supported() -> bool:
+    """当前平台是否支持多进程共享状态"""
+    return fcntl is not None
+
+
+@dataclass
+class SharedTokenRecord:
+    """某个token在共享状态中的快照"""
+    failure_count: int
+    disabled_at: float
+    in_flight: int
+
+
+class SharedTokenState:
+    """基于内存映射文件 + flock 的跨进程token状态"""
+
+    def __init__(self, path: str, slots: int = 4096):
+        if fcntl is None:
+            raise RuntimeError("共享token状态依赖 fcntl，当前平台不支持")
+
+        self.path = path
+        self.slots = max(1, slots)
+        self.size = _SLOTS_OFFSET + self.slots * SLOT_SIZE
+        self.pid = os.getpid()
+        self.worker_index = -1
+        self._leader_fd: Optional[int] = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._exclusive():
+            if not self._header_matches():
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                self._map()
+                _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.slots, MAX_WORKERS)
+                logger.info(f"🗂️ 初始化共享token状态: {path} ({self.slots} 个槽位)")
+            else:
+                self._map()
+            self._reap_dead_workers()
+            self._register_worker()
+
+    # ---------- 文件与锁 ----------
+
+    def _header_matches(self) -> bool:
+        if os.fstat(self._fd).st_size != self.size:
+            return False
+        header = os.pread(self._fd, _HEADER.size, 0)
+        return header == _HEADER.pack(MAGIC, VERSION, self.slots, MAX_WORKERS)
+
+    def _map(self):
+        self._mm = mmap.mmap(self._fd, self.size)
+        self._view = memoryview(self._mm)
+        self._ints = self._view.cast("i")
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # ---------- worker 管理 ----------
+
+    def _worker_pid(self, index: int) -> int:
+        return _WORKER.unpack_from(self._mm, _WORKERS_OFFSET + index * _WORKER.size)[0]
+
+    def _set_worker_pid(self, index: int, pid: int):
+        _WORKER.pack_into(self._mm, _WORKERS_OFFSET + index * _WORKER.size, pid)
+
+    def _clear_worker_column(self, index: int):
+        ints = self._ints
+        base = (_SLOTS_OFFSET + _IN_FLIGHT_OFFSET) // 4 + index
+        step = SLOT_SIZE // 4
+        for slot in range(self.slots):
+            ints[base + slot * step] = 0
+
+    def _register_worker(self):
+        for index in range(MAX_WORKERS):
+            if self._worker_pid(index) in (0, self.pid):
+                self._clear_worker_column(index)
+                self._set_worker_pid(index, self.pid)
+                self.worker_index = index
+                return
+        raise RuntimeError(f"共享token状态最多支持 {MAX_WORKERS} 个 worker")
+
+    def _reap_dead_workers(self) -> int:
+        reaped = 0
+        for index in range(MAX_WORKERS):
+            pid = self._worker_pid(index)
+            if not pid or pid == self.pid or _pid_alive(pid):
+                continue
+            self._clear_worker_column(index)
+            self._set_worker_pid(index, 0)
+            reaped += 1
+        if reaped:
+            logger.info(f"🧹 清理了 {reaped} 个已退出 worker 的进行中请求计数")
+        return reaped
+
+    def reap_dead_workers(self) -> int:
+        """清理已退出 worker 遗留的进行中请求数"""
+        with self._exclusive():
+            return self._reap_dead_workers()
+
+    def worker_count(self) -> int:
+        """已注册的 worker 数量"""
+        return sum(1 for index in range(MAX_WORKERS) if self._worker_pid(index))
+
+    def try_become_leader(self) -> bool:
+        """
+        尝试成为主 worker（独占 .leader 锁文件，进程退出时自动释放）
+
+        健康检查、状态快照等后台任务只需要一个 worker 执行
+        """
+        if self._leader_fd is not None:
+            return True
+        fd = os.open(f"{self.path}.leader", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_fd is not None
+
+    # ---------- 槽位 ----------
+
+    def slot(self, key: str) -> Optional[int]:
+        """查找或分配token哈希（十六进制）对应的槽位，槽位已满时返回 None"""
+        encoded = key.encode("ascii")[:_KEY_SIZE].ljust(_KEY_SIZE, b"\0")
+        start = int(key[:8], 16) % self.slots
+        with self._exclusive():
+            for probe in range(self.slots):
+                index = (start + probe) % self.slots
+                offset = _SLOTS_OFFSET + index * SLOT_SIZE
+                existing = self._mm[offset:offset + _KEY_SIZE]
+                if existing == encoded:
+                    return index
+                if existing[0] == 0:
+                    _SLOT.pack_into(self._mm, offset, encoded, 0, 0, 0.0, 0.0, 0.0)
+                    return index
+        return None
+
+    def _in_flight(self, offset: int) -> int:
+        start = (offset + _IN_FLIGHT_OFFSET) // 4
+        return sum(self._ints[start:start + MAX_WORKERS])
+
+    def try_acquire(self, slot: int, max_concurrency: int, rpm_limit: int,
+                    recovery_timeout: float, now: float) -> Tuple[int, float]:
+        """
+        检查禁用状态、并发和速率上限，通过时计入本 worker 的进行中请求数并扣除速率额度
+
+        Returns:
+            (结果, 附带时间)：ACQUIRED / DISABLED(禁用时间) / BUSY / RATE_LIMITED(可再次使用的时间)
+        """
+        mm = self._mm
+        offset = _SLOTS_OFFSET + slot * SLOT_SIZE
+        with self._exclusive():
+            disabled_at = _DOUBLE.unpack_from(mm, offset + _DISABLED_OFFSET)[0]
+            if disabled_at:
+                if now - disabled_at <= recovery_timeout:
+                    return DISABLED, disabled_at
+                # 超过恢复时间，重新尝试
+                _DOUBLE.pack_into(mm, offset + _DISABLED_OFFSET, 0.0)
+                _FAILURE.pack_into(mm, offset + _FAILURE_OFFSET, 0)
+
+            if max_concurrency and self._in_flight(offset) >= max_concurrency:
+                return BUSY, 0.0
+
+            if rpm_limit:
+                rate_tokens = _DOUBLE.unpack_from(mm, offset + _RATE_OFFSET)[0]
+                rate_updated = _DOUBLE.unpack_from(mm, offset + _RATE_UPDATED_OFFSET)[0]
+                if not rate_updated:
+                    rate_tokens = float(rpm_limit)
+                else:
+                    rate_tokens = min(float(rpm_limit), rate_tokens + (now - rate_updated) * rpm_limit / 60.0)
+                _DOUBLE.pack_into(mm, offset + _RATE_UPDATED_OFFSET, now)
+                if rate_tokens < 1:
+                    _DOUBLE.pack_into(mm, offset + _RATE_OFFSET, rate_tokens)
+                    return RATE_LIMITED, now + (1 - rate_tokens) * 60.0 / rpm_limit
+                _DOUBLE.pack_into(mm, offset + _RATE_OFFSET, rate_tokens - 1)
+
+            self._ints[(offset + _IN_FLIGHT_OFFSET) // 4 + self.worker_index] += 1
+        return ACQUIRED, 0.0
+
+    def add_in_flight(self, slot: int, delta: int):
+        """调整本 worker 在该token上的进行中请求数（不检查上限，不低于 0）"""
+        index = (_SLOTS_OFFSET + slot * SLOT_SIZE + _IN_FLIGHT_OFFSET) // 4 + self.worker_index
+        with self._exclusive():
+            self._ints[index] = max(self._ints[index] + delta, 0)
+
+    def record_success(self, slot: int):
+        """上游请求成功：清零失败次数并解除禁用"""
+        offset = _SLOTS_OFFSET + slot * SLOT_SIZE
+        with self._exclusive():
+            _FAILURE.pack_into(self._mm, offset + _FAILURE_OFFSET, 0)
+            _DOUBLE.pack_into(self._mm, offset + _DISABLED_OFFSET, 0.0)
+
+    def record_failure(self, slot: int, failure_threshold: int, now: float) -> Tuple[int, float]:
+        """
+        上游请求失败：累加失败次数，达到阈值时禁用
+
+        Returns:
+            (累计失败次数, 禁用时间)，未禁用时禁用时间为 0
+        """
+        mm = self._mm
+        offset = _SLOTS_OFFSET + slot * SLOT_SIZE
+        with self._exclusive():
+            failure_count = _FAILURE.unpack_from(mm, offset + _FAILURE_OFFSET)[0] + 1
+            _FAILURE.pack_into(mm, offset + _FAILURE_OFFSET, failure_count)
+            disabled_at = _DOUBLE.unpack_from(mm, offset + _DISABLED_OFFSET)[0]
+            if failure_count >= failure_threshold and not disabled_at:
+                disabled_at = now
+                _DOUBLE.pack_into(mm, offset + _DISABLED_OFFSET, disabled_at)
+        return failure_count, disabled_at
+
+    def disable(self, slot: int, disabled_at: float, failure_count: int):
+        """写入已知的禁用状态（例如从快照恢复），共享状态中已有禁用记录时保留原记录"""
+        mm = self._mm
+        offset = _SLOTS_OFFSET + slot * SLOT_SIZE
+        with self._exclusive():
+            if _DOUBLE.unpack_from(mm, offset + _DISABLED_OFFSET)[0]:
+                return
+            _DOUBLE.pack_into(mm, offset + _DISABLED_OFFSET, disabled_at)
+            _FAILURE.pack_into(mm, offset + _FAILURE_OFFSET, failure_count)
+
+    def read(self, slots: List[int]) -> Dict[int, SharedTokenRecord]:
+        """一次加锁读取多个槽位"""
+        mm = self._mm
+        records = {}
+        with self._exclusive():
+            for slot in slots:
+                offset = _SLOTS_OFFSET + slot * SLOT_SIZE
+                records[slot] = SharedTokenRecord(
+                    failure_count=_FAILURE.unpack_from(mm, offset + _FAILURE_OFFSET)[0],
+                    disabled_at=_DOUBLE.unpack_from(mm, offset + _DISABLED_OFFSET)[0],
+                    in_flight=self._in_flight(offset),
+                )
+        return records
+
+    def close(self):
+        """注销本 worker（清零它的进行中请求数）并释放文件"""
+        if self._fd < 0:
+            return
+        try:
+            with self._exclusive():
+                if self.worker_index >= 0 and self._worker_pid(self.worker_index) == self.pid:
+                    self._clear_worker_column(self.worker_index)
+                    self._set_worker_pid(self.worker_index, 0)
+        finally:
+            self._ints.release()
+            self._view.release()
+            self._mm.close()
+            os.close(self._fd)
+            self._fd = -1
+            if self._leader_fd is not None:
+                os.close(self._leader_fd)
+                self._leader_fd = None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# 全局共享状态（未启用多 worker 时为 None）
+_shared_state: Optional[SharedTokenState] = None
+
+
+def get_shared_state() -> Optional[SharedTokenState]:
+    """获取全局共享token状态"""
+    return _shared_state
+
+
+def initialize_shared_state(path: str, slots: int = 4096) -> Optional[SharedTokenState]:
+    """打开（必要时创建）共享token状态文件；平台不支持时返回 None，退化为进程内状态"""
+    global _shared_state
+    if not shared_state_supported():
+        logger.warning("⚠️ 当前平台不支持多进程共享token状态，各 worker 将独立维护token池")
+        return None
+    _shared_state = SharedTokenState(path, slots)
+    logger.info(f"🗂️ 已加入共享token状态: {path} (worker #{_shared_state.worker_index}, pid {_shared_state.pid})")
+    return _shared_state
+
+
+def close_shared_state():
+    """关闭全局共享token状态"""
+    global _shared_state
+    if _shared_state is not None:
+        _shared_state.close()
+        _shared_state = None
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量 SSE 解析器
+直接处理上游的原始字节流：在 bytearray 缓冲区中只保留未完整的半行，
+每个网络块中的完整行一次性解码并切分，避免 aiter_lines() 解码切行后
+再在字符串缓冲区里二次拼接、切分
+"""
+
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+
+@dataclass
+class SSEEvent:
+    """一个 SSE 事件
+
+    raw 不为 None 时表示一行不符合 SSE 格式的内容（例如上游直接返回的 JSON 错误体），
+    此时 data 为空。
+    """
+    data: str = ""
+    event: str = "message"
+    id: Optional[str] = None
+    retry: Optional[int] = None
+    raw: Optional[str] = None
+
+
+class SSEParser:
+    """增量 SSE 解析器
+
+    - 支持多行 data:（按规范以换行拼接，遇到空行派发事件）
+    - 支持 event: / id: / retry: 字段和 : 注释行，行结束符支持 LF 与 CRLF
+    - 只解码到最后一个换行为止，多字节字符被拆分到两个网络块时也能正确处理
+      （UTF-8 多字节序列中不会出现换行字节）
+    """
+
+    _KNOWN_FIELDS = ("event", "id", "retry")
+
+    def __init__(self, split_data_lines: bool = False):
+        """
+        Args:
+            split_data_lines: 每个 data: 行单独作为一个事件派发，不等待空行。
+                适用于每行 data 都是一个完整 JSON 的上游，对不规范地省略空行的上游更健壮
+        """
+        self.split_data_lines = split_data_lines
+        self.last_event_id: Optional[str] = None
+        self._buffer = bytearray()
+        self._data: List[str] = []
+        self._event: Optional[str] = None
+        self._retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """输入一段原始字节，返回其中完整解析出的事件"""
+        buffer = self._buffer
+        # 缓冲区中残留的是不含换行的半行，只需在新数据中查找换行
+        scan_from = len(buffer)
+        buffer += chunk
+
+        end = buffer.rfind(b"\n", scan_from)
+        if end == -1:
+            return []
+
+        with memoryview(buffer) as view:
+            text = str(view[:end], "utf-8", "replace")
+        del buffer[:end + 1]
+        return self._process_lines(text)
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束时调用：处理末尾没有换行的残留行并派发未完成的事件"""
+        events: List[SSEEvent] = []
+        if self._buffer:
+            events = self._process_lines(self._buffer.decode("utf-8", "replace"))
+            self._buffer.clear()
+        self._dispatch(events)
+        return events
+
+    def _process_lines(self, text: str) -> List[SSEEvent]:
+        """处理以换行分隔的若干完整行（末尾不含换行符）
+
+        状态在循环中放在局部变量里，逐行只做字符串前缀判断，
+        每行的开销与 aiter_lines() 的 C 实现切行处于同一量级。
+        """
+        if "\r" in text:
+            # 末尾的 \r 属于在切分点之前的 CRLF
+            text = text.replace("\r\n", "\n")
+            if text[-1:] == "\r":
+                text = text[:-1]
+
+        events: List[SSEEvent] = []
+        append = events.append
+        split_data_lines = self.split_data_lines
+        data_lines = self._data
+        event_type = self._event
+        retry = self._retry
+
+        for line in text.split("\n"):
+            # 快速路径：data 行
+            if line[:5] == "data:":
+                value = line[6:] if line[5:6] == " " else line[5:]
+                if split_data_lines:
+                    append(SSEEvent(value, event_type or "message", self.last_event_id, retry))
+                    event_type = retry = None
+                else:
+                    data_lines.append(value)
+                continue
+
+            # 空行：派发事件
+            if not line:
+                if data_lines:
+                    data = data_lines[0] if len(data_lines) == 1 else "\n".join(data_lines)
+                    append(SSEEvent(data, event_type or "message", self.last_event_id, retry))
+                    data_lines.clear()
+                event_type = retry = None
+                continue
+
+            # 注释行
+            if line[0] == ":":
+                continue
+
+            field, _, value = line.partition(":")
+            if field not in self._KNOWN_FIELDS:
+                append(SSEEvent(raw=line))
+                continue
+
+            if value[:1] == " ":
+                value = value[1:]
+            if field == "event":
+                event_type = value
+            elif field == "id":
+                if "\0" not in value:
+                    self.last_event_id = value
+            elif value.isdigit():
+                retry = int(value)
+
+        self._event = event_type
+        self._retry = retry
+        return events
+
+    def _dispatch(self, events: List[SSEEvent]):
+        """派发当前累积的事件"""
+        if self._data:
+            data = self._data[0] if len(self._data) == 1 else "\n".join(self._data)
+            events.append(SSEEvent(data, self._event or "message", self.last_event_id, self._retry))
+            self._data.clear()
+        self._event = None
+        self._retry = None
+
+
+async def iter_sse_events(response: httpx.Response, split_data_lines: bool = False) -> AsyncIterator[SSEEvent]:
+    """从 httpx 流式响应中逐个产出 SSE 事件"""
+    parser = SSEParser(split_data_lines=split_data_lines)
+    async for chunk in response.aiter_bytes():
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.flush():
+        yield event
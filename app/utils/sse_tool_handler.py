@@ -18,7 +18,9 @@ import time
 from typing import Dict, Any, Generator
 from enum import Enum
 
-from app.utils.logger import get_logger
+from app.utils.logger import chunk_log_enabled, debug_enabled, get_logger
+from app.utils import json_codec
+from app.utils.stream_coalescer import DeltaChunk, coalescing_enabled
 
 logger = get_logger()
 
@@ -57,6 +59,9 @@ class SSEToolHandler:
         self.flush_interval = 0.05  # 50ms 刷新间隔
         self.max_buffer_size = 100  # 最大缓冲字符数
 
+        # 已处理的数据块数，用于逐块日志采样
+        self.chunk_count = 0
+
         logger.debug(f"🔧 初始化工具处理器: model={model}, stream={stream}")
 
     def process_sse_chunk(self, chunk_data: Dict[str, Any]) -> Generator[str, None, None]:
@@ -69,6 +74,7 @@ class SSEToolHandler:
         Yields:
             str: OpenAI 格式的 SSE 响应行
         """
+        self.chunk_count += 1
         try:
             phase = chunk_data.get("phase")
             edit_content = chunk_data.get("edit_content", "")
@@ -89,7 +95,7 @@ class SSEToolHandler:
 
                 logger.info(f"📈 SSE 阶段变化: {self.current_phase} → {phase}")
                 content_preview = edit_content or delta_content
-                if content_preview:
+                if content_preview and debug_enabled():
                     logger.debug(f"   📝 内容预览: {content_preview[:1000]}{'...' if len(content_preview) > 1000 else ''}")
                 if edit_index is not None:
                     logger.debug(f"   📍 edit_index: {edit_index}")
@@ -123,19 +129,20 @@ class SSEToolHandler:
         if not delta_content:
             return
 
-        logger.debug(f"🤔 思考内容: +{len(delta_content)} 字符")
+        if chunk_log_enabled(self.chunk_count):
+            logger.debug(f"🤔 思考内容: +{len(delta_content)} 字符")
 
         # 在流模式下输出思考内容
         if self.stream:
-            chunk = self._create_content_chunk(delta_content)
-            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield self._render_content_chunk(delta_content)
 
     def _process_tool_call_phase(self, edit_content: str) -> Generator[str, None, None]:
         """处理工具调用阶段"""
         if not edit_content:
             return
 
-        logger.debug(f"🔧 进入工具调用阶段，内容长度: {len(edit_content)}")
+        if chunk_log_enabled(self.chunk_count):
+            logger.debug(f"🔧 进入工具调用阶段，内容长度: {len(edit_content)}")
 
         # 检测 glm_block 标记
         if "<glm_block " in edit_content:
@@ -148,11 +155,13 @@ class SSEToolHandler:
                 if result_pos > 0:
                     param_fragment = edit_content[:result_pos]
                     self.tool_args += param_fragment
-                    logger.debug(f"📦 累积参数片段: {param_fragment}")
+                    if chunk_log_enabled(self.chunk_count):
+                        logger.debug(f"📦 累积参数片段: {param_fragment}")
                 else:
                     # 如果没有找到结束标记，累积整个内容（可能是中间片段）
                     self.tool_args += edit_content
-                    logger.debug(f"📦 累积参数片段: {edit_content[:100]}...")
+                    if chunk_log_enabled(self.chunk_count):
+                        logger.debug(f"📦 累积参数片段: {edit_content[:100]}...")
 
     def _handle_glm_blocks(self, edit_content: str) -> Generator[str, None, None]:
         """处理 glm_block 标记的内容"""
@@ -206,7 +215,7 @@ class SSEToolHandler:
             logger.debug(f"📦 提取的 JSON 内容: {json_content[:1000]}...")
 
             # 解析工具元数据
-            metadata_obj = json.loads(json_content)
+            metadata_obj = json_codec.loads(json_content)
 
             if "data" in metadata_obj and "metadata" in metadata_obj["data"]:
                 metadata = metadata_obj["data"]["metadata"]
@@ -229,7 +238,7 @@ class SSEToolHandler:
                     self.tool_args = "{}"
                     logger.debug(f"🎯 新工具调用: {self.tool_name}(id={self.tool_id}), 空参数")
 
-        except (json.JSONDecodeError, KeyError, AttributeError) as e:
+        except (json_codec.JSONDecodeError, KeyError, AttributeError) as e:
             logger.error(f"❌ 解析工具元数据失败: {e}, 块内容: {block[:1000]}...")
 
         # 确保返回生成器（即使为空）
@@ -262,7 +271,8 @@ class SSEToolHandler:
         if not delta_content:
             return
 
-        logger.info(f"📝 工具处理器收到答案内容: {delta_content[:50]}...")
+        if chunk_log_enabled(self.chunk_count):
+            logger.debug(f"📝 工具处理器收到答案内容: {delta_content[:50]}...")
 
         # 添加到缓冲区
         self.content_buffer += delta_content
@@ -287,12 +297,14 @@ class SSEToolHandler:
         if not self.content_buffer:
             return
 
-        logger.info(f"💬 工具处理器刷新缓冲区: {self.buffer_size} 字符 - {self.content_buffer[:50]}...")
+        log_chunk = chunk_log_enabled(self.chunk_count)
+        if log_chunk:
+            logger.debug(f"💬 工具处理器刷新缓冲区: {self.buffer_size} 字符 - {self.content_buffer[:50]}...")
 
         if self.stream:
-            chunk = self._create_content_chunk(self.content_buffer)
-            output_data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
-            logger.info(f"➡️ 工具处理器输出: {output_data[:100]}...")
+            output_data = self._render_content_chunk(self.content_buffer)
+            if log_chunk:
+                logger.debug(f"➡️ 工具处理器输出: {output_data[:100]}...")
             yield output_data
 
         # 清空缓冲区
@@ -331,7 +343,7 @@ class SSEToolHandler:
             if "usage" in chunk_data:
                 final_chunk["usage"] = chunk_data["usage"]
 
-            yield f"data: {json.dumps(final_chunk, ensure_ascii=False)}\n\n"
+            yield json_codec.sse_data(final_chunk)
             yield "data: [DONE]\n\n"
 
         # 重置所有状态
@@ -350,15 +362,15 @@ class SSEToolHandler:
         if self.stream:
             # 发送工具开始块
             start_chunk = self._create_tool_start_chunk()
-            yield f"data: {json.dumps(start_chunk, ensure_ascii=False)}\n\n"
+            yield json_codec.sse_data(start_chunk)
 
             # 发送参数块
             args_chunk = self._create_tool_arguments_chunk(fixed_args)
-            yield f"data: {json.dumps(args_chunk, ensure_ascii=False)}\n\n"
+            yield json_codec.sse_data(args_chunk)
 
             # 发送完成块
             finish_chunk = self._create_tool_finish_chunk()
-            yield f"data: {json.dumps(finish_chunk, ensure_ascii=False)}\n\n"
+            yield json_codec.sse_data(finish_chunk)
 
         # 重置工具状态
         self._reset_tool_state()
@@ -381,10 +393,10 @@ class SSEToolHandler:
             logger.debug(f"🔧 json-repair 修复结果: {repaired_json}")
 
             # 3. 解析并后处理
-            args_obj = json.loads(repaired_json)
+            args_obj = json_codec.loads(repaired_json)
             args_obj = self._post_process_args(args_obj)
 
-            # 4. 生成最终结果
+            # 4. 生成最终结果（arguments 是交给客户端的字符串，保持标准库的分隔符格式）
             fixed_result = json.dumps(args_obj, ensure_ascii=False)
 
             return fixed_result
@@ -515,6 +527,13 @@ class SSEToolHandler:
             }]
         }
 
+    def _render_content_chunk(self, content: str) -> str:
+        """渲染内容块；经过输出合并层时返回可与后续内容合并的 DeltaChunk"""
+        output_data = json_codec.sse_data(self._create_content_chunk(content))
+        if coalescing_enabled():
+            return DeltaChunk(output_data, content, self._render_content_chunk)
+        return output_data
+
     def _create_tool_start_chunk(self) -> Dict[str, Any]:
         """创建工具开始块"""
         return {
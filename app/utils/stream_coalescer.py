@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式输出合并
+上游经常每次只返回一两个字符，每个字符都单独编码、单独写一次 SSE 事件。
+这里在提供商和 StreamingResponse 之间加一层输出合并：
+同一字段的连续文本增量在时间窗口/字节上限内合并为一个事件，
+角色、工具调用、结束块等其他消息原样透传，并在透传之前先输出已合并的内容。
+"""
+
+import asyncio
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, List, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger()
+
+# 当前流是否经过合并层；编码器据此决定是否返回可合并的 DeltaChunk，未启用时没有额外开销
+_coalescing: ContextVar[bool] = ContextVar("stream_coalescing", default=False)
+
+_EXHAUSTED = object()
+
+
+def coalescing_enabled() -> bool:
+    """当前流是否启用了输出合并"""
+    return _coalescing.get()
+
+
+class DeltaChunk(str):
+    """可合并的文本增量 SSE 消息
+
+    本身就是完整的 SSE 文本，可以直接写给客户端；
+    render 相同的连续增量可以拼接 value 后重新渲染为一条消息。
+    """
+
+    def __new__(cls, encoded: str, value: str, render: Callable[[str], str]):
+        chunk = super().__new__(cls, encoded)
+        chunk.value = value
+        chunk.render = render
+        return chunk
+
+
+async def _next_item(iterator: AsyncIterator[str]):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+async def coalesce_stream(
+    source: AsyncIterator[str],
+    window_ms: float,
+    max_bytes: int = 4096,
+) -> AsyncIterator[str]:
+    """
+    合并流中连续的文本增量
+
+    距上次写出超过时间窗口的增量立即写出（慢速流不增加延迟），
+    窗口内到达的增量合并后在窗口结束时写出；合并内容达到 max_bytes 时立即写出。
+    字段变化（如思考 -> 回答）、工具调用、结束块等非文本增量会先写出已合并的内容。
+
+    Args:
+        source: 提供商返回的 SSE 文本流
+        window_ms: 时间窗口（毫秒），<= 0 时不合并
+        max_bytes: 单条合并消息的文本上限（字符数）
+    """
+    if window_ms <= 0:
+        async for item in source:
+            yield item
+        return
+
+    window = window_ms / 1000
+    loop = asyncio.get_running_loop()
+    context_token = _coalescing.set(True)
+    iterator = source.__aiter__()
+
+    pending: Optional[DeltaChunk] = None
+    values: List[str] = []
+    size = 0
+    last_write = float("-inf")
+    next_item: Optional[asyncio.Task] = None
+    merged_count = 0
+
+    def flush() -> str:
+        nonlocal pending, size, merged_count
+        chunk = pending if len(values) == 1 else pending.render("".join(values))
+        merged_count += len(values) - 1
+        pending = None
+        values.clear()
+        size = 0
+        return chunk
+
+    try:
+        while True:
+            if pending is None and next_item is None:
+                item = await _next_item(iterator)
+            else:
+                # 有待写出的内容时，最多等到窗口结束；超时后上游读取继续在后台进行
+                if next_item is None:
+                    next_item = asyncio.ensure_future(_next_item(iterator))
+                if pending is not None:
+                    timeout = last_write + window - loop.time()
+                    if timeout > 0 and not next_item.done():
+                        await asyncio.wait((next_item,), timeout=timeout)
+                    if not next_item.done():
+                        yield flush()
+                        last_write = loop.time()
+                        continue
+                item = await next_item
+                next_item = None
+
+            if item is _EXHAUSTED:
+                break
+
+            if isinstance(item, DeltaChunk):
+                if pending is not None:
+                    if item.render == pending.render:
+                        values.append(item.value)
+                        size += len(item.value)
+                        if size >= max_bytes:
+                            yield flush()
+                            last_write = loop.time()
+                        continue
+                    # 字段变化
+                    yield flush()
+                    last_write = loop.time()
+
+                if loop.time() - last_write >= window:
+                    yield item
+                    last_write = loop.time()
+                else:
+                    pending = item
+                    values.append(item.value)
+                    size = len(item.value)
+                continue
+
+            if pending is not None:
+                yield flush()
+            yield item
+            last_write = loop.time()
+
+        if pending is not None:
+            yield flush()
+    finally:
+        if next_item is not None and not next_item.done():
+            next_item.cancel()
+            try:
+                await next_item
+            except BaseException:
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        try:
+            _coalescing.reset(context_token)
+        except ValueError:
+            # 在其他上下文中关闭（例如被垃圾回收时）
+            pass
+        if merged_count:
+            logger.debug(f"🧵 输出合并: 共合并 {merged_count} 个增量")
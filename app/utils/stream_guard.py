@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+客户端断开检测
+客户端中途断开后立即取消上游流：关闭提供商生成器（退出 client.stream 上下文、释放连接和
+token 的进行中计数、触发会话清理），而不是继续读完整个上游响应。
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.utils.logger import get_logger
+from app.utils.metrics import ACTIVE_STREAMS, STREAMS
+
+logger = get_logger()
+
+
+@dataclass
+class StreamStats:
+    """流式响应统计"""
+    started: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    active: int = 0
+
+
+stream_stats = StreamStats()
+
+
+def get_stream_stats() -> Dict[str, Any]:
+    """获取流式响应统计"""
+    return {
+        "started": stream_stats.started,
+        "completed": stream_stats.completed,
+        "cancelled": stream_stats.cancelled,
+        "failed": stream_stats.failed,
+        "active": stream_stats.active,
+    }
+
+
+def _cancelled_from_outside(stream_task: "asyncio.Future") -> bool:
+    """等待已取消的流任务时收到的 CancelledError 是否针对当前任务，而不是流任务自身的取消"""
+    if not stream_task.done():
+        # 流任务还没结束，await 被打断说明当前任务被取消
+        return True
+    cancelling = getattr(asyncio.current_task(), "cancelling", None)  # Python 3.11+
+    return bool(cancelling and cancelling())
+
+
+class GuardedStreamingResponse(StreamingResponse):
+    """断开即取消的流式响应
+
+    无论 ASGI 版本都同时监听 http.disconnect：上游长时间没有输出时也能及时发现断开。
+    断开（或写入失败）后只取消一次流任务，再显式关闭 body 生成器，
+    使提供商中的 finally / 上下文管理器确定地执行，而不是等垃圾回收。
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stream_stats.started += 1
+        stream_stats.active += 1
+        ACTIVE_STREAMS.inc()
+        outcome = "failed"
+
+        stream_task = asyncio.ensure_future(self.stream_response(send))
+        listen_task = asyncio.ensure_future(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait((stream_task, listen_task), return_when=asyncio.FIRST_COMPLETED)
+            if stream_task.done():
+                stream_task.result()
+                outcome = "completed"
+            else:
+                outcome = "cancelled"
+                logger.info("🔌 客户端已断开，取消上游流")
+        except OSError as e:
+            # 写入时发现连接已断开
+            outcome = "cancelled"
+            logger.info("🔌 客户端已断开（写入失败），取消上游流")
+            raise ClientDisconnect() from e
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            listen_task.cancel()
+            # 等待流任务结束期间当前任务本身被取消（例如服务器关闭）时，清理完成后继续向上传播
+            cancelled_error = None
+            if not stream_task.done():
+                stream_task.cancel()
+                try:
+                    await stream_task
+                except asyncio.CancelledError as e:
+                    if _cancelled_from_outside(stream_task):
+                        outcome = "cancelled"
+                        cancelled_error = e
+                except Exception:
+                    pass
+            await self._close_body()
+
+            stream_stats.active -= 1
+            ACTIVE_STREAMS.dec()
+            STREAMS.labels(outcome).inc()
+            if outcome == "completed":
+                stream_stats.completed += 1
+            elif outcome == "cancelled":
+                stream_stats.cancelled += 1
+            else:
+                stream_stats.failed += 1
+            if cancelled_error is not None:
+                raise cancelled_error
+
+        if self.background is not None:
+            await self.background()
+
+    async def _close_body(self):
+        """关闭 body 生成器，触发提供商的清理逻辑"""
+        aclose = getattr(self.body_iterator, "aclose", None)
+        if aclose is None:
+            return
+        try:
+            await aclose()
+        except Exception as e:
+            logger.debug(f"关闭流式生成器时出错: {e}")
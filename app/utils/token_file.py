@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token 文件缓存与监听
+按文件的 (mtime_ns, inode, size) 缓存解析结果，文件变化时由后台监听任务重新加载，
+请求路径上读取 token 列表不再触碰磁盘
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.utils.logger import logger
+
+# 文件指纹：(st_mtime_ns, st_ino, st_size)，文件不存在时为 None
+FileKey = Optional[Tuple[int, int, int]]
+
+
+def _stat_key(path: str) -> FileKey:
+    """获取文件指纹"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def dedupe_tokens(tokens: List[str]) -> Tuple[List[str], int]:
+    """去重并保持顺序，返回 (去重后的列表, 重复数量)"""
+    unique_tokens = list(dict.fromkeys(tokens))
+    return unique_tokens, len(tokens) - len(unique_tokens)
+
+
+@dataclass
+class TokenFileEntry:
+    """单个 token 文件的缓存项"""
+    path: str
+    key: FileKey
+    tokens: List[str] = field(default_factory=list)
+
+
+class TokenFileCache:
+    """Token 文件缓存
+
+    未启动监听时，每次读取只做一次 stat 比对指纹；监听启动后直接返回缓存，
+    由监听任务负责发现变更并刷新。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, TokenFileEntry] = {}
+        self.watching = False
+
+    def get(self, path: str, loader: Callable[[str], List[str]], label: str = "token") -> List[str]:
+        """
+        获取文件中的 token 列表（已去重）
+
+        Args:
+            path: token 文件路径
+            loader: 解析文件内容的函数
+            label: 日志中使用的 token 类型名称
+        """
+        entry = self._entries.get(path)
+        if entry is not None and self.watching:
+            return entry.tokens
+
+        key = _stat_key(path)
+        if entry is not None and entry.key == key:
+            return entry.tokens
+
+        return self._reload(path, key, loader, label).tokens
+
+    def refresh(self, path: str, loader: Callable[[str], List[str]], label: str = "token") -> Optional[List[str]]:
+        """重新检查文件，有变化时重新加载并返回新列表，无变化返回 None"""
+        key = _stat_key(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry.key == key:
+            return None
+
+        new_entry = self._reload(path, key, loader, label)
+        if entry is not None and entry.tokens == new_entry.tokens:
+            return None
+        return new_entry.tokens
+
+    def _reload(self, path: str, key: FileKey, loader: Callable[[str], List[str]], label: str) -> TokenFileEntry:
+        """解析文件并更新缓存"""
+        tokens, duplicate_count = dedupe_tokens(loader(path)) if key is not None else ([], 0)
+        if duplicate_count > 0:
+            logger.warning(f"⚠️ 检测到 {duplicate_count} 个重复{label}，已自动去重")
+
+        entry = TokenFileEntry(path=path, key=key, tokens=tokens)
+        self._entries[path] = entry
+        return entry
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+
+# 全局 token 文件缓存
+token_file_cache = TokenFileCache()
+
+
+@dataclass
+class WatchedTokenFile:
+    """被监听的 token 文件"""
+    path: str
+    loader: Callable[[str], List[str]]
+    on_change: Callable[[List[str]], None]
+    label: str = "token"
+
+
+class TokenFileWatcher:
+    """Token 文件监听器
+
+    优先使用 watchfiles（inotify 等系统通知），未安装时退化为按间隔轮询文件指纹。
+    """
+
+    def __init__(self, cache: TokenFileCache, interval: float = 5.0):
+        self.cache = cache
+        self.interval = max(interval, 0.1)
+        self._files: List[WatchedTokenFile] = []
+        self._task: Optional[asyncio.Task] = None
+        self.backend = "none"
+
+    def watch(self, path: str, loader: Callable[[str], List[str]],
+              on_change: Callable[[List[str]], None], label: str = "token"):
+        """注册要监听的文件"""
+        self._files.append(WatchedTokenFile(path=path, loader=loader, on_change=on_change, label=label))
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def check(self):
+        """检查所有文件，变化时触发回调"""
+        for watched in self._files:
+            try:
+                tokens = self.cache.refresh(watched.path, watched.loader, watched.label)
+                if tokens is not None:
+                    logger.info(f"📄 检测到{watched.label}文件变化，重新加载 {len(tokens)} 个: {watched.path}")
+                    watched.on_change(tokens)
+            except Exception as e:
+                logger.error(f"❌ 处理{watched.label}文件变化失败 {watched.path}: {e}")
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+    async def _watchfiles_loop(self, awatch):
+        # 监听所在目录：编辑器和原子替换（rename）会更换 inode，直接监听文件会丢事件
+        targets = {os.path.abspath(f.path) for f in self._files}
+        directories = sorted({os.path.dirname(path) for path in targets})
+        try:
+            async for _ in awatch(
+                *directories,
+                watch_filter=lambda change, path: os.path.abspath(path) in targets,
+                debounce=200,
+                recursive=False,
+            ):
+                self.check()
+        except Exception as e:
+            logger.warning(f"⚠️ watchfiles 监听失败，改为轮询: {e}")
+
+        self.backend = "polling"
+        await self._poll_loop()
+
+    async def start(self):
+        """启动监听任务"""
+        if self.is_running or not self._files:
+            return
+
+        # 以当前文件内容为基准，之后只在变化时回调
+        for watched in self._files:
+            self.cache.refresh(watched.path, watched.loader, watched.label)
+
+        try:
+            from watchfiles import awatch
+            directories_exist = all(os.path.isdir(os.path.dirname(os.path.abspath(f.path))) for f in self._files)
+        except ImportError:
+            awatch, directories_exist = None, False
+
+        if awatch is not None and directories_exist:
+            self.backend = "watchfiles"
+            self._task = asyncio.create_task(self._watchfiles_loop(awatch))
+        else:
+            self.backend = "polling"
+            self._task = asyncio.create_task(self._poll_loop())
+
+        self.cache.watching = True
+        logger.info(f"👀 已启动token文件监听 ({self.backend}): {', '.join(f.path for f in self._files)}")
+
+    async def stop(self):
+        """停止监听任务"""
+        self.cache.watching = False
+        task = self._task
+        self._task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -7,13 +7,23 @@ Token池管理器
 """
 
 import asyncio
+import hashlib
+import heapq
+import json
+import os
+import random
 import time
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Collection, Deque, Dict, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from threading import Lock
 import httpx
 
+from app.utils.http_client import HttpClientConfig, get_http_client
 from app.utils.logger import logger
+from app.utils.metrics import TOKEN_POOL_WAIT, TOKEN_REQUESTS
+from app.utils.shared_state import ACQUIRED, DISABLED, RATE_LIMITED, SharedTokenState, get_shared_state
 
 
 @dataclass
@@ -27,6 +37,11 @@ class TokenStatus:
     total_requests: int = 0
     successful_requests: int = 0
     token_type: str = "unknown"  # "user", "guest", "unknown"
+    in_flight: int = 0  # 正在进行的上游请求数
+    ewma_latency: float = 0.0  # 首字节延迟的指数移动平均（秒），0 表示尚无样本
+    rate_tokens: float = 0.0  # RPM 令牌桶中剩余的请求额度
+    last_check_time: float = 0.0  # 上次健康检查的时间
+    rate_updated: float = 0.0  # 令牌桶上次补充的时间，0 表示尚未初始化
     
     @property
     def success_rate(self) -> float:
@@ -68,10 +83,134 @@ class TokenStatus:
         return self.success_rate >= 0.5
 
 
+# 健康检查默认的 Z.AI 站点地址，调用方应传入 settings.ZAI_BASE_URL（指向回放服务器时不会用真实token访问线上）
+DEFAULT_ZAI_BASE_URL = "https://chat.z.ai"
+
+# 持久化快照格式版本及保存的字段
+TOKEN_STATE_VERSION = 1
+PERSISTED_STATUS_FIELDS = (
+    "is_available",
+    "failure_count",
+    "last_failure_time",
+    "last_success_time",
+    "total_requests",
+    "successful_requests",
+    "token_type",
+    "ewma_latency",
+    "last_check_time",
+)
+
+
+# token获取等待时间指标：立即获得 / 排队后获得 / 排队超时
+_WAIT_IMMEDIATE = TOKEN_POOL_WAIT.labels("immediate")
+_WAIT_QUEUED = TOKEN_POOL_WAIT.labels("queued")
+_WAIT_TIMEOUT = TOKEN_POOL_WAIT.labels("timeout")
+
+
+def token_fingerprint(token: str) -> str:
+    """token的短哈希，用于在快照中代替token原文"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:24]
+
+
+@dataclass
+class TokenRequestTracker:
+    """单次上游请求的跟踪信息（由 TokenPool.track_request 产生）"""
+    token: str
+    started_at: float
+    first_byte_at: float = 0.0
+
+    def mark_first_byte(self):
+        """记录收到上游响应头的时间，用于更新延迟 EWMA"""
+        if not self.first_byte_at:
+            self.first_byte_at = time.perf_counter()
+
+
+def _sample_two(pool: "TokenPool") -> Tuple[TokenStatus, TokenStatus]:
+    """从可用token中随机取两个（只有一个时两者相同）"""
+    available = pool._available
+    count = len(available)
+    first = random.randrange(count)
+    second = random.randrange(count - 1) if count > 1 else 0
+    if count > 1 and second >= first:
+        second += 1
+    statuses = pool.token_statuses
+    return statuses[available[first]], statuses[available[second]]
+
+
+def _select_round_robin(pool: "TokenPool") -> str:
+    """轮询"""
+    available = pool._available
+    index = pool._current_index % len(available)
+    pool._current_index = index + 1
+    return available[index]
+
+
+def _select_least_in_flight(pool: "TokenPool") -> str:
+    """进行中请求数最少的token（同负载的token之间轮转）"""
+    buckets = pool._load_buckets
+    while not buckets[pool._min_load]:
+        pool._min_load += 1
+    bucket = buckets[pool._min_load]
+    token, _ = bucket.popitem(last=False)
+    bucket[token] = None
+    return token
+
+
+def _select_power_of_two(pool: "TokenPool") -> str:
+    """随机两选一：选进行中请求数较少的"""
+    a, b = _sample_two(pool)
+    return (a if a.in_flight <= b.in_flight else b).token
+
+
+def _select_ewma_latency(pool: "TokenPool") -> str:
+    """随机两选一：按 EWMA 延迟 ×（进行中请求数 + 1）选代价较低的，无样本的token优先探测"""
+    a, b = _sample_two(pool)
+    cost_a = a.ewma_latency * (a.in_flight + 1)
+    cost_b = b.ewma_latency * (b.in_flight + 1)
+    return (a if cost_a <= cost_b else b).token
+
+
+def _select_success_rate(pool: "TokenPool") -> str:
+    """随机两选一：按成功率 /（进行中请求数 + 1）选得分较高的"""
+    a, b = _sample_two(pool)
+    score_a = a.success_rate / (a.in_flight + 1)
+    score_b = b.success_rate / (b.in_flight + 1)
+    return (a if score_a >= score_b else b).token
+
+
+# token选择策略，调用时可用token列表保证非空
+SELECTION_STRATEGIES: Dict[str, Callable[["TokenPool"], str]] = {
+    "round_robin": _select_round_robin,
+    "least_in_flight": _select_least_in_flight,
+    "power_of_two": _select_power_of_two,
+    "ewma_latency": _select_ewma_latency,
+    "success_rate": _select_success_rate,
+}
+
+
 class TokenPool:
-    """Token池管理器"""
+    """Token池管理器
+
+    可用token保存在增量维护的数组 + 位置索引中，轮询选择、成功/失败标记均为 O(1)；
+    被禁用的token按 last_failure_time 进入恢复最小堆，到期后 O(log n) 恢复。
+    启用并发/RPM 限制后，达到上限的token暂时移出可用环，按可再次使用的时间进入限流堆，
+    所有token都被限流时调用方在 FIFO 队列中等待。
+    所有方法都只在事件循环线程中调用，请求路径上不需要加锁。
+
+    多 worker 部署时传入 SharedTokenState：禁用状态、并发和 RPM 限制以共享状态为准，
+    选出token时在共享状态中原子地占用名额，被拒绝的token暂时移出本进程的可用环。
+    """
     
-    def __init__(self, tokens: List[str], failure_threshold: int = 3, recovery_timeout: int = 1800):
+    # 延迟 EWMA 的平滑系数
+    EWMA_ALPHA = 0.3
+    # 选出但未开始请求的预留名额的有效期（秒），防止调用方异常退出后名额泄漏
+    RESERVATION_TTL = 60.0
+    # 共享状态中token达到并发上限时，本进程再次尝试的间隔（秒）
+    SHARED_RETRY_INTERVAL = 0.05
+
+    def __init__(self, tokens: List[str], failure_threshold: int = 3, recovery_timeout: int = 1800,
+                 strategy: str = "round_robin", max_concurrency: int = 0, rpm_limit: int = 0,
+                 shared_state: Optional[SharedTokenState] = None):
         """
         初始化Token池
         
@@ -79,11 +218,53 @@ class TokenPool:
             tokens: token列表
             failure_threshold: 失败阈值，超过此次数将标记为不可用
             recovery_timeout: 恢复超时时间（秒），失败token在此时间后重新尝试
+            strategy: token选择策略，见 SELECTION_STRATEGIES
+            max_concurrency: 单个token的最大并发请求数，0 表示不限制
+            rpm_limit: 单个token每分钟最大请求数（令牌桶），0 表示不限制
+            shared_state: 多 worker 共享的token状态，None 表示只使用进程内状态
         """
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
-        self._lock = Lock()
         self._current_index = 0
+        self.set_strategy(strategy)
+
+        # 并发与速率限制
+        self.max_concurrency = max(0, max_concurrency)
+        self.rpm_limit = max(0, rpm_limit)
+        self._limits_enabled = bool(self.max_concurrency or self.rpm_limit)
+        # 多 worker 共享状态及token -> 槽位缓存（槽位已满时为 None）
+        self._shared = shared_state
+        self._shared_slots: Dict[str, Optional[int]] = {}
+        # 已选出、尚未进入 track_request 的预留：token -> 预留时间队列
+        self._reservations: Dict[str, Deque[float]] = {}
+        # 已启用但被限流的token，以及 (可再次使用的时间, token) 限流堆
+        self._throttled: Set[str] = set()
+        self._throttle_heap: List[Tuple[float, str]] = []
+
+        # 状态版本号，用于判断快照是否需要重新保存
+        self._state_version = 0
+
+        # 等待队列（FIFO）及统计
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._dispatch_timer: Optional[asyncio.TimerHandle] = None
+        self._dispatch_at = 0.0
+        self.queue_waits = 0
+        self.queue_timeouts = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        # 按token缓存的指标子项（token -> (成功, 失败)）
+        self._token_metrics: Dict[str, Tuple] = {}
+
+        # 按进行中请求数分桶的可用token（least_in_flight 策略使用），_min_load 为最低非空桶的下界
+        self._load_buckets: List[OrderedDict] = [OrderedDict()]
+        self._min_load = 0
+
+        # 可用token环：_available 保存可选token，_available_pos 记录其下标，支持 O(1) 增删
+        self._available: List[str] = []
+        self._available_pos: Dict[str, int] = {}
+        # 恢复堆：(last_failure_time, token)，过期条目在弹出时惰性丢弃
+        self._recovery_heap: List[Tuple[float, str]] = []
+        self._empty_warned = False
         
         # 初始化token状态
         self.token_statuses: Dict[str, TokenStatus] = {}
@@ -95,6 +276,7 @@ class TokenPool:
             if token and token not in self.token_statuses:  # 过滤空token和重复token
                 # 预设为认证用户token，因为这些是用户手动配置的token
                 self.token_statuses[token] = TokenStatus(token=token, token_type="user")
+                self._add_available(token)
                 unique_tokens.append(token)
 
         duplicate_count = original_count - len(unique_tokens)
@@ -106,32 +288,394 @@ class TokenPool:
         # else:
         #     logger.info(f"🔧 初始化Token池，共 {len(self.token_statuses)} 个token")
     
-    def get_next_token(self) -> Optional[str]:
+    def get_next_token(self, exclude: Optional[Collection[str]] = None) -> Optional[str]:
         """
-        获取下一个可用的token（轮询算法）
+        获取下一个可用的token（按选择策略，不等待）
+
+        启用并发/RPM 限制时会为选中的token预留一个名额，在 track_request 中转为进行中请求
+
+        Args:
+            exclude: 不参与本次选择的token（例如同一请求已经用过的token）
 
         Returns:
-            可用的token，如果没有可用token则返回None
+            可用的token，如果没有可用token（或全部被限流、被排除）则返回None
         """
-        with self._lock:
-            if not self.token_statuses:
-                return None
-
-            available_tokens = self._get_available_tokens()
-            if not available_tokens:
-                # 尝试恢复过期的失败token
-                self._try_recover_failed_tokens()
-                available_tokens = self._get_available_tokens()
+        now = time.time()
+
+        # 到期的失败token重新加入轮询
+        heap = self._recovery_heap
+        if heap and now - heap[0][0] > self.recovery_timeout:
+            self._try_recover_failed_tokens()
+
+        # 限流到期的token重新加入轮询
+        throttle_heap = self._throttle_heap
+        while throttle_heap and throttle_heap[0][0] <= now:
+            _, token = heapq.heappop(throttle_heap)
+            status = self.token_statuses.get(token)
+            if status and token in self._throttled:
+                self._sync_available(status)
+
+        available = self._available
+        if not available:
+            if self.token_statuses and not self._throttled and not self._empty_warned:
+                self._empty_warned = True
+                logger.warning("⚠️ 没有可用的token")
+                guest_count = sum(1 for status in self.token_statuses.values() if status.token_type == "guest")
+                if guest_count:
+                    logger.warning(f"⚠️ 检测到 {guest_count} 个匿名用户token，轮询机制将跳过这些token")
+            return None
+
+        if not exclude:
+            return self._select_available(now)
+
+        # 被排除的token暂时移出可用环，选完后放回
+        removed = [token for token in exclude if token in self._available_pos]
+        if len(removed) == len(available):
+            return None
+        for token in removed:
+            self._remove_available(token)
+        try:
+            return self._select_available(now)
+        finally:
+            for token in removed:
+                self._add_available(token)
+
+    def _select_available(self, now: float) -> Optional[str]:
+        """按策略从可用环中选出token并占用名额"""
+        if self._shared is not None:
+            return self._select_shared(now)
+
+        token = self._select(self)
+        if self._limits_enabled:
+            self._reserve(self.token_statuses[token], now)
+        return token
+
+    def _select_shared(self, now: float) -> Optional[str]:
+        """多 worker 模式：按策略选出token后在共享状态中占用名额，被拒绝的token暂时移出可用环"""
+        shared = self._shared
+        for _ in range(len(self._available)):
+            if not self._available:
+                break
+            token = self._select(self)
+            slot = self._shared_slot(token)
+            if slot is None:
+                # 共享槽位已满，该token只按进程内状态使用
+                return token
+
+            result, when = shared.try_acquire(slot, self.max_concurrency, self.rpm_limit, self.recovery_timeout, now)
+            if result == ACQUIRED:
+                self._reservations.setdefault(token, deque()).append(now)
+                return token
+
+            status = self.token_statuses[token]
+            if result == DISABLED:
+                self._disable_from_shared(status, when)
+            else:
+                ready_at = when if result == RATE_LIMITED else now + self.SHARED_RETRY_INTERVAL
+                self._throttled.add(token)
+                self._remove_available(token)
+                heapq.heappush(self._throttle_heap, (ready_at, token))
+        return None
+
+    def _shared_slot(self, token: str) -> Optional[int]:
+        """token在共享状态中的槽位（带缓存）"""
+        try:
+            return self._shared_slots[token]
+        except KeyError:
+            slot = self._shared.slot(token_fingerprint(token))
+            if slot is None:
+                logger.warning(f"⚠️ 共享token状态槽位已满，token {token[:20]}... 将只在本进程内跟踪")
+            self._shared_slots[token] = slot
+            return slot
+
+    def _disable_from_shared(self, status: TokenStatus, disabled_at: float):
+        """同步其他 worker 在共享状态中标记的禁用"""
+        if status.is_available:
+            logger.warning(f"🚫 Token已被其他 worker 禁用: {status.token[:20]}...")
+        status.is_available = False
+        status.failure_count = max(status.failure_count, self.failure_threshold)
+        status.last_failure_time = disabled_at
+        self._throttled.discard(status.token)
+        self._remove_available(status.token)
+        heapq.heappush(self._recovery_heap, (disabled_at, status.token))
+        self._state_version += 1
+
+    def sync_shared_state(self) -> int:
+        """
+        与共享状态同步：释放过期的预留名额，应用其他 worker 标记的禁用和恢复
 
-                if not available_tokens:
-                    logger.warning("⚠️ 没有可用的token")
-                    return None
+        Returns:
+            可用状态发生变化的token数量
+        """
+        shared = self._shared
+        if shared is None:
+            return 0
+
+        now = time.time()
+        deadline = now - self.RESERVATION_TTL
+        for token, reservations in self._reservations.items():
+            while reservations and reservations[0] < deadline:
+                reservations.popleft()
+                slot = self._shared_slot(token)
+                if slot is not None:
+                    shared.add_in_flight(slot, -1)
+
+        slots = {token: self._shared_slot(token) for token in self.token_statuses}
+        records = shared.read([slot for slot in slots.values() if slot is not None])
+        changed = 0
+        for token, slot in slots.items():
+            if slot is None:
+                continue
+            record = records[slot]
+            status = self.token_statuses[token]
+            if record.disabled_at and now - record.disabled_at <= self.recovery_timeout:
+                if status.is_available:
+                    self._disable_from_shared(status, record.disabled_at)
+                    changed += 1
+            elif not status.is_available and status.token_type == "user" and record.failure_count < self.failure_threshold:
+                # 其他 worker 已确认token恢复
+                status.is_available = True
+                status.failure_count = record.failure_count
+                self._sync_available(status)
+                self._state_version += 1
+                changed += 1
+
+        if changed and self._waiters:
+            self._dispatch_waiters()
+        return changed
+
+    def _publish_disabled_to_shared(self):
+        """将本地（快照恢复的）禁用状态写入共享状态"""
+        now = time.time()
+        for token, status in self.token_statuses.items():
+            if status.is_available or now - status.last_failure_time > self.recovery_timeout:
+                continue
+            slot = self._shared_slot(token)
+            if slot is not None:
+                self._shared.disable(slot, status.last_failure_time, status.failure_count)
+
+    async def acquire_token(self, timeout: float = 30.0, exclude: Optional[Collection[str]] = None) -> Optional[str]:
+        """
+        获取token，所有token都被限流时在公平的 FIFO 队列中等待
 
-            # 轮询选择token
-            token = available_tokens[self._current_index % len(available_tokens)]
-            self._current_index = (self._current_index + 1) % len(available_tokens)
+        Args:
+            timeout: 最长等待时间（秒）
+            exclude: 不参与选择的token；指定时不排队，没有其他可用token时直接返回None
 
+        Returns:
+            可用的token；没有已启用的token或等待超时时返回None
+        """
+        if exclude:
+            return self.get_next_token(exclude)
+
+        if not self._waiters:
+            token = self.get_next_token()
+            if token or not self._throttled:
+                _WAIT_IMMEDIATE.observe(0.0)
+                return token
+        elif not self._available and not self._throttled:
+            _WAIT_IMMEDIATE.observe(0.0)
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._schedule_dispatch()
+        started = time.perf_counter()
+        wait_metric = _WAIT_QUEUED
+        token = None
+        try:
+            token = await asyncio.wait_for(waiter, timeout)
             return token
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            wait_metric = _WAIT_TIMEOUT
+            logger.warning(f"⏳ 等待可用token超时 ({timeout}s)，队列长度: {len(self._waiters)}")
+            return None
+        finally:
+            waited = time.perf_counter() - started
+            wait_metric.observe(waited)
+            self.queue_waits += 1
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            if token is None and not waiter.cancelled() and waiter.result():
+                # 名额已分给本等待者，但调用方恰好超时或被取消，没有拿到token
+                self._release_reserved(waiter.result())
+
+    def _dispatch_waiters(self):
+        """按先来先到把空出的名额分配给等待者"""
+        self._dispatch_timer = None
+        waiters = self._waiters
+        while waiters:
+            if waiters[0].done():
+                waiters.popleft()
+                continue
+
+            token = self.get_next_token()
+            if token is None:
+                if not self._throttled:
+                    # 已没有任何启用的token，等待没有意义
+                    while waiters:
+                        waiter = waiters.popleft()
+                        if not waiter.done():
+                            waiter.set_result(None)
+                break
+            waiters.popleft().set_result(token)
+
+        if waiters:
+            self._schedule_dispatch()
+
+    def _release_reserved(self, token: str):
+        """归还选出后未被使用的token：交给下一个等待者，没有等待者时释放其预留名额"""
+        waiters = self._waiters
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(token)
+                return
+
+        reservations = self._reservations.get(token)
+        if reservations:
+            reservations.pop()
+            if self._shared is not None:
+                slot = self._shared_slot(token)
+                if slot is not None:
+                    self._shared.add_in_flight(slot, -1)
+        status = self.token_statuses.get(token)
+        if status is None:
+            return
+        if self.rpm_limit and self._shared is None:
+            status.rate_tokens = min(float(self.rpm_limit), status.rate_tokens + 1)
+        if self._limits_enabled:
+            self._sync_available(status)
+
+    def _schedule_dispatch(self):
+        """在最早的限流到期时间唤醒等待队列"""
+        if not self._throttle_heap:
+            return
+        when = self._throttle_heap[0][0]
+        if self._dispatch_timer is not None:
+            if self._dispatch_at <= when:
+                return
+            self._dispatch_timer.cancel()
+        self._dispatch_at = when
+        loop = asyncio.get_running_loop()
+        self._dispatch_timer = loop.call_later(max(when - time.time(), 0), self._dispatch_waiters)
+
+    def _reserve(self, status: TokenStatus, now: float):
+        """为选中的token预留并发名额并扣除速率额度"""
+        if self.max_concurrency:
+            self._reservations.setdefault(status.token, deque()).append(now)
+        if self.rpm_limit:
+            self._refill_rate(status, now)
+            status.rate_tokens -= 1
+        self._sync_available(status)
+
+    def _reserved_count(self, token: str, now: float) -> int:
+        """token当前的有效预留数（顺便清理过期预留）"""
+        reservations = self._reservations.get(token)
+        if not reservations:
+            return 0
+        deadline = now - self.RESERVATION_TTL
+        while reservations and reservations[0] < deadline:
+            reservations.popleft()
+        return len(reservations)
+
+    def _refill_rate(self, status: TokenStatus, now: float):
+        """按经过的时间补充 RPM 令牌桶"""
+        if not status.rate_updated:
+            status.rate_tokens = float(self.rpm_limit)
+        else:
+            refill = (now - status.rate_updated) * self.rpm_limit / 60.0
+            status.rate_tokens = min(float(self.rpm_limit), status.rate_tokens + refill)
+        status.rate_updated = now
+
+    def _is_throttled(self, status: TokenStatus, now: float) -> bool:
+        """token是否达到并发或速率上限，是则登记可再次使用的时间"""
+        token = status.token
+        if self.max_concurrency:
+            load = status.in_flight + self._reserved_count(token, now)
+            if load >= self.max_concurrency:
+                reservations = self._reservations.get(token)
+                if reservations:
+                    # 预留过期后名额自动释放
+                    heapq.heappush(self._throttle_heap, (reservations[0] + self.RESERVATION_TTL, token))
+                return True
+
+        if self.rpm_limit:
+            self._refill_rate(status, now)
+            if status.rate_tokens < 1:
+                ready_at = now + (1 - status.rate_tokens) * 60.0 / self.rpm_limit
+                heapq.heappush(self._throttle_heap, (ready_at, token))
+                return True
+
+        return False
+
+    def set_strategy(self, strategy: str):
+        """切换token选择策略"""
+        if strategy not in SELECTION_STRATEGIES:
+            logger.warning(f"⚠️ 未知的token选择策略: {strategy}，使用 round_robin")
+            strategy = "round_robin"
+        self.strategy = strategy
+        self._select = SELECTION_STRATEGIES[strategy]
+
+    @contextmanager
+    def track_request(self, token: str) -> Iterator[Optional[TokenRequestTracker]]:
+        """
+        跟踪一次使用该token的上游请求：进入时计入进行中请求数，退出时扣除，
+        若调用过 mark_first_byte 则用首字节延迟更新 EWMA
+
+        不在池中的token（例如回退使用的 AUTH_TOKEN）不做跟踪，返回 None
+        """
+        status = self.token_statuses.get(token)
+        if status is None:
+            yield None
+            return
+
+        # 预留名额转为进行中请求，避免重复计数
+        reservations = self._reservations.get(token)
+        reserved = bool(reservations)
+        if reserved:
+            reservations.popleft()
+
+        shared_slot = self._shared_slot(token) if self._shared is not None else None
+        if shared_slot is not None and not reserved:
+            self._shared.add_in_flight(shared_slot, 1)
+
+        tracker = TokenRequestTracker(token=token, started_at=time.perf_counter())
+        self._change_in_flight(status, 1)
+        if self._limits_enabled and not reserved:
+            self._sync_available(status)
+        try:
+            yield tracker
+        finally:
+            self._change_in_flight(status, -1)
+            if shared_slot is not None:
+                self._shared.add_in_flight(shared_slot, -1)
+            if self._limits_enabled:
+                self._sync_available(status)
+                if self._waiters:
+                    self._dispatch_waiters()
+            if tracker.first_byte_at:
+                latency = tracker.first_byte_at - tracker.started_at
+                if status.ewma_latency:
+                    status.ewma_latency += self.EWMA_ALPHA * (latency - status.ewma_latency)
+                else:
+                    status.ewma_latency = latency
+
+    def _change_in_flight(self, status: TokenStatus, delta: int):
+        """调整进行中请求数，并同步负载分桶"""
+        in_pool = status.token in self._available_pos and self.token_statuses.get(status.token) is status
+        if in_pool:
+            self._load_buckets[status.in_flight].pop(status.token, None)
+        status.in_flight = max(status.in_flight + delta, 0)
+        if in_pool:
+            self._bucket_add(status)
     
     def _get_available_tokens(self) -> List[str]:
         """
@@ -143,131 +687,320 @@ class TokenPool:
 
         这确保轮询机制只会选择有效的认证用户token，跳过匿名用户token
         """
-        available_user_tokens = [
-            status.token for status in self.token_statuses.values()
-            if status.is_available and status.token_type == "user"
-        ]
-
-        # 检查是否有匿名用户token并给出警告
-        if not available_user_tokens and self.token_statuses:
-            guest_tokens = [
-                status.token for status in self.token_statuses.values()
-                if status.token_type == "guest"
-            ]
-            if guest_tokens:
-                logger.warning(f"⚠️ 检测到 {len(guest_tokens)} 个匿名用户token，轮询机制将跳过这些token")
-
-        return available_user_tokens
+        return list(self._available)
+
+    def _add_available(self, token: str):
+        """将token加入可用环（已存在时忽略）"""
+        if token not in self._available_pos:
+            self._available_pos[token] = len(self._available)
+            self._available.append(token)
+            self._bucket_add(self.token_statuses[token])
+            self._empty_warned = False
+
+    def _remove_available(self, token: str):
+        """将token移出可用环：与末尾元素交换后弹出"""
+        index = self._available_pos.pop(token, None)
+        if index is None:
+            return
+        status = self.token_statuses.get(token)
+        if status:
+            self._load_buckets[status.in_flight].pop(token, None)
+        last = self._available.pop()
+        if last != token:
+            self._available[index] = last
+            self._available_pos[last] = index
+
+    def _bucket_add(self, status: TokenStatus):
+        """将可用token放入对应负载的桶"""
+        load = status.in_flight
+        buckets = self._load_buckets
+        while len(buckets) <= load:
+            buckets.append(OrderedDict())
+        buckets[load][status.token] = None
+        if load < self._min_load:
+            self._min_load = load
+
+    def _sync_available(self, status: TokenStatus):
+        """根据token状态（启用、类型、限流）同步其在可用环中的成员关系"""
+        token = status.token
+        if status.is_available and status.token_type == "user":
+            if self._limits_enabled and self._shared is None and self._is_throttled(status, time.time()):
+                self._throttled.add(token)
+                self._remove_available(token)
+            else:
+                self._throttled.discard(token)
+                self._add_available(token)
+        else:
+            self._throttled.discard(token)
+            self._remove_available(token)
+
+    def set_token_type(self, token: str, token_type: str):
+        """更新token类型（健康检查识别出匿名token时会将其移出轮询）"""
+        status = self.token_statuses.get(token)
+        if status:
+            status.token_type = token_type
+            self._sync_available(status)
+            self._state_version += 1
     
     def _try_recover_failed_tokens(self):
-        """尝试恢复失败的token"""
+        """恢复已超过恢复超时时间的失败token"""
         current_time = time.time()
         recovered_count = 0
+        heap = self._recovery_heap
         
-        for status in self.token_statuses.values():
-            if (not status.is_available and 
-                current_time - status.last_failure_time > self.recovery_timeout):
-                status.is_available = True
-                status.failure_count = 0
-                recovered_count += 1
-                logger.info(f"🔄 恢复失败token: {status.token[:20]}...")
+        while heap and current_time - heap[0][0] > self.recovery_timeout:
+            failure_time, token = heapq.heappop(heap)
+            status = self.token_statuses.get(token)
+            # 跳过已移除、已恢复或之后又失败过（堆中有更新条目）的token
+            if not status or status.is_available or status.last_failure_time != failure_time:
+                continue
+
+            status.is_available = True
+            status.failure_count = 0
+            self._sync_available(status)
+            self._state_version += 1
+            recovered_count += 1
+            logger.info(f"🔄 恢复失败token: {status.token[:20]}...")
         
         if recovered_count > 0:
             logger.info(f"✅ 恢复了 {recovered_count} 个失败的token")
     
     def mark_token_success(self, token: str):
         """标记token使用成功"""
-        with self._lock:
-            if token in self.token_statuses:
-                status = self.token_statuses[token]
-                status.total_requests += 1
-                status.successful_requests += 1
-                status.last_success_time = time.time()
-                status.failure_count = 0  # 重置失败计数
-                
-                if not status.is_available:
-                    status.is_available = True
-                    logger.info(f"✅ Token恢复可用: {token[:20]}...")
+        status = self.token_statuses.get(token)
+        if status:
+            self._state_version += 1
+            status.total_requests += 1
+            status.successful_requests += 1
+            status.last_success_time = time.time()
+            status.failure_count = 0  # 重置失败计数
+            self._record_token_result(token, True)
+            if self._shared is not None:
+                slot = self._shared_slot(token)
+                if slot is not None:
+                    self._shared.record_success(slot)
+            
+            if not status.is_available:
+                status.is_available = True
+                self._sync_available(status)
+                logger.info(f"✅ Token恢复可用: {token[:20]}...")
+                if self._waiters:
+                    self._dispatch_waiters()
     
     def mark_token_failure(self, token: str, error: Exception = None):
         """标记token使用失败"""
-        with self._lock:
-            if token in self.token_statuses:
-                status = self.token_statuses[token]
-                status.total_requests += 1
+        status = self.token_statuses.get(token)
+        if status:
+            self._state_version += 1
+            status.total_requests += 1
+            status.last_failure_time = time.time()
+            self._record_token_result(token, False)
+            slot = self._shared_slot(token) if self._shared is not None else None
+            if slot is not None:
+                # 失败次数在所有 worker 间累计，禁用时间以首个达到阈值的 worker 为准
+                status.failure_count, disabled_at = self._shared.record_failure(
+                    slot, self.failure_threshold, status.last_failure_time)
+                if disabled_at:
+                    status.last_failure_time = disabled_at
+            else:
                 status.failure_count += 1
-                status.last_failure_time = time.time()
-                
-                if status.failure_count >= self.failure_threshold:
-                    status.is_available = False
+            
+            if status.failure_count >= self.failure_threshold:
+                if status.is_available:
                     logger.warning(f"🚫 Token已禁用: {token[:20]}... (失败 {status.failure_count} 次)")
+                status.is_available = False
+                self._remove_available(token)
+                heapq.heappush(self._recovery_heap, (status.last_failure_time, token))
     
+    def _record_token_result(self, token: str, success: bool):
+        """按token哈希记录上游结果指标"""
+        children = self._token_metrics.get(token)
+        if children is None:
+            label = token_fingerprint(token)[:12]
+            children = self._token_metrics[token] = (
+                TOKEN_REQUESTS.labels(label, "success"),
+                TOKEN_REQUESTS.labels(label, "failure"),
+            )
+        children[0 if success else 1].inc()
+
+    def get_load_summary(self) -> Dict[str, int]:
+        """获取token池负载概况（不含逐token明细，供指标抓取使用）"""
+        return {
+            "total": len(self.token_statuses),
+            "available": len(self._available),
+            "in_flight": sum(status.in_flight for status in self.token_statuses.values()),
+            "queue_depth": len(self._waiters),
+        }
+
     def get_pool_status(self) -> Dict:
         """获取token池状态信息"""
-        with self._lock:
-            available_count = len(self._get_available_tokens())
-            total_count = len(self.token_statuses)
-
-            # 统计健康token数量
-            healthy_count = sum(1 for status in self.token_statuses.values() if status.is_healthy)
-
-            status_info = {
-                "total_tokens": total_count,
-                "available_tokens": available_count,
-                "unavailable_tokens": total_count - available_count,
-                "healthy_tokens": healthy_count,
-                "unhealthy_tokens": total_count - healthy_count,
-                "current_index": self._current_index,
-                "tokens": []
-            }
-
-            for token, status in self.token_statuses.items():
-                status_info["tokens"].append({
-                    "token": f"{token[:10]}...{token[-10:]}",
-                    "token_type": status.token_type,
-                    "is_available": status.is_available,
-                    "failure_count": status.failure_count,
-                    "success_count": status.successful_requests,
-                    "success_rate": f"{status.success_rate:.2%}",
-                    "total_requests": status.total_requests,
-                    "is_healthy": status.is_healthy,
-                    "last_failure_time": status.last_failure_time,
-                    "last_success_time": status.last_success_time
-                })
-
-            return status_info
+        available_count = len(self._available)
+        total_count = len(self.token_statuses)
+
+        # 统计健康token数量
+        healthy_count = sum(1 for status in self.token_statuses.values() if status.is_healthy)
+
+        status_info = {
+            "total_tokens": total_count,
+            "available_tokens": available_count,
+            "unavailable_tokens": total_count - available_count,
+            "healthy_tokens": healthy_count,
+            "unhealthy_tokens": total_count - healthy_count,
+            "current_index": self._current_index,
+            "strategy": self.strategy,
+            "in_flight": sum(status.in_flight for status in self.token_statuses.values()),
+            "limits": {
+                "max_concurrency": self.max_concurrency,
+                "rpm_limit": self.rpm_limit,
+                "throttled_tokens": len(self._throttled),
+            },
+            "shared": self._shared_status(),
+            "queue": {
+                "depth": sum(1 for waiter in self._waiters if not waiter.done()),
+                "total_waits": self.queue_waits,
+                "timeouts": self.queue_timeouts,
+                "avg_wait_ms": round(self.queue_wait_total / self.queue_waits * 1000, 1) if self.queue_waits else 0.0,
+                "max_wait_ms": round(self.queue_wait_max * 1000, 1),
+            },
+            "tokens": []
+        }
+
+        for token, status in self.token_statuses.items():
+            status_info["tokens"].append({
+                "token": f"{token[:10]}...{token[-10:]}",
+                "token_type": status.token_type,
+                "is_available": status.is_available,
+                "failure_count": status.failure_count,
+                "success_count": status.successful_requests,
+                "success_rate": f"{status.success_rate:.2%}",
+                "total_requests": status.total_requests,
+                "is_healthy": status.is_healthy,
+                "last_failure_time": status.last_failure_time,
+                "last_success_time": status.last_success_time,
+                "in_flight": status.in_flight,
+                "reserved": len(self._reservations.get(token, ())),
+                "throttled": token in self._throttled,
+                "ewma_latency_ms": round(status.ewma_latency * 1000, 1)
+            })
+
+        return status_info
     
+    def _shared_status(self) -> Optional[Dict]:
+        """共享状态概况（未启用时为 None）"""
+        shared = self._shared
+        if shared is None:
+            return None
+        slots = [slot for slot in (self._shared_slot(token) for token in self.token_statuses) if slot is not None]
+        records = shared.read(slots)
+        return {
+            "path": shared.path,
+            "workers": shared.worker_count(),
+            "worker_index": shared.worker_index,
+            "is_leader": shared.is_leader,
+            "in_flight": sum(record.in_flight for record in records.values()),
+        }
+
     def update_tokens(self, new_tokens: List[str]):
         """动态更新token列表"""
-        with self._lock:
-            # 保留现有token的状态信息
-            old_statuses = self.token_statuses.copy()
-            self.token_statuses.clear()
-
-            original_count = len(new_tokens)
-            unique_tokens = []
-
-            # 去重并添加新token，保留已存在token的状态
-            for token in new_tokens:
-                if token and token not in self.token_statuses:  # 过滤空token和重复token
-                    if token in old_statuses:
-                        self.token_statuses[token] = old_statuses[token]
-                    else:
-                        # 预设为认证用户token，因为这些是用户手动配置的token
-                        self.token_statuses[token] = TokenStatus(token=token, token_type="user")
-                    unique_tokens.append(token)
-
-            # 记录去重信息
-            duplicate_count = original_count - len(unique_tokens)
-            if duplicate_count > 0:
-                logger.warning(f"⚠️ 更新时检测到 {duplicate_count} 个重复token，已自动去重")
-
-            # 重置索引
-            self._current_index = 0
-
-            logger.info(f"🔄 更新Token池，共 {len(self.token_statuses)} 个token")
+        # 保留现有token的状态信息
+        old_statuses = self.token_statuses
+        token_statuses: Dict[str, TokenStatus] = {}
+
+        original_count = len(new_tokens)
+        unique_tokens = []
+
+        # 去重并添加新token，保留已存在token的状态
+        for token in new_tokens:
+            if token and token not in token_statuses:  # 过滤空token和重复token
+                if token in old_statuses:
+                    token_statuses[token] = old_statuses[token]
+                else:
+                    # 预设为认证用户token，因为这些是用户手动配置的token
+                    token_statuses[token] = TokenStatus(token=token, token_type="user")
+                unique_tokens.append(token)
+
+        # 记录去重信息
+        duplicate_count = original_count - len(unique_tokens)
+        if duplicate_count > 0:
+            logger.warning(f"⚠️ 更新时检测到 {duplicate_count} 个重复token，已自动去重")
+
+        self.token_statuses = token_statuses
+        self._rebuild_indexes()
+        self._state_version += 1
+
+        logger.info(f"🔄 更新Token池，共 {len(self.token_statuses)} 个token")
+
+        if self._waiters:
+            self._dispatch_waiters()
+
+    def _rebuild_indexes(self):
+        """按 token_statuses 重建可用环、负载分桶、限流状态和恢复堆"""
+        token_statuses = self.token_statuses
+        self._available = []
+        self._available_pos = {}
+        self._load_buckets = [OrderedDict()]
+        self._min_load = 0
+        self._reservations = {token: reserved for token, reserved in self._reservations.items() if token in token_statuses}
+        self._throttled = set()
+        self._throttle_heap = []
+        self._recovery_heap = []
+        for status in token_statuses.values():
+            self._sync_available(status)
+            if not status.is_available:
+                self._recovery_heap.append((status.last_failure_time, status.token))
+        heapq.heapify(self._recovery_heap)
+
+        # 重置索引
+        self._current_index = 0
+
+    @property
+    def state_version(self) -> int:
+        """状态版本号，token状态每次变化时递增（用于判断是否需要保存快照）"""
+        return self._state_version
+
+    def export_state(self) -> Dict:
+        """
+        导出可持久化的token状态快照
+
+        快照以token的哈希为键，不保存token原文；进行中请求数、限流额度等运行时状态不保存
+        """
+        tokens = {}
+        for token, status in self.token_statuses.items():
+            tokens[token_fingerprint(token)] = {
+                field_name: getattr(status, field_name) for field_name in PERSISTED_STATUS_FIELDS
+            }
+        return {"version": TOKEN_STATE_VERSION, "saved_at": time.time(), "tokens": tokens}
+
+    def import_state(self, snapshot: Dict) -> int:
+        """
+        从快照恢复token状态（只恢复当前池中存在的token）
+
+        Returns:
+            恢复状态的token数量
+        """
+        if not isinstance(snapshot, dict) or snapshot.get("version") != TOKEN_STATE_VERSION:
+            logger.warning("⚠️ Token状态快照版本不匹配，忽略")
+            return 0
+
+        saved_tokens = snapshot.get("tokens") or {}
+        restored = 0
+        for token, status in self.token_statuses.items():
+            saved = saved_tokens.get(token_fingerprint(token))
+            if not isinstance(saved, dict):
+                continue
+            for field_name in PERSISTED_STATUS_FIELDS:
+                if field_name in saved:
+                    setattr(status, field_name, saved[field_name])
+            restored += 1
+
+        if restored:
+            self._rebuild_indexes()
+            self._state_version += 1
+            if self._shared is not None:
+                self._publish_disabled_to_shared()
+        return restored
     
-    async def health_check_token(self, token: str, auth_url: str = "https://chat.z.ai/api/v1/auths/") -> bool:
+    async def health_check_token(self, token: str, base_url: str = DEFAULT_ZAI_BASE_URL) -> bool:
         """
         异步健康检查单个token
 
@@ -275,11 +1008,15 @@ class TokenPool:
 
         Args:
             token: 要检查的token
-            auth_url: 认证URL
+            base_url: Z.AI 站点地址（settings.ZAI_BASE_URL），认证URL和Referer由此生成
 
         Returns:
             token是否健康
         """
+        status = self.token_statuses.get(token)
+        if status:
+            status.last_check_time = time.time()
+
         try:
             # 构建完整的请求头，模拟真实浏览器请求
             headers = {
@@ -289,7 +1026,7 @@ class TokenPool:
                 "Connection": "keep-alive",
                 "Content-Type": "application/json",
                 "DNT": "1",
-                "Referer": "https://chat.z.ai/",
+                "Referer": f"{base_url}/",
                 "Sec-Fetch-Dest": "empty",
                 "Sec-Fetch-Mode": "cors",
                 "Sec-Fetch-Site": "same-origin",
@@ -299,30 +1036,29 @@ class TokenPool:
                 "sec-ch-ua-platform": "Windows"
             }
 
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.get(auth_url, headers=headers)
+            client = get_http_client("token_pool", HttpClientConfig(timeout=15.0))
+            response = await client.get(f"{base_url}/api/v1/auths/", headers=headers)
 
-                # 验证token有效性并获取类型
-                token_type, is_healthy = self._validate_token_response(response)
+            # 验证token有效性并获取类型
+            token_type, is_healthy = self._validate_token_response(response)
 
-                # 更新token类型
-                if token in self.token_statuses:
-                    self.token_statuses[token].token_type = token_type
+            # 更新token类型
+            self.set_token_type(token, token_type)
 
-                if is_healthy:
-                    self.mark_token_success(token)
+            if is_healthy:
+                self.mark_token_success(token)
+            else:
+                # 简化错误信息，只记录关键错误类型
+                if token_type == "guest":
+                    error_msg = "匿名用户token"
+                elif response.status_code != 200:
+                    error_msg = f"HTTP {response.status_code}"
                 else:
-                    # 简化错误信息，只记录关键错误类型
-                    if token_type == "guest":
-                        error_msg = "匿名用户token"
-                    elif response.status_code != 200:
-                        error_msg = f"HTTP {response.status_code}"
-                    else:
-                        error_msg = "认证失败"
+                    error_msg = "认证失败"
 
-                    self.mark_token_failure(token, Exception(error_msg))
+                self.mark_token_failure(token, Exception(error_msg))
 
-                return is_healthy
+            return is_healthy
 
         except (httpx.TimeoutException, httpx.ConnectError, Exception) as e:
             self.mark_token_failure(token, e)
@@ -378,25 +1114,59 @@ class TokenPool:
         except (ValueError, Exception):
             return ("unknown", False)
 
-    async def health_check_all(self, auth_url: str = "https://chat.z.ai/api/v1/auths/"):
-        """异步健康检查所有token"""
+    def tokens_due_for_check(self, stale_after: float) -> List[str]:
+        """
+        需要健康检查的token
+
+        1. 可用token：距上次检查或上次成功使用超过 stale_after 秒
+        2. 禁用token：距上次失败已超过 recovery_timeout，先验证再恢复
+        """
+        now = time.time()
+        due = []
+        for token, status in self.token_statuses.items():
+            if status.is_available:
+                if now - max(status.last_check_time, status.last_success_time) >= stale_after:
+                    due.append(token)
+            elif now - status.last_failure_time > self.recovery_timeout:
+                due.append(token)
+        return due
+
+    async def health_check_all(
+        self,
+        base_url: str = DEFAULT_ZAI_BASE_URL,
+        tokens: Optional[List[str]] = None,
+        concurrency: int = 10,
+        jitter: float = 0.0,
+    ):
+        """
+        异步健康检查token（并发数受限）
+
+        Args:
+            base_url: Z.AI 站点地址（settings.ZAI_BASE_URL）
+            tokens: 要检查的token，默认检查全部
+            concurrency: 同时进行的检查数上限
+            jitter: 每个检查开始前随机延迟的上限（秒），用于打散请求
+        """
         if not self.token_statuses:
             logger.warning("⚠️ Token池为空，跳过健康检查")
             return
 
-        total_tokens = len(self.token_statuses)
-        logger.info(f"🔍 开始Token池健康检查... (共 {total_tokens} 个token)")
+        token_list = list(self.token_statuses.keys()) if tokens is None else list(tokens)
+        total_tokens = len(token_list)
+        if total_tokens == 0:
+            return
+        logger.info(f"🔍 开始Token池健康检查... (共 {total_tokens} 个token, 并发 {concurrency})")
 
-        # 并发执行所有token的健康检查
-        tasks = []
-        token_list = list(self.token_statuses.keys())
+        semaphore = asyncio.Semaphore(max(1, concurrency))
 
-        for token in token_list:
-            task = self.health_check_token(token, auth_url)
-            tasks.append(task)
+        async def check(token: str) -> bool:
+            if jitter > 0:
+                await asyncio.sleep(random.uniform(0, jitter))
+            async with semaphore:
+                return await self.health_check_token(token, base_url)
 
         # 执行并收集结果
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*(check(token) for token in token_list), return_exceptions=True)
 
         # 统计结果
         healthy_count = 0
@@ -437,19 +1207,149 @@ def get_token_pool() -> Optional[TokenPool]:
     return _token_pool
 
 
-def initialize_token_pool(tokens: List[str], failure_threshold: int = 3, recovery_timeout: int = 1800) -> TokenPool:
-    """初始化全局token池"""
+def initialize_token_pool(tokens: List[str], failure_threshold: int = 3, recovery_timeout: int = 1800,
+                          strategy: str = "round_robin", max_concurrency: int = 0, rpm_limit: int = 0,
+                          state_file: Optional[str] = None,
+                          shared_state: Optional[SharedTokenState] = None) -> TokenPool:
+    """初始化全局token池，配置了状态文件时从上次保存的快照恢复token状态"""
     global _token_pool
     with _pool_lock:
-        _token_pool = TokenPool(tokens, failure_threshold, recovery_timeout)
+        _token_pool = TokenPool(tokens, failure_threshold, recovery_timeout, strategy, max_concurrency, rpm_limit,
+                                shared_state)
+        if state_file:
+            load_token_state(_token_pool, state_file)
+        _token_pool.sync_shared_state()
         return _token_pool
 
 
-def update_token_pool(tokens: List[str]):
-    """更新全局token池"""
+def update_token_pool(tokens: List[str], failure_threshold: int = 3, recovery_timeout: int = 1800,
+                      strategy: str = "round_robin", max_concurrency: int = 0, rpm_limit: int = 0,
+                      state_file: Optional[str] = None,
+                      shared_state: Optional[SharedTokenState] = None):
+    """更新全局token池（池尚未创建时按给定参数创建）"""
     global _token_pool
     with _pool_lock:
         if _token_pool:
             _token_pool.update_tokens(tokens)
         else:
-            _token_pool = TokenPool(tokens)
+            _token_pool = TokenPool(tokens, failure_threshold, recovery_timeout, strategy, max_concurrency, rpm_limit,
+                                    shared_state)
+            if state_file:
+                load_token_state(_token_pool, state_file)
+        _token_pool.sync_shared_state()
+
+
+def is_primary_worker() -> bool:
+    """
+    当前进程是否负责执行全局后台任务（健康检查、状态快照）
+
+    单进程部署时总是 True；多 worker 共享状态时只有持有主 worker 锁的进程为 True，
+    主 worker 退出后锁被释放，其他 worker 在下一轮自动接管
+    """
+    shared = get_shared_state()
+    return shared is None or shared.try_become_leader()
+
+
+def _write_state_file(path: str, snapshot: Dict):
+    """原子写入快照文件：先写临时文件再替换，中途崩溃不会留下半个文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def save_token_state(pool: TokenPool, path: str) -> bool:
+    """将token池状态快照写入文件"""
+    try:
+        _write_state_file(path, pool.export_state())
+        return True
+    except Exception as e:
+        logger.error(f"❌ 保存token状态失败 {path}: {e}")
+        return False
+
+
+def load_token_state(pool: TokenPool, path: str) -> int:
+    """从文件恢复token池状态，返回恢复的token数量"""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取token状态文件失败 {path}: {e}")
+        return 0
+
+    restored = pool.import_state(snapshot)
+    if restored:
+        unavailable = sum(1 for status in pool.token_statuses.values() if not status.is_available)
+        logger.info(f"💾 从状态文件恢复了 {restored} 个token的状态（其中 {unavailable} 个处于禁用中）: {path}")
+    return restored
+
+
+async def run_token_state_saver(path: str, interval: float = 60.0):
+    """后台定期保存token池状态（状态有变化时才写入，文件写入在线程中进行）"""
+    saved_version = None
+    saved_pool = None
+    while True:
+        await asyncio.sleep(interval)
+        pool = get_token_pool()
+        if pool is None or (pool is saved_pool and pool.state_version == saved_version):
+            continue
+        if not is_primary_worker():
+            continue
+
+        version = pool.state_version
+        try:
+            await asyncio.to_thread(_write_state_file, path, pool.export_state())
+            saved_pool, saved_version = pool, version
+        except Exception as e:
+            logger.error(f"❌ 保存token状态失败 {path}: {e}")
+
+
+async def run_token_health_checker(
+    interval: float = 300.0,
+    concurrency: int = 10,
+    base_url: str = DEFAULT_ZAI_BASE_URL,
+):
+    """
+    后台定期健康检查（base_url 为 settings.ZAI_BASE_URL）
+
+    每轮间隔带 ±20% 抖动；只检查过期未检查的可用token和已过恢复时间的禁用token，
+    轮内各检查在前 10% 间隔（最多 30 秒）内随机错开，并发数受 concurrency 限制
+    """
+    interval = max(interval, 1.0)
+    while True:
+        await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+        pool = get_token_pool()
+        if pool is None or not is_primary_worker():
+            continue
+
+        due = pool.tokens_due_for_check(stale_after=interval)
+        if not due:
+            logger.debug("🔍 没有需要健康检查的token")
+            continue
+
+        try:
+            await pool.health_check_all(
+                base_url, tokens=due, concurrency=concurrency, jitter=min(interval * 0.1, 30.0)
+            )
+        except Exception as e:
+            logger.error(f"❌ 后台健康检查失败: {e}")
+
+
+async def run_shared_state_sync(interval: float = 1.0):
+    """后台定期与多 worker 共享状态同步（应用其他 worker 的禁用/恢复、释放过期预留、清理已退出的 worker）"""
+    while True:
+        await asyncio.sleep(interval)
+        shared = get_shared_state()
+        if shared is None:
+            continue
+        try:
+            shared.reap_dead_workers()
+            pool = get_token_pool()
+            if pool is not None:
+                pool.sync_shared_state()
+        except Exception as e:
+            logger.error(f"❌ 同步共享token状态失败: {e}")
@@ -13,6 +13,7 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from app.core.config import settings
 from app.utils.logger import get_logger
+from app.utils.request_log import get_request_log
 from app.providers import get_provider_router
 
 logger = get_logger()
@@ -93,16 +94,9 @@ async def docs(request: Request):
 
 @router.get("/dashboard/stats")
 async def dashboard_stats():
-    """获取监控面板统计数据"""
+    """获取监控面板统计数据（p50/p95/p99 在读取时计算）"""
     try:
-        # 这里可以添加实际的统计逻辑
-        # 目前返回模拟数据
-        return {
-            "totalRequests": 0,
-            "successfulRequests": 0,
-            "failedRequests": 0,
-            "averageResponseTime": 0
-        }
+        return get_request_log().stats()
     except Exception as e:
         logger.error(f"❌ 获取统计数据失败: {e}")
         return {
@@ -114,12 +108,10 @@ async def dashboard_stats():
 
 
 @router.get("/dashboard/requests")
-async def dashboard_requests():
-    """获取实时请求数据"""
+async def dashboard_requests(limit: int = 100):
+    """获取实时请求数据（最新的在前）"""
     try:
-        # 这里可以添加实际的请求记录逻辑
-        # 目前返回空数组
-        return []
+        return [record.to_dict() for record in get_request_log().recent(max(0, limit))]
     except Exception as e:
         logger.error(f"❌ 获取请求数据失败: {e}")
         return []
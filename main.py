@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
 import sys
 import psutil
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -12,35 +13,132 @@ from app.core.config import settings
 from app.core import openai
 from app.web import pages
 from app.utils.reload_config import RELOAD_CONFIG
-from app.utils.logger import setup_logger
-from app.utils.token_pool import initialize_token_pool
-from app.providers import initialize_providers
+from app.utils.logger import flush_logger, setup_logger
+from app.utils.token_pool import (
+    get_token_pool,
+    initialize_token_pool,
+    is_primary_worker,
+    run_shared_state_sync,
+    run_token_health_checker,
+    run_token_state_saver,
+    save_token_state,
+    update_token_pool,
+)
+from app.utils.token_file import TokenFileWatcher, token_file_cache
+from app.utils.http_client import close_http_clients
+from app.utils.shared_state import close_shared_state, initialize_shared_state
+from app.utils.json_codec import set_json_backend
+from app.utils.request_log import RequestTimingMiddleware, initialize_request_log
+from app.providers import initialize_providers, start_providers, shutdown_providers
 
 from granian import Granian
+from granian.constants import Loops
 
 
 # Setup logger
-logger = setup_logger(log_dir=None, debug_mode=settings.DEBUG_LOGGING)
+logger = setup_logger(
+    log_dir=None,
+    debug_mode=settings.DEBUG_LOGGING,
+    profile=settings.LOG_PROFILE,
+    chunk_sample_every=settings.LOG_CHUNK_SAMPLE_EVERY,
+)
+
+
+def _on_auth_tokens_changed(tokens):
+    """AUTH_TOKENS_FILE 变化时更新 token 池"""
+    update_token_pool(tokens, **settings.token_pool_options)
+
+
+def _create_token_file_watcher():
+    """根据配置创建 token 文件监听器，未配置 token 文件时返回 None"""
+    if not settings.TOKEN_FILE_WATCH_ENABLED:
+        return None
+
+    watcher = TokenFileWatcher(token_file_cache, interval=settings.TOKEN_FILE_WATCH_INTERVAL)
+    if settings.AUTH_TOKENS_FILE:
+        watcher.watch(settings.AUTH_TOKENS_FILE, settings._load_tokens_from_file, _on_auth_tokens_changed, "token")
+    if settings.LONGCAT_TOKENS_FILE:
+        # LongCat 每次请求从缓存列表中随机选择，刷新缓存即可生效
+        watcher.watch(settings.LONGCAT_TOKENS_FILE, settings._load_tokens_from_file, lambda tokens: None, "LongCat token")
+    return watcher
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    json_backend = set_json_backend(settings.JSON_BACKEND)
+    logger.info(f"🧩 JSON 后端: {json_backend}")
+
     # 初始化提供商系统
     initialize_providers()
 
+    # 多 worker 部署时加入共享 token 状态
+    shared_state = None
+    if settings.shared_state_path:
+        shared_state = initialize_shared_state(settings.shared_state_path, settings.SHARED_STATE_SLOTS)
+
     # 初始化 token 池
     token_list = settings.auth_token_list
     if token_list:
-        token_pool = initialize_token_pool(
-            tokens=token_list,
-            failure_threshold=settings.TOKEN_FAILURE_THRESHOLD,
-            recovery_timeout=settings.TOKEN_RECOVERY_TIMEOUT
-        )
+        token_pool = initialize_token_pool(tokens=token_list, **settings.token_pool_options)
+
+    # 监听 token 文件，变化时热更新 token 池
+    token_file_watcher = _create_token_file_watcher()
+    if token_file_watcher:
+        await token_file_watcher.start()
+
+    background_tasks = []
+
+    # 同步其他 worker 标记的 token 禁用/恢复状态
+    if shared_state:
+        background_tasks.append(asyncio.create_task(run_shared_state_sync(settings.SHARED_STATE_SYNC_INTERVAL)))
+
+    # 定期保存 token 状态快照，重启后恢复
+    if settings.TOKEN_STATE_FILE:
+        background_tasks.append(asyncio.create_task(
+            run_token_state_saver(settings.TOKEN_STATE_FILE, settings.TOKEN_STATE_SAVE_INTERVAL)
+        ))
+
+    # 后台定期健康检查 token 池
+    if settings.TOKEN_HEALTH_CHECK_ENABLED and not settings.ANONYMOUS_MODE:
+        background_tasks.append(asyncio.create_task(
+            run_token_health_checker(
+                settings.TOKEN_HEALTH_CHECK_INTERVAL,
+                settings.TOKEN_HEALTH_CHECK_CONCURRENCY,
+                settings.ZAI_BASE_URL,
+            )
+        ))
+
+    # 启动提供商后台任务（访客令牌预取等）
+    await start_providers()
 
     yield
 
     logger.info("🔄 应用正在关闭...")
 
+    await shutdown_providers()
+
+    if token_file_watcher:
+        await token_file_watcher.stop()
+
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+
+    # 关闭前保存最终的 token 状态（多 worker 时由主 worker 保存）
+    token_pool = get_token_pool()
+    if settings.TOKEN_STATE_FILE and token_pool and is_primary_worker():
+        save_token_state(token_pool, settings.TOKEN_STATE_FILE)
+
+    close_shared_state()
+
+    # 关闭共享的上游HTTP连接池
+    await close_http_clients()
+
+    # 写完队列中剩余的日志
+    flush_logger()
+
 
 # Create FastAPI app with lifespan
 app = FastAPI(lifespan=lifespan)
@@ -54,6 +152,10 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization"],
 )
 
+# 记录 API 请求耗时，供监控面板使用
+initialize_request_log(settings.REQUEST_LOG_SIZE)
+app.add_middleware(RequestTimingMiddleware)
+
 # Include API routers
 app.include_router(openai.router)
 
@@ -67,6 +169,15 @@ async def handle_options():
     return Response(status_code=200)
 
 
+def _resolve_loop(name: str) -> Loops:
+    """解析事件循环配置，未知值回退到 auto"""
+    try:
+        return Loops(name)
+    except ValueError:
+        logger.warning(f"⚠️ 未知的事件循环 {name}，使用 auto")
+        return Loops.auto
+
+
 def run_server():
     service_name = settings.SERVICE_NAME
 
@@ -74,6 +185,7 @@ def run_server():
     logger.info(f"📡 监听地址: 0.0.0.0:{settings.LISTEN_PORT}")
     logger.info(f"🔧 调试模式: {'开启' if settings.DEBUG_LOGGING else '关闭'}")
     logger.info(f"🔐 匿名模式: {'开启' if settings.ANONYMOUS_MODE else '关闭'}")
+    logger.info(f"🧵 Worker: {settings.WORKERS} 个进程 × {settings.THREADS} 个线程, 事件循环: {settings.LOOP}")
 
     try:
         Granian(
@@ -81,6 +193,9 @@ def run_server():
             interface="asgi",
             address="0.0.0.0",
             port=settings.LISTEN_PORT,
+            workers=max(1, settings.WORKERS),
+            runtime_threads=max(1, settings.THREADS),
+            loop=_resolve_loop(settings.LOOP),
             reload=False,  # 生产环境请关闭热重载
             process_name=service_name,  # 设置进程名称
             **RELOAD_CONFIG,    # 热重载配置
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+本地假上游：按配置的首字节延迟和输出速率回放录制的 Z.AI / LongCat / K2Think SSE 流
+
+    python tests/fake_upstream.py --port 9100 --ttft-ms 300 --token-rate 50
+
+代理通过 ZAI_BASE_URL / LONGCAT_BASE_URL / K2THINK_BASE_URL 指向它即可离线运行，
+握手、访客令牌、会话创建等辅助接口都返回固定的成功响应。压测见 tests/load_test.py。
+"""
+
+import os
+import sys
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+# 回放参数通过环境变量传给 Granian worker 进程
+TTFT_MS = float(os.getenv("FAKE_UPSTREAM_TTFT_MS", "0"))  # 首个事件前的延迟（毫秒）
+TOKEN_RATE = float(os.getenv("FAKE_UPSTREAM_TOKEN_RATE", "0"))  # 每秒输出的事件数，0 表示不限速
+
+
+def load_transcript(name: str) -> List[bytes]:
+    """读取录制的 SSE 流，按空行切分为事件（保留结尾的空行）"""
+    with open(os.path.join(TRANSCRIPT_DIR, f"{name}.sse"), "rb") as f:
+        body = f.read()
+    return [event + b"\n\n" for event in body.split(b"\n\n") if event.strip()]
+
+
+TRANSCRIPTS: Dict[str, List[bytes]] = {
+    name: load_transcript(name) for name in ("zai", "longcat", "k2think")
+}
+
+
+async def replay(events: List[bytes], ttft: float, token_rate: float) -> AsyncIterator[bytes]:
+    """按固定节奏输出事件；按起始时间排期，避免 sleep 误差累积"""
+    if ttft > 0:
+        await asyncio.sleep(ttft)
+    interval = 1.0 / token_rate if token_rate > 0 else 0.0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for index, event in enumerate(events):
+        if interval:
+            delay = start + index * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield event
+
+
+def stream(name: str) -> StreamingResponse:
+    return StreamingResponse(
+        replay(TRANSCRIPTS[name], TTFT_MS / 1000, TOKEN_RATE),
+        media_type="text/event-stream",
+    )
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+# ==================== Z.AI ====================
+
+async def zai_auth(request: Request):
+    """访客令牌：返回带 exp 的 JWT 形式字符串（签名不校验）"""
+    payload = f'{{"id":"guest-{uuid.uuid4().hex[:8]}","exp":{int(time.time()) + 3600}}}'
+    token = f"{_b64(b'{}')}.{_b64(payload.encode())}.replay"
+    return JSONResponse({"token": token})
+
+
+async def zai_chat(request: Request):
+    await request.body()
+    return stream("zai")
+
+
+# ==================== LongCat ====================
+
+async def longcat_session_create(request: Request):
+    return JSONResponse({"code": 0, "data": {"conversationId": str(uuid.uuid4())}})
+
+
+async def longcat_session_delete(request: Request):
+    return JSONResponse({"code": 0, "message": "success"})
+
+
+async def longcat_chat(request: Request):
+    await request.body()
+    return stream("longcat")
+
+
+# ==================== K2Think ====================
+
+async def k2_guest(request: Request):
+    response = PlainTextResponse("ok")
+    response.set_cookie("guest_session", uuid.uuid4().hex, max_age=3600)
+    return response
+
+
+async def k2_new_chat(request: Request):
+    await request.body()
+    return JSONResponse({"id": str(uuid.uuid4())})
+
+
+async def k2_chat(request: Request):
+    await request.body()
+    return stream("k2think")
+
+
+app = Starlette(routes=[
+    Route("/api/v1/auths/", zai_auth),
+    Route("/api/chat/completions", zai_chat, methods=["POST"]),
+    Route("/api/v1/session-create", longcat_session_create, methods=["POST"]),
+    Route("/api/v1/session-delete", longcat_session_delete),
+    Route("/api/v1/chat-completion", longcat_chat, methods=["POST"]),
+    Route("/guest", k2_guest),
+    Route("/api/v1/chats/guest/new", k2_new_chat, methods=["POST"]),
+    Route("/api/guest/chat/completions", k2_chat, methods=["POST"]),
+])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制的上游 SSE 流")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=TTFT_MS, help="首个事件前的延迟（毫秒）")
+    parser.add_argument("--token-rate", type=float, default=TOKEN_RATE, help="每秒输出的事件数，0 表示不限速")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    os.environ["FAKE_UPSTREAM_TTFT_MS"] = str(args.ttft_ms)
+    os.environ["FAKE_UPSTREAM_TOKEN_RATE"] = str(args.token_rate)
+
+    from granian import Granian
+
+    Granian(
+        "fake_upstream:app",
+        interface="asgi",
+        address=args.host,
+        port=args.port,
+        workers=args.workers,
+        working_dir=Path(__file__).resolve().parent,
+        log_access=False,
+        workers_kill_timeout=1,
+    ).serve()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+端到端压测：启动假上游（tests/fake_upstream.py）和代理，以固定并发驱动 /v1/chat/completions，
+统计 RPS、首 token 延迟（TTFT）p50/p99、token 间隔 p50/p99、每千 token 的代理 CPU 耗时和内存占用。
+
+    python tests/load_test.py --model GLM-4.5 --concurrency 32 --requests 500 --ttft-ms 300 --token-rate 50
+    python tests/load_test.py --model LongCat-Flash --json results/longcat.json
+    python tests/load_test.py --target http://127.0.0.1:8080 --pid 12345   # 压测已启动的代理
+
+每个 SSE 数据块中非空的 content / reasoning_content 计为一个 token。
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+import psutil
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+PROMPT = "解释一下事件循环是怎么工作的"
+
+
+@dataclass
+class RequestResult:
+    """单个请求的测量结果（秒）"""
+    ok: bool
+    ttft: Optional[float] = None
+    duration: float = 0.0
+    tokens: int = 0
+    gaps: List[float] = field(default_factory=list)  # 相邻 token 的间隔
+    content: str = ""
+    error: Optional[str] = None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩法百分位（毫秒）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))
+    return round(ordered[int(index)] * 1000, 2)
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 30.0):
+    """轮询直到服务可以响应"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"进程已退出: {url} (exit {process.returncode})")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise TimeoutError(f"等待服务启动超时: {url}")
+
+
+def start_fake_upstream(port: int, ttft_ms: float = 0, token_rate: float = 0) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(TESTS_DIR, "fake_upstream.py"),
+         "--port", str(port), "--ttft-ms", str(ttft_ms), "--token-rate", str(token_rate)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_until_ready(f"http://127.0.0.1:{port}/guest", process)
+    return process
+
+
+def start_proxy(port: int, upstream: str, workers: int = 1, extra_env: Optional[Dict[str, str]] = None,
+                log_file=None) -> subprocess.Popen:
+    """以匿名模式启动代理，所有上游指向假上游"""
+    env = {
+        **os.environ,
+        "LISTEN_PORT": str(port),
+        "WORKERS": str(workers),
+        "ZAI_BASE_URL": upstream,
+        "LONGCAT_BASE_URL": upstream,
+        "K2THINK_BASE_URL": upstream,
+        "ANONYMOUS_MODE": "true",
+        "SKIP_AUTH_TOKEN": "true",
+        "LONGCAT_PASSPORT_TOKEN": "replay",
+        "TOKEN_HEALTH_CHECK_ENABLED": "false",
+        "TOKEN_FILE_WATCH_ENABLED": "false",
+        "DEBUG_LOGGING": "false",
+        "LOG_PROFILE": "production",
+        **(extra_env or {}),
+    }
+    env.pop("AUTH_TOKENS_FILE", None)
+    env.pop("TOKEN_STATE_FILE", None)
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=log_file or subprocess.DEVNULL,
+        stderr=subprocess.STDOUT if log_file else subprocess.DEVNULL,
+    )
+    wait_until_ready(f"http://127.0.0.1:{port}/v1/models", process)
+    return process
+
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class ProcessSampler:
+    """统计进程树（含 Granian worker 子进程）的 CPU 时间和内存峰值"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.peak_rss = 0
+        self._task: Optional[asyncio.Task] = None
+        self._start_cpu = 0.0
+
+    def _processes(self) -> List[psutil.Process]:
+        try:
+            return [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def cpu_seconds(self) -> float:
+        total = 0.0
+        for process in self._processes():
+            try:
+                times = process.cpu_times()
+                total += times.user + times.system
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def rss(self) -> int:
+        total = 0
+        for process in self._processes():
+            try:
+                total += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._start_cpu = self.cpu_seconds()
+        self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> float:
+        """停止采样，返回期间消耗的 CPU 秒数"""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.peak_rss = max(self.peak_rss, self.rss())
+        return self.cpu_seconds() - self._start_cpu
+
+
+async def run_request(client: httpx.AsyncClient, url: str, model: str, keep_content: bool = False) -> RequestResult:
+    """发送一个流式请求，记录首 token 时间和 token 间隔"""
+    body = {"model": model, "stream": True, "messages": [{"role": "user", "content": PROMPT}]}
+    started = time.perf_counter()
+    result = RequestResult(ok=False)
+    last = None
+    parts: List[str] = []
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            if response.status_code != 200:
+                result.error = f"HTTP {response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                chunk = json.loads(line[6:])
+                if "error" in chunk:
+                    result.error = str(chunk["error"])
+                    return result
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta") or {}
+                text = delta.get("content") or delta.get("reasoning_content")
+                if not text:
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    result.ttft = now - started
+                else:
+                    result.gaps.append(now - last)
+                last = now
+                result.tokens += 1
+                if keep_content and delta.get("content"):
+                    parts.append(delta["content"])
+        result.ok = result.tokens > 0
+        if not result.ok:
+            result.error = "响应中没有内容"
+    except (httpx.HTTPError, ValueError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.duration = time.perf_counter() - started
+        result.content = "".join(parts)
+    return result
+
+
+async def run_load(base_url: str, model: str, concurrency: int, total_requests: int,
+                   pid: Optional[int] = None, keep_content: bool = False,
+                   api_key: str = "sk-load-test") -> Dict[str, Any]:
+    """以固定并发发送 total_requests 个请求，返回汇总结果"""
+    url = f"{base_url.rstrip('/')}/v1/chat/completions"
+    results: List[RequestResult] = []
+    remaining = total_requests
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    sampler = ProcessSampler(pid) if pid else None
+
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits, headers=headers) as client:
+        # 预热：建立连接并触发代理的懒加载
+        await run_request(client, url, model)
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                results.append(await run_request(client, url, model, keep_content))
+
+        if sampler:
+            sampler.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        cpu = await sampler.stop() if sampler else None
+
+    return summarize(results, wall, model, concurrency, cpu, sampler.peak_rss if sampler else None)
+
+
+def summarize(results: List[RequestResult], wall: float, model: str, concurrency: int,
+              cpu_seconds: Optional[float] = None, peak_rss: Optional[int] = None) -> Dict[str, Any]:
+    ok = [r for r in results if r.ok]
+    tokens = sum(r.tokens for r in ok)
+    ttfts = [r.ttft for r in ok if r.ttft is not None]
+    gaps = [gap for r in ok for gap in r.gaps]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.ok:
+            errors[r.error or "unknown"] = errors.get(r.error or "unknown", 0) + 1
+    return {
+        "model": model,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "failed": len(results) - len(ok),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "rps": round(len(ok) / wall, 2) if wall else 0,
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / wall, 1) if wall else 0,
+        "ttft_ms": {"p50": percentile(ttfts, 50), "p99": percentile(ttfts, 99)},
+        "itl_ms": {"p50": percentile(gaps, 50), "p99": percentile(gaps, 99)},
+        "cpu_ms_per_1k_tokens": round(cpu_seconds * 1000 / tokens * 1000, 1) if cpu_seconds is not None and tokens else None,
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss else None,
+        "contents": sorted({r.content for r in ok if r.content}),
+    }
+
+
+def print_report(summary: Dict[str, Any]):
+    print(f"📊 {summary['model']}  并发 {summary['concurrency']}  请求 {summary['requests']}（失败 {summary['failed']}）")
+    print(f"  RPS              {summary['rps']}")
+    print(f"  token/s          {summary['tokens_per_second']}")
+    print(f"  TTFT p50/p99     {summary['ttft_ms']['p50']} / {summary['ttft_ms']['p99']} ms")
+    print(f"  token 间隔 p50/p99 {summary['itl_ms']['p50']} / {summary['itl_ms']['p99']} ms")
+    if summary["cpu_ms_per_1k_tokens"] is not None:
+        print(f"  CPU / 1k token   {summary['cpu_ms_per_1k_tokens']} ms")
+    if summary["peak_rss_mb"] is not None:
+        print(f"  RSS 峰值          {summary['peak_rss_mb']} MB")
+    for error, count in summary["errors"].items():
+        print(f"  ❌ {count} × {error}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="代理端到端压测")
+    parser.add_argument("--model", default="GLM-4.5", help="GLM-4.5 / LongCat-Flash / MBZUAI-IFM/K2-Think 等")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--ttft-ms", type=float, default=200, help="假上游首个事件前的延迟")
+    parser.add_argument("--token-rate", type=float, default=100, help="假上游每秒输出的事件数，0 表示不限速")
+    parser.add_argument("--workers", type=int, default=1, help="代理 worker 进程数")
+    parser.add_argument("--target", help="压测已启动的代理（不启动假上游和代理）")
+    parser.add_argument("--pid", type=int, help="配合 --target，统计该进程的 CPU 和内存")
+    parser.add_argument("--api-key", default=os.getenv("AUTH_TOKEN", "sk-load-test"), help="配合 --target 使用的客户端密钥")
+    parser.add_argument("--json", help="把结果写入 JSON 文件，便于对比不同提交")
+    args = parser.parse_args(argv)
+
+    processes: List[subprocess.Popen] = []
+    try:
+        if args.target:
+            base_url, pid = args.target, args.pid
+        else:
+            upstream_port, proxy_port = free_port(), free_port()
+            processes.append(start_fake_upstream(upstream_port, args.ttft_ms, args.token_rate))
+            proxy = start_proxy(proxy_port, f"http://127.0.0.1:{upstream_port}", workers=args.workers)
+            processes.append(proxy)
+            base_url, pid = f"http://127.0.0.1:{proxy_port}", proxy.pid
+
+        summary = asyncio.run(run_load(base_url, args.model, args.concurrency, args.requests, pid,
+                                     api_key=args.api_key))
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+    summary.pop("contents")
+    summary.update({"ttft_config_ms": args.ttft_ms, "token_rate": args.token_rate, "workers": args.workers})
+    print_report(summary)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.json}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+流式响应块编码器测试：与 create_openai_chunk + format_sse_chunk 输出一致；直接运行时对比逐 token 开销
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.providers.k2think_provider import K2ThinkProvider
+from app.utils import json_codec
+
+
+def legacy_chunk(provider, chat_id, model, delta, finish_reason=None, usage=None):
+    chunk = provider.create_openai_chunk(chat_id, model, delta, finish_reason)
+    if usage is not None:
+        chunk["usage"] = usage
+    return asyncio.run(provider.format_sse_chunk(chunk))
+
+
+def test_encoder_matches_legacy_output(monkeypatch):
+    """各类 chunk 与原实现逐字节一致，created 跟随秒数刷新"""
+
+    print("🧪 测试编码器输出一致性\n")
+
+    provider = K2ThinkProvider()
+    chat_id, model = provider.create_chat_id(), "MBZUAI-IFM/K2-Think"
+    now = [1700000000.2]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+
+    original = json_codec.backend
+    try:
+        for name in json_codec.available_backends():
+            json_codec.set_json_backend(name)
+            encoder = provider.create_chunk_encoder(chat_id, model)
+
+            cases = [
+                (encoder.text("content", "你好 \"世界\" \\ 🚀\n"), {"content": "你好 \"世界\" \\ 🚀\n"}),
+                (encoder.text("reasoning_content", "思考", role="assistant"),
+                 {"role": "assistant", "reasoning_content": "思考"}),
+                (encoder.chunk({"role": "assistant"}), {"role": "assistant"}),
+            ]
+            for encoded, delta in cases:
+                assert encoded == legacy_chunk(provider, chat_id, model, delta)
+
+            usage = {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}
+            assert encoder.chunk({}, "stop", usage=usage) == legacy_chunk(provider, chat_id, model, {}, "stop", usage)
+
+            # 跨秒后 created 刷新
+            now[0] += 1.0
+            assert '"created":1700000001,' in encoder.text("content", "x")
+            assert encoder.text("content", "x") == legacy_chunk(provider, chat_id, model, {"content": "x"})
+            now[0] -= 1.0
+            print(f"  ✅ {name}")
+    finally:
+        json_codec.set_json_backend(original)
+
+
+def benchmark_encoder():
+    """逐 token 的内容块：原实现（构建字典 + 完整序列化）vs 预渲染模板"""
+
+    print("\n🧪 测试逐 token 编码开销\n")
+
+    provider = K2ThinkProvider()
+    chat_id, model = provider.create_chat_id(), "MBZUAI-IFM/K2-Think"
+    encoder = provider.create_chunk_encoder(chat_id, model)
+    tokens = [f"第{i}个token " for i in range(20_000)]
+
+    start = time.perf_counter()
+    for token in tokens:
+        json_codec.sse_data(provider.create_openai_chunk(chat_id, model, {"content": token}))
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for token in tokens:
+        encoder.text("content", token)
+    encoder_time = time.perf_counter() - start
+
+    print(f"  原实现: 平均 {legacy_time / len(tokens) * 1e6:.2f}µs/token")
+    print(f"  编码器: 平均 {encoder_time / len(tokens) * 1e6:.2f}µs/token")
+    print(f"  加速 {legacy_time / encoder_time:.2f}x (JSON 后端: {json_codec.backend})")
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, "-s", "-q"])
+    benchmark_encoder()
+    sys.exit(exit_code)
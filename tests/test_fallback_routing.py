@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+跨提供商降级测试：按降级链依次尝试，熔断器打开的提供商直接跳过
+"""
+
+import sys
+import os
+import asyncio
+import json
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+
+from app.core.config import settings
+from app.models.schemas import Message, OpenAIRequest
+from app.providers.longcat_provider import LongCatProvider
+from app.providers.provider_factory import ProviderRouter
+from app.providers.routing_table import Route, RoutingTable
+from app.utils.chunk_encoder import OpenAIChunkEncoder
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.utils.stream_coalescer import coalesce_stream
+
+ERROR_CHUNK = 'data: {"error":{"message":"upstream 503","code":503}}\n\n'
+
+
+class FakeProvider:
+    """按预设结果响应的提供商：ok / error（错误字典或错误块）/ raise"""
+
+    def __init__(self, name, outcome="ok"):
+        self.name = name
+        self.outcome = outcome
+        self.models = []
+        self.closed = 0
+
+    async def chat_completion(self, request, **kwargs):
+        self.models.append(request.model)
+        if self.outcome == "raise":
+            raise RuntimeError("connection reset")
+        if not request.stream:
+            if self.outcome == "error":
+                return {"error": {"message": f"{self.name} failed", "code": "internal_error"}}
+            return {"model": request.model, "provider": self.name}
+        return self._stream(request.model)
+
+    async def _stream(self, model):
+        try:
+            if self.outcome == "error":
+                yield ERROR_CHUNK
+            else:
+                yield f'data: {{"model":"{model}","content":"{self.name}"}}\n\n'
+            yield "data: [DONE]\n\n"
+        finally:
+            self.closed += 1
+
+    def handle_error(self, error, context=""):
+        return {"error": {"message": f"{self.name} {context} 错误: {error}", "code": "internal_error"}}
+
+
+class CharProvider(FakeProvider):
+    """逐字符输出回答的提供商，文本增量由 OpenAIChunkEncoder 编码"""
+
+    def __init__(self, name, answer):
+        super().__init__(name)
+        self.answer = answer
+        self.started = 0
+
+    async def _stream(self, model):
+        self.started += 1
+        encoder = OpenAIChunkEncoder("chatcmpl-test", model, "fp_test")
+        try:
+            yield encoder.chunk({"role": "assistant"})
+            for char in self.answer:
+                yield encoder.text("content", char)
+            yield encoder.chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            self.closed += 1
+
+
+def make_router(providers):
+    """按模型返回指定的假提供商，GLM-4.5 依次降级到 GLM-4.5-Air、LongCat-Flash"""
+    routes = {model: Route(model, provider) for model, provider in providers.items()}
+    fallbacks = {"GLM-4.5": (routes["GLM-4.5-Air"], routes["LongCat-Flash"])}
+    router = ProviderRouter()
+    router.factory._routing = RoutingTable(routes, [], fallbacks=fallbacks)
+    return router
+
+
+def route(router, stream=False):
+    request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=stream)
+
+    async def call():
+        result = await router.route_request(request)
+        if hasattr(result, "__aiter__"):
+            return "".join([chunk async for chunk in result])
+        return result
+
+    return asyncio.run(call())
+
+
+def test_fallback_chain_parsing():
+    """降级链按 -> 和 ; 解析，链上每个模型都降级到它后面的模型"""
+
+    previous = settings.MODEL_FALLBACKS
+    settings.MODEL_FALLBACKS = " GLM-4.5 -> GLM-4.5-Air -> LongCat-Flash ; GLM-4.6->GLM-4.5;bad"
+    try:
+        chains = settings.model_fallback_chains
+    finally:
+        settings.MODEL_FALLBACKS = previous
+    print(f"  降级链: {chains}")
+    assert chains == {
+        "GLM-4.5": ["GLM-4.5-Air", "LongCat-Flash"],
+        "GLM-4.5-Air": ["LongCat-Flash"],
+        "GLM-4.6": ["GLM-4.5"],
+    }
+
+
+def test_non_stream_fallback():
+    """主模型返回错误或抛出异常时改用降级链上的下一个模型"""
+
+    zai = FakeProvider("zai", "error")
+    zai_air = FakeProvider("zai", "raise")
+    longcat = FakeProvider("longcat")
+    router = make_router({"GLM-4.5": zai, "GLM-4.5-Air": zai_air, "LongCat-Flash": longcat})
+
+    result = route(router)
+    assert result == {"model": "LongCat-Flash", "provider": "longcat"}
+    assert zai.models == ["GLM-4.5"] and zai_air.models == ["GLM-4.5-Air"]
+    assert router.breakers["zai"].get_status()["window_requests"] == 2
+    assert router.breakers["longcat"].get_status()["error_rate"] == 0.0
+
+
+def test_stream_fallback_on_error_chunk():
+    """流式响应的第一个数据块是错误块时关闭该流并降级，客户端只看到降级后的内容"""
+
+    zai = FakeProvider("zai", "error")
+    longcat = FakeProvider("longcat")
+    router = make_router({"GLM-4.5": zai, "GLM-4.5-Air": zai, "LongCat-Flash": longcat})
+
+    output = route(router, stream=True)
+    print(f"  输出: {output!r}")
+    assert '"content":"longcat"' in output and '"error"' not in output
+    assert output.endswith("data: [DONE]\n\n")
+    assert zai.closed == 2 and longcat.closed == 1
+
+
+def test_stream_fallback_is_coalesced():
+    """有降级链的流式请求在响应体内才开始尝试，合并层之内产生的增量可以合并"""
+
+    answer = "降级后的回答" * 50
+    zai = FakeProvider("zai", "error")
+    longcat = CharProvider("longcat", answer)
+    router = make_router({"GLM-4.5": zai, "GLM-4.5-Air": zai, "LongCat-Flash": longcat})
+    request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=True)
+
+    async def call():
+        result = await router.route_request(request)
+        # 返回时还没有调用任何提供商，响应头不等待上游首字节
+        assert zai.models == [] and longcat.started == 0
+        return [item async for item in coalesce_stream(result, window_ms=50)]
+
+    events = asyncio.run(call())
+    content = "".join(
+        json.loads(item[6:])["choices"][0]["delta"].get("content", "")
+        for item in events if item.startswith("data: {")
+    )
+    print(f"  {len(answer)} 个增量 -> {len(events)} 个事件")
+    assert content == answer
+    assert len(events) < 10
+    assert zai.closed == 2 and longcat.closed == 1
+
+
+def test_stream_without_fallback_is_not_peeked():
+    """没有降级链时流式响应原样返回，熔断器在读到第一个数据块时记录结果"""
+
+    longcat = CharProvider("longcat", "abc")
+    router = ProviderRouter()
+    router.factory._routing = RoutingTable({"LongCat-Flash": Route("LongCat-Flash", longcat)}, [])
+    request = OpenAIRequest(model="LongCat-Flash", messages=[Message(role="user", content="hi")], stream=True)
+
+    async def call():
+        result = await router.route_request(request)
+        assert longcat.started == 0
+        assert router.breakers["longcat"].get_status()["window_requests"] == 0
+        return [item async for item in result]
+
+    items = asyncio.run(call())
+    assert len(items) == 6 and longcat.closed == 1
+    assert router.breakers["longcat"].get_status()["window_requests"] == 1
+
+
+def test_longcat_error_before_content_comes_first():
+    """LongCat 上游在输出内容之前返回错误时，错误块是流的第一个数据块（路由器据此降级）"""
+
+    longcat = LongCatProvider()
+    longcat.schedule_session_deletion = lambda *args: None
+
+    async def first_items(body):
+        response = httpx.Response(200, content=body)
+        stream = longcat._handle_stream_response(response, "chatcmpl-test", "LongCat-Flash", "conv", "token", "ua")
+        return [item async for item in stream]
+
+    items = asyncio.run(first_items(b'{"code": 401, "message": "unauthorized"}\n'))
+    assert items[0].startswith('data: {"error"')
+
+    items = asyncio.run(first_items(
+        b'data: {"choices":[{"delta":{"content":"hi"}}],"lastOne":true}\n\n'
+    ))
+    assert '"role":"assistant"' in items[0] and '"content":"hi"' in items[1]
+
+
+def test_last_candidate_error_is_returned():
+    """所有候选都失败时返回最后一个候选的错误"""
+
+    router = make_router({
+        "GLM-4.5": FakeProvider("zai", "error"),
+        "GLM-4.5-Air": FakeProvider("zai", "error"),
+        "LongCat-Flash": FakeProvider("longcat", "error"),
+    })
+    assert route(router)["error"]["message"] == "longcat failed"
+    assert ERROR_CHUNK in route(router, stream=True)
+
+
+def test_open_breaker_is_skipped():
+    """熔断器打开的提供商不再调用；全部打开时返回 provider_unavailable"""
+
+    zai = FakeProvider("zai")
+    longcat = FakeProvider("longcat")
+    router = make_router({"GLM-4.5": zai, "GLM-4.5-Air": zai, "LongCat-Flash": longcat})
+    breaker = router.get_breaker("zai")
+    breaker._open(now=10 ** 12)
+
+    assert route(router)["provider"] == "longcat"
+    assert zai.models == []
+    assert breaker.rejected == 2
+
+    router.get_breaker("longcat")._open(now=10 ** 12)
+    assert route(router)["error"]["code"] == "provider_unavailable"
+    assert router.get_status()["circuit_breakers"]["zai"]["state"] == OPEN
+
+
+def test_circuit_breaker_states():
+    """错误率或慢请求比例超过阈值后打开，冷却后只放行一个探测请求，探测结果决定关闭或重新打开"""
+
+    breaker = CircuitBreaker("test", window=10, min_requests=4, error_rate=0.5,
+                             slow_call_duration=5.0, slow_call_rate=0.75, open_duration=30.0)
+    for _ in range(3):
+        breaker.record_failure(now=0.0)
+    assert breaker.state == CLOSED  # 请求数不足 min_requests
+    breaker.record_success(0.1, now=0.0)
+    assert breaker.state == OPEN
+
+    assert not breaker.allow(now=29.0)
+    assert breaker.allow(now=30.0) and breaker.state == HALF_OPEN
+    assert not breaker.allow(now=31.0)  # 同一时间只有一个探测请求
+    breaker.record_failure(now=31.0)
+    assert breaker.state == OPEN and breaker.times_opened == 2
+
+    assert breaker.allow(now=61.0)
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED and breaker.allow()
+
+    # 全部成功但大多很慢同样打开
+    for duration in (6.0, 7.0, 0.1, 8.0):
+        breaker.record_success(duration, now=100.0)
+    assert breaker.state == OPEN
+    print(f"  熔断器状态: {breaker.get_status()}")
+
+
+if __name__ == "__main__":
+    test_fallback_chain_parsing()
+    test_non_stream_fallback()
+    test_stream_fallback_on_error_chunk()
+    test_stream_fallback_is_coalesced()
+    test_stream_without_fallback_is_not_peeked()
+    test_longcat_error_before_content_comes_first()
+    test_last_candidate_error_is_returned()
+    test_open_breaker_is_skipped()
+    test_circuit_breaker_states()
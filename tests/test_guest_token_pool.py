@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+访客令牌预取池测试：过期/即将过期的令牌被跳过、复用上限、补充失败时退避、池为空时回退到直接获取
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.core.config import settings
+from app.utils.guest_token_pool import GuestTokenPool
+
+
+class FakeFetcher:
+    """按顺序返回预设令牌的获取函数，列表用完后返回 None（模拟上游失败）"""
+
+    def __init__(self, tokens=()):
+        self.tokens = list(tokens)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.tokens.pop(0) if self.tokens else None
+
+
+def test_expired_tokens_are_skipped():
+    """已过期和距离过期不足 refresh_margin 的令牌不会放入池中，也不会被取出"""
+
+    now = time.time()
+    expiry = {"expired": now - 10, "near": now + 30, "fresh": now + 3600, "later": now + 3600}
+    pool = GuestTokenPool(FakeFetcher(), expiry_resolver=expiry.get, refresh_margin=60)
+
+    assert not pool.add("expired") and not pool.add("near")
+    assert pool.add("fresh") and pool.add("later")
+    assert pool.size == 2 and pool.expired == 2
+
+    # 池中的令牌进入 refresh_margin 后被跳过
+    pool._tokens[0].expires_at = now + 30
+    assert pool.acquire() == "later"
+    assert pool.expired == 3
+    assert pool.acquire() is None and pool.misses == 1
+
+
+def test_token_dropped_after_max_uses():
+    """令牌复用均匀轮换，达到 max_uses 后移出池"""
+
+    pool = GuestTokenPool(FakeFetcher(), max_uses=2)
+    pool.add("a")
+    pool.add("b")
+    assert [pool.acquire() for _ in range(4)] == ["a", "b", "a", "b"]
+    assert pool.size == 0 and pool.acquire() is None
+    assert pool.hits == 4
+
+
+def test_refill_backs_off_after_failures():
+    """上游获取失败时后台补充按 1, 2, 4... 秒退避（上限 60 秒），恢复后填满到 max_size"""
+
+    real_sleep = asyncio.sleep
+    delays = []
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    async def run():
+        fetcher = FakeFetcher()
+        pool = GuestTokenPool(fetcher, min_size=1, max_size=3)
+        asyncio.sleep = fake_sleep
+        try:
+            await pool.start()
+            while len(delays) < 8:
+                await real_sleep(0)
+            backoff = list(delays[:8])
+
+            # 上游恢复后补充到最大容量，不再退避
+            fetcher.tokens = ["t1", "t2", "t3"]
+            while pool.size < 3:
+                await real_sleep(0)
+        finally:
+            await pool.stop()
+            asyncio.sleep = real_sleep
+        return pool, backoff
+
+    pool, backoff = asyncio.run(run())
+    print(f"  退避: {backoff}")
+    assert backoff == [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0]
+    assert pool.fetch_failures >= 8 and pool.fetched == 3
+
+
+def test_empty_pool_falls_back_to_direct_fetch():
+    """匿名模式下池为空时，ZAIProvider 直接获取访客令牌"""
+
+    from app.providers.zai_provider import ZAIProvider
+
+    provider = ZAIProvider()
+    direct = FakeFetcher(["direct-token"])
+    provider._fetch_guest_token = direct
+    provider.guest_token_pool = GuestTokenPool(FakeFetcher())
+
+    previous = settings.ANONYMOUS_MODE
+    settings.ANONYMOUS_MODE = True
+    try:
+        assert asyncio.run(provider.get_token()) == "direct-token"
+        provider.guest_token_pool.add("pooled-token")
+        assert asyncio.run(provider.get_token()) == "pooled-token"
+    finally:
+        settings.ANONYMOUS_MODE = previous
+    assert direct.calls == 1 and provider.guest_token_pool.misses == 1
+
+
+if __name__ == "__main__":
+    test_expired_tokens_are_skipped()
+    test_token_dropped_after_max_uses()
+    test_refill_backs_off_after_failures()
+    test_empty_pool_falls_back_to_direct_fetch()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+对冲请求测试：首块超过等待时间后用另一个token再发请求，先返回首块的胜出，另一个被取消并释放token
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+
+from app.core.config import settings
+from app.models.schemas import Message, OpenAIRequest
+from app.providers.zai_provider import ZAIProvider
+from app.utils import token_pool as token_pool_module
+from app.utils.hedging import HedgePolicy
+
+TOKENS = ["token-a", "token-b", "token-c", "token-d"]
+
+EVENTS = [
+    b'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":"hello"}}\n\n',
+    b'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":"","usage":{"total_tokens":1}}}\n\n',
+]
+
+
+class FakeUpstream:
+    """按token在首块前等待指定秒数（delays: token -> 秒）；记录每个流是否被关闭"""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+        self.closed = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        token = request.headers["Authorization"][7:]
+        self.calls.append((token, request.url.params["current_url"]))
+        delay = self.delays.get(token, 0.0)
+
+        async def body():
+            try:
+                await asyncio.sleep(delay)
+                for event in EVENTS:
+                    yield event
+            finally:
+                self.closed.append(token)
+
+        return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+
+def run(upstream, policy, requests=1, tokens=TOKENS, strategy="round_robin"):
+    """在非匿名模式下依次发送流式请求，返回 (输出列表, 耗时列表, token池)"""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    previous_pool = token_pool_module._token_pool
+    previous_anonymous = settings.ANONYMOUS_MODE
+    settings.ANONYMOUS_MODE = False
+    try:
+        pool = token_pool_module.initialize_token_pool(tokens, strategy=strategy)
+        provider = ZAIProvider()
+        provider.get_http_client = lambda: client
+        provider.hedge_policy = policy
+        request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=True)
+
+        async def call():
+            started = time.perf_counter()
+            stream = await provider.chat_completion(request)
+            output = "".join([chunk async for chunk in stream])
+            return output, time.perf_counter() - started
+
+        async def main():
+            results = [await call() for _ in range(requests)]
+            await asyncio.sleep(0)
+            return results
+
+        results = asyncio.run(main())
+        return [r[0] for r in results], [r[1] for r in results], pool
+    finally:
+        settings.ANONYMOUS_MODE = previous_anonymous
+        token_pool_module._token_pool = previous_pool
+
+
+def test_hedge_wins_when_primary_is_slow():
+    """原请求首块很慢时对冲请求胜出，原请求被取消、token名额释放"""
+
+    upstream = FakeUpstream({"token-a": 1.0})
+    policy = HedgePolicy(min_delay=0.05, default_delay=0.1)
+    outputs, durations, pool = run(upstream, policy)
+
+    print(f"  耗时 {durations[0] * 1000:.0f}ms，请求: {[token for token, _ in upstream.calls]}")
+    assert '"content":"hello"' in outputs[0] and '"error"' not in outputs[0]
+    assert durations[0] < 0.5
+    assert [token for token, _ in upstream.calls] == ["token-a", "token-b"]
+    # 对冲请求使用新的对话ID
+    assert upstream.calls[0][1] != upstream.calls[1][1]
+    assert "token-a" in upstream.closed
+    assert all(status.in_flight == 0 for status in pool.token_statuses.values())
+
+    status = policy.get_status()
+    print(f"  {status}")
+    assert status["hedged"] == 1 and status["hedge_wins"] == 1 and status["primary_wins"] == 0
+    assert pool.token_statuses["token-b"].successful_requests == 1
+    assert pool.token_statuses["token-a"].failure_count == 0
+
+
+def test_no_hedge_when_primary_is_fast():
+    """首块在等待时间内到达时不发对冲请求"""
+
+    upstream = FakeUpstream({})
+    policy = HedgePolicy(min_delay=0.2, default_delay=0.2)
+    outputs, _, _ = run(upstream, policy, requests=3)
+
+    assert all('"content":"hello"' in output for output in outputs)
+    assert len(upstream.calls) == 3
+    status = policy.get_status()
+    assert status["requests"] == 3 and status["hedged"] == 0 and status["samples"] == 3
+
+
+def test_primary_wins_race():
+    """对冲请求更慢时原请求胜出"""
+
+    upstream = FakeUpstream({"token-a": 0.3, "token-b": 1.0})
+    policy = HedgePolicy(min_delay=0.05, default_delay=0.1)
+    outputs, durations, pool = run(upstream, policy)
+
+    assert '"content":"hello"' in outputs[0]
+    assert durations[0] < 0.8
+    assert policy.primary_wins == 1 and policy.hedge_wins == 0
+    assert "token-b" in upstream.closed
+    assert all(status.in_flight == 0 for status in pool.token_statuses.values())
+
+
+def test_hedge_budget():
+    """max_ratio 限制对冲数量，超出预算时只等待原请求"""
+
+    upstream = FakeUpstream({token: 0.15 for token in TOKENS})
+    policy = HedgePolicy(min_delay=0.05, default_delay=0.05, max_ratio=0.0)
+    run(upstream, policy, requests=3)
+
+    status = policy.get_status()
+    print(f"  {status}")
+    assert status["hedged"] == 1
+    assert status["budget_skipped"] == 2
+    assert len(upstream.calls) == 4
+
+
+def test_hedge_uses_another_token():
+    """对冲请求总是换一个token；没有其他可用token时不对冲，额度退还"""
+
+    upstream = FakeUpstream({"token-a": 0.2, "token-b": 0.2})
+    policy = HedgePolicy(min_delay=0.05, default_delay=0.05, max_ratio=1.0)
+    run(upstream, policy, requests=10, tokens=TOKENS[:2], strategy="power_of_two")
+    calls = [token for token, _ in upstream.calls]
+    assert len(calls) == 20
+    assert all(calls[i] != calls[i + 1] for i in range(0, 20, 2))
+
+    upstream = FakeUpstream({"token-a": 0.2})
+    policy = HedgePolicy(min_delay=0.05, default_delay=0.05, max_ratio=0.0)
+    previous_auth_token = settings.AUTH_TOKEN
+    settings.AUTH_TOKEN = ""
+    try:
+        outputs, _, _ = run(upstream, policy, requests=2, tokens=TOKENS[:1])
+    finally:
+        settings.AUTH_TOKEN = previous_auth_token
+    status = policy.get_status()
+    print(f"  {status}")
+    assert all('"content":"hello"' in output for output in outputs)
+    assert [token for token, _ in upstream.calls] == ["token-a", "token-a"]
+    assert status["hedged"] == 0 and status["no_token_skipped"] == 2 and status["budget_skipped"] == 0
+
+
+def test_delay_tracks_percentile():
+    """等待时间取最近首块延迟的百分位并限制在上下限内"""
+
+    policy = HedgePolicy(percentile=90, min_delay=0.05, max_delay=1.0, default_delay=0.5, min_samples=20)
+    assert policy.delay() == 0.5
+    for i in range(1, 101):
+        policy.record_latency(i / 100)
+    assert abs(policy.delay() - 0.9) < 0.06
+
+    for _ in range(500):
+        policy.record_latency(5.0)
+    assert policy.delay() == 1.0
+
+
+if __name__ == "__main__":
+    test_hedge_wins_when_primary_is_slow()
+    test_no_hedge_when_primary_is_fast()
+    test_primary_wins_race()
+    test_hedge_budget()
+    test_hedge_uses_another_token()
+    test_delay_tracks_percentile()
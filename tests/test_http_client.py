@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+共享 HTTP 客户端注册表测试：按名称复用同一客户端、close_all 关闭并清空、连接复用/建连计数
+"""
+
+import sys
+import os
+import asyncio
+import logging
+import httpx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.utils.http_client import HttpClientConfig, HttpClientRegistry
+from app.utils.metrics import UPSTREAM_CONNECT
+
+
+class KeepAliveTransport(httpx.MockTransport):
+    """模拟长连接的传输层：第一个请求建立连接（触发 connect_tcp 追踪事件），之后的请求复用连接"""
+
+    def __init__(self):
+        self.connected = False
+        super().__init__(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if not self.connected:
+            self.connected = True
+            trace = request.extensions["trace"]
+            await trace("connection.connect_tcp.started", {})
+            await trace("connection.connect_tcp.complete", {})
+        return httpx.Response(200, json={"ok": True})
+
+
+def test_same_name_returns_shared_client():
+    """同名返回同一个客户端，不同名称各自独立，已关闭的客户端会被重新创建"""
+
+    async def run():
+        registry = HttpClientRegistry()
+        config = HttpClientConfig(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        client = registry.get_client("zai", config)
+        assert registry.get_client("zai") is client
+        assert registry.get_client("zai", config) is client
+        assert registry.get_client("longcat", config) is not client
+
+        await client.aclose()
+        recreated = registry.get_client("zai")
+        assert recreated is not client and not recreated.is_closed
+        # 重建时沿用首次传入的配置
+        assert (await recreated.get("http://upstream/")).status_code == 200
+        await registry.close_all()
+
+    asyncio.run(run())
+
+
+def test_close_all_closes_and_forgets_clients():
+    """close_all 关闭所有客户端并从注册表移除，之后按名称获取会得到新客户端"""
+
+    async def run():
+        registry = HttpClientRegistry()
+        clients = [registry.get_client(name) for name in ("zai", "k2think", "longcat")]
+        await registry.close_all()
+
+        assert all(client.is_closed for client in clients)
+        assert not registry._clients
+        assert all(stats["is_closed"] for stats in registry.get_stats().values())
+
+        fresh = registry.get_client("zai")
+        assert fresh not in clients and not fresh.is_closed
+        await registry.close_all()
+
+    asyncio.run(run())
+
+
+def test_reuse_and_connect_counters():
+    """只有新建连接计入 connections_opened，其余请求计为复用"""
+
+    connect_metric = UPSTREAM_CONNECT.labels("counter-test")
+    observed_before = connect_metric.count
+
+    async def run():
+        registry = HttpClientRegistry()
+        client = registry.get_client("counter-test", HttpClientConfig(transport=KeepAliveTransport()))
+        for _ in range(4):
+            response = await client.get("http://upstream/v1/chat")
+            assert response.status_code == 200
+        stats = registry.get_stats()["counter-test"]
+        await registry.close_all()
+        return stats
+
+    stats = asyncio.run(run())
+    print(f"  统计: {stats}")
+    assert stats["requests"] == 4
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 3
+    assert stats["reuse_rate"] == "75.00%"
+    assert connect_metric.count == observed_before + 1
+
+
+if __name__ == "__main__":
+    test_same_name_returns_shared_client()
+    test_close_all_closes_and_forgets_clients()
+    test_reuse_and_connect_counters()
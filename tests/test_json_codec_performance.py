@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+JSON 编解码测试：各后端结果一致；直接运行时对比流式热路径单 chunk 延迟
+"""
+
+import sys
+import os
+import json
+import time
+import logging
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.utils import json_codec
+
+
+UPSTREAM_CHUNK = json.dumps({
+    "type": "chat:completion",
+    "data": {
+        "phase": "answer",
+        "delta_content": "这是一段流式输出的内容，包含中文和 emoji 🚀",
+        "edit_index": 1024,
+        "usage": {"prompt_tokens": 12, "completion_tokens": 345, "total_tokens": 357},
+    },
+}, ensure_ascii=False)
+
+
+def build_openai_chunk(upstream: dict) -> dict:
+    return {
+        "id": "chatcmpl-1234567890",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "GLM-4.5",
+        "choices": [{"index": 0, "delta": {"content": upstream["data"]["delta_content"]}, "finish_reason": None}],
+    }
+
+
+def test_backends_roundtrip():
+    """所有可用后端的解析/序列化结果一致，解析错误统一为 JSONDecodeError"""
+
+    print("🧪 测试 JSON 后端一致性\n")
+    original = json_codec.backend
+    samples = [
+        {"content": "中文 🚀 \"quoted\" \\ \n", "n": [1, 2.5, None, True], "nested": {"k": {}}},
+        {1: "int key"},
+        {"big": 2 ** 70},
+    ]
+    try:
+        for name in json_codec.available_backends():
+            json_codec.set_json_backend(name)
+            for sample in samples:
+                encoded = json_codec.dumps(sample)
+                assert "\\u" not in encoded  # 不转义非 ASCII 字符
+                assert json.loads(encoded) == json.loads(json.dumps(sample))
+                assert json_codec.dumps_bytes(sample) == encoded.encode("utf-8")
+            assert json_codec.loads(UPSTREAM_CHUNK.encode("utf-8")) == json.loads(UPSTREAM_CHUNK)
+            assert json_codec.sse_data({"a": 1}) == 'data: {"a":1}\n\n'
+            with pytest.raises(json_codec.JSONDecodeError):
+                json_codec.loads("{broken")
+            print(f"  ✅ {name}")
+    finally:
+        json_codec.set_json_backend(original)
+
+
+def run_stdlib():
+    upstream = json.loads(UPSTREAM_CHUNK)
+    return f"data: {json.dumps(build_openai_chunk(upstream), ensure_ascii=False)}\n\n"
+
+
+def run_codec():
+    upstream = json_codec.loads(UPSTREAM_CHUNK)
+    return json_codec.sse_data(build_openai_chunk(upstream))
+
+
+def test_chunk_matches_stdlib():
+    """流式热路径（解析上游 + 序列化下游）在各后端下与标准库结果一致"""
+
+    original = json_codec.backend
+    expected = json.loads(run_stdlib()[6:])
+    try:
+        for name in json_codec.available_backends():
+            json_codec.set_json_backend(name)
+            event = run_codec()
+            assert event.startswith("data: ") and event.endswith("\n\n")
+            assert json.loads(event[6:]) == expected
+    finally:
+        json_codec.set_json_backend(original)
+
+
+def benchmark_chunk_latency():
+    """单个 chunk 的 解析上游 + 序列化下游 延迟：标准库 vs 当前后端"""
+
+    print("\n🧪 测试单 chunk 编解码延迟\n")
+    iterations = 20_000
+
+    results = {}
+    for label, func in (("stdlib", run_stdlib), (json_codec.backend, run_codec)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        results[label] = (time.perf_counter() - start) / iterations
+        print(f"  {label:8s} 平均 {results[label] * 1e6:.2f}µs/chunk")
+
+    codec_time = results[json_codec.backend]
+    print(f"  加速 {results['stdlib'] / codec_time:.2f}x")
+
+
+if __name__ == "__main__":
+    test_backends_roundtrip()
+    test_chunk_matches_stdlib()
+    benchmark_chunk_latency()
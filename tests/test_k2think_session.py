@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+K2Think 握手会话缓存与预建对话池测试：Cookie 过期时间、401/403 淘汰会话、按模型复用预建对话、默认关闭预建池
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+from email.utils import formatdate
+import httpx
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.core.config import settings
+from app.providers.k2think_provider import K2ThinkProvider, K2GuestSession, K2Conversation
+
+
+class FakeK2Upstream:
+    """模拟 K2Think 的 /guest 握手和 /new 建对话端点"""
+
+    def __init__(self, cookie_attrs="Max-Age=120", new_chat_statuses=()):
+        self.cookie_attrs = cookie_attrs
+        self.new_chat_statuses = list(new_chat_statuses)
+        self.handshakes = 0
+        self.new_chats = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/guest":
+            self.handshakes += 1
+            cookie = f"guest_session=s{self.handshakes}"
+            if self.cookie_attrs:
+                cookie += f"; {self.cookie_attrs}"
+            return httpx.Response(200, headers={"Set-Cookie": cookie}, text="ok")
+
+        self.new_chats.append(request.headers.get("Cookie"))
+        status = self.new_chat_statuses.pop(0) if self.new_chat_statuses else 200
+        if status != 200:
+            return httpx.Response(status, text="rejected")
+        return httpx.Response(200, json={"id": f"conv-{len(self.new_chats)}"})
+
+
+def make_provider(upstream: FakeK2Upstream) -> K2ThinkProvider:
+    provider = K2ThinkProvider()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handler))
+    provider.get_http_client = lambda: client
+    return provider
+
+
+def make_conversation(model_id: str, session: K2GuestSession, ttl: float = 600) -> K2Conversation:
+    return K2Conversation(
+        conversation_id=f"warm-{model_id}",
+        cookie=session.cookies,
+        model_id=model_id,
+        session=session,
+        expires_at=time.time() + ttl,
+    )
+
+
+def test_cookie_expiry_is_honored():
+    """Set-Cookie 的 Max-Age / Expires 决定缓存时长，过期前复用，过期后重新握手"""
+
+    provider = K2ThinkProvider()
+    expires = formatdate(time.time() + 300, usegmt=True)
+    headers = httpx.Headers([
+        ("Set-Cookie", f"a=1; Path=/; Expires={expires}"),
+        ("Set-Cookie", "b=2; Max-Age=60"),
+        ("Set-Cookie", "c=3; Path=/"),
+    ])
+    expiry = provider.parse_cookie_expiry(headers)
+    assert abs(expiry - (time.time() + 60)) < 5, "应取最早的过期时间"
+    assert provider.parse_cookie_expiry(httpx.Headers([("Set-Cookie", "c=3")])) is None
+
+    upstream = FakeK2Upstream(cookie_attrs="Max-Age=120")
+    provider = make_provider(upstream)
+
+    async def run():
+        first = await provider._get_guest_session()
+        second = await provider._get_guest_session()
+        assert first is second and upstream.handshakes == 1
+        assert abs(first.expires_at - (time.time() + 120)) < 5
+
+        # Cookie 过期后重新握手
+        first.expires_at = time.time() - 1
+        third = await provider._get_guest_session()
+        assert third is not first and upstream.handshakes == 2
+        assert third.cookies == "guest_session=s2"
+
+    asyncio.run(run())
+
+
+def test_session_without_expiry_uses_configured_ttl():
+    """Cookie 未声明过期时间时按 K2THINK_SESSION_TTL 缓存"""
+
+    upstream = FakeK2Upstream(cookie_attrs="")
+    provider = make_provider(upstream)
+
+    previous = settings.K2THINK_SESSION_TTL
+    settings.K2THINK_SESSION_TTL = 45
+    try:
+        session = asyncio.run(provider._get_guest_session())
+    finally:
+        settings.K2THINK_SESSION_TTL = previous
+    assert abs(session.expires_at - (time.time() + 45)) < 5
+
+
+def test_rejected_session_is_evicted():
+    """/new 返回 401 或 403 时淘汰缓存的会话，下一次请求重新握手"""
+
+    async def run(status: int):
+        upstream = FakeK2Upstream(new_chat_statuses=[status])
+        provider = make_provider(upstream)
+        session = await provider._get_guest_session()
+        provider._warm_conversations.append(make_conversation("MBZUAI-IFM/K2-Think", session))
+        with pytest.raises(Exception, match=str(status)):
+            await provider._create_conversation(session, "hi", "MBZUAI-IFM/K2-Think")
+        assert session.invalidated and provider._session is None
+        assert not provider._warm_conversations, "基于被拒会话的预建对话应一并移除"
+
+        fresh = await provider._get_guest_session()
+        assert fresh is not session and upstream.handshakes == 2
+        conversation = await provider._create_conversation(fresh, "hi", "MBZUAI-IFM/K2-Think")
+        assert conversation.session is fresh
+        assert upstream.new_chats[-1].startswith("guest_session=s2")
+
+    for status in (401, 403):
+        asyncio.run(run(status))
+
+    # 其他错误状态不淘汰会话
+    upstream = FakeK2Upstream(new_chat_statuses=[500])
+    provider = make_provider(upstream)
+
+    async def run_server_error():
+        session = await provider._get_guest_session()
+        with pytest.raises(Exception, match="500"):
+            await provider._create_conversation(session, "hi", "MBZUAI-IFM/K2-Think")
+        assert not session.invalidated
+        assert await provider._get_guest_session() is session
+
+    asyncio.run(run_server_error())
+
+
+def test_warm_conversation_matches_model():
+    """预建对话只复用给相同模型，过期或会话已失效的对话被丢弃"""
+
+    provider = K2ThinkProvider()
+    session = K2GuestSession(cookies="guest_session=s1", expires_at=time.time() + 600)
+    stale_session = K2GuestSession(cookies="guest_session=s0", expires_at=time.time() + 600, invalidated=True)
+
+    other_model = make_conversation("other-model", session)
+    provider._warm_conversations.append(other_model)
+    assert provider._take_warm_conversation("MBZUAI-IFM/K2-Think") is None
+
+    expired = make_conversation("MBZUAI-IFM/K2-Think", session, ttl=-1)
+    rejected = make_conversation("MBZUAI-IFM/K2-Think", stale_session)
+    usable = make_conversation("MBZUAI-IFM/K2-Think", session)
+    provider._warm_conversations.extend([expired, rejected, usable])
+    assert provider._take_warm_conversation("MBZUAI-IFM/K2-Think") is usable
+    assert provider._take_warm_conversation("MBZUAI-IFM/K2-Think") is None
+
+
+def test_warm_pool_disabled_by_default():
+    """K2THINK_WARM_CONVERSATIONS=0（默认）时不启动后台任务，也不向上游预建对话"""
+
+    upstream = FakeK2Upstream()
+    provider = make_provider(upstream)
+
+    previous = settings.K2THINK_WARM_CONVERSATIONS
+    settings.K2THINK_WARM_CONVERSATIONS = 0
+    try:
+        async def run():
+            await provider.startup()
+            assert provider._warm_task is None and provider._warm_event is None
+            assert provider._take_warm_conversation("MBZUAI-IFM/K2-Think") is None
+            await asyncio.sleep(0.05)
+            await provider.shutdown()
+
+        asyncio.run(run())
+    finally:
+        settings.K2THINK_WARM_CONVERSATIONS = previous
+    assert upstream.handshakes == 0 and not upstream.new_chats
+
+
+if __name__ == "__main__":
+    test_cookie_expiry_is_honored()
+    test_session_without_expiry_uses_configured_ttl()
+    test_rejected_session_is_evicted()
+    test_warm_conversation_matches_model()
+    test_warm_pool_disabled_by_default()
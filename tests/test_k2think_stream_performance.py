@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+K2Think 流式增量解析测试：正确性、长回答下缓冲区不随长度增长；直接运行时输出单块处理耗时
+"""
+
+import sys
+import os
+import time
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 临时禁用日志以避免性能测试中的噪音
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.providers.k2think_provider import K2StreamParser, K2ThinkProvider
+
+
+def make_provider():
+    return K2ThinkProvider()
+
+
+def build_content(reasoning: str, answer: str) -> str:
+    return (
+        '<details type="reasoning" done="true" duration="3">\n'
+        '<summary>Thought for 3 seconds</summary>\n'
+        f'{reasoning}\n'
+        '</details>\n'
+        f'<answer>\n{answer}\n</answer>'
+    )
+
+
+def run_parser(full: str, step: int, cumulative: bool = True):
+    """按 step 切块喂入解析器，返回 (推理, 答案)"""
+    parser = K2StreamParser()
+    reasoning, answer = [], []
+    for end in range(step, len(full) + step, step):
+        if cumulative:
+            deltas = parser.feed_content(full[:end])
+        else:
+            deltas = parser.feed(full[end - step:end])
+        for field, delta in deltas:
+            (reasoning if field == "reasoning_content" else answer).append(delta)
+    return "".join(reasoning), "".join(answer)
+
+
+def test_parser_matches_regex_extraction():
+    """解析器在任意切块方式下都应与正则提取结果一致"""
+
+    print("🧪 测试增量解析器正确性\n")
+
+    provider = make_provider()
+    samples = [
+        build_content("Let me think.\n\n  Step 1 <b>bold</b>\n", "  Hello <i>world</i> < 3  "),
+        build_content("", "only answer"),
+        "<answer>no reasoning</answer>",
+        build_content("reasoning with </detail partial", "answer with </answe partial"),
+        '<details type="reasoning"><summary>x</summary>r</details>trailing<answer>a\n\nb</answer>ignored',
+    ]
+
+    for sample in samples:
+        expected = provider.extract_reasoning_and_answer(sample)
+        for step in (1, 2, 3, 7, 16, len(sample)):
+            for cumulative in (True, False):
+                assert run_parser(sample, step, cumulative) == expected, (sample, step, cumulative)
+        print(f"  ✅ {sample[:40]!r}...")
+
+
+def long_content():
+    answer = ("The quick brown fox jumps over the lazy dog. " * 2300)[:100_000]
+    return build_content("reasoning " * 200, answer)
+
+
+def test_buffer_stays_bounded():
+    """10 万字符的答案按累计全文推送时，每块都被消费完，缓冲区只保留可能未完整的标签"""
+
+    full = long_content()
+    step = 20
+    parser = K2StreamParser()
+    longest = 0
+    answer = []
+    for end in range(step, len(full) + step, step):
+        for field, delta in parser.feed_content(full[:end]):
+            if field == "content":
+                answer.append(delta)
+        longest = max(longest, len(parser._buffer))
+    print(f"  内容长度: {len(full)} 字符, 缓冲区最大 {longest} 字符")
+    assert longest < step + len(K2StreamParser.REASONING_OPEN)
+    assert "".join(answer) == make_provider().extract_reasoning_and_answer(full)[1]
+
+
+def benchmark_per_chunk_cost():
+    """10 万字符的答案按累计全文推送时，后期数据块的处理耗时不应随长度增长"""
+
+    print("\n🧪 测试长回答的单块处理耗时\n")
+
+    full = long_content()
+    step = 20
+    ends = list(range(step, len(full) + step, step))
+
+    parser = K2StreamParser()
+    timings = []
+    for end in ends:
+        piece = full[:end]
+        start = time.perf_counter()
+        parser.feed_content(piece)
+        timings.append(time.perf_counter() - start)
+
+    window = len(timings) // 10
+    early = sum(timings[:window]) / window * 1e6
+    late = sum(timings[-window:]) / window * 1e6
+    total = sum(timings)
+
+    print(f"  内容长度: {len(full)} 字符, 数据块: {len(ends)}")
+    print(f"  增量解析总耗时: {total * 1000:.2f}ms")
+    print(f"  前 10% 平均: {early:.2f}µs/块, 后 10% 平均: {late:.2f}µs/块")
+
+    # 对比旧方案（每块对全文跑正则再求差分）在 1/10 规模下的耗时
+    provider = make_provider()
+    small = full[:len(full) // 10]
+    start = time.perf_counter()
+    for end in range(step, len(small) + step, step):
+        provider.extract_reasoning_and_answer(small[:end])
+    regex_total = time.perf_counter() - start
+    print(f"  旧方案(正则全文, 1/10 规模)总耗时: {regex_total * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    test_parser_matches_regex_extraction()
+    test_buffer_stays_bounded()
+    benchmark_per_chunk_cost()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+回放压测工具自检：假上游按配置的延迟和速率回放，代理对三个提供商的录制流端到端输出完整答案
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from load_test import free_port, run_load, start_fake_upstream, start_proxy, stop_process
+
+ANSWER_START = "事件循环是异步编程的核心调度器。"
+ANSWER_END = "应放到线程池或子进程中。"
+
+
+def test_replay_pacing():
+    """首个事件前等待 ttft，之后按 token_rate 输出"""
+
+    port = free_port()
+    upstream = start_fake_upstream(port, ttft_ms=100, token_rate=400)
+    try:
+        started = time.perf_counter()
+        first_byte = None
+        events = 0
+        with httpx.stream("POST", f"http://127.0.0.1:{port}/api/chat/completions", json={}) as response:
+            for line in response.iter_lines():
+                if line.startswith("data: "):
+                    events += 1
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+        duration = time.perf_counter() - started
+    finally:
+        stop_process(upstream)
+
+    expected = 0.1 + (events - 1) / 400
+    print(f"  {events} 个事件，首字节 {first_byte * 1000:.0f}ms，总耗时 {duration * 1000:.0f}ms（预期 ≥ {expected * 1000:.0f}ms）")
+    assert first_byte >= 0.1
+    assert duration >= expected
+
+
+def test_proxy_end_to_end():
+    """代理以并发 4 回放三个提供商的录制流：全部成功且答案完整"""
+
+    upstream_port, proxy_port = free_port(), free_port()
+    upstream = start_fake_upstream(upstream_port)
+    proxy = start_proxy(proxy_port, f"http://127.0.0.1:{upstream_port}")
+    try:
+        for model in ("GLM-4.5", "LongCat-Flash", "MBZUAI-IFM/K2-Think"):
+            summary = asyncio.run(run_load(
+                f"http://127.0.0.1:{proxy_port}", model, concurrency=4, total_requests=12,
+                pid=proxy.pid, keep_content=True,
+            ))
+            print(f"  {model}: {summary['rps']} RPS, TTFT p50 {summary['ttft_ms']['p50']}ms, "
+                  f"CPU {summary['cpu_ms_per_1k_tokens']}ms/1k token, RSS {summary['peak_rss_mb']}MB")
+            assert summary["failed"] == 0, summary["errors"]
+            assert len(summary["contents"]) == 1
+            answer = summary["contents"][0].strip()
+            assert answer.startswith(ANSWER_START) and answer.endswith(ANSWER_END), answer[:80]
+            assert summary["cpu_ms_per_1k_tokens"] is not None and summary["peak_rss_mb"] > 0
+    finally:
+        stop_process(proxy)
+        stop_process(upstream)
+
+
+if __name__ == "__main__":
+    test_replay_pacing()
+    test_proxy_end_to_end()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+日志配置测试：production 配置的逐块日志采样；直接运行时对比同一段 Z.AI 流在 default / production 日志配置下的输出速率（增量/秒）
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+from typing import Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.schemas import Message, OpenAIRequest
+from app.providers.zai_provider import ZAIProvider
+from app.utils import json_codec
+from app.utils import logger as logger_module
+from app.utils.logger import chunk_log_enabled, flush_logger, setup_logger
+
+
+class FakeResponse:
+    """模拟 httpx 流式响应"""
+
+    def __init__(self, body: bytes, chunk_size: int = 512):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def aiter_bytes(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def build_upstream(deltas: int) -> bytes:
+    lines = []
+    for i in range(deltas):
+        data = {"type": "chat:completion", "data": {"phase": "answer", "delta_content": f"字{i % 10}"}}
+        lines.append(f"data: {json_codec.dumps(data)}\n\n")
+    done = {"type": "chat:completion", "data": {"phase": "answer", "usage": {"total_tokens": deltas}}}
+    lines.append(f"data: {json_codec.dumps(done)}\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def run_stream(provider: ZAIProvider, body: bytes) -> int:
+    request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=True)
+
+    async def consume():
+        count = 0
+        stream = provider._handle_stream_response(FakeResponse(body), "chat-1", "GLM-4.5", request, {"body": {}})
+        async for item in stream:
+            if '"content":' in item:
+                count += 1
+        return count
+
+    return asyncio.run(consume())
+
+
+def measure(provider: ZAIProvider, body: bytes, deltas: int, **logger_options) -> Tuple[float, int]:
+    """在指定日志配置下处理一次流，返回 (每秒输出的增量数, 写出的日志行数)"""
+    original_stderr = sys.stderr
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as log_file:
+        sys.stderr = log_file
+        try:
+            setup_logger(**logger_options)
+            start = time.perf_counter()
+            count = run_stream(provider, body)
+            elapsed = time.perf_counter() - start
+            flush_logger()
+        finally:
+            sys.stderr = original_stderr
+            setup_logger(debug_mode=False)
+        log_file.seek(0)
+        lines = sum(1 for _ in log_file)
+    assert count >= deltas
+    return deltas / elapsed, lines
+
+
+def test_chunk_log_sampling():
+    """逐块日志只在开启 DEBUG 时按采样输出"""
+    try:
+        setup_logger(debug_mode=True, profile="production", chunk_sample_every=10)
+        assert [i for i in range(1, 31) if chunk_log_enabled(i)] == [10, 20, 30]
+        setup_logger(debug_mode=True)
+        assert all(chunk_log_enabled(i) for i in range(1, 5))
+        setup_logger(debug_mode=False, profile="production")
+        assert not any(chunk_log_enabled(i) for i in range(1, 500))
+    finally:
+        setup_logger(debug_mode=False)
+    assert logger_module._chunk_sample_every == 1
+
+
+def test_production_profile_samples_chunk_logs():
+    """同样开启 DEBUG 时，production 配置的逐块日志按采样输出，日志行数远少于 default 配置"""
+
+    deltas = 1000
+    body = build_upstream(deltas)
+    provider = ZAIProvider()
+    _, default_lines = measure(provider, body, deltas, debug_mode=True)
+    _, production_lines = measure(provider, body, deltas, debug_mode=True, profile="production")
+    print(f"  日志行数: default {default_lines}, production {production_lines}")
+    assert default_lines >= deltas
+    assert 0 < production_lines < default_lines / 10
+
+
+def benchmark_profiles():
+    """production 配置下逐块日志采样、队列写入，输出速率明显高于 default 配置"""
+
+    print("🧪 日志配置输出速率对比\n")
+    deltas = 3000
+    body = build_upstream(deltas)
+    provider = ZAIProvider()
+    run_stream(provider, body)  # 预热
+
+    results = {
+        "default + DEBUG": measure(provider, body, deltas, debug_mode=True),
+        "production + DEBUG": measure(provider, body, deltas, debug_mode=True, profile="production"),
+        "default": measure(provider, body, deltas, debug_mode=False),
+        "production": measure(provider, body, deltas, debug_mode=False, profile="production"),
+    }
+    for name, (rate, lines) in results.items():
+        print(f"  {name:<20} {rate:>10.0f} 增量/秒  {lines:>6} 行日志")
+
+
+if __name__ == "__main__":
+    test_chunk_log_sampling()
+    test_production_profile_samples_chunk_logs()
+    benchmark_profiles()
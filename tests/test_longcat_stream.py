@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+LongCat 流式转发测试：上游每推送一块数据就立即转发给客户端，客户端中途断开时仍会清理会话
+"""
+
+import sys
+import os
+import asyncio
+import logging
+import httpx
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.models.schemas import OpenAIRequest, Message
+from app.providers.longcat_provider import LongCatProvider
+from app.utils import json_codec
+
+
+class GatedUpstream(httpx.AsyncByteStream):
+    """由测试逐块放行的上游响应体，放行 None 表示上游结束"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.finished = False
+        self.closed = False
+
+    def push(self, data=None):
+        self.queue.put_nowait(data)
+
+    def push_content(self, content: str, last: bool = False):
+        data = {"choices": [{"delta": {"content": content}}], "lastOne": last}
+        self.push(f"data: {json_codec.dumps(data)}\n\n".encode())
+
+    async def __aiter__(self):
+        while True:
+            data = await self.queue.get()
+            if data is None:
+                self.finished = True
+                return
+            yield data
+
+    async def aclose(self):
+        self.closed = True
+
+
+def make_provider(upstream: GatedUpstream):
+    provider = LongCatProvider()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, headers={"Content-Type": "text/event-stream"}, stream=upstream)
+    ))
+    provider.get_http_client = lambda: client
+    deletions = []
+    provider.schedule_session_deletion = lambda *args: deletions.append(args)
+    return provider, deletions
+
+
+def start_stream(provider: LongCatProvider):
+    request = OpenAIRequest(
+        model="LongCat-Flash", messages=[Message(role="user", content="hi")], stream=True
+    )
+    transformed = {
+        "url": "https://longcat.test/api/v1/chat-completion",
+        "headers": {},
+        "payload": {"conversationId": "conv-1"},
+        "model": request.model,
+        "conversation_id": "conv-1",
+        "passport_token": "passport",
+        "user_agent": "test-agent",
+    }
+    return provider._create_stream_response(request, transformed)
+
+
+async def next_chunk(stream) -> str:
+    return await asyncio.wait_for(stream.__anext__(), timeout=1.0)
+
+
+def test_chunks_forwarded_before_upstream_finishes():
+    """每个上游数据块在下一块到达之前就已转发，不等待上游结束"""
+
+    async def run():
+        upstream = GatedUpstream()
+        provider, deletions = make_provider(upstream)
+        stream = start_stream(provider)
+
+        upstream.push_content("Hel")
+        assert '"role":"assistant"' in (await next_chunk(stream)).replace(" ", "")
+        assert "Hel" in await next_chunk(stream)
+        assert not upstream.finished
+
+        upstream.push_content("lo")
+        assert "lo" in await next_chunk(stream)
+        assert not upstream.finished and not deletions
+
+        upstream.push_content("!", last=True)
+        rest = [chunk async for chunk in stream]
+        assert "!" in rest[0] and rest[-1].strip() == "data: [DONE]"
+        assert deletions == [("conv-1", "passport", "test-agent")]
+
+    asyncio.run(run())
+
+
+def test_aclose_mid_stream_schedules_session_deletion():
+    """客户端中途断开（aclose）时关闭上游响应并删除会话"""
+
+    async def run():
+        upstream = GatedUpstream()
+        provider, deletions = make_provider(upstream)
+        stream = start_stream(provider)
+
+        upstream.push_content("partial")
+        await next_chunk(stream)
+        assert "partial" in await next_chunk(stream)
+        assert not deletions
+
+        await stream.aclose()
+        assert deletions == [("conv-1", "passport", "test-agent")]
+        assert upstream.closed and not upstream.finished
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_chunks_forwarded_before_upstream_finishes()
+    test_aclose_mid_stream_schedules_session_deletion()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+指标测试：Prometheus 文本格式、流式请求结果统计、token池等待/逐token计数、记录开销
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.utils.metrics import (
+    CHUNKS_PER_SECOND,
+    MetricsRegistry,
+    REQUESTS,
+    TIME_TO_FIRST_TOKEN,
+    TOKEN_POOL_WAIT,
+    TOKEN_REQUESTS,
+    metrics_registry,
+    observe_stream,
+)
+from app.utils.token_pool import TokenPool, token_fingerprint
+
+
+def test_render_format():
+    """直方图桶累加输出，标签值转义"""
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo", ("path",), buckets=(0.1, 1))
+    child = histogram.labels('a"b')
+    for value in (0.05, 0.5, 0.5, 5):
+        child.observe(value)
+    registry.counter("demo_total", "Demo").inc(3)
+
+    text = registry.render()
+    print(text)
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{path="a\\"b",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{path="a\\"b",le="1"} 3' in text
+    assert 'demo_seconds_bucket{path="a\\"b",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{path="a\\"b"} 4' in text
+    assert "demo_total 3" in text
+
+    # 同名指标只注册一次，标签数量不符时报错
+    assert registry.histogram("demo_seconds", "Demo", ("path",)) is histogram
+    with pytest.raises(ValueError):
+        histogram.labels("a", "b")
+
+
+def test_observe_stream_outcomes():
+    """流式请求按 success / error / cancelled 计数，并记录首个内容块延迟"""
+
+    async def body(error: bool = False):
+        yield 'data: {"choices":[{"delta":{"role":"assistant"}}]}\n\n'
+        for char in "abc":
+            yield 'data: {"choices":[{"delta":{"content":"' + char + '"}}]}\n\n'
+        if error:
+            yield 'data: {"error":{"message":"boom"}}\n\n'
+        yield "data: [DONE]\n\n"
+
+    async def run():
+        items = [item async for item in observe_stream(body(), "test", "m-ok")]
+        assert len(items) == 5
+
+        async for _ in observe_stream(body(error=True), "test", "m-err"):
+            pass
+
+        stream = observe_stream(body(), "test", "m-cancel")
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert REQUESTS.labels("test", "m-ok", "success").value == 1
+    assert REQUESTS.labels("test", "m-err", "error").value == 1
+    assert REQUESTS.labels("test", "m-cancel", "cancelled").value == 1
+    assert TIME_TO_FIRST_TOKEN.labels("test", "m-ok").count == 1
+    assert TIME_TO_FIRST_TOKEN.labels("test", "m-cancel").count == 0
+    assert CHUNKS_PER_SECOND.labels("test", "m-ok").count == 1
+
+
+def test_empty_content_chunks_not_counted():
+    """content 为空的数据块（角色块、保活块）不算作首个内容块，也不计入输出速率"""
+
+    async def body():
+        yield 'data: {"choices":[{"delta":{"role":"assistant","content":""}}]}\n\n'
+        yield 'data: {"choices":[{"delta":{"content": ""}}]}\n\n'
+        yield 'data: {"choices":[{"delta":{"content":null}}]}\n\n'
+        yield 'data: {"choices":[{"delta":{},"finish_reason":"stop"}]}\n\n'
+        yield "data: [DONE]\n\n"
+
+    async def run():
+        async for _ in observe_stream(body(), "test", "m-empty"):
+            pass
+
+    asyncio.run(run())
+    assert REQUESTS.labels("test", "m-empty", "success").value == 1
+    assert TIME_TO_FIRST_TOKEN.labels("test", "m-empty").count == 0
+    assert CHUNKS_PER_SECOND.labels("test", "m-empty").count == 0
+
+
+def test_token_pool_metrics():
+    """token获取等待时间和逐token结果计数"""
+
+    async def run():
+        pool = TokenPool(["token-a"], max_concurrency=1)
+        before_immediate = TOKEN_POOL_WAIT.labels("immediate").count
+        before_timeout = TOKEN_POOL_WAIT.labels("timeout").count
+
+        token = await pool.acquire_token(timeout=0.1)
+        assert token == "token-a"
+        with pool.track_request(token):
+            assert await pool.acquire_token(timeout=0.05) is None
+
+        assert TOKEN_POOL_WAIT.labels("immediate").count == before_immediate + 1
+        assert TOKEN_POOL_WAIT.labels("timeout").count == before_timeout + 1
+
+        pool.mark_token_success(token)
+        pool.mark_token_failure(token)
+        fingerprint = token_fingerprint(token)[:12]
+        assert TOKEN_REQUESTS.labels(fingerprint, "success").value >= 1
+        assert TOKEN_REQUESTS.labels(fingerprint, "failure").value >= 1
+        # 标签中只出现token哈希
+        assert "token-a" not in metrics_registry.render()
+
+    asyncio.run(run())
+
+
+def test_observe_overhead():
+    """热路径上记录一次直方图的开销"""
+
+    child = MetricsRegistry().histogram("bench_seconds", "Bench", ("provider",)).labels("zai")
+    iterations = 200_000
+    start = time.perf_counter()
+    for i in range(iterations):
+        child.observe(i * 1e-6)
+    per_call = (time.perf_counter() - start) / iterations * 1e6
+    print(f"  observe(): {per_call:.2f}µs/次")
+    assert child.count == iterations
+    assert per_call < 20
+
+
+if __name__ == "__main__":
+    test_render_format()
+    test_observe_stream_outcomes()
+    test_empty_content_chunks_not_counted()
+    test_token_pool_metrics()
+    test_observe_overhead()
@@ -120,7 +120,17 @@ def test_multiple_tool_calls():
         print(f"  实际: {completed_tool_names}")
         return False
 
+def test_fixed_arguments_keep_stdlib_format():
+    """修复后的工具参数字符串与标准库 json.dumps 的格式一致（带空格的分隔符、不转义中文）"""
+
+    handler = SSEToolHandler("test-model", stream=False)
+    fixed = handler._fix_tool_arguments('{"query":"北京天气","limit":3}')
+    print(f"  修复后的参数: {fixed}")
+    assert fixed == '{"query": "北京天气", "limit": 3}'
+
+
 if __name__ == "__main__":
+    test_fixed_arguments_keep_stdlib_format()
     success = test_multiple_tool_calls()
     
     if success:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+实时请求记录测试：环形缓冲区覆盖、读取时计算百分位、中间件记录状态码/模型/首字节耗时
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.utils.request_log import (
+    RequestLog,
+    RequestRecord,
+    RequestTimingMiddleware,
+    get_request_log,
+    initialize_request_log,
+    note_request_model,
+)
+
+
+def make_record(duration: float, status: int = 200) -> RequestRecord:
+    return RequestRecord(timestamp=time.time(), method="POST", path="/v1/chat/completions",
+                         status=status, ttft=duration / 2, duration=duration)
+
+
+def test_ring_buffer_and_percentiles():
+    """缓冲区满后覆盖最旧记录；累计计数覆盖全部请求，百分位基于最近的请求"""
+
+    log = RequestLog(capacity=100)
+    for i in range(1, 151):
+        log.add(make_record(i / 1000, status=200 if i % 10 else 500))
+
+    records = log.recent()
+    assert len(records) == 100
+    assert records[0].duration == 0.150 and records[-1].duration == 0.051
+    assert len(log.recent(5)) == 5
+
+    stats = log.stats()
+    print(f"  {stats}")
+    assert stats["totalRequests"] == 150
+    assert stats["failedRequests"] == 15
+    assert stats["successfulRequests"] == 135
+    assert stats["windowSize"] == 100
+    assert stats["responseTime"] == {"p50": 100.0, "p95": 145.0, "p99": 149.0}
+    assert stats["timeToFirstToken"]["p50"] == 50.0
+
+    empty = RequestLog(capacity=10).stats()
+    assert empty["totalRequests"] == 0 and empty["responseTime"]["p99"] is None
+
+
+def test_middleware_records_requests():
+    """中间件记录 API 请求的状态码、模型和流式首字节耗时，不记录其他路径"""
+
+    app = FastAPI()
+    app.add_middleware(RequestTimingMiddleware)
+
+    @app.post("/v1/chat/completions")
+    async def chat(body: dict):
+        note_request_model(body["model"])
+
+        async def stream():
+            yield "data: 1\n\n"
+            await asyncio.sleep(0.1)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/v1/fail")
+    async def fail():
+        raise RuntimeError("boom")
+
+    @app.get("/dashboard/stats")
+    async def stats():
+        return get_request_log().stats()
+
+    log = initialize_request_log(10)
+    client = TestClient(app, raise_server_exceptions=False)
+    client.post("/v1/chat/completions", json={"model": "GLM-4.6"})
+    client.get("/v1/fail")
+    client.get("/dashboard/stats")
+
+    records = log.recent()
+    assert [record.path for record in records] == ["/v1/fail", "/v1/chat/completions"]
+    fail_record, chat_record = records
+    assert fail_record.status == 500
+    assert chat_record.status == 200 and chat_record.model == "GLM-4.6"
+    print(f"  首字节 {chat_record.ttft * 1000:.0f}ms, 总耗时 {chat_record.duration * 1000:.0f}ms")
+    assert chat_record.ttft < 0.1 <= chat_record.duration
+    assert chat_record.to_dict()["duration"] >= 100
+
+
+def test_add_cost_is_constant():
+    """写入开销不随缓冲区大小变化（旧实现每次写入都复制整个列表）"""
+
+    def measure(capacity: int) -> float:
+        log = RequestLog(capacity)
+        record = make_record(0.01)
+        for _ in range(capacity):
+            log.add(record)
+        start = time.perf_counter()
+        for _ in range(20_000):
+            log.add(record)
+        return (time.perf_counter() - start) / 20_000 * 1e6
+
+    small, large = measure(100), measure(100_000)
+    print(f"  add(): 容量100 {small:.2f}µs, 容量100000 {large:.2f}µs")
+    assert large < small * 5
+
+
+if __name__ == "__main__":
+    test_ring_buffer_and_percentiles()
+    test_middleware_records_requests()
+    test_add_cost_is_constant()
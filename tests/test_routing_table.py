@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+模型路由表测试：别名、大小写、通配符/正则规则、默认提供商和降级链在初始化时编译，重新加载时整体替换
+"""
+
+import sys
+import os
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.core.config import settings
+from app.providers.base import ProviderRegistry
+from app.providers.provider_factory import ProviderFactory
+from app.providers.routing_table import MAX_CACHED_MODELS, build_routing_table
+
+
+class FakeProvider:
+    def __init__(self, name):
+        self.name = name
+
+
+def make_registry():
+    registry = ProviderRegistry()
+    registry.register(FakeProvider("zai"), ["GLM-4.5", "GLM-4.5-Air"])
+    registry.register(FakeProvider("longcat"), ["LongCat-Flash"])
+    registry.register(FakeProvider("k2think"), ["MBZUAI-IFM/K2-Think"])
+    return registry
+
+
+def build(aliases=None, patterns=None, fallbacks=None, default="zai"):
+    return build_routing_table(
+        make_registry(),
+        {"LongCat": "longcat", "Broken": "missing"},
+        aliases or {},
+        patterns or [],
+        fallbacks or {},
+        default,
+    )
+
+
+def test_exact_alias_and_case_insensitive():
+    """精确名称、别名和大小写不同的名称都解析到规范模型名"""
+
+    table = build(aliases={"gpt-4o": "glm-4.5", "fast": "LongCat-Flash", "dangling": "nope"})
+    for name in ("GLM-4.5", "glm-4.5", "Glm-4.5", "gpt-4o", "GPT-4o"):
+        route = table.lookup(name)
+        assert (route.model, route.provider.name, route.known) == ("GLM-4.5", "zai", True), name
+    assert table.lookup("FAST").model == "LongCat-Flash"
+    assert table.lookup("LongCat").provider.name == "longcat"
+    # 常用写法（精确名称及其小写形式）一次字典查询命中
+    assert "glm-4.5" in table.routes and "gpt-4o" in table.routes
+    assert "dangling" not in table.routes and "Broken" not in table.routes
+
+
+def test_patterns_and_default():
+    """未注册的模型按规则顺序匹配，模型名原样传给提供商；都不匹配时使用默认提供商"""
+
+    table = build(patterns=[("glm-*", "longcat"), ("re:^k2-", "k2think"), ("re:[", "zai"), ("x*", "missing")])
+    route = table.lookup("GLM-Z1-Rumination")
+    assert (route.model, route.provider.name, route.known) == ("GLM-Z1-Rumination", "longcat", False)
+    assert table.lookup("K2-Think-V2").provider.name == "k2think"
+    assert table.lookup("xyz").provider.name == "zai"
+    assert len(table.patterns) == 2
+
+    assert build(default=None).lookup("unknown") is None
+
+
+def test_resolved_cache_is_bounded():
+    """规则和默认提供商的解析结果被缓存，但数量有上限"""
+
+    table = build()
+    for index in range(MAX_CACHED_MODELS + 10):
+        assert table.lookup(f"model-{index}").provider.name == "zai"
+    assert len(table._resolved) == MAX_CACHED_MODELS
+    assert table.lookup("model-1") is table.lookup("model-1")
+
+
+def test_fallbacks_resolved_through_aliases():
+    """降级链中的别名和大小写不同的名称编译成规范路由，重复、指向自身和不存在的项被去掉"""
+
+    table = build(
+        aliases={"fast": "LongCat-Flash"},
+        patterns=[("glm-*", "k2think")],
+        fallbacks={"glm-4.5": ["GLM-4.5-Air", "fast", "GLM-9", "longcat-flash", "GLM-4.5"]},
+    )
+    chain = [route.model for route in table.fallbacks["GLM-4.5"]]
+    print(f"  降级链: {chain}")
+    assert chain == ["GLM-4.5-Air", "LongCat-Flash"]
+    # 不存在的降级目标不会被路由规则或默认提供商接走
+    assert "GLM-9" not in chain and table.lookup("GLM-9").provider.name == "k2think"
+
+
+def test_reload_routing_requires_api_key():
+    """重新加载路由表需要 API key"""
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.core import openai
+
+    app = FastAPI()
+    app.include_router(openai.router)
+    client = TestClient(app)
+    previous = settings.SKIP_AUTH_TOKEN, settings.AUTH_TOKEN
+    settings.SKIP_AUTH_TOKEN, settings.AUTH_TOKEN = False, "sk-test"
+    try:
+        assert client.post("/v1/providers/reload-routing").status_code == 401
+        assert client.post("/v1/providers/reload-routing",
+                           headers={"Authorization": "Bearer wrong"}).status_code == 401
+        response = client.post("/v1/providers/reload-routing", headers={"Authorization": "Bearer sk-test"})
+        assert response.status_code == 200 and response.json()["status"] == "success"
+    finally:
+        settings.SKIP_AUTH_TOKEN, settings.AUTH_TOKEN = previous
+
+
+def test_factory_rebuild_is_atomic():
+    """重新加载配置后生成新表并整体替换，旧表不受影响"""
+
+    factory = ProviderFactory()
+    old_table = factory.routing
+    previous = settings.MODEL_ALIASES
+    settings.MODEL_ALIASES = "my-model=GLM-4.5-Air"
+    try:
+        new_table = factory.rebuild_routing()
+    finally:
+        settings.MODEL_ALIASES = previous
+
+    assert factory.routing is new_table and new_table is not old_table
+    assert factory.resolve("MY-MODEL").model == "GLM-4.5-Air"
+    assert old_table.lookup("my-model").model == "my-model"
+    assert factory.get_provider_for_model("longcat-flash").name == "longcat"
+
+
+if __name__ == "__main__":
+    test_exact_alias_and_case_insensitive()
+    test_patterns_and_default()
+    test_resolved_cache_is_bounded()
+    test_fallbacks_resolved_through_aliases()
+    test_reload_routing_requires_api_key()
+    test_factory_rebuild_is_atomic()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+多 worker 共享token状态测试：并发/RPM 限制跨进程一致、禁用与恢复在 worker 间同步、退出的 worker 不遗留名额
+"""
+
+import sys
+import os
+import time
+import tempfile
+import logging
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import pytest
+
+from app.utils.shared_state import SharedTokenState, shared_state_supported
+from app.utils.token_pool import TokenPool, token_fingerprint
+
+pytestmark = pytest.mark.skipif(
+    not shared_state_supported() or "fork" not in multiprocessing.get_all_start_methods(),
+    reason="需要 fcntl 和 fork",
+)
+
+TOKENS = ["token-a", "token-b", "token-c"]
+
+
+def _worker_loop(path: str, iterations: int, max_concurrency: int, rpm_limit: int, results):
+    """模拟一个 worker：反复取token并在请求期间检查全局进行中请求数"""
+    shared = SharedTokenState(path, slots=64)
+    pool = TokenPool(TOKENS, max_concurrency=max_concurrency, rpm_limit=rpm_limit, shared_state=shared)
+    slots = {token: pool._shared_slot(token) for token in TOKENS}
+    acquired = 0
+    violations = 0
+    for _ in range(iterations):
+        token = pool.get_next_token()
+        if token is None:
+            time.sleep(0.001)
+            continue
+        with pool.track_request(token):
+            acquired += 1
+            in_flight = shared.read([slots[token]])[slots[token]].in_flight
+            if max_concurrency and in_flight > max_concurrency:
+                violations += 1
+            time.sleep(0.001)
+    shared.close()
+    results.put((acquired, violations))
+
+
+def _crash_holding_token(path: str):
+    """取得token后不释放直接退出（模拟 worker 崩溃）"""
+    shared = SharedTokenState(path, slots=64)
+    pool = TokenPool(TOKENS, max_concurrency=1, shared_state=shared)
+    held = []
+    for _ in TOKENS:
+        tracker = pool.track_request(pool.get_next_token())
+        tracker.__enter__()
+        held.append(tracker)
+    os._exit(0)
+
+
+def run_workers(path: str, workers: int, iterations: int, max_concurrency: int = 0, rpm_limit: int = 0):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker_loop, args=(path, iterations, max_concurrency, rpm_limit, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=10)
+    return outcomes
+
+
+def test_concurrency_limit_across_workers():
+    """4 个 worker 共用 3 个token、每个token并发上限 1：任何时刻都不会超过上限"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "pool.state")
+        SharedTokenState(path, slots=64).close()
+
+        outcomes = run_workers(path, workers=4, iterations=200, max_concurrency=1)
+        acquired = sum(a for a, _ in outcomes)
+        violations = sum(v for _, v in outcomes)
+        print(f"  4 个 worker 共获得 {acquired} 次token，超出并发上限 {violations} 次")
+        assert violations == 0
+        assert acquired > 0
+
+        # 所有 worker 退出后没有遗留的进行中请求
+        shared = SharedTokenState(path, slots=64)
+        slots = [shared.slot(token_fingerprint(token)) for token in TOKENS]
+        assert all(record.in_flight == 0 for record in shared.read(slots).values())
+        shared.close()
+
+
+def test_rate_limit_across_workers():
+    """RPM 令牌桶在 worker 间共享：3 个 worker 合计每个token只能取到 rpm_limit 次"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "pool.state")
+        outcomes = run_workers(path, workers=3, iterations=50, rpm_limit=2)
+        acquired = sum(a for a, _ in outcomes)
+        print(f"  3 个 worker 合计获得 {acquired} 次token（上限 {2 * len(TOKENS)}）")
+        assert acquired == 2 * len(TOKENS)
+
+
+def test_disable_and_recover_propagate():
+    """其他 worker 累计失败禁用token后本进程同步禁用；其他 worker 成功后同步恢复"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "pool.state")
+        shared = SharedTokenState(path, slots=64)
+        pool = TokenPool(TOKENS, failure_threshold=3, shared_state=shared)
+        slot = pool._shared_slot("token-a")
+
+        # 模拟另一个 worker 的失败
+        for _ in range(3):
+            shared.record_failure(slot, 3, time.time())
+        assert pool.sync_shared_state() == 1
+        assert not pool.token_statuses["token-a"].is_available
+        assert "token-a" not in {pool.get_next_token() for _ in range(10)}
+
+        shared.record_success(slot)
+        assert pool.sync_shared_state() == 1
+        assert pool.token_statuses["token-a"].is_available
+
+        # 本进程的失败同样写入共享状态
+        for _ in range(3):
+            pool.mark_token_failure("token-b")
+        record = shared.read([pool._shared_slot("token-b")])[pool._shared_slot("token-b")]
+        assert record.failure_count == 3 and record.disabled_at > 0
+        shared.close()
+
+
+def test_crashed_worker_is_reaped():
+    """worker 崩溃后，它占用的名额在清理后释放"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "pool.state")
+        shared = SharedTokenState(path, slots=64)
+        pool = TokenPool(TOKENS, max_concurrency=1, shared_state=shared)
+
+        process = multiprocessing.get_context("fork").Process(target=_crash_holding_token, args=(path,))
+        process.start()
+        process.join(timeout=10)
+
+        assert pool.get_next_token() is None
+        assert shared.reap_dead_workers() == 1
+        time.sleep(TokenPool.SHARED_RETRY_INTERVAL * 2)
+        assert pool.get_next_token() is not None
+        shared.close()
+
+
+def test_leader_election():
+    """同一时间只有一个 worker 持有主 worker 锁"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "pool.state")
+        shared = SharedTokenState(path, slots=64)
+        assert shared.try_become_leader()
+
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+
+        def other_worker():
+            other = SharedTokenState(path, slots=64)
+            results.put(other.try_become_leader())
+            other.close()
+
+        process = ctx.Process(target=other_worker)
+        process.start()
+        assert results.get(timeout=10) is False
+        process.join(timeout=10)
+        shared.close()
+
+
+if __name__ == "__main__":
+    test_concurrency_limit_across_workers()
+    test_rate_limit_across_workers()
+    test_disable_and_recover_propagate()
+    test_crashed_worker_is_reaped()
+    test_leader_election()
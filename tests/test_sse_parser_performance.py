@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+SSE 解析器测试：正确性、与原 aiter_lines() + 字符串缓冲方案结果一致；直接运行时对比两者性能
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+from httpx._decoders import LineDecoder, TextDecoder
+
+from app.utils.sse_parser import SSEParser, iter_sse_events
+
+
+def build_stream(count: int) -> bytes:
+    """构造类似 Z.AI 的上游 SSE 流"""
+    lines = []
+    for i in range(count):
+        chunk = {
+            "type": "chat:completion",
+            "data": {"phase": "answer", "delta_content": f"第{i}段内容，包含中文和 emoji 🚀 ", "edit_index": i},
+        }
+        lines.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def split_network_chunks(payload: bytes, size: int):
+    return [payload[i:i + size] for i in range(0, len(payload), size)]
+
+
+def parse_new(chunks, split_data_lines=True):
+    parser = SSEParser(split_data_lines=split_data_lines)
+    results = []
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.raw is None:
+                results.append(event.data)
+    for event in parser.flush():
+        if event.raw is None:
+            results.append(event.data)
+    return results
+
+
+def parse_old(chunks):
+    """原实现：aiter_lines() 解码切行后，再拼回字符串缓冲区二次切分"""
+    text_decoder = TextDecoder()
+    line_decoder = LineDecoder()
+    results = []
+    buffer = ""
+
+    def handle(lines):
+        nonlocal buffer
+        for line in lines:
+            if not line:
+                continue
+            buffer += line + "\n"
+            while "\n" in buffer:
+                current_line, buffer = buffer.split("\n", 1)
+                if not current_line.strip():
+                    continue
+                if current_line.startswith("data:"):
+                    results.append(current_line[5:].strip())
+
+    for chunk in chunks:
+        handle(line_decoder.decode(text_decoder.decode(chunk)))
+    handle(line_decoder.decode(text_decoder.flush()))
+    handle(line_decoder.flush())
+    return results
+
+
+def test_parser_correctness():
+    """任意切块（包括切断多字节 UTF-8 字符）下解析结果一致"""
+
+    print("🧪 测试 SSE 解析器正确性\n")
+
+    payload = (
+        ": keep-alive\r\n"
+        "event: delta\r\nid: 42\r\ndata: 第一行\r\ndata: 第二行 🚀\r\n\r\n"
+        "retry: 3000\ndata:no-space\n\n"
+        '{"code": 401, "message": "unauthorized"}\n'
+        "data: last-without-newline"
+    ).encode("utf-8")
+
+    for size in (1, 2, 3, 5, 7, len(payload)):
+        parser = SSEParser()
+        events = []
+        for chunk in split_network_chunks(payload, size):
+            events.extend(parser.feed(chunk))
+        events.extend(parser.flush())
+
+        assert [e.data for e in events if e.raw is None] == ["第一行\n第二行 🚀", "no-space", "last-without-newline"]
+        assert events[0].event == "delta" and events[0].id == "42"
+        assert events[1].retry == 3000 and events[1].event == "message"
+        assert [e.raw for e in events if e.raw is not None] == ['{"code": 401, "message": "unauthorized"}']
+
+    # 每个 data 行单独派发（兼容省略空行的上游）
+    assert parse_new([b"data: a\ndata: b\n"]) == ["a", "b"]
+    assert parse_new([b"data: a\ndata: b\n\n"], split_data_lines=False) == ["a\nb"]
+    print("  ✅ 多行 data、字段、注释、CRLF、UTF-8 边界均正确")
+
+
+def test_iter_sse_events_on_httpx_response():
+    """iter_sse_events 直接读取 httpx 流式响应"""
+
+    async def run():
+        payload = build_stream(20)
+
+        async def body():
+            for chunk in split_network_chunks(payload, 37):
+                yield chunk
+
+        response = httpx.Response(200, content=body())
+        return [event.data async for event in iter_sse_events(response, split_data_lines=True)]
+
+    data = asyncio.run(run())
+    assert len(data) == 21 and data[-1] == "[DONE]"
+    assert json.loads(data[0])["data"]["edit_index"] == 0
+
+
+def test_parser_matches_old_parser():
+    """不同大小的网络块下，新解析器与原 aiter_lines() + 字符串缓冲方案的结果一致"""
+
+    payload = build_stream(5000)
+    for size in (1, 64, 1024, 16384):
+        chunks = split_network_chunks(payload, size)
+        assert parse_new(chunks) == parse_old(chunks)
+
+
+def benchmark_parser():
+    """与原 aiter_lines() + 字符串缓冲方案对比"""
+
+    print("\n🧪 测试 SSE 解析性能\n")
+
+    payload = build_stream(5000)
+    for size in (64, 1024, 16384):
+        chunks = split_network_chunks(payload, size)
+
+        iterations = 5
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse_old(chunks)
+        old_time = (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse_new(chunks)
+        new_time = (time.perf_counter() - start) / iterations
+
+        print(f"  网络块 {size:>5} 字节: 原方案 {old_time * 1000:.2f}ms, 新解析器 {new_time * 1000:.2f}ms, "
+              f"加速 {old_time / new_time:.2f}x ({len(payload) / 1024:.0f}KB, 5000 个事件)")
+
+
+if __name__ == "__main__":
+    test_parser_correctness()
+    test_iter_sse_events_on_httpx_response()
+    test_parser_matches_old_parser()
+    benchmark_parser()
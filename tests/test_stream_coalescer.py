@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+流式输出合并测试：合并正确性、阶段切换/结束块刷新、慢速流不增加延迟
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+
+from app.models.schemas import Message, OpenAIRequest
+from app.providers.k2think_provider import K2ThinkProvider
+from app.providers.zai_provider import ZAIProvider
+from app.utils.stream_coalescer import DeltaChunk, coalesce_stream
+
+provider = K2ThinkProvider()
+
+
+async def fake_stream(reasoning: str, answer: str, delay: float = 0.0, stall_after: int = -1, stall: float = 0.0):
+    """模拟提供商：逐字符输出思考和回答，最后输出结束块"""
+    encoder = provider.create_chunk_encoder("chatcmpl-test", "test-model")
+    yield encoder.chunk({"role": "assistant"})
+    for field, text in (("reasoning_content", reasoning), ("content", answer)):
+        for i, char in enumerate(text):
+            if delay:
+                await asyncio.sleep(delay)
+            if i == stall_after:
+                await asyncio.sleep(stall)
+            yield encoder.text(field, char)
+    yield encoder.chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+async def collect(stream):
+    start = time.perf_counter()
+    events = []
+    async for item in stream:
+        events.append((time.perf_counter() - start, item))
+    return events
+
+
+def decode(events):
+    result = {"reasoning_content": "", "content": ""}
+    order = []
+    for _, item in events:
+        if item == "data: [DONE]\n\n":
+            order.append("done")
+            continue
+        chunk = json.loads(item[6:])
+        choice = chunk["choices"][0]
+        for field in result:
+            if field in choice["delta"]:
+                result[field] += choice["delta"][field]
+                order.append(field)
+        if choice["finish_reason"]:
+            order.append("finish")
+    return result, order
+
+
+def test_fast_stream_is_coalesced():
+    """快速流合并为少量事件，内容与顺序不变，阶段切换和结束块立即刷新"""
+
+    print("🧪 测试快速流合并\n")
+    reasoning, answer = "思考" * 100, "回答🚀" * 300
+
+    events = asyncio.run(collect(coalesce_stream(fake_stream(reasoning, answer), window_ms=20)))
+    result, order = decode(events)
+
+    assert result == {"reasoning_content": reasoning, "content": answer}
+    # 思考内容全部在回答之前，结束块和 [DONE] 在最后
+    first_content = order.index("content")
+    assert "reasoning_content" not in order[first_content:]
+    assert order[-2:] == ["finish", "done"]
+    print(f"  {len(reasoning) + len(answer)} 个增量 -> {len(events)} 个事件")
+    assert len(events) < 20
+
+    # 字节上限
+    events = asyncio.run(collect(coalesce_stream(fake_stream("", "x" * 1000), window_ms=1000, max_bytes=100)))
+    result, _ = decode(events)
+    assert result["content"] == "x" * 1000
+    assert max(len(json.loads(item[6:])["choices"][0]["delta"].get("content", "")) for _, item in events[:-1]) <= 100
+
+
+def test_slow_stream_is_not_delayed():
+    """增量间隔大于窗口时逐个立即发送，不合并"""
+
+    events = asyncio.run(collect(coalesce_stream(fake_stream("", "abcde", delay=0.03), window_ms=10)))
+    result, order = decode(events)
+    assert result["content"] == "abcde"
+    assert order.count("content") == 5
+
+
+def test_pending_flushed_when_upstream_stalls():
+    """上游停顿时，已合并的内容在窗口结束时发送，而不是等到下一个增量"""
+
+    events = asyncio.run(collect(
+        coalesce_stream(fake_stream("", "abcd", stall_after=3, stall=0.3), window_ms=20)
+    ))
+    contents = [(t, json.loads(item[6:])["choices"][0]["delta"].get("content")) for t, item in events[:-1]]
+    contents = [(t, c) for t, c in contents if c]
+    assert "".join(c for _, c in contents) == "abcd"
+    # "b"/"c" 在停顿期间就已发送
+    before_stall = "".join(c for t, c in contents if t < 0.2)
+    assert before_stall == "abc"
+
+
+def test_disabled_passes_through():
+    """窗口为 0 时原样透传，编码器返回普通字符串"""
+
+    async def run():
+        items = [item async for item in coalesce_stream(fake_stream("", "ab"), window_ms=0)]
+        assert not any(isinstance(item, DeltaChunk) for item in items)
+        return items
+
+    items = asyncio.run(run())
+    assert len(items) == 5
+
+
+def test_client_disconnect_closes_source():
+    """消费方提前关闭时，后台读取被取消，上游生成器被关闭"""
+
+    closed = []
+
+    async def source():
+        try:
+            async for item in fake_stream("", "x" * 100, delay=0.001):
+                yield item
+        finally:
+            closed.append(True)
+
+    async def run():
+        stream = coalesce_stream(source(), window_ms=50)
+        await stream.__anext__()
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert closed == [True]
+
+
+def test_zai_answer_stream_is_coalesced():
+    """Z.AI 回答阶段逐字符的真实流经过合并层后事件数明显减少，角色块只发送一次"""
+
+    answer = "事件循环是异步编程的核心调度器。" * 10
+    body = "".join(
+        'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":%s}}\n\n' % json.dumps(char)
+        for char in answer
+    ) + 'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":"","usage":{"total_tokens":1}}}\n\n'
+    zai = ZAIProvider()
+    request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=True)
+
+    def run(window_ms):
+        response = httpx.Response(200, content=body.encode("utf-8"))
+        stream = zai._handle_stream_response(response, "chatcmpl-test", "GLM-4.5", request, {"body": {}})
+        return asyncio.run(collect(coalesce_stream(stream, window_ms=window_ms)))
+
+    plain, merged = run(0), run(50)
+    print(f"  Z.AI 回答: {len(plain)} 个事件 -> {len(merged)} 个事件")
+    for events in (plain, merged):
+        assert decode(events)[0]["content"] == answer
+        assert sum('"delta":{"role":"assistant"}' in item for _, item in events) == 1
+    assert len(plain) > len(answer)
+    assert len(merged) < 10
+
+
+if __name__ == "__main__":
+    test_fast_stream_is_coalesced()
+    test_slow_stream_is_not_delayed()
+    test_pending_flushed_when_upstream_stalls()
+    test_disabled_passes_through()
+    test_client_disconnect_closes_source()
+    test_zai_answer_stream_is_coalesced()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+客户端断开检测测试：断开后立即关闭上游生成器、释放token进行中计数并计入统计
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from starlette.requests import ClientDisconnect
+
+from app.utils.stream_guard import GuardedStreamingResponse, stream_stats
+from app.utils.token_pool import TokenPool
+
+
+def make_upstream(pool: TokenPool, events: list, delay: float):
+    """模拟提供商生成器：在 track_request 内慢速读取上游"""
+
+    async def upstream():
+        token = pool.get_next_token()
+        with pool.track_request(token):
+            try:
+                for i in range(100):
+                    await asyncio.sleep(delay)
+                    yield f"data: {i}\n\n"
+            finally:
+                events.append("closed")
+
+    return upstream()
+
+
+def test_disconnect_while_upstream_idle():
+    """上游长时间没有输出时，客户端断开也会立即取消上游"""
+
+    async def run():
+        pool = TokenPool(["token-a"])
+        events = []
+        sent = []
+
+        async def receive():
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        before = stream_stats.cancelled
+        response = GuardedStreamingResponse(make_upstream(pool, events, delay=10), media_type="text/event-stream")
+        start = time.perf_counter()
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        elapsed = time.perf_counter() - start
+
+        print(f"  断开后 {elapsed * 1000:.0f}ms 关闭上游")
+        assert elapsed < 1.0
+        assert events == ["closed"]
+        assert pool.get_pool_status()["in_flight"] == 0
+        assert stream_stats.cancelled == before + 1
+        assert stream_stats.active == 0
+
+    print("🧪 测试上游空闲时的断开检测")
+    asyncio.run(run())
+
+
+def test_send_failure_closes_generator():
+    """写入失败（ASGI 2.4 服务器在连接断开时抛出 OSError）时关闭生成器"""
+
+    async def run():
+        pool = TokenPool(["token-a"])
+        events = []
+        writes = 0
+
+        async def receive():
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            nonlocal writes
+            if message["type"] == "http.response.body":
+                writes += 1
+                if writes == 3:
+                    raise OSError("connection reset")
+
+        response = GuardedStreamingResponse(make_upstream(pool, events, delay=0), media_type="text/event-stream")
+        with pytest.raises(ClientDisconnect):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+        assert events == ["closed"]
+        assert pool.get_pool_status()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_completed_stream():
+    """正常完成的流计入 completed"""
+
+    async def run():
+        async def body():
+            yield "data: 1\n\n"
+            yield "data: [DONE]\n\n"
+
+        chunks = []
+
+        async def receive():
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            chunks.append(message.get("body"))
+
+        before = stream_stats.completed
+        await GuardedStreamingResponse(body())({"type": "http"}, receive, send)
+        assert b"data: [DONE]\n\n" in chunks
+        assert stream_stats.completed == before + 1
+
+    asyncio.run(run())
+
+
+def test_outer_cancellation_propagates():
+    """等待上游清理期间所在任务被取消（例如服务器关闭）时，取消继续向上传播，统计照常更新"""
+
+    async def run():
+        async def upstream():
+            try:
+                yield "data: 0\n\n"
+                await asyncio.sleep(3600)
+            finally:
+                # 清理较慢的上游（例如等待会话删除），所在任务在此期间被取消
+                await asyncio.sleep(0.2)
+
+        async def receive():
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        before = stream_stats.cancelled
+        response = GuardedStreamingResponse(upstream(), media_type="text/event-stream")
+        task = asyncio.create_task(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        result = (await asyncio.gather(task, return_exceptions=True))[0]
+        assert isinstance(result, asyncio.CancelledError) and task.cancelled()
+        assert stream_stats.cancelled == before + 1
+        assert stream_stats.active == 0
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_disconnect_while_upstream_idle()
+    test_send_failure_closes_generator()
+    test_completed_stream()
+    test_outer_cancellation_propagates()
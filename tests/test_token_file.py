@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Token 文件缓存与热更新测试
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.utils.token_file import TokenFileCache, TokenFileWatcher
+
+
+def count_loads(loader):
+    calls = []
+
+    def wrapped(path):
+        calls.append(path)
+        return loader(path)
+    return wrapped, calls
+
+
+def test_cache_reloads_only_on_change():
+    """文件未变化时不重复解析，内容变化后重新加载并去重"""
+    cache = TokenFileCache()
+    loader, calls = count_loads(settings._load_tokens_from_file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tokens.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("a,b\n# comment\nb\nc\n")
+
+        assert cache.get(path, loader) == ["a", "b", "c"]
+        assert cache.get(path, loader) == ["a", "b", "c"]
+        assert len(calls) == 1
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("d\ne\n")
+        assert cache.get(path, loader) == ["d", "e"]
+        assert len(calls) == 2
+
+        os.remove(path)
+        assert cache.get(path, loader) == []
+
+
+def test_watcher_pushes_changes():
+    """监听发现变化后回调新列表，监听期间读取不触碰磁盘"""
+
+    async def run():
+        cache = TokenFileCache()
+        loader, calls = count_loads(settings._load_tokens_from_file)
+        updates = []
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tokens.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("a\n")
+
+            watcher = TokenFileWatcher(cache, interval=0.05)
+            watcher.watch(path, loader, updates.append)
+            await watcher.start()
+            try:
+                loads_before = len(calls)
+                for _ in range(100):
+                    assert cache.get(path, loader) == ["a"]
+                assert len(calls) == loads_before
+
+                # 等待监听任务开始工作
+                await asyncio.sleep(0.3)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("a\nb\n")
+                for _ in range(100):
+                    if updates:
+                        break
+                    await asyncio.sleep(0.05)
+            finally:
+                await watcher.stop()
+
+        assert updates == [["a", "b"]]
+        assert cache.get(path, loader) == []
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_cache_reloads_only_on_change()
+    test_watcher_pushes_changes()
+    print("✅ token 文件测试通过")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Token池并发/RPM 限制、排队以及健康检查并发上限测试
+"""
+
+import sys
+import os
+import asyncio
+import time
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+
+from app.utils import token_pool as token_pool_module
+from app.utils.token_pool import TokenPool
+
+
+def test_concurrency_limit_queues_fairly():
+    """超过单token并发上限的请求按先来先到排队，释放后依次获得token"""
+
+    async def run():
+        pool = TokenPool(["token-a", "token-b"], max_concurrency=2)
+        active = {"token-a": 0, "token-b": 0}
+        peak = {"token-a": 0, "token-b": 0}
+        order = []
+
+        async def worker(i):
+            token = await pool.acquire_token(timeout=5)
+            assert token
+            order.append(i)
+            with pool.track_request(token):
+                active[token] += 1
+                peak[token] = max(peak[token], active[token])
+                await asyncio.sleep(0.02)
+                active[token] -= 1
+
+        tasks = []
+        for i in range(12):
+            tasks.append(asyncio.create_task(worker(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+        status = pool.get_pool_status()
+        print(f"  峰值并发: {peak}, 排队: {status['queue']}")
+        assert max(peak.values()) <= 2
+        assert order == list(range(12))
+        assert status["queue"]["depth"] == 0
+        assert status["queue"]["total_waits"] == 8
+        assert status["in_flight"] == 0
+
+    print("🧪 测试并发限制与公平排队")
+    asyncio.run(run())
+
+
+def test_rpm_limit_and_timeout():
+    """RPM 额度用完后排队等待令牌桶补充，等待超时返回 None"""
+
+    async def run():
+        pool = TokenPool(["token-a"], rpm_limit=600)  # 每 0.1 秒补充一个额度
+
+        for _ in range(600):
+            assert pool.get_next_token() == "token-a"
+        assert pool.get_next_token() is None
+
+        start = time.perf_counter()
+        token = await pool.acquire_token(timeout=2)
+        waited = time.perf_counter() - start
+        print(f"  额度耗尽后等待 {waited * 1000:.0f}ms 获得token")
+        assert token == "token-a"
+        assert 0.05 < waited < 1.0
+
+        assert await pool.acquire_token(timeout=0.01) is None
+        assert pool.get_pool_status()["queue"]["timeouts"] == 1
+
+    print("\n🧪 测试 RPM 限制与等待超时")
+    asyncio.run(run())
+
+
+def test_disabled_pool_does_not_wait():
+    """没有已启用的token时立即返回，不进入队列"""
+
+    async def run():
+        pool = TokenPool(["token-a"], failure_threshold=1, max_concurrency=1)
+        pool.mark_token_failure("token-a")
+        start = time.perf_counter()
+        assert await pool.acquire_token(timeout=5) is None
+        assert time.perf_counter() - start < 0.1
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_hands_token_on():
+    """等待者刚分到token就被取消时，token交给下一个等待者；没有等待者时释放预留名额"""
+
+    async def run():
+        pool = TokenPool(["token-a"], max_concurrency=1)
+        token = pool.get_next_token()
+        with pool.track_request(token):
+            first = asyncio.create_task(pool.acquire_token(timeout=5))
+            second = asyncio.create_task(pool.acquire_token(timeout=5))
+            await asyncio.sleep(0.01)
+            assert len(pool._waiters) == 2
+        # 请求结束时名额已分给 first，first 在拿到结果之前被取消
+        first.cancel()
+        result = (await asyncio.gather(first, return_exceptions=True))[0]
+        if result == "token-a":
+            # Python 3.11 及更早的 wait_for 在结果已就绪时忽略取消，token照常返回给调用方
+            with pool.track_request(result):
+                pass
+        assert await asyncio.wait_for(second, 1) == "token-a"
+        with pool.track_request("token-a"):
+            pass
+
+        # 没有其他等待者：预留名额被释放，token可以立即再次选出
+        with pool.track_request(pool.get_next_token()):
+            third = asyncio.create_task(pool.acquire_token(timeout=5))
+            await asyncio.sleep(0.01)
+        third.cancel()
+        result = (await asyncio.gather(third, return_exceptions=True))[0]
+        if result == "token-a":
+            with pool.track_request(result):
+                pass
+        assert pool._reserved_count("token-a", time.time()) == 0
+        assert await pool.acquire_token(timeout=0.01) == "token-a"
+
+    asyncio.run(run())
+
+
+def test_update_endpoint_uses_configured_options():
+    """管理接口创建token池时与启动、token 文件热更新使用相同的配置参数"""
+
+    from app.core import openai
+    from app.core.config import settings
+
+    previous_pool = token_pool_module._token_pool
+    previous = settings.TOKEN_SELECTION_STRATEGY, settings.TOKEN_MAX_CONCURRENCY
+    token_pool_module._token_pool = None
+    settings.TOKEN_SELECTION_STRATEGY, settings.TOKEN_MAX_CONCURRENCY = "least_in_flight", 2
+    try:
+        asyncio.run(openai.update_token_pool_endpoint(["token-a", "token-b"]))
+        pool = token_pool_module.get_token_pool()
+        assert pool.strategy == "least_in_flight" and pool.max_concurrency == 2
+    finally:
+        settings.TOKEN_SELECTION_STRATEGY, settings.TOKEN_MAX_CONCURRENCY = previous
+        token_pool_module._token_pool = previous_pool
+
+
+def test_health_check_bounded_and_selective():
+    """健康检查只检查过期/待恢复的token，且同时进行的检查数不超过上限"""
+
+    async def run():
+        tokens = [f"token-{i:03d}" for i in range(50)]
+        pool = TokenPool(tokens, failure_threshold=1, recovery_timeout=60)
+        now = time.time()
+
+        # 刚使用过的token不需要检查；刚失败的禁用token未到恢复时间
+        pool.token_statuses[tokens[0]].last_success_time = now
+        pool.token_statuses[tokens[1]].last_check_time = now
+        pool.mark_token_failure(tokens[2])
+        # 失败已久的禁用token需要验证
+        pool.mark_token_failure(tokens[3])
+        pool.token_statuses[tokens[3]].last_failure_time = now - 120
+
+        due = pool.tokens_due_for_check(stale_after=300)
+        assert tokens[0] not in due and tokens[1] not in due and tokens[2] not in due
+        assert tokens[3] in due and len(due) == 47
+
+        running = 0
+        peak = 0
+        checked = []
+
+        async def fake_check(token, base_url=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.005)
+            running -= 1
+            checked.append(token)
+            pool.mark_token_success(token)
+            return True
+
+        pool.health_check_token = fake_check
+        await pool.health_check_all(tokens=due, concurrency=5, jitter=0.01)
+
+        print(f"  待检查 {len(due)} 个, 峰值并发 {peak}")
+        assert peak <= 5
+        assert sorted(checked) == sorted(due)
+        assert pool.token_statuses[tokens[3]].is_available
+
+    print("\n🧪 测试健康检查并发上限")
+    asyncio.run(run())
+
+
+def test_health_check_uses_configured_base_url():
+    """健康检查的认证地址和 Referer 由传入的站点地址生成（指向回放服务器时不访问线上）"""
+
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"role": "user"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    previous = token_pool_module.get_http_client
+    token_pool_module.get_http_client = lambda *args, **kwargs: client
+    try:
+        pool = TokenPool(["token-a"])
+        asyncio.run(pool.health_check_all("http://127.0.0.1:9999", concurrency=1))
+    finally:
+        token_pool_module.get_http_client = previous
+
+    assert [str(request.url) for request in requests] == ["http://127.0.0.1:9999/api/v1/auths/"]
+    assert requests[0].headers["Referer"] == "http://127.0.0.1:9999/"
+
+
+if __name__ == "__main__":
+    test_concurrency_limit_queues_fairly()
+    test_rpm_limit_and_timeout()
+    test_disabled_pool_does_not_wait()
+    test_cancelled_waiter_hands_token_on()
+    test_update_endpoint_uses_configured_options()
+    test_health_check_bounded_and_selective()
+    test_health_check_uses_configured_base_url()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Token池选择测试：1 万个token下的选择、成功/失败标记与恢复；直接运行时输出各操作的平均耗时
+"""
+
+import sys
+import os
+import time
+import logging
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 临时禁用日志以避免性能测试中的噪音
+logging.getLogger().setLevel(logging.CRITICAL)
+
+from app.utils.token_pool import SELECTION_STRATEGIES, TokenPool
+
+
+def make_tokens(count: int):
+    return [f"token-{i:05d}-" + "x" * 20 for i in range(count)]
+
+
+def test_round_robin_and_recovery():
+    """轮询覆盖所有可用token，禁用的token到期后自动恢复"""
+
+    print("🧪 测试轮询与恢复\n")
+
+    tokens = make_tokens(10)
+    pool = TokenPool(tokens, failure_threshold=2, recovery_timeout=0.05)
+
+    assert sorted(pool.get_next_token() for _ in range(10)) == sorted(tokens)
+
+    # 连续失败两次后禁用
+    bad = tokens[3]
+    pool.mark_token_failure(bad)
+    assert bad in pool._get_available_tokens()
+    pool.mark_token_failure(bad)
+    assert bad not in pool._get_available_tokens()
+    assert bad not in {pool.get_next_token() for _ in range(50)}
+
+    # 匿名token被移出轮询
+    pool.set_token_type(tokens[5], "guest")
+    assert len(pool._get_available_tokens()) == 8
+
+    # 超过恢复时间后重新加入轮询
+    time.sleep(0.06)
+    assert bad in {pool.get_next_token() for _ in range(50)}
+    assert pool.token_statuses[bad].failure_count == 0
+
+    # 更新token列表时保留已有状态
+    pool.update_tokens(tokens[:6] + ["new-token"])
+    assert len(pool._get_available_tokens()) == 6
+    assert pool.token_statuses[tokens[5]].token_type == "guest"
+
+    # 全部禁用后返回 None
+    for token in list(pool._get_available_tokens()):
+        pool.mark_token_failure(token)
+        pool.mark_token_failure(token)
+    pool.recovery_timeout = 3600
+    assert pool.get_next_token() is None
+    print("  ✅ 轮询、禁用、恢复行为正确")
+
+
+def check_indexes(pool: TokenPool):
+    """可用环的下标表、负载分桶与可用token列表保持一致"""
+    assert all(pool._available_pos[token] == index for index, token in enumerate(pool._available))
+    assert len(pool._available_pos) == len(pool._available)
+    assert sum(len(bucket) for bucket in pool._load_buckets) == len(pool._available)
+
+
+def test_selection_at_10k():
+    """1 万个token下轮询均匀覆盖所有token，大量选择与标记之后索引仍然一致"""
+
+    tokens = make_tokens(10_000)
+    pool = TokenPool(tokens, failure_threshold=1, recovery_timeout=3600)
+
+    counts = {}
+    for _ in range(50_000):
+        token = pool.get_next_token()
+        counts[token] = counts.get(token, 0) + 1
+    assert len(counts) == len(tokens) and set(counts.values()) == {5}
+
+    for i in range(50_000):
+        token = pool.get_next_token()
+        if i % 50 == 0:
+            pool.mark_token_failure(token)
+        else:
+            pool.mark_token_success(token)
+    check_indexes(pool)
+    disabled = set(t for _, t in pool._recovery_heap)
+    assert len(disabled) == 1000 and not disabled & set(pool._available)
+    assert len(pool._available) + len(disabled) == len(tokens)
+
+
+def benchmark_selection_10k():
+    """1 万个token下单次选择与标记的平均耗时"""
+
+    print("\n🧪 测试 1 万个token的选择性能\n")
+
+    tokens = make_tokens(10_000)
+    pool = TokenPool(tokens, failure_threshold=1, recovery_timeout=3600)
+    iterations = 100_000
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pool.get_next_token()
+    select_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        token = pool.get_next_token()
+        if i % 50 == 0:
+            pool.mark_token_failure(token)
+        else:
+            pool.mark_token_success(token)
+    mixed_time = time.perf_counter() - start
+
+    print(f"  选择: {iterations} 次, 总时间 {select_time * 1000:.2f}ms, 平均 {select_time / iterations * 1e6:.3f}µs")
+    print(f"  选择+标记(2% 失败): 总时间 {mixed_time * 1000:.2f}ms, 平均 {mixed_time / iterations * 1e6:.3f}µs")
+    print(f"  剩余可用token: {len(pool._available)}")
+
+
+def test_selection_strategies():
+    """负载感知策略会避开繁忙、较慢或失败率高的token"""
+
+    print("\n🧪 测试token选择策略\n")
+
+    tokens = make_tokens(4)
+
+    # least_in_flight: 始终选进行中请求最少的
+    pool = TokenPool(tokens, strategy="least_in_flight")
+    with pool.track_request(tokens[0]), pool.track_request(tokens[1]), pool.track_request(tokens[1]):
+        picks = {pool.get_next_token() for _ in range(20)}
+        assert picks == {tokens[2], tokens[3]}
+    assert pool.get_pool_status()["in_flight"] == 0
+
+    # power_of_two: 繁忙token被选中的次数明显更少
+    pool = TokenPool(tokens[:2], strategy="power_of_two")
+    with pool.track_request(tokens[0]):
+        picks = [pool.get_next_token() for _ in range(200)]
+    assert picks.count(tokens[1]) == 200
+
+    # ewma_latency: 慢token的首字节延迟更高，被选中更少
+    pool = TokenPool(tokens[:2], strategy="ewma_latency")
+    pool.token_statuses[tokens[0]].ewma_latency = 2.0
+    pool.token_statuses[tokens[1]].ewma_latency = 0.2
+    picks = [pool.get_next_token() for _ in range(200)]
+    assert picks.count(tokens[1]) > picks.count(tokens[0])
+
+    with pool.track_request(tokens[0]) as tracker:
+        tracker.mark_first_byte()
+    assert 0 < pool.token_statuses[tokens[0]].ewma_latency < 2.0
+
+    # success_rate: 失败率高的token被选中更少
+    pool = TokenPool(tokens[:2], failure_threshold=100, strategy="success_rate")
+    for _ in range(10):
+        pool.mark_token_failure(tokens[0])
+        pool.mark_token_success(tokens[1])
+    picks = [pool.get_next_token() for _ in range(200)]
+    assert picks.count(tokens[1]) > picks.count(tokens[0])
+
+    # 未知策略回退到轮询，池外token不跟踪
+    pool = TokenPool(tokens, strategy="unknown")
+    assert pool.strategy == "round_robin"
+    with pool.track_request("not-in-pool") as tracker:
+        assert tracker is None
+    print("  ✅ 各策略行为正确")
+
+
+def test_strategies_at_10k():
+    """1 万个token下各策略反复选择 + 跟踪后，进行中请求数归零且索引一致"""
+
+    tokens = make_tokens(10_000)
+    for strategy in SELECTION_STRATEGIES:
+        pool = TokenPool(tokens, strategy=strategy)
+        for _ in range(5_000):
+            token = pool.get_next_token()
+            assert token in pool._available_pos
+            with pool.track_request(token) as tracker:
+                tracker.mark_first_byte()
+        assert pool.get_pool_status()["in_flight"] == 0
+        check_indexes(pool)
+
+
+def benchmark_strategies_10k():
+    """1 万个token下各策略的选择 + 跟踪开销"""
+
+    print("\n🧪 测试各策略在 1 万个token下的开销\n")
+
+    tokens = make_tokens(10_000)
+    iterations = 50_000
+
+    for strategy in SELECTION_STRATEGIES:
+        pool = TokenPool(tokens, strategy=strategy)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            token = pool.get_next_token()
+            with pool.track_request(token) as tracker:
+                tracker.mark_first_byte()
+        duration = time.perf_counter() - start
+        print(f"  {strategy:16s} 平均 {duration / iterations * 1e6:.3f}µs/次")
+
+
+if __name__ == "__main__":
+    test_round_robin_and_recovery()
+    test_selection_at_10k()
+    test_selection_strategies()
+    test_strategies_at_10k()
+    benchmark_selection_10k()
+    benchmark_strategies_10k()
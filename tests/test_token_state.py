@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Token池状态持久化测试
+"""
+
+import sys
+import os
+import json
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.token_pool import TokenPool, load_token_state, save_token_state
+
+
+def test_state_survives_restart():
+    """保存后重新创建的token池恢复禁用状态、计数和类型，快照中不含token原文"""
+    tokens = ["token-alive-0123456789", "token-dead-0123456789", "token-guest-0123456789"]
+
+    pool = TokenPool(tokens, failure_threshold=2, recovery_timeout=1800)
+    pool.mark_token_success(tokens[0])
+    pool.mark_token_failure(tokens[1])
+    pool.mark_token_failure(tokens[1])
+    pool.set_token_type(tokens[2], "guest")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state", "token_state.json")
+        assert save_token_state(pool, path)
+
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        assert not any(token in raw for token in tokens)
+        assert len(json.loads(raw)["tokens"]) == 3
+
+        # 模拟重启：新的池，且token列表有增减
+        restarted = TokenPool(tokens[1:] + ["token-new-0123456789"], failure_threshold=2, recovery_timeout=1800)
+        assert load_token_state(restarted, path) == 2
+
+    dead = restarted.token_statuses[tokens[1]]
+    assert not dead.is_available and dead.failure_count == 2
+    assert restarted.token_statuses[tokens[2]].token_type == "guest"
+    assert restarted.token_statuses["token-new-0123456789"].total_requests == 0
+
+    # 禁用和匿名token不参与轮询，禁用token仍会按原失败时间恢复
+    assert {restarted.get_next_token() for _ in range(10)} == {"token-new-0123456789"}
+    restarted.recovery_timeout = time.time() - dead.last_failure_time - 1
+    assert tokens[1] in {restarted.get_next_token() for _ in range(10)}
+
+
+def test_missing_or_corrupt_state_file():
+    """状态文件不存在或损坏时忽略，不影响启动"""
+    pool = TokenPool(["token-a"])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "token_state.json")
+        assert load_token_state(pool, path) == 0
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        assert load_token_state(pool, path) == 0
+    assert pool.get_next_token() == "token-a"
+
+
+if __name__ == "__main__":
+    test_state_survives_restart()
+    test_missing_or_corrupt_state_file()
+    print("✅ token 状态持久化测试通过")
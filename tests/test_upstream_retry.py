@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+上游重试测试：首字节之前遇到 401/429/5xx/连接失败时换token重新签名后重试，客户端看不到失败
+"""
+
+import sys
+import os
+import asyncio
+import logging
+from urllib.parse import parse_qs, urlparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+import httpx
+
+from app.core.config import settings
+from app.models.schemas import Message, OpenAIRequest
+from app.providers.zai_provider import ZAIProvider
+from app.utils import token_pool as token_pool_module
+from app.utils.retry_policy import NETWORK_ERROR, RetryPolicy
+
+TOKENS = ["token-a", "token-b", "token-c"]
+
+UPSTREAM_BODY = (
+    b'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":"hello"}}\n\n'
+    b'data: {"type":"chat:completion","data":{"phase":"answer","delta_content":"",'
+    b'"usage":{"total_tokens":1}}}\n\n'
+)
+
+
+class FakeUpstream:
+    """按顺序返回预设的响应，记录每次请求使用的token和签名参数"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        query = parse_qs(urlparse(str(request.url)).query)
+        self.calls.append({
+            "token": request.headers.get("Authorization", "")[7:],
+            "request_id": query["requestId"][0],
+            "signature": request.headers.get("X-Signature"),
+        })
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if outcome == NETWORK_ERROR:
+            raise httpx.ConnectError("connection refused", request=request)
+        if outcome == 200:
+            return httpx.Response(200, content=UPSTREAM_BODY, headers={"content-type": "text/event-stream"})
+        return httpx.Response(outcome, text=f"upstream {outcome}")
+
+
+def run(outcomes, stream=True, max_attempts=3, budget=15.0, tokens=TOKENS, strategy="round_robin"):
+    """在非匿名模式下用token池发送一个请求，返回 (输出, 假上游, token池)"""
+    upstream = FakeUpstream(outcomes)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    previous_pool = token_pool_module._token_pool
+    previous_anonymous = settings.ANONYMOUS_MODE
+    settings.ANONYMOUS_MODE = False
+    try:
+        pool = token_pool_module.initialize_token_pool(tokens, failure_threshold=3, strategy=strategy)
+        provider = ZAIProvider()
+        provider.get_http_client = lambda: client
+        provider.retry_policy = RetryPolicy(max_attempts=max_attempts, budget=budget, backoff=0.01)
+        request = OpenAIRequest(model="GLM-4.5", messages=[Message(role="user", content="hi")], stream=stream)
+
+        async def call():
+            result = await provider.chat_completion(request)
+            if stream:
+                return "".join([chunk async for chunk in result])
+            return result
+
+        output = asyncio.run(call())
+        return output, upstream, pool
+    finally:
+        settings.ANONYMOUS_MODE = previous_anonymous
+        token_pool_module._token_pool = previous_pool
+
+
+def test_retry_with_next_token():
+    """401 和 503 之后换token重新签名，第三次成功，客户端只看到正常内容"""
+
+    output, upstream, pool = run([401, 503])
+    tokens = [call["token"] for call in upstream.calls]
+    print(f"  尝试的token: {tokens}")
+    assert len(upstream.calls) == 3
+    assert len(set(tokens)) == 3
+    assert len({call["request_id"] for call in upstream.calls}) == 3
+    assert len({call["signature"] for call in upstream.calls}) == 3
+    assert '"content":"hello"' in output and '"error"' not in output
+
+    # 只有 401 计入token失败次数，成功的token在池中记录成功
+    statuses = pool.token_statuses
+    assert statuses[tokens[0]].failure_count == 1
+    assert statuses[tokens[1]].failure_count == 0
+    assert statuses[tokens[2]].successful_requests == 1
+    assert all(status.in_flight == 0 for status in statuses.values())
+
+
+def test_retry_skips_tried_token():
+    """重试不会再用刚返回 429 的token，即使选择策略会再次选中它"""
+
+    for _ in range(20):
+        output, upstream, _ = run([429], tokens=TOKENS[:2], strategy="power_of_two")
+        tokens = [call["token"] for call in upstream.calls]
+        assert len(tokens) == 2 and tokens[0] != tokens[1]
+        assert '"content":"hello"' in output
+    print(f"  429 后换用的token: {tokens}")
+
+    # token比尝试次数少时，所有token都用过之后才重复使用
+    _, upstream, _ = run([429, 429], tokens=TOKENS[:2], strategy="power_of_two")
+    tokens = [call["token"] for call in upstream.calls]
+    assert len(tokens) == 3 and tokens[0] != tokens[1]
+
+
+def test_network_error_is_retried():
+    """连接失败同样重试"""
+
+    output, upstream, _ = run([NETWORK_ERROR])
+    assert len(upstream.calls) == 2
+    assert '"content":"hello"' in output
+
+
+def test_attempts_exhausted():
+    """重试次数用尽后把最后一次的错误返回给客户端"""
+
+    output, upstream, _ = run([500, 502, 503, 504], max_attempts=3)
+    assert len(upstream.calls) == 3
+    assert '"code":503' in output.replace(" ", "")
+    assert output.rstrip().endswith("data: [DONE]")
+
+
+def test_non_retryable_status():
+    """400 等不可重试的状态码直接返回错误"""
+
+    output, upstream, pool = run([400])
+    assert len(upstream.calls) == 1
+    assert '"code":400' in output.replace(" ", "")
+    assert all(status.failure_count == 0 for status in pool.token_statuses.values())
+
+
+def test_non_stream_retry():
+    """非流式请求同样重试"""
+
+    result, upstream, _ = run([429], stream=False)
+    assert len(upstream.calls) == 2
+    assert result["choices"][0]["message"]["content"] == "hello"
+
+
+def test_policy_budget_and_backoff():
+    """退避按次数翻倍且有上限，超出时长预算后不再重试"""
+
+    policy = RetryPolicy(max_attempts=10, budget=5.0, backoff=0.5, max_backoff=2.0)
+    delays = [policy.retry_delay(500, attempt, started=0.0, now=0.0) for attempt in range(1, 6)]
+    print(f"  退避: {[round(d, 2) for d in delays]}")
+    for attempt, delay in enumerate(delays, 1):
+        upper = min(2.0, 0.5 * 2 ** (attempt - 1))
+        assert upper / 2 <= delay <= upper
+
+    assert policy.retry_delay(401, 1, started=0.0, now=0.0) == 0.0
+    assert policy.retry_delay(500, 1, started=0.0, now=4.9) is None
+    assert policy.retry_delay(404, 1, started=0.0, now=0.0) is None
+    assert policy.retry_delay(500, 10, started=0.0, now=0.0) is None
+    assert RetryPolicy(retry_network_errors=False).retry_delay(NETWORK_ERROR, 1, 0.0, 0.0) is None
+
+
+if __name__ == "__main__":
+    test_retry_with_next_token()
+    test_retry_skips_tried_token()
+    test_network_error_is_retried()
+    test_attempts_exhausted()
+    test_non_retryable_status()
+    test_non_stream_retry()
+    test_policy_budget_and_backoff()